@@ -0,0 +1,386 @@
+"""Asynchronous output of streamed agent responses.
+
+The streaming callback of a handoff orchestration is called for every chunk of every agent.
+Printing each chunk directly blocks the event loop on a slow terminal, and two orchestrations
+printing at the same time mix their chunks on one line. :class:`OutputPipeline` decouples the
+callbacks from the output:
+
+* every orchestration writes to its own :class:`SessionOutput`, which buffers the chunks per
+  agent and publishes them coalesced, at the latest after ``flush_interval`` seconds,
+* every sink has its own queue and task, so a slow sink neither delays the agents nor the
+  other sinks,
+* :class:`TerminalSink` streams one message at a time and holds back the messages of other
+  agents or sessions until that message is complete, :class:`JsonlSink` appends the events
+  to a file and :class:`WebSocketSink` sends them to a WebSocket endpoint.
+
+Usage::
+
+    async with OutputPipeline([TerminalSink()]) as output:
+        console = output.session("console")
+        orchestration = HandoffOrchestration(..., streaming_agent_response_callback=console.write_message)
+"""
+
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional, TextIO
+
+from semantic_kernel.contents import FunctionCallContent, FunctionResultContent, StreamingChatMessageContent
+
+DEFAULT_FLUSH_INTERVAL = 0.05
+DEFAULT_MAX_CHUNK_CHARS = 512
+
+TEXT = "text"
+FUNCTION_CALL = "function_call"
+FUNCTION_RESULT = "function_result"
+END = "end"
+INFO = "info"
+
+
+class OutputEvent(NamedTuple):
+    """A piece of output of an agent or a notice of the orchestration (``agent`` is ``None``)."""
+
+    session: str
+    agent: Optional[str]
+    kind: str
+    text: str
+    time: float
+
+    def to_dict(self) -> dict:
+        return self._asdict()
+
+
+class OutputSink:
+    """Destination of the output events. ``write`` receives the events in order."""
+
+    async def start(self) -> None:
+        pass
+
+    async def write(self, events: list[OutputEvent]) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class TerminalSink(OutputSink):
+    """Render the events as text, one complete message at a time.
+
+    The message that started first owns the terminal and is streamed as it arrives. Messages of
+    other agents or sessions are rendered into a buffer and written once the terminal is free,
+    so concurrent orchestrations never share a line.
+
+    Args:
+        stream (Optional[TextIO]): The output stream, ``sys.stdout`` by default.
+        show_sessions (Optional[bool]): Prefix messages with their session. By default this
+            happens as soon as a second session writes.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None, show_sessions: Optional[bool] = None):
+        self.stream = stream or sys.stdout
+        self.show_sessions = show_sessions
+        # One writer thread keeps the writes in order without blocking the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="terminal-output")
+        self._sessions: set[str] = set()
+        self._owner: Optional[tuple[str, Optional[str]]] = None
+        self._pending: dict[tuple[str, Optional[str]], list[str]] = {}
+        self._completed: set[tuple[str, Optional[str]]] = set()
+        self._notices: list[str] = []
+
+    def _prefix(self, event: OutputEvent) -> str:
+        self._sessions.add(event.session)
+        show_sessions = self.show_sessions if self.show_sessions is not None else len(self._sessions) > 1
+        return f"[{event.session}] " if show_sessions else ""
+
+    def _render(self, event: OutputEvent) -> str:
+        if event.kind == FUNCTION_CALL:
+            return f"Calling {event.text}"
+        if event.kind == FUNCTION_RESULT:
+            return f"Result from {event.text}"
+        if event.kind == END:
+            return "\n"
+        return event.text
+
+    def _release(self, output: list[str]) -> None:
+        """Write the held back messages after the owner finished."""
+        self._owner = None
+        for key in list(self._pending):
+            output.extend(self._pending.pop(key))
+            if key in self._completed:
+                self._completed.discard(key)
+                continue
+            self._owner = key
+            return
+        output.extend(self._notices)
+        self._notices.clear()
+
+    def _format(self, events: list[OutputEvent]) -> str:
+        output: list[str] = []
+        for event in events:
+            if event.agent is None:
+                notice = f"{self._prefix(event)}{event.text}\n"
+                if self._owner is None:
+                    output.append(notice)
+                else:
+                    self._notices.append(notice)
+                continue
+            key = (event.session, event.agent)
+            if self._owner is None and key not in self._pending:
+                self._owner = key
+                output.append(f"{self._prefix(event)}{event.agent}: ")
+            if key == self._owner:
+                output.append(self._render(event))
+                if event.kind == END:
+                    self._release(output)
+                continue
+            if key not in self._pending:
+                self._pending[key] = [f"{self._prefix(event)}{event.agent}: "]
+            self._pending[key].append(self._render(event))
+            if event.kind == END:
+                self._completed.add(key)
+        return "".join(output)
+
+    def _emit(self, text: str) -> None:
+        self.stream.write(text)
+        self.stream.flush()
+
+    async def write(self, events: list[OutputEvent]) -> None:
+        text = self._format(events)
+        if text:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._emit, text)
+
+    async def close(self) -> None:
+        # Messages that never completed are still worth showing
+        output: list[str] = []
+        for chunks in self._pending.values():
+            output.extend(chunks + ["\n"])
+        output.extend(self._notices)
+        self._pending.clear()
+        self._notices.clear()
+        if output:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._emit, "".join(output))
+        self._executor.shutdown(wait=True)
+
+
+class JsonlSink(OutputSink):
+    """Append the events as JSON lines to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jsonl-output")
+        self._file: Optional[TextIO] = None
+
+    async def start(self) -> None:
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _append(self, lines: str) -> None:
+        self._file.write(lines)
+        self._file.flush()
+
+    async def write(self, events: list[OutputEvent]) -> None:
+        lines = "".join(json.dumps(event.to_dict(), ensure_ascii=False) + "\n" for event in events)
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._append, lines)
+
+    async def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        if self._file:
+            self._file.close()
+
+
+class WebSocketSink(OutputSink):
+    """Send the events as JSON arrays, one text frame per batch, to a WebSocket endpoint.
+
+    Uses ``aiohttp``, which is installed with Semantic Kernel. While the endpoint cannot be
+    reached, batches are dropped and counted in ``dropped`` and the connection is retried after
+    ``retry_seconds``.
+    """
+
+    def __init__(self, url: str, retry_seconds: float = 5.0):
+        self.url = url
+        self.retry_seconds = retry_seconds
+        self.dropped = 0
+        self._session = None
+        self._socket = None
+        self._retry_at = 0.0
+
+    async def start(self) -> None:
+        try:
+            import aiohttp
+        except ImportError as error:
+            raise ImportError("The WebSocket output needs aiohttp: pip install aiohttp") from error
+        self._session = aiohttp.ClientSession()
+
+    async def _connect(self) -> bool:
+        if self._socket is not None and not self._socket.closed:
+            return True
+        if time.monotonic() < self._retry_at:
+            return False
+        try:
+            self._socket = await self._session.ws_connect(self.url, heartbeat=30)
+            return True
+        except Exception:  # aiohttp raises client and OS errors for unreachable endpoints
+            self._retry_at = time.monotonic() + self.retry_seconds
+            return False
+
+    async def write(self, events: list[OutputEvent]) -> None:
+        if not await self._connect():
+            self.dropped += len(events)
+            return
+        try:
+            await self._socket.send_str(json.dumps([event.to_dict() for event in events], ensure_ascii=False))
+        except Exception:
+            self.dropped += len(events)
+            self._socket = None
+
+    async def close(self) -> None:
+        if self._socket is not None:
+            await self._socket.close()
+        if self._session is not None:
+            await self._session.close()
+
+
+class SessionOutput:
+    """The output of one orchestration, buffered per agent.
+
+    ``write_message`` has the signature of a ``streaming_agent_response_callback``. Text chunks
+    are collected per agent and published together once ``max_chunk_chars`` are reached, the
+    message ends or a function call interrupts it, but at the latest after ``flush_interval``.
+    """
+
+    def __init__(self, pipeline: "OutputPipeline", session_id: str):
+        self.pipeline = pipeline
+        self.session_id = session_id
+        self._buffers: dict[str, list[str]] = {}
+        self._sizes: dict[str, int] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _event(self, agent: Optional[str], kind: str, text: str) -> OutputEvent:
+        return OutputEvent(self.session_id, agent, kind, text, time.time())
+
+    def _flush_agent(self, agent: str) -> list[OutputEvent]:
+        chunks = self._buffers.pop(agent, None)
+        self._sizes.pop(agent, None)
+        return [self._event(agent, TEXT, "".join(chunks))] if chunks else []
+
+    def flush(self) -> None:
+        """Publish all buffered text."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        events = [event for agent in list(self._buffers) for event in self._flush_agent(agent)]
+        if events:
+            self.pipeline.publish(events)
+
+    def write_message(self, message: StreamingChatMessageContent, is_final: bool) -> None:
+        agent = message.name or "Agent"
+        events: list[OutputEvent] = []
+        if message.content:
+            self._buffers.setdefault(agent, []).append(message.content)
+            self._sizes[agent] = self._sizes.get(agent, 0) + len(message.content)
+            if self._sizes[agent] >= self.pipeline.max_chunk_chars:
+                events += self._flush_agent(agent)
+        for item in message.items:
+            if isinstance(item, FunctionCallContent):
+                events += self._flush_agent(agent)
+                events.append(self._event(agent, FUNCTION_CALL, f"'{item.name}' with arguments '{item.arguments}'"))
+            elif isinstance(item, FunctionResultContent):
+                events += self._flush_agent(agent)
+                events.append(self._event(agent, FUNCTION_RESULT, f"'{item.name}' is '{item.result}'"))
+        if is_final:
+            events += self._flush_agent(agent)
+            events.append(self._event(agent, END, ""))
+        if events:
+            self.pipeline.publish(events)
+        if self._buffers and self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.pipeline.flush_interval, self.flush)
+
+    def info(self, text: str) -> None:
+        """Publish a notice of the orchestration on its own line."""
+        self.pipeline.publish([self._event(None, INFO, text)])
+
+    async def drain(self) -> None:
+        """Wait until everything written so far has reached the sinks, e.g. before a prompt."""
+        self.flush()
+        await self.pipeline.drain()
+
+
+class OutputPipeline:
+    """Deliver the events of all sessions to the sinks.
+
+    Args:
+        sinks (list[OutputSink]): Destinations of the events.
+        flush_interval (float): Longest time text chunks are held back for coalescing.
+        max_chunk_chars (int): Buffered characters per agent that are published right away.
+    """
+
+    def __init__(self, sinks: list[OutputSink], flush_interval: float = DEFAULT_FLUSH_INTERVAL, max_chunk_chars: int = DEFAULT_MAX_CHUNK_CHARS):
+        self.sinks = sinks
+        self.flush_interval = flush_interval
+        self.max_chunk_chars = max_chunk_chars
+        self.errors = 0
+        self._sessions: dict[str, SessionOutput] = {}
+        self._queues: list[asyncio.Queue] = []
+        self._tasks: list[asyncio.Task] = []
+
+    async def __aenter__(self) -> "OutputPipeline":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def start(self) -> None:
+        for sink in self.sinks:
+            await sink.start()
+            queue: asyncio.Queue = asyncio.Queue()
+            self._queues.append(queue)
+            self._tasks.append(asyncio.create_task(self._pump(sink, queue)))
+
+    def session(self, session_id: str) -> SessionOutput:
+        """Return the output of a session, created on first use."""
+        if session_id not in self._sessions:
+            self._sessions[session_id] = SessionOutput(self, session_id)
+        return self._sessions[session_id]
+
+    def end_session(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id, None)
+        if session:
+            session.flush()
+
+    def publish(self, events: list[OutputEvent]) -> None:
+        for queue in self._queues:
+            queue.put_nowait(events)
+
+    async def _pump(self, sink: OutputSink, queue: asyncio.Queue) -> None:
+        while True:
+            batches = [await queue.get()]
+            # Everything that queued up while the sink was busy goes out in one write
+            while not queue.empty():
+                batches.append(queue.get_nowait())
+            events = [event for batch in batches if batch is not None for event in batch]
+            try:
+                if events:
+                    await sink.write(events)
+            except Exception:  # a failing sink must not stop the others or the agents
+                self.errors += 1
+            finally:
+                for _ in batches:
+                    queue.task_done()
+            if batches[-1] is None:
+                return
+
+    async def drain(self) -> None:
+        await asyncio.gather(*(queue.join() for queue in self._queues))
+
+    async def close(self) -> None:
+        for session in list(self._sessions.values()):
+            session.flush()
+        self._sessions.clear()
+        self.publish(None)
+        await asyncio.gather(*self._tasks)
+        for sink in self.sinks:
+            await sink.close()
+        self._queues.clear()
+        self._tasks.clear()
@@ -0,0 +1,393 @@
+"""HTTP front-end that serves the orchestrator to many users at once.
+
+The terminal loop serves one user on one thread. :class:`AgentService` shares the provisioned
+orchestrator and a single ``AgentsClient`` between all users instead: every user session is
+mapped to a thread of its own, runs of the same session are serialized while runs of
+different sessions execute concurrently, and sessions are evicted least recently used first
+or after an idle period.
+
+The service runs on ``asyncio`` without additional dependencies. The synchronous SDK calls
+are executed on a bounded thread pool, so the number of concurrent runs and HTTP connections
+stays limited no matter how many users are connected. Endpoints::
+
+    POST   /chat              {"session_id": "...", "user": "...", "message": "..."} -> run result
+    DELETE /sessions/<id>     forget a session (and delete its thread if configured)
+    GET    /health            number of sessions, runs in progress and served requests
+    GET    /usage             token usage per agent, user and session (with a usage ledger)
+"""
+
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Awaitable, Callable, Optional
+
+import requests
+from azure.ai.agents.models import MessageRole
+from azure.core.exceptions import ResourceNotFoundError
+from azure.core.pipeline.transport import RequestsTransport
+from requests.adapters import HTTPAdapter
+
+from message_cursor import MessageCursor
+from resilient_runs import CircuitOpenError
+from usage_ledger import BUDGET_STOP, UsageLedger
+
+DEFAULT_MAX_SESSIONS = 1000
+DEFAULT_IDLE_SECONDS = 1800.0
+DEFAULT_MAX_CONCURRENT_RUNS = 16
+# Largest request body that is accepted
+MAX_BODY_BYTES = 64 * 1024
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+def pooled_transport(max_connections: int):
+    """Return a requests transport whose connection pool fits ``max_connections`` concurrent calls.
+
+    The default pool of ``requests`` keeps 10 connections per host, further concurrent calls
+    open connections that are discarded afterwards.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return RequestsTransport(session=session, session_owner=True)
+
+
+async def handle_json_connection(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    route: Callable[[str, str, bytes], Awaitable[tuple[int, dict]]],
+    on_error: Optional[Callable[[Exception], None]] = None,
+) -> None:
+    """Answer the HTTP/1.1 requests of a keep-alive connection with the JSON results of ``route``.
+
+    ``route`` is called with the method, the path without query and the body and returns the
+    status code and the payload.
+    """
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            method, path, version = request_line.decode("latin-1").split()[:3]
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", "0"))
+            if length > MAX_BODY_BYTES:
+                status, payload = 413, {"error": "Request too large"}
+                keep_alive = False
+            else:
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                try:
+                    status, payload = await route(method, path.split("?", 1)[0], body)
+                except Exception as error:
+                    # The error of one request is returned to its caller, the service keeps running
+                    if on_error:
+                        on_error(error)
+                    status, payload = 500, {"error": f"{type(error).__name__}: {error}"}
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data
+            )
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+@dataclass
+class UserSession:
+    """The thread of a user session and the state that belongs to it."""
+
+    session_id: str
+    thread_id: str
+    cursor: MessageCursor
+    intake: Optional[object] = None
+    user: Optional[str] = None
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    last_used: float = field(default_factory=time.monotonic)
+    turns: int = 0
+
+
+class SessionMap:
+    """Map session IDs to sessions with LRU eviction and idle expiry.
+
+    Sessions with a run in progress are never evicted, so ``max_sessions`` can be exceeded
+    temporarily while all sessions are busy.
+    """
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS, idle_seconds: float = DEFAULT_IDLE_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.clock = clock
+        self._sessions: OrderedDict[str, UserSession] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> Optional[UserSession]:
+        """Return the session and mark it as most recently used."""
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self.touch(session)
+        return session
+
+    def touch(self, session: UserSession) -> None:
+        """Mark a session as most recently used, e.g. when its run finished.
+
+        The session also moves to the end of the LRU order that :meth:`expire` relies on.
+        """
+        session.last_used = self.clock()
+        if self._sessions.get(session.session_id) is session:
+            self._sessions.move_to_end(session.session_id)
+
+    def add(self, session: UserSession) -> list[UserSession]:
+        """Add a session and return the sessions evicted to make room for it."""
+        session.last_used = self.clock()
+        self._sessions[session.session_id] = session
+        evicted = []
+        for candidate in list(self._sessions.values()):
+            if len(self._sessions) <= self.max_sessions:
+                break
+            if candidate is not session and not candidate.lock.locked():
+                evicted.append(self._sessions.pop(candidate.session_id))
+        return evicted
+
+    def pop(self, session_id: str) -> Optional[UserSession]:
+        return self._sessions.pop(session_id, None)
+
+    def expire(self) -> list[UserSession]:
+        """Remove and return the idle sessions that are not running."""
+        deadline = self.clock() - self.idle_seconds
+        expired = []
+        # The least recently used sessions come first, so the scan stops at the first active one
+        for session in list(self._sessions.values()):
+            if session.last_used > deadline:
+                break
+            if not session.lock.locked():
+                expired.append(self._sessions.pop(session.session_id))
+        return expired
+
+
+class AgentService:
+    """Serve the orchestrator to concurrent user sessions.
+
+    Args:
+        client: The synchronous ``AgentsClient`` shared by all sessions.
+        agent_id (str): The orchestrator agent.
+        waiter: The :class:`~run_waiter.RunWaiter` used to wait for the runs, or a
+            :class:`~resilient_runs.ResilientRuns` that retries and hedges them.
+        max_concurrent_runs (int): Upper bound of SDK calls in progress at the same time.
+        max_sessions (int): Number of sessions kept before the least recently used is evicted.
+        idle_seconds (float): Sessions without a request for this long are evicted.
+        intake_factory (Optional[Callable[[], object]]): Creates the per-session
+            :class:`~trip_parser.TripIntake` that answers incomplete trip requests locally.
+        delete_threads (bool): Delete the thread of an evicted session.
+        usage (Optional[UsageLedger]): Records the token usage of the runs per session and
+            user, and stops sessions at the budget of the ledger.
+    """
+
+    def __init__(
+        self,
+        client,
+        agent_id: str,
+        waiter,
+        max_concurrent_runs: int = DEFAULT_MAX_CONCURRENT_RUNS,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        idle_seconds: float = DEFAULT_IDLE_SECONDS,
+        intake_factory: Optional[Callable[[], object]] = None,
+        delete_threads: bool = False,
+        usage: Optional[UsageLedger] = None,
+    ):
+        self.client = client
+        self.agent_id = agent_id
+        self.waiter = waiter
+        self.sessions = SessionMap(max_sessions, idle_seconds)
+        self.intake_factory = intake_factory
+        self.delete_threads = delete_threads
+        self.usage = usage
+        self.stats = {"requests": 0, "runs": 0, "local_replies": 0, "budget_exceeded": 0, "errors": 0, "evicted": 0}
+        self.running = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_runs, thread_name_prefix="agent-service")
+        self._creating: dict[str, asyncio.Future] = {}
+        self._stats_lock = threading.Lock()
+
+    async def _call(self, function: Callable, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(function, *args, **kwargs))
+
+    async def _session(self, session_id: str, user: Optional[str] = None) -> UserSession:
+        session = self.sessions.get(session_id)
+        if session is not None:
+            return session
+        # Concurrent first requests of the same session must not create two threads
+        pending = self._creating.get(session_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        pending = self._creating[session_id] = asyncio.get_running_loop().create_future()
+        try:
+            thread = await self._call(self.client.threads.create)
+            session = UserSession(
+                session_id,
+                thread.id,
+                MessageCursor(self.client, thread.id),
+                intake=self.intake_factory() if self.intake_factory else None,
+                user=user,
+            )
+            self._discard(self.sessions.add(session))
+            pending.set_result(session)
+            return session
+        except BaseException as error:
+            pending.set_exception(error)
+            # Mark the exception as retrieved in case no other request is waiting for it
+            pending.exception()
+            raise
+        finally:
+            del self._creating[session_id]
+
+    def _discard(self, sessions: list[UserSession]) -> None:
+        self.stats["evicted"] += len(sessions)
+        if self.delete_threads:
+            for session in sessions:
+                self._executor.submit(self._delete_thread, session.thread_id)
+
+    def _delete_thread(self, thread_id: str) -> None:
+        try:
+            self.client.threads.delete(thread_id)
+        except ResourceNotFoundError:
+            pass
+
+    def _run_turn(self, session: UserSession, content: str) -> dict:
+        # Executed on a worker thread, the session lock is held by the caller
+        self.client.messages.create(thread_id=session.thread_id, role=MessageRole.USER, content=content)
+        with self._stats_lock:
+            self.running += 1
+        try:
+            if self.usage is not None:
+                # The waiter records the run, and the runs of sub-agents, within the turn
+                with self.usage.turn(session.session_id, session.user):
+                    run = self.waiter.create_and_wait(session.thread_id, self.agent_id)
+            else:
+                run = self.waiter.create_and_wait(session.thread_id, self.agent_id)
+        except CircuitOpenError as error:
+            return {"run_id": None, "status": "unavailable", "error": str(error), "retry_after": round(error.retry_after, 1), "messages": []}
+        finally:
+            with self._stats_lock:
+                self.running -= 1
+        if run.thread_id != session.thread_id:
+            # A hedged duplicate on a copy of the conversation answered first, the session continues there
+            previous_thread_id, session.thread_id = session.thread_id, run.thread_id
+            session.cursor.reset(run.thread_id)
+            if self.delete_threads:
+                self._delete_thread(previous_thread_id)
+        result = {"run_id": run.id, "thread_id": session.thread_id, "status": getattr(run.status, "value", run.status), "messages": []}
+        if run.last_error:
+            result["error"] = str(run.last_error)
+        if result["status"] == "completed":
+            for message in session.cursor.new_messages(run_id=run.id):
+                if message.text_messages:
+                    result["messages"].append({"role": str(getattr(message.role, "value", message.role)), "text": message.text_messages[-1].text.value})
+        return result
+
+    async def chat(self, session_id: Optional[str], message: str, user: Optional[str] = None) -> dict:
+        """Send a user message to the session's thread and return the answer of the run.
+
+        A new session of ``user`` is started if ``session_id`` is empty or unknown.
+        """
+        session_id = session_id or uuid.uuid4().hex
+        self.stats["requests"] += 1
+        session = await self._session(session_id, user)
+        async with session.lock:
+            session.turns += 1
+            result = {"session_id": session_id, "thread_id": session.thread_id, "turn": session.turns}
+            content = message
+            if session.intake is not None:
+                local_reply, content = session.intake.handle(message)
+                if local_reply:
+                    self.stats["local_replies"] += 1
+                    result.update(status="local", messages=[{"role": "assistant", "text": local_reply}])
+                    return result
+            if self.usage is not None and self.usage.check_budget(session_id) == BUDGET_STOP:
+                self.stats["budget_exceeded"] += 1
+                result.update(status="budget_exceeded", messages=[], tokens_used=self.usage.spent(session_id))
+                return result
+            self.stats["runs"] += 1
+            result.update(await self._call(self._run_turn, session, content))
+            self.sessions.touch(session)
+            return result
+
+    async def end_session(self, session_id: str) -> bool:
+        """Forget a session, waiting for its run to finish first."""
+        session = self.sessions.pop(session_id)
+        if session is None:
+            return False
+        async with session.lock:
+            pass
+        if self.delete_threads:
+            await self._call(self._delete_thread, session.thread_id)
+        return True
+
+    async def _expire_idle_sessions(self) -> None:
+        while True:
+            await asyncio.sleep(max(1.0, self.sessions.idle_seconds / 4))
+            self._discard(self.sessions.expire())
+
+    def health(self) -> dict:
+        return {"sessions": len(self.sessions), "runs_in_progress": self.running, **self.stats}
+
+    async def _route(self, method: str, path: str, body: bytes) -> tuple[int, dict]:
+        if path == "/health":
+            return (200, self.health()) if method == "GET" else (405, {"error": "Method not allowed"})
+        if path == "/usage":
+            if self.usage is None:
+                return 404, {"error": "No usage ledger configured"}
+            return (200, self.usage.aggregates()) if method == "GET" else (405, {"error": "Method not allowed"})
+        if path == "/chat":
+            if method != "POST":
+                return 405, {"error": "Method not allowed"}
+            try:
+                request = json.loads(body or b"{}")
+            except json.JSONDecodeError as error:
+                return 400, {"error": f"Invalid JSON: {error}"}
+            if not isinstance(request, dict) or not isinstance(request.get("message"), str) or not request["message"].strip():
+                return 400, {"error": "A JSON object with 'message' is expected"}
+            return 200, await self.chat(request.get("session_id"), request["message"], request.get("user"))
+        if path.startswith("/sessions/") and method == "DELETE":
+            session_id = path[len("/sessions/"):]
+            if await self.end_session(session_id):
+                return 200, {"session_id": session_id, "deleted": True}
+            return 404, {"error": f"Unknown session {session_id}"}
+        return 404, {"error": f"Unknown path {path}"}
+
+    def _count_error(self, error: Exception) -> None:
+        self.stats["errors"] += 1
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080, ready: Optional[Callable[[str, int], None]] = None) -> None:
+        """Serve HTTP requests until cancelled."""
+        server = await asyncio.start_server(partial(handle_json_connection, route=self._route, on_error=self._count_error), host, port)
+        expiry = asyncio.create_task(self._expire_idle_sessions())
+        if ready:
+            ready(*server.sockets[0].getsockname()[:2])
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            expiry.cancel()
+            self._executor.shutdown(wait=False, cancel_futures=True)
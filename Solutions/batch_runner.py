@@ -0,0 +1,196 @@
+"""Headless batch processing of travel requests.
+
+The interactive loop handles one request at a time at typing speed. :class:`BatchRunner`
+reads requests from a JSONL file instead, runs every request on a thread of its own against
+the shared orchestrator with a bounded number of concurrent runs and appends one result line
+per request to an output JSONL file as soon as it completes.
+
+Input lines are JSON objects with a ``message`` and an optional ``id`` (the line number is
+used otherwise)::
+
+    {"id": "req-1", "message": "Ich muss Dienstag bis Freitag nach Berlin"}
+
+Every output line contains the ``id``, the run ``status``, the final agent message, timings
+and the error if the request failed. Requests that already have a completed result in the
+output file are skipped, so an interrupted file can be resumed by starting the batch again.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterator, Optional
+
+from azure.ai.agents.models import AgentThreadCreationOptions, MessageRole, ThreadMessageOptions
+from azure.core.exceptions import ResourceNotFoundError
+
+DEFAULT_BATCH_CONCURRENCY = 4
+
+
+def read_requests(input_path: str) -> Iterator[dict]:
+    """Yield the requests of a JSONL file, skipping empty lines.
+
+    Raises:
+        ValueError: If a line is not a JSON object with a ``message``.
+    """
+    with open(input_path, encoding="utf-8") as input_file:
+        for line_number, line in enumerate(input_file, start=1):
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            if not isinstance(request, dict) or not request.get("message"):
+                raise ValueError(f"{input_path}:{line_number}: expected a JSON object with a 'message'")
+            request.setdefault("id", str(line_number))
+            yield request
+
+
+def completed_request_ids(output_path: str) -> set[str]:
+    """Return the IDs of the requests that already have a completed result in ``output_path``."""
+    completed = set()
+    try:
+        with open(output_path, encoding="utf-8") as output_file:
+            for line in output_file:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut off by an interrupted batch
+                    continue
+                if result.get("status") == "completed":
+                    completed.add(str(result["id"]))
+    except FileNotFoundError:
+        pass
+    return completed
+
+
+def _terminate_last_line(output_path: str) -> None:
+    # A line cut off by an interrupted batch must not be continued by the next result
+    try:
+        with open(output_path, "rb+") as output_file:
+            output_file.seek(0, os.SEEK_END)
+            if output_file.tell() == 0:
+                return
+            output_file.seek(-1, os.SEEK_END)
+            if output_file.read(1) != b"\n":
+                output_file.write(b"\n")
+    except FileNotFoundError:
+        pass
+
+
+class BatchRunner:
+    """Process travel requests from a JSONL file concurrently.
+
+    Args:
+        client: The synchronous ``AgentsClient``.
+        agent_id (str): The orchestrator agent every request is sent to.
+        waiter: The :class:`~run_waiter.RunWaiter` used to wait for the runs, or a
+            :class:`~resilient_runs.ResilientRuns` that repeats a failed request only if it is
+            :meth:`~resilient_runs.ResilientRuns.repeatable`.
+        max_concurrency (int): Upper bound of runs in progress at the same time.
+        prepare (Optional[Callable[[str], str]]): Turns the request text into the message that
+            is sent, e.g. to attach the structured trip data.
+        delete_threads (bool): Delete the thread of a request once its result is written.
+    """
+
+    def __init__(
+        self,
+        client,
+        agent_id: str,
+        waiter,
+        max_concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+        prepare: Optional[Callable[[str], str]] = None,
+        delete_threads: bool = False,
+    ):
+        self.client = client
+        self.agent_id = agent_id
+        self.waiter = waiter
+        self.max_concurrency = max_concurrency
+        self.prepare = prepare
+        self.delete_threads = delete_threads
+        self._write_lock = threading.Lock()
+
+    def process(self, request: dict) -> dict:
+        """Run a single request on a new thread and return its result record."""
+        result = {"id": request["id"], "status": "error", "thread_id": None, "run_id": None, "message": None}
+        started = time.monotonic()
+        try:
+            content = self.prepare(request["message"]) if self.prepare else request["message"]
+            run = self.client.create_thread_and_run(
+                agent_id=self.agent_id,
+                thread=AgentThreadCreationOptions(messages=[ThreadMessageOptions(role=MessageRole.USER, content=content)]),
+            )
+            result.update(thread_id=run.thread_id, run_id=run.id, create_seconds=round(time.monotonic() - started, 3))
+            run = self.waiter.wait(run)
+            result["status"] = getattr(run.status, "value", run.status)
+            if run.last_error:
+                result["error"] = str(run.last_error)
+            if run.usage:
+                result["total_tokens"] = run.usage.total_tokens
+            if result["status"] == "completed":
+                answer = self.client.messages.get_last_message_text_by_role(thread_id=run.thread_id, role=MessageRole.AGENT)
+                result["message"] = answer.text.value if answer else None
+            stats = self.waiter.stats_for(run.id)
+            if stats:
+                result["polls"] = stats.polls
+        except Exception as error:
+            # A single failing request must not stop the batch, it is retried on resume
+            result["error"] = f"{type(error).__name__}: {error}"
+        finally:
+            result["duration_seconds"] = round(time.monotonic() - started, 3)
+            if self.delete_threads and result["thread_id"]:
+                try:
+                    self.client.threads.delete(result["thread_id"])
+                except ResourceNotFoundError:
+                    pass
+        return result
+
+    def _write(self, output_file, result: dict) -> None:
+        with self._write_lock:
+            output_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output_file.flush()
+            os.fsync(output_file.fileno())
+
+    def run(self, input_path: str, output_path: str, resume: bool = True, on_result: Optional[Callable[[dict], None]] = None) -> dict:
+        """Process all requests of ``input_path`` and append their results to ``output_path``.
+
+        Args:
+            input_path (str): The JSONL file with the requests.
+            output_path (str): The JSONL file the results are appended to.
+            resume (bool): Skip requests with a completed result in ``output_path``.
+            on_result (Optional[Callable[[dict], None]]): Called with every written result.
+
+        Returns:
+            dict: Number of processed and skipped requests per status and the wall time.
+        """
+        done = completed_request_ids(output_path) if resume else set()
+        summary: dict = {"skipped": 0, "statuses": {}}
+        started = time.monotonic()
+        requests = read_requests(input_path)
+        running = set()
+        _terminate_last_line(output_path)
+        with open(output_path, "a", encoding="utf-8") as output_file, ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="batch"
+        ) as executor:
+            exhausted = False
+            while running or not exhausted:
+                # Only read as many requests as can run, so large files are not held in memory
+                while not exhausted and len(running) < self.max_concurrency:
+                    request = next(requests, None)
+                    if request is None:
+                        exhausted = True
+                    elif str(request["id"]) in done:
+                        summary["skipped"] += 1
+                    else:
+                        running.add(executor.submit(self.process, request))
+                if not running:
+                    continue
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    result = future.result()
+                    self._write(output_file, result)
+                    summary["statuses"][result["status"]] = summary["statuses"].get(result["status"], 0) + 1
+                    if on_result:
+                        on_result(result)
+        summary["processed"] = sum(summary["statuses"].values())
+        summary["wall_seconds"] = round(time.monotonic() - started, 3)
+        return summary
@@ -0,0 +1,508 @@
+"""Load test and benchmark of the agent flows against the in-process fake service.
+
+Drives N synthetic conversations concurrently through the same building blocks the solution
+scripts use and reports throughput together with p50/p95/p99 latencies per turn, per agent
+and per provisioning step:
+
+- ``session1``: provisioning graph of the travel agents, then conversations through the
+  orchestrator loop (streamed via :func:`~run_stream.stream_run` or polled via
+  :class:`~run_waiter.RunWaiter`) with fan-out to the connected agents.
+- ``session2``: the Semantic Kernel ``HandoffOrchestration`` of ``code_complete_session_2``
+  with scripted customers instead of the terminal.
+
+Examples::
+
+    python benchmark.py session1 --conversations 50 --concurrency 10 --time-scale 0.05
+    python benchmark.py session2 --conversations 20 --concurrency 5 --json session2.json
+
+Latencies are simulated by :mod:`fake_agents`, so the numbers measure the client-side flow
+(request count, polling, streaming, concurrency) and regress when it gets slower.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from typing import Optional
+
+from azure.ai.agents.models import ConnectedAgentTool, MessageRole
+from azure.core.exceptions import AzureError
+
+from fake_agents import FakeAgentsClient, FakeAgentsService, LatencyProfile, Reply, fake_project_client, last_user_text, tool_names
+from intent_router import IntentRouter, RoutingStats
+from message_cursor import MessageCursor
+from order_store import DEFAULT_SEED_ORDERS, OrderStore
+from provisioning import AgentProvisioner, ProvisioningManifest, ProvisioningStep, run_provisioning_graph
+from resilient_runs import ResilientRuns
+from run_stream import ConsoleRunEventHandler, stream_run
+from run_waiter import AdaptiveBackoff, RunWaiter, polling_strategy_from_name
+
+PERCENTILES = (50, 95, 99)
+
+POLICY_FILE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "Hands-On-Hacking-Session-1",
+    "Resources",
+    "Reiserichtlinie_Munich_Agent_Factory_GmbH_v1.pdf",
+)
+
+SESSION1_PROMPTS = (
+    "Ich muss Dienstag bis Freitag nach Berlin",
+    "Wie hoch ist die Hotelobergrenze in München?",
+    "Bitte buche die erste Option",
+    "Ich fliege vom 3. bis 6. Juli nach Paris, Abflug ab 8 Uhr",
+    "Darf ich für 5 Stunden Bahnfahrt 1. Klasse buchen?",
+    "Ja, die Optionen sind genehmigt",
+)
+
+SESSION2_SCENARIOS = (
+    ("Ich möchte eine Rückerstattung für Bestellung 1234, der Artikel kam beschädigt an.", "Danke, das war alles."),
+    ("Wo ist meine Bestellung 5678?", "Danke, das war alles."),
+    ("Ich möchte Bestellung 4321 zurückgeben, sie passt nicht.", "Danke, das war alles."),
+    ("Wo ist meine Bestellung 1111?", "Ich möchte außerdem Bestellung 2222 zurückgeben, falsche Größe.", "Danke, das war alles."),
+)
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Return the ``p``-th percentile of ``values`` with the nearest-rank method."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(values: list[float]) -> dict:
+    """Return count, mean, p50/p95/p99 and maximum of a list of durations in seconds."""
+    if not values:
+        return {"count": 0}
+    summary = {"count": len(values), "mean": round(sum(values) / len(values), 4)}
+    summary.update({f"p{p}": round(percentile(values, p), 4) for p in PERCENTILES})
+    summary["max"] = round(max(values), 4)
+    return summary
+
+
+class LatencyRecorder:
+    """Thread-safe collection of durations by category (turn, agent, ...) and name."""
+
+    def __init__(self):
+        self.samples: dict[str, dict[str, list[float]]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, category: str, name: str, seconds: float) -> None:
+        with self._lock:
+            self.samples.setdefault(category, {}).setdefault(name, []).append(seconds)
+
+    def extend(self, category: str, samples: dict[str, list[float]]) -> None:
+        for name, values in samples.items():
+            for seconds in values:
+                self.record(category, name, seconds)
+
+    @contextmanager
+    def measure(self, category: str, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(category, name, time.perf_counter() - started)
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                category: {name: summarize(values) for name, values in sorted(samples.items())}
+                for category, samples in self.samples.items()
+            }
+
+
+def _service(args, responder=None) -> FakeAgentsService:
+    return FakeAgentsService(
+        LatencyProfile(time_scale=args.time_scale),
+        responder=responder,
+        api_failure_rate=args.api_failure_rate,
+        run_failure_rate=args.run_failure_rate,
+        parallel_connected_agents=args.parallel_fan_out,
+        seed=args.seed,
+    )
+
+
+def _report(args, recorder: LatencyRecorder, service: FakeAgentsService, wall_seconds: float, turns: int, errors: int) -> dict:
+    recorder.extend("agent", service.timings["agent"])
+    recorder.extend("api", service.timings["api"])
+    report = {
+        "scenario": args.scenario,
+        "config": {
+            key: getattr(args, key)
+            for key in (
+                "conversations", "concurrency", "turns", "mode", "time_scale", "api_failure_rate", "run_failure_rate", "retries", "hedge_percentile",
+                "parallel_fan_out", "seed",
+            )
+            if hasattr(args, key)
+        },
+        "wall_seconds": round(wall_seconds, 3),
+        "turns": turns,
+        "errors": errors,
+        "throughput": {
+            "turns_per_second": round(turns / wall_seconds, 3) if wall_seconds else 0.0,
+            "conversations_per_second": round(args.conversations / wall_seconds, 3) if wall_seconds else 0.0,
+        },
+    }
+    report.update(recorder.report())
+    return report
+
+
+# region Session 1
+
+
+def provision_session1(client: FakeAgentsClient, recorder: LatencyRecorder, max_workers: int):
+    """Provision the travel agents with the provisioning graph of session 1, timing every step."""
+    with tempfile.TemporaryDirectory() as directory:
+        provisioner = AgentProvisioner(client, ProvisioningManifest(os.path.join(directory, "manifest.json")))
+
+        def timed(name, action):
+            def step(results):
+                with recorder.measure("provisioning", name):
+                    return action(results)
+
+            return step
+
+        def orchestrator(results):
+            tools = [
+                ConnectedAgentTool(id=results[name].id, name=results[name].name, description=name).definitions[0]
+                for name in ("policy_agent", "recherche_agent", "buchungs_agent")
+            ]
+            return provisioner.ensure_agent(model="fake-model", name="orchestrierungs_agent", tools=tools)
+
+        return run_provisioning_graph(
+            {
+                "recherche_agent": ProvisioningStep((), timed("recherche_agent", lambda _: provisioner.ensure_agent(model="fake-model", name="reise_recherche_agent"))),
+                "buchungs_agent": ProvisioningStep((), timed("buchungs_agent", lambda _: provisioner.ensure_agent(model="fake-model", name="buchungs_agent"))),
+                "vector_store": ProvisioningStep((), timed("vector_store", lambda _: provisioner.ensure_vector_store(POLICY_FILE_PATH, name="travel_policy_vector_store"))),
+                "policy_agent": ProvisioningStep(
+                    ("vector_store",), timed("policy_agent", lambda _: provisioner.ensure_agent(model="fake-model", name="policy_pruefungs_agent"))
+                ),
+                "orchestrator_agent": ProvisioningStep(
+                    ("recherche_agent", "buchungs_agent", "policy_agent"), timed("orchestrator_agent", orchestrator)
+                ),
+            },
+            max_workers=max_workers,
+        )["orchestrator_agent"]
+
+
+def session1_conversation(client, agent_id: str, waiter, recorder: LatencyRecorder, args, index: int) -> tuple[int, int]:
+    """Run one synthetic conversation and return the number of turns and errors."""
+    thread_id = client.threads.create().id
+    cursor = MessageCursor(client, thread_id)
+    turns = errors = 0
+    for turn in range(args.turns):
+        prompt = SESSION1_PROMPTS[(index + turn) % len(SESSION1_PROMPTS)]
+        started = time.perf_counter()
+        try:
+            client.messages.create(thread_id=thread_id, role=MessageRole.USER, content=prompt)
+            if args.mode == "stream":
+                handler = ConsoleRunEventHandler(write=lambda text: None)
+
+                def attempt():
+                    return stream_run(
+                        client, thread_id, agent_id, event_handler=handler, fallback=lambda: waiter.create_and_wait(thread_id, agent_id)
+                    )
+
+                if isinstance(waiter, ResilientRuns):
+                    run, streamed = waiter.call(agent_id, attempt, run_of=lambda result: result[0], repeatable=waiter.repeatable)
+                else:
+                    run, streamed = attempt()
+                if handler.first_output_at is not None:
+                    recorder.record("time_to_first_output", "orchestrator", handler.first_output_at)
+            else:
+                run, streamed = waiter.create_and_wait(thread_id, agent_id), False
+                if run.thread_id != thread_id:
+                    # A hedged duplicate answered on a copy of the conversation
+                    thread_id = run.thread_id
+                    cursor.reset(thread_id)
+            if not streamed:
+                cursor.new_messages(run_id=run.id)
+            if run.status != "completed":
+                errors += 1
+        except AzureError:
+            errors += 1
+        recorder.record("turn", args.mode, time.perf_counter() - started)
+        turns += 1
+    return turns, errors
+
+
+def run_session1(args) -> dict:
+    service = _service(args)
+    client = FakeAgentsClient(service)
+    recorder = LatencyRecorder()
+
+    # Failures are only injected into the conversations, provisioning has to succeed
+    service.api_failure_rate = 0.0
+    for _ in range(args.provisioning_rounds):
+        orchestrator = provision_session1(client, recorder, args.concurrency)
+    service.api_failure_rate = args.api_failure_rate
+    service.timings["agent"].clear()
+    service.timings["api"].clear()
+
+    waiter = RunWaiter(client, polling_strategy_from_name(args.polling), timeout=args.run_timeout)
+    runs = waiter
+    if args.retries or args.hedge_percentile:
+        # The fake agents have no side effects, so the orchestrator runs are retried and hedged as well
+        runs = ResilientRuns(
+            client,
+            waiter,
+            max_retries=args.retries,
+            backoff=AdaptiveBackoff(fast_start_polls=0, initial=args.time_scale, maximum=8 * args.time_scale, multiplier=2.0),
+            hedge_percentile=args.hedge_percentile or None,
+            hedge_min_samples=10,
+            hedge_conversations=True,
+            retry_conversations=True,
+            failure_threshold=max(5, args.concurrency * (args.retries + 1)),
+        )
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="conversation") as executor:
+        results = list(
+            executor.map(lambda index: session1_conversation(client, orchestrator.id, runs, recorder, args, index), range(args.conversations))
+        )
+    wall_seconds = time.perf_counter() - started
+    report = _report(args, recorder, service, wall_seconds, sum(turns for turns, _ in results), sum(errors for _, errors in results))
+    report["polling"] = waiter.summary()
+    if runs is not waiter:
+        report["resilience"] = runs.summary()
+    return report
+
+
+# endregion
+
+# region Session 2
+
+INTENTS = {
+    "RefundAgent": ("rückerstattung", "erstatt", "refund", "geld zurück"),
+    "OrderReturnAgent": ("zurückgeben", "rücksendung", "return"),
+    "OrderStatusAgent": ("wo ist", "status", "track", "lieferung"),
+}
+
+PLUGIN_FUNCTIONS = {
+    "RefundAgent": "OrderRefundPlugin-process_refund",
+    "OrderReturnAgent": "OrderReturnPlugin-process_return",
+    "OrderStatusAgent": "OrderStatusPlugin-check_order_status",
+}
+
+
+def handoff_responder(agent: dict, messages: list[dict], tools: list[dict], tool_outputs: list[dict]) -> Reply:
+    """Simulate the model decisions of the session 2 agents.
+
+    The support agent transfers to the specialist matching the request, specialists call their
+    plugin function, transfer back when the request is not theirs and complete the task when
+    the customer is done.
+    """
+    name = agent["name"]
+    available = tool_names(tools)
+    text = last_user_text(messages).lower()
+    if tool_outputs:
+        return Reply(text=f"{name}: Der Vorgang ist abgeschlossen. Kann ich sonst noch helfen?")
+    if "danke" in text:
+        return Reply(function_calls=(("Handoff-complete_task", {"task_summary": f"{name} hat die Anfrage abgeschlossen."}),))
+
+    intent = next((target for target, keywords in INTENTS.items() if any(keyword in text for keyword in keywords)), None)
+    if name == "SupportAgent":
+        if intent and f"Handoff-transfer_to_{intent}" in available:
+            return Reply(function_calls=((f"Handoff-transfer_to_{intent}", {}),))
+        return Reply(text="Hallo! Wie kann ich Ihnen heute helfen?")
+    if intent != name:
+        return Reply(function_calls=(("Handoff-transfer_to_SupportAgent", {}),))
+
+    order = re.search(r"\d{3,}", text)
+    arguments = {"order_id": order.group(0) if order else "unbekannt"}
+    if name != "OrderStatusAgent":
+        arguments["reason"] = text.split(",", 1)[-1].strip() or "keine Angabe"
+    return Reply(function_calls=((PLUGIN_FUNCTIONS[name], arguments),))
+
+
+class ScriptedCustomer:
+    """Answers the orchestration in place of ``input`` and measures the time per turn."""
+
+    def __init__(self, responses: tuple, recorder: LatencyRecorder, think_time: float = 0.0):
+        self.responses = list(responses)
+        self.recorder = recorder
+        self.think_time = think_time
+        self.turns = 0
+        self._turn_started = time.perf_counter()
+
+    def end_turn(self) -> None:
+        self.recorder.record("turn", "handoff", time.perf_counter() - self._turn_started)
+        self.turns += 1
+
+    async def respond(self):
+        from semantic_kernel.contents import AuthorRole, ChatMessageContent
+
+        self.end_turn()
+        if self.think_time:
+            await asyncio.sleep(self.think_time)
+        content = self.responses.pop(0) if self.responses else "Danke, das war alles."
+        self._turn_started = time.perf_counter()
+        return ChatMessageContent(role=AuthorRole.USER, content=content)
+
+
+async def run_session2(args) -> dict:
+    try:
+        from semantic_kernel.agents import HandoffOrchestration
+        from semantic_kernel.agents.runtime import InProcessRuntime
+
+        from agent_output import JsonlSink, OutputPipeline, TerminalSink
+        from human_input import ScriptedInput
+        from routed_handoff import RoutedHandoffOrchestration, observe_agent_message
+    except ImportError as error:
+        raise ImportError("The session 2 benchmark needs Semantic Kernel: pip install semantic-kernel[azure]==1.45.0") from error
+
+    # code_complete_session_2 reads its settings from the environment, the fake service ignores them
+    os.environ.setdefault("AZURE_AI_AGENT_ENDPOINT", "https://fake.local/api/projects/benchmark")
+    os.environ.setdefault("AZURE_AI_AGENT_MODEL_DEPLOYMENT_NAME", "fake-model")
+    import code_complete_session_2 as session2
+
+    service = _service(args, handoff_responder)
+    project_client = fake_project_client(service)
+    recorder = LatencyRecorder()
+
+    # Manifests and the order database of the plugins stay out of the working directory
+    with (
+        tempfile.TemporaryDirectory() as directory,
+        closing(OrderStore.open(os.path.join(directory, "orders.db"), seed_orders=DEFAULT_SEED_ORDERS)) as order_store,
+    ):
+        session2.order_store = order_store
+        service.api_failure_rate = 0.0
+        for round_number in range(args.provisioning_rounds):
+            # Every round starts with an empty manifest, so every round creates the agents
+            manifest = ProvisioningManifest(os.path.join(directory, f"manifest_{round_number}.json"), scope=session2.get_ai_agent_settings().endpoint)
+            with recorder.measure("provisioning", "get_agents"):
+                agents, handoffs = await session2.get_agents(project_client, session2.get_ai_agent_settings(), manifest)
+        recorder.extend("provisioning", service.timings["provisioning"])
+        service.api_failure_rate = args.api_failure_rate
+        service.timings["agent"].clear()
+        service.timings["api"].clear()
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+        routers = []
+        scenarios = [tuple(ScriptedInput.from_file(args.transcript).messages)] if args.transcript else SESSION2_SCENARIOS
+        sinks = ([TerminalSink()] if args.output_terminal else []) + ([JsonlSink(args.output_jsonl)] if args.output_jsonl else [])
+        output_pipeline = OutputPipeline(sinks)
+        await output_pipeline.start()
+
+        async def conversation(index: int) -> tuple[int, int]:
+            async with semaphore:
+                customer = ScriptedCustomer(scenarios[index % len(scenarios)], recorder, args.think_time)
+                output = output_pipeline.session(f"conversation-{index}")
+                options = dict(members=agents, handoffs=handoffs, human_response_function=customer.respond)
+                if args.intent_router:
+                    router = IntentRouter()
+                    routers.append(router)
+
+                    def callback(message, is_final, router=router):
+                        output.write_message(message, is_final)
+                        observe_agent_message(router, message, is_final)
+
+                    orchestration = RoutedHandoffOrchestration(**options, streaming_agent_response_callback=callback, router=router)
+                else:
+                    orchestration = HandoffOrchestration(**options, streaming_agent_response_callback=output.write_message)
+                runtime = InProcessRuntime()
+                runtime.start()
+                errors = 0
+                try:
+                    result = await orchestration.invoke(task="Greet the customer who is reaching out for support.", runtime=runtime)
+                    await result.get(timeout=args.run_timeout)
+                except Exception:  # the orchestration surfaces service errors and timeouts as various types
+                    errors += 1
+                finally:
+                    customer.end_turn()
+                    await runtime.stop_when_idle()
+                    output_pipeline.end_session(output.session_id)
+                return customer.turns, errors
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(conversation(index) for index in range(args.conversations)))
+        wall_seconds = time.perf_counter() - started
+        await output_pipeline.close()
+        report = _report(args, recorder, service, wall_seconds, sum(turns for turns, _ in results), sum(errors for _, errors in results))
+        if routers:
+            routing = RoutingStats()
+            for router in routers:
+                for name, value in vars(router.stats).items():
+                    setattr(routing, name, getattr(routing, name) + value)
+            report["routing"] = {**vars(routing), "accuracy": routing.accuracy()}
+        session2.order_store = None
+        return report
+
+
+# endregion
+
+
+def format_report(report: dict) -> str:
+    """Render the latency summaries of a report as a text table."""
+    lines = [
+        f"Scenario {report['scenario']}: {report['turns']} turns in {report['wall_seconds']} s, "
+        f"{report['throughput']['turns_per_second']} turns/s, {report['errors']} errors",
+        f"{'':<42}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}",
+    ]
+    for category in ("turn", "time_to_first_output", "agent", "provisioning", "api"):
+        for name, summary in report.get(category, {}).items():
+            if not summary.get("count"):
+                continue
+            lines.append(
+                f"{category + ' ' + name:<42}{summary['count']:>6}"
+                + "".join(f"{summary[key]:>10.3f}" for key in ("p50", "p95", "p99", "max"))
+            )
+    resilience = report.get("resilience")
+    if resilience:
+        lines.append(
+            f"Resilience: {resilience['retries']} retries, {resilience['hedges']} hedges "
+            f"({resilience['hedge_wins']} faster), {resilience['rejected']} rejected by the circuit breaker, "
+            f"{resilience['failures']} failed for good"
+        )
+    routing = report.get("routing")
+    if routing:
+        accuracy = f"{routing['accuracy']:.0%}" if routing["accuracy"] is not None else "n/a"
+        lines.append(
+            f"Intent router: {routing['routed']} of {routing['messages']} messages routed locally, "
+            f"{routing['hops_saved']} agent hops saved, accuracy {accuracy}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[list[str]] = None) -> dict:
+    parser = argparse.ArgumentParser(description="Benchmark the agent workflows against a simulated Agents service")
+    parser.add_argument("scenario", choices=("session1", "session2"))
+    parser.add_argument("--conversations", type=int, default=20, help="Number of synthetic conversations")
+    parser.add_argument("--concurrency", type=int, default=5, help="Conversations running at the same time")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per conversation (session1)")
+    parser.add_argument("--mode", choices=("stream", "poll"), default="stream", help="How runs are executed (session1)")
+    parser.add_argument("--polling", choices=("adaptive", "fixed"), default="adaptive", help="Polling strategy (session1)")
+    parser.add_argument("--provisioning-rounds", type=int, default=3, help="Repetitions of the provisioning")
+    parser.add_argument("--time-scale", type=float, default=0.1, help="Factor for all simulated latencies")
+    parser.add_argument("--api-failure-rate", type=float, default=0.0, help="Share of failing requests")
+    parser.add_argument("--run-failure-rate", type=float, default=0.0, help="Share of failing runs")
+    parser.add_argument("--retries", type=int, default=0, help="Retries of transiently failed runs (session1)")
+    parser.add_argument("--hedge-percentile", type=float, default=0.0, help="Percentile of the run duration after which a duplicate starts, 0 = off (session1)")
+    parser.add_argument("--parallel-fan-out", action="store_true", help="Run connected agents in parallel instead of one after the other")
+    parser.add_argument("--intent-router", action="store_true", help="Route customer messages locally to the specialists (session2)")
+    parser.add_argument("--output-terminal", action="store_true", help="Print the agent answers in the terminal (session2)")
+    parser.add_argument("--output-jsonl", metavar="PATH", help="Save the agent answers as JSON lines (session2)")
+    parser.add_argument("--transcript", metavar="PATH", help="Customer messages from a transcript instead of the built-in scenarios (session2)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Think time of the customers in seconds (session2)")
+    parser.add_argument("--run-timeout", type=float, default=120.0, help="Timeout per run or conversation in seconds")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible latencies")
+    parser.add_argument("--json", metavar="PATH", help="Also save the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run_session1(args) if args.scenario == "session1" else asyncio.run(run_session2(args))
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2, ensure_ascii=False)
+    return report
+
+
+if __name__ == "__main__":
+    main()
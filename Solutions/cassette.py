@@ -0,0 +1,609 @@
+"""Record and replay the HTTP traffic of the agents clients.
+
+A :class:`Cassette` sits below the Azure SDK as its HTTP transport, so it captures every call of
+the synchronous ``AgentsClient`` of session 1 as well as the calls Semantic Kernel's
+``AzureAIAgent`` makes through the async ``AIProjectClient`` of session 2, including the chunks
+of streamed runs. In record mode the requests go to the service and the responses are written
+into a compact JSON file (gzip compressed if the path ends in ``.gz``). In replay mode no
+request leaves the machine: the responses come from the cassette within milliseconds, or with
+the recorded latencies when ``time_scale`` is 1.
+
+Requests are matched by method and path, so a cassette recorded against one project replays
+against any endpoint. Among several recordings of the same path the one with an identical
+body wins, otherwise they are served in recorded order. A request without a recording raises
+:class:`CassetteMismatchError`.
+
+Replays start from the state the recording started from, so record and replay with the same
+``AGENT_MANIFEST_PATH`` contents, e.g. a fresh file each time.
+
+Examples::
+
+    AGENT_CASSETTE=cassettes/session1.json.gz AGENT_CASSETTE_MODE=record python code_complete_session_1.py
+    AGENT_CASSETTE=cassettes/session1.json.gz python code_complete_session_1.py
+    python cassette.py cassettes/session1.json.gz
+"""
+
+import argparse
+import asyncio
+import base64
+import codecs
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+from azure.core.credentials import AccessToken, AccessTokenInfo
+from azure.core.exceptions import HttpResponseError, ResponseNotReadError, StreamClosedError, StreamConsumedError
+from azure.core.pipeline.transport import AsyncHttpTransport, HttpTransport
+from azure.core.rest import AsyncHttpResponse, HttpResponse
+from azure.core.utils import case_insensitive_dict
+
+CASSETTE_VERSION = 1
+MODES = ("record", "replay")
+# Response headers worth keeping; bodies are stored decoded, so Content-Encoding is dropped
+RECORDED_HEADERS = ("content-type", "retry-after", "x-ms-error-code")
+
+
+class CassetteMismatchError(RuntimeError):
+    """Raised in replay mode when a request has no recording."""
+
+
+def _body_hash(request) -> Optional[str]:
+    try:
+        content = request.content
+    except Exception:
+        content = None
+    if content is None:
+        return None
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    elif not isinstance(content, (bytes, bytearray)):
+        # Multipart or streamed uploads cannot be compared
+        return None
+    return hashlib.sha256(content).hexdigest()[:16]
+
+
+def _path(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.path}?{parts.query}" if parts.query else parts.path
+
+
+class Cassette:
+    """The recorded interactions of one session.
+
+    Args:
+        path (str): The cassette file.
+        mode (str): ``"record"`` to call the service and record, ``"replay"`` to answer from
+            the file.
+        time_scale (float): Replays sleep the recorded latencies multiplied by this factor,
+            0 answers right away.
+    """
+
+    def __init__(self, path: str, mode: str = "replay", time_scale: float = 0.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}, expected one of {', '.join(MODES)}")
+        self.path = path
+        self.mode = mode
+        self.time_scale = time_scale
+        self._lock = threading.Lock()
+        self.interactions: list[dict] = [] if mode == "record" else self._load()
+        self._unused = list(range(len(self.interactions)))
+        self.recorded = 0
+        self.replayed = 0
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _load(self) -> list[dict]:
+        opener = gzip.open if self.path.endswith(".gz") else open
+        with opener(self.path, "rt", encoding="utf-8") as cassette_file:
+            data = json.load(cassette_file)
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"{self.path} has cassette version {data.get('version')}, expected {CASSETTE_VERSION}")
+        return data["interactions"]
+
+    def save(self) -> None:
+        """Write the recorded interactions atomically, a no-op in replay mode."""
+        if self.replaying:
+            return
+        with self._lock:
+            data = {"version": CASSETTE_VERSION, "interactions": [entry for entry in self.interactions if "chunks" in entry]}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        opener = gzip.open if self.path.endswith(".gz") else open
+        with opener(tmp_path, "wt", encoding="utf-8") as cassette_file:
+            json.dump(data, cassette_file, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    def start(self, request) -> dict:
+        """Reserve the entry of a request in recorded order and return it."""
+        entry = {"method": request.method, "path": _path(request.url), "body": _body_hash(request)}
+        with self._lock:
+            self.interactions.append(entry)
+        return entry
+
+    def finish(self, entry: dict, status: int, reason: str, headers, latency: float, chunks: list[tuple[float, bytes]]) -> None:
+        """Complete a recorded entry with its response."""
+        body = b"".join(chunk for _, chunk in chunks)
+        try:
+            body.decode("utf-8")
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            stored = [[round(offset, 4), decoder.decode(chunk)] for offset, chunk in chunks]
+            entry["encoding"] = "utf-8"
+        except UnicodeDecodeError:
+            stored = [[round(offset, 4), base64.b64encode(chunk).decode("ascii")] for offset, chunk in chunks]
+            entry["encoding"] = "base64"
+        entry.update(
+            status=status,
+            reason=reason,
+            headers={name: headers[name] for name in RECORDED_HEADERS if name in headers},
+            latency=round(latency, 4),
+        )
+        with self._lock:
+            entry["chunks"] = stored
+            self.recorded += 1
+
+    def take(self, request) -> dict:
+        """Return and consume the recording that answers ``request``."""
+        method, path, body = request.method, _path(request.url), _body_hash(request)
+        with self._lock:
+            candidates = [
+                position
+                for position in self._unused
+                if self.interactions[position]["method"] == method and self.interactions[position]["path"] == path
+            ]
+            if not candidates:
+                raise CassetteMismatchError(f"No recording left for {method} {path} in {self.path}")
+            position = next((position for position in candidates if self.interactions[position]["body"] == body), candidates[0])
+            self._unused.remove(position)
+            self.replayed += 1
+            return self.interactions[position]
+
+    def chunks(self, entry: dict) -> list[tuple[float, bytes]]:
+        if entry["encoding"] == "base64":
+            return [(offset, base64.b64decode(chunk)) for offset, chunk in entry["chunks"]]
+        return [(offset, chunk.encode("utf-8")) for offset, chunk in entry["chunks"]]
+
+    def summary(self) -> dict:
+        with self._lock:
+            summary = {"mode": self.mode, "interactions": len(self.interactions)}
+            if self.replaying:
+                summary.update(replayed=self.replayed, unused=len(self._unused))
+            else:
+                summary["recorded"] = self.recorded
+            return summary
+
+    def transport(self, inner: Optional[HttpTransport] = None) -> "CassetteTransport":
+        """Return the transport for a synchronous client."""
+        return CassetteTransport(self, inner)
+
+    def async_transport(self, inner: Optional[AsyncHttpTransport] = None) -> "AsyncCassetteTransport":
+        """Return the transport for an async client."""
+        return AsyncCassetteTransport(self, inner)
+
+
+class _ReplayedBody:
+    def close(self) -> None:
+        pass
+
+
+class _AsyncReplayedBody:
+    async def close(self) -> None:
+        pass
+
+
+class _Recording:
+    """Internal response of a recorded call: collects the chunks and completes the entry once."""
+
+    def __init__(self, cassette: Cassette, entry: dict, response, latency: float):
+        self.cassette = cassette
+        self.entry = entry
+        self.response = response
+        self.latency = latency
+        self.received = time.perf_counter()
+        self.chunks: list[tuple[float, bytes]] = []
+        self.finished = False
+
+    def add(self, chunk: bytes) -> None:
+        self.chunks.append((time.perf_counter() - self.received, chunk))
+
+    def finish(self) -> None:
+        # Responses closed before they were read are recorded with the chunks read so far
+        if not self.finished:
+            self.finished = True
+            response = self.response
+            self.cassette.finish(self.entry, response.status_code, response.reason, response.headers, self.latency, self.chunks)
+
+    def close(self) -> None:
+        self.finish()
+        self.response.close()
+
+
+class _AsyncRecording(_Recording):
+    async def close(self) -> None:
+        self.finish()
+        await self.response.close()
+
+
+class _CassetteResponseBase:
+    """The parts of a cassette response that do not depend on sync or async I/O.
+
+    The responses implement the public ``azure.core.rest`` response classes, which the SDK
+    documents for custom transports, so they do not depend on azure-core internals.
+    """
+
+    def __init__(self, request, status: int, reason: str, headers, body, stream):
+        self._request = request
+        self._status_code = status
+        self._reason = reason
+        self._headers = case_insensitive_dict(headers)
+        # ``body`` is closed with the response, ``stream`` returns an iterator over the chunks
+        self._body = body
+        self._stream = stream
+        self._content: Optional[bytes] = None
+        self._encoding: Optional[str] = None
+        self._is_closed = False
+        self._is_stream_consumed = False
+
+    @property
+    def request(self):
+        return self._request
+
+    @property
+    def url(self) -> str:
+        return self._request.url
+
+    @property
+    def status_code(self) -> int:
+        return self._status_code
+
+    @property
+    def reason(self) -> str:
+        return self._reason
+
+    @property
+    def headers(self):
+        return self._headers
+
+    @property
+    def content_type(self) -> Optional[str]:
+        return self._headers.get("content-type")
+
+    @property
+    def is_closed(self) -> bool:
+        return self._is_closed
+
+    @property
+    def is_stream_consumed(self) -> bool:
+        return self._is_stream_consumed
+
+    @property
+    def encoding(self) -> Optional[str]:
+        if self._encoding is None:
+            _, _, charset = (self.content_type or "").partition("charset=")
+            self._encoding = charset.split(";")[0].strip().strip('"') or "utf-8"
+        return self._encoding
+
+    @encoding.setter
+    def encoding(self, value: Optional[str]) -> None:
+        self._encoding = value
+
+    @property
+    def content(self) -> bytes:
+        if self._content is None:
+            raise ResponseNotReadError(self)
+        return self._content
+
+    def text(self, encoding: Optional[str] = None) -> str:
+        return self.content.decode(encoding or self.encoding)
+
+    def json(self) -> Any:
+        return json.loads(self.text())
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise HttpResponseError(response=self)
+
+    def _start_stream(self) -> None:
+        if self._is_stream_consumed:
+            raise StreamConsumedError(self)
+        if self._is_closed:
+            raise StreamClosedError(self)
+        self._is_stream_consumed = True
+
+    def __repr__(self) -> str:
+        return f"<CassetteResponse: {self.status_code} {self.reason}>"
+
+
+class _CassetteResponse(_CassetteResponseBase, HttpResponse):
+    def read(self) -> bytes:
+        if self._content is None:
+            self._content = b"".join(self.iter_bytes())
+        return self._content
+
+    def iter_bytes(self, **kwargs: Any):
+        if self._content is not None:
+            yield self._content
+            return
+        self._start_stream()
+        try:
+            yield from self._stream()
+        finally:
+            self.close()
+
+    def iter_raw(self, **kwargs: Any):
+        return self.iter_bytes(**kwargs)
+
+    def close(self) -> None:
+        if not self._is_closed:
+            self._is_closed = True
+            self._body.close()
+
+    def __enter__(self) -> "_CassetteResponse":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class _AsyncCassetteResponse(_CassetteResponseBase, AsyncHttpResponse):
+    async def read(self) -> bytes:
+        if self._content is None:
+            self._content = b"".join([chunk async for chunk in self.iter_bytes()])
+        return self._content
+
+    async def iter_bytes(self, **kwargs: Any):
+        if self._content is not None:
+            yield self._content
+            return
+        self._start_stream()
+        try:
+            async for chunk in self._stream():
+                yield chunk
+        finally:
+            await self.close()
+
+    def iter_raw(self, **kwargs: Any):
+        return self.iter_bytes(**kwargs)
+
+    async def close(self) -> None:
+        if not self._is_closed:
+            self._is_closed = True
+            await self._body.close()
+
+    async def __aenter__(self) -> "_AsyncCassetteResponse":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+
+class CassetteTransport(HttpTransport):
+    """Synchronous transport that records into or replays from a :class:`Cassette`.
+
+    Args:
+        cassette (Cassette): The cassette.
+        inner (HttpTransport): The transport of the service calls while recording, by default
+            ``RequestsTransport``.
+    """
+
+    def __init__(self, cassette: Cassette, inner: Optional[HttpTransport] = None):
+        self.cassette = cassette
+        self.inner = inner
+        if inner is None and not cassette.replaying:
+            from azure.core.pipeline.transport import RequestsTransport
+
+            self.inner = RequestsTransport()
+
+    def send(self, request, **kwargs: Any):
+        response = self._replay(request) if self.cassette.replaying else self._record(request, **kwargs)
+        # Like the SDK transports, bodies of responses that are not streamed are read right away
+        if not kwargs.get("stream"):
+            response.read()
+        return response
+
+    def _record(self, request, **kwargs: Any):
+        entry = self.cassette.start(request)
+        started = time.perf_counter()
+        response = self.inner.send(request, **kwargs)
+        recording = _Recording(self.cassette, entry, response, time.perf_counter() - started)
+
+        def record():
+            try:
+                for chunk in response.iter_bytes():
+                    recording.add(chunk)
+                    yield chunk
+            finally:
+                recording.finish()
+
+        return _CassetteResponse(request, response.status_code, response.reason, response.headers, recording, record)
+
+    def _replay(self, request):
+        entry = self.cassette.take(request)
+        scale = self.cassette.time_scale
+        if scale:
+            time.sleep(entry["latency"] * scale)
+
+        def replay():
+            previous = 0.0
+            for offset, chunk in self.cassette.chunks(entry):
+                if scale and offset > previous:
+                    time.sleep((offset - previous) * scale)
+                previous = offset
+                yield chunk
+
+        return _CassetteResponse(request, entry["status"], entry["reason"], entry["headers"], _ReplayedBody(), replay)
+
+    def open(self) -> None:
+        if self.inner:
+            self.inner.open()
+
+    def close(self) -> None:
+        if self.inner:
+            self.inner.close()
+        self.cassette.save()
+
+    def __enter__(self) -> "CassetteTransport":
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class AsyncCassetteTransport(AsyncHttpTransport):
+    """Async transport that records into or replays from a :class:`Cassette`.
+
+    Args:
+        cassette (Cassette): The cassette.
+        inner (AsyncHttpTransport): The transport of the service calls while recording, by
+            default ``AioHttpTransport``.
+    """
+
+    def __init__(self, cassette: Cassette, inner: Optional[AsyncHttpTransport] = None):
+        self.cassette = cassette
+        self.inner = inner
+        if inner is None and not cassette.replaying:
+            from azure.core.pipeline.transport import AioHttpTransport
+
+            self.inner = AioHttpTransport()
+
+    async def send(self, request, **kwargs: Any):
+        response = await self._replay(request) if self.cassette.replaying else await self._record(request, **kwargs)
+        if not kwargs.get("stream"):
+            await response.read()
+        return response
+
+    async def _record(self, request, **kwargs: Any):
+        entry = self.cassette.start(request)
+        started = time.perf_counter()
+        response = await self.inner.send(request, **kwargs)
+        recording = _AsyncRecording(self.cassette, entry, response, time.perf_counter() - started)
+
+        async def record():
+            try:
+                async for chunk in response.iter_bytes():
+                    recording.add(chunk)
+                    yield chunk
+            finally:
+                recording.finish()
+
+        return _AsyncCassetteResponse(request, response.status_code, response.reason, response.headers, recording, record)
+
+    async def _replay(self, request):
+        entry = self.cassette.take(request)
+        scale = self.cassette.time_scale
+        if scale:
+            await asyncio.sleep(entry["latency"] * scale)
+
+        async def replay():
+            previous = 0.0
+            for offset, chunk in self.cassette.chunks(entry):
+                if scale and offset > previous:
+                    await asyncio.sleep((offset - previous) * scale)
+                previous = offset
+                yield chunk
+
+        return _AsyncCassetteResponse(request, entry["status"], entry["reason"], entry["headers"], _AsyncReplayedBody(), replay)
+
+    async def open(self) -> None:
+        if self.inner:
+            await self.inner.open()
+
+    async def close(self) -> None:
+        if self.inner:
+            await self.inner.close()
+        self.cassette.save()
+
+    async def __aenter__(self) -> "AsyncCassetteTransport":
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+
+class ReplayCredential:
+    """Credential for replays, which need a bearer token but no identity."""
+
+    def get_token(self, *scopes: str, **kwargs: Any) -> AccessToken:
+        return AccessToken("replay", int(time.time()) + 3600)
+
+    def get_token_info(self, *scopes: str, **kwargs: Any) -> AccessTokenInfo:
+        return AccessTokenInfo("replay", int(time.time()) + 3600)
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "ReplayCredential":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+class AsyncReplayCredential:
+    """Async credential for replays."""
+
+    async def get_token(self, *scopes: str, **kwargs: Any) -> AccessToken:
+        return AccessToken("replay", int(time.time()) + 3600)
+
+    async def get_token_info(self, *scopes: str, **kwargs: Any) -> AccessTokenInfo:
+        return AccessTokenInfo("replay", int(time.time()) + 3600)
+
+    async def close(self) -> None:
+        pass
+
+    async def __aenter__(self) -> "AsyncReplayCredential":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        pass
+
+
+def cassette_from_env() -> Optional[Cassette]:
+    """Return the cassette configured by ``AGENT_CASSETTE``, or ``None`` to call the service directly.
+
+    ``AGENT_CASSETTE_MODE`` is ``record`` or ``replay``; by default an existing cassette is
+    replayed and a missing one is recorded. ``AGENT_CASSETTE_TIME_SCALE`` (default 0) scales
+    the recorded latencies of replays.
+    """
+    path = os.getenv("AGENT_CASSETTE")
+    if not path:
+        return None
+    mode = os.getenv("AGENT_CASSETTE_MODE") or ("replay" if os.path.exists(path) else "record")
+    return Cassette(path, mode.lower(), float(os.getenv("AGENT_CASSETTE_TIME_SCALE", "0")))
+
+
+def main(argv: Optional[list[str]] = None) -> dict:
+    parser = argparse.ArgumentParser(description="Show the contents of a cassette with recorded agent requests.")
+    parser.add_argument("path", help="Path of the cassette (.json or .json.gz)")
+    args = parser.parse_args(argv)
+
+    cassette = Cassette(args.path, "replay")
+    paths: dict[str, dict] = {}
+    for entry in cassette.interactions:
+        # IDs in the path are replaced, so calls of the same operation are counted together
+        name = entry["method"] + " " + "/".join(
+            "{id}" if "_" in part or any(char.isdigit() for char in part) else part
+            for part in entry["path"].split("?")[0].split("/")
+        )
+        stats = paths.setdefault(name, {"calls": 0, "seconds": 0.0, "chunks": 0})
+        stats["calls"] += 1
+        stats["seconds"] += entry["latency"] + (entry["chunks"][-1][0] if entry["chunks"] else 0.0)
+        stats["chunks"] += len(entry["chunks"])
+    for name, stats in sorted(paths.items(), key=lambda item: -item[1]["seconds"]):
+        print(f"{name:<60} {stats['calls']:>5} calls {stats['seconds']:>8.2f} s {stats['chunks']:>6} chunks")
+    print(f"{len(cassette.interactions)} interactions, recorded {sum(stats['seconds'] for stats in paths.values()):.2f} s")
+    return paths
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,136 @@
+import argparse
 import os
+import sys
+import time
 from dotenv import load_dotenv
 # Add references
 from azure.ai.agents import AgentsClient
-from azure.ai.agents.models import ConnectedAgentTool, MessageRole, ListSortOrder, FileSearchTool, FilePurpose
-from azure.identity import DefaultAzureCredential
-
-# Clear the console
-os.system('cls' if os.name=='nt' else 'clear')
+from azure.ai.agents.models import ConnectedAgentTool, MessageRole, ListSortOrder, FileSearchTool, FunctionTool, ToolSet
+from batch_runner import DEFAULT_BATCH_CONCURRENCY, BatchRunner
+from cassette import ReplayCredential, cassette_from_env
+from message_cursor import MessageCursor
+from policy_index import PolicyEngine
+from provisioning import AgentProvisioner, ProvisioningManifest, ProvisioningStep, file_hash, run_provisioning_graph
+from resource_lifecycle import ResourceJournal, ResourceRegistry
+from resilient_runs import CircuitOpenError, ResilientRuns
+from response_cache import TTLLRUCache
+from run_stream import stream_run
+from run_waiter import FixedInterval, RunWaiter, polling_strategy_from_name
+from startup import AGENTS_SCOPE, DeferredCredential
+from subagents import POLICY_NAMESPACE, RESEARCH_NAMESPACE, CachedAgentTools
+from thread_compaction import ThreadCompactor
+from tracing import TracedCredential, instrument, tracer_from_env
+from trip_parser import TripIntake, structure_message
+from usage_ledger import BUDGET_COMPACT, BUDGET_STOP, ConversationBudget, UsageLedger, parse_prices
 
 # Load environment variables from .env file
 load_dotenv()
+
+# Record the service traffic into AGENT_CASSETTE or replay it from there without Azure
+cassette = cassette_from_env()
+replaying = cassette is not None and cassette.replaying
+
+# Without --batch the script starts the interactive terminal loop
+parser = argparse.ArgumentParser(description="Multi-Agenten-Reiseplanung für Geschäftsreisen")
+parser.add_argument("--batch", metavar="INPUT_JSONL", help="Reiseanfragen aus einer JSONL-Datei ohne Terminal verarbeiten")
+parser.add_argument("--output", metavar="OUTPUT_JSONL", help="Ergebnisdatei, Standard: <INPUT_JSONL>.results.jsonl")
+parser.add_argument(
+    "--concurrency",
+    type=int,
+    default=int(os.getenv("BATCH_CONCURRENCY", str(DEFAULT_BATCH_CONCURRENCY))),
+    help="Maximale Anzahl gleichzeitiger Runs im Batch",
+)
+parser.add_argument("--no-resume", action="store_true", help="Bereits abgeschlossene Anfragen erneut verarbeiten")
+parser.add_argument("--delete-threads", action="store_true", help="Threads nach jeder Batch-Anfrage bzw. verdrängten Sitzung löschen")
+parser.add_argument("--serve", metavar="[HOST:]PORT", help="Den Orchestrator als HTTP-Dienst für viele Nutzer bereitstellen")
+args = parser.parse_args()
+
+# The credential chain runs on a background thread while the script initializes
+credential = ReplayCredential() if replaying else DeferredCredential().warm(AGENTS_SCOPE)
+
+# Clear the console with an escape sequence instead of starting a shell for it
+if not args.batch and not args.serve and sys.stdout.isatty():
+    print("\033[2J\033[H", end="", flush=True)
+
 project_endpoint = os.getenv("PROJECT_ENDPOINT")
 model_deployment = os.getenv("MODEL_DEPLOYMENT_NAME")
+# Keep the agents between runs and reuse them as long as their definition is unchanged
+delete_agents_on_exit = os.getenv("DELETE_AGENTS_ON_EXIT", "false").lower() == "true"
+# Deleted on exit and on SIGTERM: "threads" of this run, "all" also the cached agents and the vector store, "none" nothing
+cleanup_on_exit = os.getenv("CLEANUP_ON_EXIT", "all" if delete_agents_on_exit else "threads").lower()
+verify_cached_agents = os.getenv("AGENT_MANIFEST_VERIFY", "false").lower() == "true"
+provisioning_concurrency = int(os.getenv("PROVISIONING_CONCURRENCY", "4"))
+# "delta" prints only the messages of the latest run, "full" reprints the whole thread
+message_output = os.getenv("MESSAGE_OUTPUT", "delta").lower()
+# "stream" renders the answer while it is generated, "poll" waits for the complete run
+run_mode = os.getenv("RUN_MODE", "stream").lower()
+# Polling of non-streamed runs: "adaptive" backs off with jitter after a fast start, "fixed" polls every second
+run_polling = os.getenv("RUN_POLLING", "adaptive").lower()
+run_timeout = float(os.getenv("RUN_TIMEOUT_SECONDS", "300"))
+show_run_stats = os.getenv("RUN_WAIT_STATS", "false").lower() == "true"
+# Retry transient run failures with backoff, hedge slow runs with a duplicate and stop calling failing agents for a while
+run_retries = int(os.getenv("RUN_RETRIES", "2"))
+run_deadline = float(os.getenv("RUN_DEADLINE_SECONDS", "0")) or None
+hedge_percentile = float(os.getenv("RUN_HEDGE_PERCENTILE", "0")) or None  # e.g. 95, 0 disables hedging
+# A repeated or duplicate orchestrator run may call the booking agent twice, so by default only the sub-agent runs
+# are retried and hedged; retried orchestrator runs must not have called a tool yet
+retry_orchestrator = os.getenv("RUN_RETRY_ORCHESTRATOR", "false").lower() == "true"
+hedge_orchestrator = os.getenv("RUN_HEDGE_ORCHESTRATOR", "false").lower() == "true"
+circuit_breaker_failures = int(os.getenv("CIRCUIT_BREAKER_FAILURES", "5"))
+circuit_breaker_reset_seconds = float(os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", "30"))
+# Answer common policy questions from a local index of the Reiserichtlinie
+use_local_policy_engine = os.getenv("LOCAL_POLICY_ENGINE", "true").lower() == "true"
+# Call the policy and research agents client-side through a TTL/LRU response cache
+use_cached_agent_tools = os.getenv("CACHED_AGENT_TOOLS", "false").lower() == "true"
+response_cache_size = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+research_cache_ttl = float(os.getenv("RESEARCH_CACHE_TTL_SECONDS", "900"))
+# Run the policy check and the research concurrently client-side and hand only policy-compliant options to the orchestrator
+use_parallel_fan_out = os.getenv("PARALLEL_FAN_OUT", "false").lower() == "true"
+# Extract trip parameters locally and ask for missing ones without a model call
+use_trip_parser = os.getenv("LOCAL_TRIP_PARSER", "true").lower() == "true"
+# Spans of provisioning and runs, exported to TRACE_EXPORT_PATH; 'trace' prints the breakdown of the last turn
+tracer = tracer_from_env("reiseplanung")
+print_trace_breakdown = os.getenv("TRACE_BREAKDOWN", "false").lower() == "true"
+# Token usage per agent, user and conversation, exported to USAGE_EXPORT_PATH; 'usage' prints the totals
+token_prices = parse_prices(os.getenv("TOKEN_PRICES", ""))  # per million tokens, e.g. "gpt-4o=2.5/10"
+conversation_token_budget = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "0"))
+# "compact" continues on a compacted thread before the budget stops the conversation, "stop" stops right away
+budget_action = os.getenv("BUDGET_ACTION", "compact").lower()
+# Move long conversations to a fresh thread seeded with the trip parameters, approvals and bookings
+use_thread_compaction = os.getenv("THREAD_COMPACTION", "true").lower() == "true"
+compaction_max_messages = int(os.getenv("COMPACTION_MAX_MESSAGES", "24"))
+compaction_max_prompt_tokens = int(os.getenv("COMPACTION_MAX_PROMPT_TOKENS", "12000"))
+compaction_keep_turns = int(os.getenv("COMPACTION_KEEP_TURNS", "1"))
+compaction_delete_old_threads = os.getenv("COMPACTION_DELETE_OLD_THREADS", "false").lower() == "true"
+# HTTP service mode: concurrent runs share the connection pool of one client
+service_max_concurrent_runs = int(os.getenv("SERVICE_MAX_CONCURRENT_RUNS", "16"))
+service_max_sessions = int(os.getenv("SERVICE_MAX_SESSIONS", "1000"))
+service_idle_seconds = float(os.getenv("SERVICE_IDLE_SECONDS", "1800"))
 
-# Create the agents client
-agents_client = AgentsClient(endpoint=project_endpoint, credential=DefaultAzureCredential())
+# Track the threads of this run, so they are deleted on exit and found by the sweeper after a crash
+lifecycle = ResourceRegistry("session1", ResourceJournal() if cleanup_on_exit != "none" else None)
+lifecycle.install_signal_handlers()
+
+# Create the agents client; the modules of the HTTP service are imported only in service mode
+transport = None
+if args.serve:
+    import asyncio
+
+    from agent_service import AgentService, pooled_transport
+
+    transport = pooled_transport(service_max_concurrent_runs)
+if cassette:
+    transport = cassette.transport(transport)
+agents_client = instrument(
+    lifecycle.watch(
+        AgentsClient(
+            endpoint=project_endpoint,
+            credential=TracedCredential(credential, tracer),
+            **({"transport": transport} if transport else {}),
+        )
+    ),
+    tracer,
+)
 
 # Agent instructions
 orchestration_agent_name = "orchestrierungs_agent"
@@ -52,6 +168,27 @@ Koordiniere spezialisierte Agenten, um anhand natürlicher Spracheingaben vollst
 - Folge strikt dem definierten Ablauf, initiiere Folgeaktionen aktiv.
 """
 
+local_policy_instructions = """
+## Lokale Werkzeuge
+- **lookup_travel_policy:** Liefert sofort Hotelobergrenzen pro Nacht, Flug- und Bahnklassen, Verpflegungssätze und passende Abschnitte der Reiserichtlinie.
+- Nutze lookup_travel_policy zuerst für Richtlinienfragen. Rufe Agent 1 nur auf, wenn das Ergebnis keine eindeutige Antwort enthält.
+"""
+
+cached_agent_instructions = """
+## Gecachte Agenten-Werkzeuge
+- Agent 1 ist als Werkzeug **pruefe_reiserichtlinie**, Agent 2 als Werkzeug **recherchiere_reiseoptionen** verfügbar.
+- Übergib immer die strukturierten Reisedaten (Ziel, Anreise- und Abreisedatum im Format JJJJ-MM-TT, Reiseklasse).
+- Gib die Rahmenbedingungen von pruefe_reiserichtlinie als policy_constraints an recherchiere_reiseoptionen weiter.
+"""
+
+fan_out_instructions = """
+## Parallele Prüfung und Recherche
+- Sobald Ziel, Anreise- und Abreisedatum feststehen, rufe **plane_reiseoptionen** genau einmal auf, statt Agent 1 und Agent 2 nacheinander aufzurufen.
+- Das Werkzeug prüft die Reiserichtlinie und recherchiert gleichzeitig; options enthält nur richtlinienkonforme Optionen, rejected_options die ausgeschlossenen mit Begründung.
+- Fehlt options, vergleiche options_text selbst mit policy_constraints.
+- Nutze pruefe_reiserichtlinie nur für reine Richtlinienfragen ohne Recherche.
+"""
+
 policy_agent_name = "policy_pruefungs_agent"
 policy_agent_instructions = """
 Du bist der Policy-Prüfungs-Agent. Deine Aufgabe ist es, die Rahmenbedingungen für die eingegebene Reise aus der Reiserichtlinie zu extrahieren und zu prüfen, ob die geplante Reise regelkonform ist. Gib bei Verstößen klare Hinweise.
@@ -67,34 +204,91 @@ buchungs_agent_instructions = """
 Du bist der Buchungs-Agent. Führe die Buchung durch, sobald eine genehmigte Option vorliegt. Bestätige die Buchung und gib eine Zusammenfassung der gebuchten Reise zurück.
 """
 
-with agents_client:
+# Reuse agents from previous runs whose definition did not change
+provisioner = AgentProvisioner(
+    agents_client,
+    ProvisioningManifest(scope=project_endpoint),
+    verify=verify_cached_agents,
+    metadata=lifecycle.tags,
+)
+
+# Define the path to the file to be uploaded
+policy_file_path = "Resources/Reiserichtlinie_Munich_Agent_Factory_GmbH_v1.pdf"
+
+# Local function tools are executed on this machine instead of by a remote agent
+local_functions = set()
+local_instructions = ""
+policy_engine = None
+if use_local_policy_engine:
+    try:
+        policy_engine = PolicyEngine.load(policy_file_path)
+        local_functions.add(policy_engine.lookup_travel_policy)
+        local_instructions += local_policy_instructions
+    except ImportError as error:
+        print(f"Lokale Richtlinienprüfung deaktiviert: {error}")
 
+# The function tools are registered when the orchestrator is provisioned
+toolset = ToolSet()
+
+# Policy answers stay valid as long as the policy file is unchanged, research answers expire quickly
+response_cache = TTLLRUCache(
+    max_entries=response_cache_size,
+    ttls={POLICY_NAMESPACE: None, RESEARCH_NAMESPACE: research_cache_ttl},
+)
+policy_version = file_hash(policy_file_path)
+
+usage_ledger = UsageLedger(
+    agents_client,
+    agent_names=tracer.agent_names,
+    prices=token_prices,
+    budget=ConversationBudget(conversation_token_budget, compact=budget_action == "compact") if conversation_token_budget else None,
+)
+# Replays answer instantly, unless the recorded latencies are replayed as well
+polling_strategy = FixedInterval(0.0) if replaying and not cassette.time_scale else polling_strategy_from_name(run_polling)
+run_waiter = RunWaiter(agents_client, polling_strategy, timeout=run_timeout, on_finished=usage_ledger.record_run)
+resilient_runs = ResilientRuns(
+    agents_client,
+    run_waiter,
+    max_retries=run_retries,
+    deadline=run_deadline,
+    hedge_percentile=hedge_percentile,
+    hedge_conversations=hedge_orchestrator,
+    retry_conversations=retry_orchestrator,
+    failure_threshold=circuit_breaker_failures,
+    reset_seconds=circuit_breaker_reset_seconds,
+    agent_names=tracer.agent_names,
+)
+
+
+# Provisioning steps: each step receives the results of the steps it depends on,
+# so only the policy agent and the orchestrator have to wait for others.
+def reference_recherche_agent(_):
     # Reference the existing Bing Grounding Agent
-    recherche_agent = agents_client.get_agent(
+    return agents_client.get_agent(
         agent_id="Recherche_Agent_ID" # Replace with actual ID of the Bing Grounding Agent
     )
 
 
+def create_buchungs_agent(_):
     # Create the Booking Agent
-    buchungs_agent = agents_client.create_agent(
+    return provisioner.ensure_agent(
         model=model_deployment,
         name=buchungs_agent_name,
         instructions=buchungs_agent_instructions
     )
 
-    
-    # Define the path to the file to be uploaded
-    policy_file_path = "Resources/Reiserichtlinie_Munich_Agent_Factory_GmbH_v1.pdf"
 
-    # Upload the file to foundry and create a vector store
-    file = agents_client.files.upload_and_poll(file_path=policy_file_path, purpose=FilePurpose.AGENTS)
-    vector_store = agents_client.vector_stores.create_and_poll(file_ids=[file.id], name="travel_policy_vector_store")
+def create_policy_vector_store(_):
+    # Upload the file to foundry and create a vector store (reused while the file content is unchanged)
+    return provisioner.ensure_vector_store(policy_file_path, name="travel_policy_vector_store")
+
 
+def create_policy_agent(results):
     # Create file search tool with resources followed by creating agent
-    file_search = FileSearchTool(vector_store_ids=[vector_store.id])
+    file_search = FileSearchTool(vector_store_ids=[results["vector_store"].id])
 
     # Create the policy agent using the file search tool
-    policy_agent = agents_client.create_agent(
+    return provisioner.ensure_agent(
         model=model_deployment,
         name=policy_agent_name,
         instructions=policy_agent_instructions,
@@ -102,70 +296,278 @@ with agents_client:
         tool_resources=file_search.resources,
     )
 
+
+def create_orchestrator_agent(results):
     # Create the connected agent tools for all 3 agents
     # Note: The connected agent tools are used to connect the agents to the orchestrator agent
     policy_agent_tool = ConnectedAgentTool(
-        id=policy_agent.id,
+        id=results["policy_agent"].id,
         name=policy_agent_name,
         description="Prüft die Reiserichtlinie für die geplante Reise."
     )
-    
+
     recherche_agent_tool = ConnectedAgentTool(
-        id=recherche_agent.id,
+        id=results["recherche_agent"].id,
         name=recherche_agent_name,
         description="Sucht Transport- und Unterkunftsoptionen."
     )
 
     buchungs_agent_tool = ConnectedAgentTool(
-        id=buchungs_agent.id,
+        id=results["buchungs_agent"].id,
         name=buchungs_agent_name,
         description="Bucht genehmigte Reiseoptionen."
     )
 
+    agent_tools = [
+        policy_agent_tool.definitions[0],
+        recherche_agent_tool.definitions[0],
+        buchungs_agent_tool.definitions[0]
+    ]
+    instructions = orchestration_instructions + local_instructions
+
+    # Replace the connected policy and research agents by cached client-side calls
+    if use_cached_agent_tools or use_parallel_fan_out:
+        cached_agent_tools = CachedAgentTools(
+            agents_client,
+            resilient_runs,
+            response_cache,
+            policy_agent_id=results["policy_agent"].id,
+            research_agent_id=results["recherche_agent"].id,
+            policy_version=policy_version,
+            policy_engine=policy_engine,
+        )
+        local_functions.update(cached_agent_tools.functions(fan_out=use_parallel_fan_out))
+        agent_tools = [buchungs_agent_tool.definitions[0]]
+        instructions += fan_out_instructions if use_parallel_fan_out else cached_agent_instructions
+
+    if local_functions:
+        toolset.add(FunctionTool(local_functions))
+
     # Create the Orchestrator Agent
     # This agent will coordinate the other agents based on user input
-    orchestrator_agent = agents_client.create_agent(
+    return provisioner.ensure_agent(
         model=model_deployment,
         name=orchestration_agent_name,
-        instructions=orchestration_instructions,
-        tools=[
-            policy_agent_tool.definitions[0],
-            recherche_agent_tool.definitions[0],
-            buchungs_agent_tool.definitions[0]
-        ]
+        instructions=instructions,
+        tools=agent_tools + toolset.definitions
+    )
+
+
+with agents_client, lifecycle.cleanup_on_exit(
+    enabled=cleanup_on_exit != "none",
+    manifest=provisioner.manifest if cleanup_on_exit == "all" else None,
+    names=(orchestration_agent_name, policy_agent_name, buchungs_agent_name, "travel_policy_vector_store"),
+    on_report=lambda report: print(f"Aufgeräumt: {report.summary()}"),
+):
+
+    # Run independent provisioning steps concurrently
+    with tracer.root_span("provisioning"):
+        provisioned = run_provisioning_graph(
+            {
+                "recherche_agent": ProvisioningStep((), tracer.wrap("step recherche_agent", reference_recherche_agent)),
+                "buchungs_agent": ProvisioningStep((), tracer.wrap("step buchungs_agent", create_buchungs_agent)),
+                "vector_store": ProvisioningStep((), tracer.wrap("step vector_store", create_policy_vector_store)),
+                "policy_agent": ProvisioningStep(("vector_store",), tracer.wrap("step policy_agent", create_policy_agent)),
+                "orchestrator_agent": ProvisioningStep(
+                    ("recherche_agent", "buchungs_agent", "policy_agent"),
+                    tracer.wrap("step orchestrator_agent", create_orchestrator_agent),
+                ),
+            },
+            max_workers=provisioning_concurrency,
+        )
+    orchestrator_agent = provisioned["orchestrator_agent"]
+    tracer.agent_names.update(
+        {provisioned[step].id: provisioned[step].name for step in ("recherche_agent", "buchungs_agent", "policy_agent", "orchestrator_agent")}
     )
 
-    print(f"Orchestrator-Agent '{orchestration_agent_name}' und verbundene Agenten wurden erfolgreich erstellt.")
+    # Execute the local function tools automatically, both in streamed and in polled runs
+    if local_functions:
+        agents_client.enable_auto_function_calls(toolset)
+        run_waiter.toolset = toolset
 
-    # === Thread for Terminal Interaction ===
-    thread = agents_client.threads.create()
-    print("\nGib deine Reiseanfrage ein (oder 'exit' zum Beenden):")
-    while True:
-        user_input = input("> ")
-        if user_input.strip().lower() == "exit":
-            break
+    print(f"Orchestrator-Agent '{orchestration_agent_name}' und verbundene Agenten sind bereit ({provisioner.calls} Provisionierungsaufrufe).")
 
-        agents_client.messages.create(
-            thread_id=thread.id,
-            role=MessageRole.USER,
-            content=user_input,
+    if args.batch:
+        # === Headless batch processing, every request runs on its own thread ===
+        output_path = args.output or os.path.splitext(args.batch)[0] + ".results.jsonl"
+        batch_runner = BatchRunner(
+            agents_client,
+            orchestrator_agent.id,
+            resilient_runs,
+            max_concurrency=args.concurrency,
+            prepare=structure_message if use_trip_parser else None,
+            delete_threads=args.delete_threads,
         )
+        summary = batch_runner.run(
+            args.batch,
+            output_path,
+            resume=not args.no_resume,
+            on_result=lambda result: print(f"[{result['id']}] {result['status']} ({result['duration_seconds']} s)"),
+        )
+        print(f"Batch abgeschlossen, Ergebnisse in {output_path}: {summary}")
+    elif args.serve:
+        # === HTTP service, one thread per user session ===
+        host, _, port = args.serve.rpartition(":")
+        agent_service = AgentService(
+            agents_client,
+            orchestrator_agent.id,
+            resilient_runs,
+            max_concurrent_runs=service_max_concurrent_runs,
+            max_sessions=service_max_sessions,
+            idle_seconds=service_idle_seconds,
+            intake_factory=TripIntake if use_trip_parser else None,
+            delete_threads=args.delete_threads,
+            usage=usage_ledger,
+        )
+        try:
+            asyncio.run(
+                agent_service.serve(
+                    host or "127.0.0.1",
+                    int(port),
+                    ready=lambda bound_host, bound_port: print(f"Dienst läuft auf http://{bound_host}:{bound_port} (Strg+C zum Beenden)"),
+                )
+            )
+        except KeyboardInterrupt:
+            print(f"\nDienst beendet: {agent_service.health()}")
+    else:
+        # === Thread for Terminal Interaction ===
+        thread = agents_client.threads.create()
+        # Compaction moves the conversation to new threads, the usage stays with the first one
+        conversation_id = thread.id
+        cursor = MessageCursor(agents_client, thread.id)
+        trip_intake = TripIntake()
+        thread_compactor = (
+            ThreadCompactor(
+                agents_client,
+                max_messages=compaction_max_messages,
+                max_prompt_tokens=compaction_max_prompt_tokens,
+                keep_turns=compaction_keep_turns,
+                delete_old_threads=compaction_delete_old_threads,
+            )
+            if use_thread_compaction
+            else None
+        )
+        print("\nGib deine Reiseanfrage ein (oder 'exit' zum Beenden):")
+        turn = 0
+        while True:
+            if print_trace_breakdown and turn:
+                print(f"[Trace]\n{tracer.breakdown()}\n")
+            user_input = input("> ")
+            if user_input.strip().lower() == "exit":
+                break
+            if user_input.strip().lower() == "trace":
+                print(tracer.breakdown() if tracer.enabled else "Tracing ist deaktiviert (TRACING=true setzen).")
+                continue
+            if user_input.strip().lower() == "usage":
+                print(usage_ledger.summary())
+                continue
+            turn += 1
+            with tracer.root_span("turn", turn=turn), usage_ledger.turn(conversation_id):
+                # Answer incomplete trip requests locally and attach the structured trip data otherwise
+                content = user_input
+                if use_trip_parser:
+                    local_reply, content = trip_intake.handle(user_input)
+                    if local_reply:
+                        print(f"assistant:\n{local_reply}\n")
+                        continue
+
+                # Compact or stop before the next turn would exceed the token budget of the conversation
+                budget = usage_ledger.check_budget(conversation_id, can_compact=thread_compactor is not None)
+                if budget == BUDGET_COMPACT:
+                    thread = thread_compactor.compact(thread.id, trip=trip_intake.trip.to_dict() if use_trip_parser else None)
+                    cursor.reset(thread.id)
+                    usage_ledger.compacted(conversation_id)
+                    print(f"[Verlauf wegen des Token-Budgets komprimiert, weiter auf Thread {thread.id}]\n")
+                    budget = usage_ledger.check_budget(conversation_id)
+                if budget == BUDGET_STOP:
+                    print(
+                        f"Das Token-Budget dieser Unterhaltung ist ausgeschöpft ({usage_ledger.spent(conversation_id)} von "
+                        f"{conversation_token_budget} Tokens). Beende sie mit 'exit'.\n"
+                    )
+                    continue
+
+                agents_client.messages.create(
+                    thread_id=thread.id,
+                    role=MessageRole.USER,
+                    content=content,
+                )
+
+                print("Verarbeite Anfrage...")
+                try:
+                    if run_mode == "stream":
+                        run_started = time.perf_counter()
+                        stream_attempts = [0]
+
+                        def stream_attempt():
+                            stream_attempts[0] += 1
+                            if stream_attempts[0] > 1:
+                                # The part of the answer the failed run already streamed stays on the console
+                                print("\n[Run fehlgeschlagen, neuer Versuch – die Antwort beginnt von vorn]\n")
+                            return stream_run(
+                                agents_client,
+                                thread.id,
+                                orchestrator_agent.id,
+                                fallback=lambda: run_waiter.create_and_wait(thread.id, orchestrator_agent.id),
+                            )
+
+                        # Streamed runs are not hedged, their answer is already on the console
+                        run, streamed = resilient_runs.call(
+                            orchestrator_agent.id, stream_attempt, run_of=lambda result: result[0], repeatable=resilient_runs.repeatable
+                        )
+                        if streamed:
+                            usage_ledger.record_run(run, time.perf_counter() - run_started)
+                    else:
+                        with tracer.span(f"run {orchestration_agent_name}") as run_span:
+                            run = resilient_runs.create_and_wait(thread.id, orchestrator_agent.id)
+                            tracer.record_run(run_span, run, client=agents_client)
+                        streamed = False
+                except KeyboardInterrupt:
+                    print("\nRun abgebrochen.")
+                    continue
+                except CircuitOpenError as error:
+                    print(f"Der Orchestrator ist nach wiederholten Fehlern vorübergehend gesperrt, bitte in {error.retry_after:.0f} s erneut versuchen.\n")
+                    continue
+                if show_run_stats and run_waiter.history and run_waiter.history[-1].run_id == run.id:
+                    print(f"[Run-Statistik] {run_waiter.last_stats()}")
+                if run.status == "failed":
+                    print(f"Run fehlgeschlagen: {run.last_error}")
+                    continue
+                if run.status in ("cancelled", "cancelling", "expired"):
+                    print(f"Run nicht abgeschlossen: {run.status}")
+                    continue
+                if run.thread_id != thread.id:
+                    # The hedged duplicate on a copy of the conversation answered first, the conversation continues there
+                    thread = agents_client.threads.get(run.thread_id)
+                    cursor.reset(thread.id)
+                if not streamed:
+                    if message_output == "full":
+                        messages = agents_client.messages.list(thread_id=thread.id, order=ListSortOrder.ASCENDING)
+                    else:
+                        messages = cursor.new_messages(run_id=run.id)
+                    for message in messages:
+                        if message.text_messages:
+                            last_msg = message.text_messages[-1]
+                            print(f"{message.role}:\n{last_msg.text.value}\n")
+
+                # Continue long conversations on a fresh thread that starts with the conversation state
+                if thread_compactor and thread_compactor.record_run(run):
+                    thread = thread_compactor.compact(thread.id, trip=trip_intake.trip.to_dict() if use_trip_parser else None)
+                    cursor.reset(thread.id)
+                    print(f"[Verlauf komprimiert, weiter auf Thread {thread.id}]\n")
+
+    if use_cached_agent_tools or use_parallel_fan_out:
+        print(f"Antwort-Cache: {response_cache.summary()}")
+    resilience = resilient_runs.summary()
+    if resilience["retries"] or resilience["hedges"] or resilience["rejected"]:
+        print(f"Resilienz der Runs: {resilience}")
+    if cassette:
+        print(f"Kassette {cassette.path}: {cassette.summary()}")
+    if usage_ledger.total.calls:
+        print(f"Token-Verbrauch, exportiert nach {usage_ledger.export()}:\n{usage_ledger.summary()}")
+
+    # Aufräumen beim Verlassen des Blocks
+    if cleanup_on_exit != "all":
+        print("Agenten bleiben für den nächsten Start erhalten.")
 
-        print("Verarbeite Anfrage...")
-        run = agents_client.runs.create_and_process(thread_id=thread.id, agent_id=orchestrator_agent.id)
-        if run.status == "failed":
-            print(f"Run fehlgeschlagen: {run.last_error}")
-            continue
-
-        messages = agents_client.messages.list(thread_id=thread.id, order=ListSortOrder.ASCENDING)
-        for message in messages:
-            if message.text_messages:
-                last_msg = message.text_messages[-1]
-                print(f"{message.role}:\n{last_msg.text.value}\n")
-
-    # Aufräumen
-    # print("Lösche Agenten...")
-    agents_client.delete_agent(orchestrator_agent.id)
-    agents_client.delete_agent(policy_agent.id)
-    agents_client.delete_agent(buchungs_agent.id)
-    print("Alle Agenten wieder gelöscht.")
+    # Export the spans recorded outside of turns, e.g. of a batch
+    tracer.flush()
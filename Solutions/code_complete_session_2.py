@@ -1,107 +1,236 @@
 import asyncio
+import os
+import signal
+from functools import partial
+from typing import TYPE_CHECKING, Optional
+
+from cassette import AsyncReplayCredential, cassette_from_env
+from startup import AGENTS_SCOPE, AsyncDeferredCredential, DeferredCredential, preload
+
+# Record the traffic of the AzureAIAgent calls into AGENT_CASSETTE or replay it from there without Azure
+cassette = cassette_from_env()
+replaying = cassette is not None and cassette.replaying
+# Run as a script, the credential chain runs on a background thread while Semantic Kernel is imported, which takes
+# seconds; importing the module, e.g. in the benchmark, starts no credential
+token_prefetch = DeferredCredential().warm(AGENTS_SCOPE) if __name__ == "__main__" and not replaying else None
+
+# Add references; the project client and the agents are imported where they are used, see preload below
+from semantic_kernel.contents import AuthorRole, ChatMessageContent, StreamingChatMessageContent
+from semantic_kernel.functions import kernel_function
 
-
-# Add references
-from azure.identity.aio import DefaultAzureCredential
-from semantic_kernel.agents import Agent, HandoffOrchestration, OrchestrationHandoffs, AzureAIAgent, AzureAIAgentSettings
-from semantic_kernel.agents.runtime import InProcessRuntime
-from semantic_kernel.contents import (
-    AuthorRole,
-    ChatMessageContent,
-    FunctionCallContent,
-    FunctionResultContent,
-    StreamingChatMessageContent,
+from agent_output import JsonlSink, OutputPipeline, OutputSink, SessionOutput, TerminalSink, WebSocketSink
+from human_input import HumanInput, QueueInput, ScriptedInput, TerminalInput
+from intent_router import IntentRouter
+from order_store import DEFAULT_ORDER_STORE_PATH, DEFAULT_SEED_ORDERS, OrderNotFoundError, OrderStore
+from provisioning import AsyncAgentProvisioner, ProvisioningManifest, ProvisioningStep, run_provisioning_graph_async
+from resource_lifecycle import AsyncResourceRegistry, ResourceJournal
+from tracing import AsyncTracedCredential, instrument_project_client, tracer_from_env
+from usage_ledger import BUDGET_STOP, ConversationBudget, UsageLedger, parse_prices
+
+if TYPE_CHECKING:
+    from semantic_kernel.agents import Agent, AzureAIAgentSettings, OrchestrationHandoffs
+
+# Read from the AZURE_AI_AGENT_* environment variables on first use
+ai_agent_settings: Optional["AzureAIAgentSettings"] = None
+
+# Spans of provisioning and agent runs per customer turn, exported to TRACE_EXPORT_PATH
+tracer = tracer_from_env("customer-support")
+print_trace_breakdown = os.getenv("TRACE_BREAKDOWN", "false").lower() == "true"
+
+# Customer messages with a clear intent go straight to the specialist instead of through a handoff turn
+intent_router = IntentRouter() if os.getenv("LOCAL_INTENT_ROUTER", "true").lower() == "true" else None
+
+# Token usage per agent, exported to USAGE_EXPORT_PATH; the conversation ends before it exceeds CONVERSATION_TOKEN_BUDGET
+conversation_token_budget = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "0"))
+usage_ledger = UsageLedger(
+    agent_names=tracer.agent_names,
+    prices=parse_prices(os.getenv("TOKEN_PRICES", "")),
+    budget=ConversationBudget(conversation_token_budget, compact=False) if conversation_token_budget else None,
 )
-from semantic_kernel.functions import kernel_function
 
-ai_agent_settings = AzureAIAgentSettings()
+# Sent for the customer once the input source has no more messages
+end_of_input_message = os.getenv("HUMAN_INPUT_END_MESSAGE", "Thank you, that's all.")
+
+# Deleted on exit and on SIGTERM: "threads" of the conversation, "all" also the cached agents, "none" nothing
+cleanup_on_exit = os.getenv("CLEANUP_ON_EXIT", "threads").lower()
+lifecycle = AsyncResourceRegistry("session2", ResourceJournal() if cleanup_on_exit != "none" else None)
+agent_names = ("SupportAgent", "OrderStatusAgent", "RefundAgent", "OrderReturnAgent")
+
+# The project client, the agents and the orchestration are needed only in main, their import overlaps with the
+# credential warm-up and the imports of this module
+preload("azure.ai.projects.aio", "semantic_kernel.agents.azure_ai.azure_ai_agent", "semantic_kernel.agents.orchestration.handoffs")
+
+
+# Orders, refunds and returns of the plugins, opened on first use and filled with synthetic orders if empty
+order_store: Optional[OrderStore] = None
+
+
+def get_ai_agent_settings() -> "AzureAIAgentSettings":
+    global ai_agent_settings
+    if ai_agent_settings is None:
+        from semantic_kernel.agents import AzureAIAgentSettings
+
+        ai_agent_settings = AzureAIAgentSettings()
+    return ai_agent_settings
+
+
+def get_order_store() -> OrderStore:
+    global order_store
+    if order_store is None:
+        # Read on first use, so a caller importing this module can still choose the database
+        order_store = OrderStore.open(
+            os.getenv("ORDER_STORE_PATH", DEFAULT_ORDER_STORE_PATH),
+            seed_orders=int(os.getenv("ORDER_STORE_SEED_ORDERS", str(DEFAULT_SEED_ORDERS))),
+        )
+    return order_store
+
+
+def agent_manifest_from_env() -> ProvisioningManifest:
+    """The manifest of the agents of previous runs, reused as long as their definition did not change.
+
+    Read from ``AGENT_MANIFEST_PATH`` at call time, not on import.
+    """
+    return ProvisioningManifest(scope=get_ai_agent_settings().endpoint)
 
 
 # Define the plugin for handling order-related tasks
 class OrderStatusPlugin:
+    def __init__(self, store: OrderStore):
+        self.store = store
+
     @kernel_function
-    def check_order_status(self, order_id: str) -> str:
+    async def check_order_status(self, order_id: str) -> str:
         """Check the status of an order."""
-        # Simulate checking the order status
-        return f"Order {order_id} is shipped and will arrive in 2-3 days."
+        try:
+            return (await self.store.get_order(order_id)).describe()
+        except OrderNotFoundError as error:
+            return str(error)
+
+    @kernel_function
+    async def check_order_statuses(self, order_ids: list[str]) -> str:
+        """Check the status of several orders at once."""
+        orders = await self.store.get_orders(order_ids)
+        return "\n".join(
+            orders[order_id.strip()].describe() if order_id.strip() in orders else f"Order {order_id} does not exist."
+            for order_id in order_ids
+        )
 
 # Define plugin for handling refunds
 class OrderRefundPlugin:
+    def __init__(self, store: OrderStore):
+        self.store = store
+
     @kernel_function
-    def process_refund(self, order_id: str, reason: str) -> str:
+    async def process_refund(self, order_id: str, reason: str) -> str:
         """Process a refund for an order."""
-        # Simulate processing a refund
-        print(f"Processing refund for order {order_id} due to: {reason}")
-        return f"Refund for order {order_id} has been processed successfully."
+        (result,) = await self.store.refund_orders([(order_id, reason)])
+        return result.message
+
+    @kernel_function
+    async def process_refunds(self, order_ids: list[str], reason: str) -> str:
+        """Process refunds for several orders with the same reason at once."""
+        results = await self.store.refund_orders([(order_id, reason) for order_id in order_ids])
+        return "\n".join(result.message for result in results)
 
 # Define plugin for handling order returns
 class OrderReturnPlugin:
+    def __init__(self, store: OrderStore):
+        self.store = store
+
     @kernel_function
-    def process_return(self, order_id: str, reason: str) -> str:
+    async def process_return(self, order_id: str, reason: str) -> str:
         """Process a return for an order."""
-        # Simulate processing a return
-        print(f"Processing return for order {order_id} due to: {reason}")
-        return f"Return for order {order_id} has been processed successfully."
+        (result,) = await self.store.return_orders([(order_id, reason)])
+        return result.message
+
+    @kernel_function
+    async def process_returns(self, order_ids: list[str], reason: str) -> str:
+        """Process returns of several orders with the same reason at once."""
+        results = await self.store.return_orders([(order_id, reason) for order_id in order_ids])
+        return "\n".join(result.message for result in results)
 
 
-async def get_agents(project_client, ai_agent_settings) -> tuple[list[Agent], OrchestrationHandoffs]:
+async def get_agents(
+    project_client, ai_agent_settings, agent_manifest: Optional[ProvisioningManifest] = None
+) -> tuple[list["Agent"], "OrchestrationHandoffs"]:
     """Return a list of agents that will participate in the Handoff orchestration and the handoff relationships.
 
     Feel free to add or remove agents and handoff connections.
+
+    Args:
+        agent_manifest (Optional[ProvisioningManifest]): The manifest of the reused agents,
+            by default the one of :func:`agent_manifest_from_env`.
     """
 
-    # Create the support agent in Azure AI Foundry
-    support_agent_definition = await project_client.agents.create_agent(
-        model=ai_agent_settings.model_deployment_name,
-        name="SupportAgent",
-        instructions="Handle customer support requests and triage them to the appropriate agents.",
-        description="A customer support agent that triages issues."
+    # Reuse agents from previous runs whose definition did not change
+    provisioner = AsyncAgentProvisioner(
+        project_client.agents,
+        agent_manifest or agent_manifest_from_env(),
+        verify=os.getenv("AGENT_MANIFEST_VERIFY", "false").lower() == "true",
+        metadata=lifecycle.tags,
     )
 
+    # The four agent definitions do not depend on each other, so they are provisioned concurrently
+    definitions = await run_provisioning_graph_async(
+        {
+            # Create the support agent in Azure AI Foundry
+            "SupportAgent": ProvisioningStep((), tracer.wrap("step SupportAgent", lambda _: provisioner.ensure_agent(
+                model=ai_agent_settings.model_deployment_name,
+                name="SupportAgent",
+                instructions="Handle customer support requests and triage them to the appropriate agents.",
+                description="A customer support agent that triages issues."
+            ))),
+            # Create the Order status agent
+            "OrderStatusAgent": ProvisioningStep((), tracer.wrap("step OrderStatusAgent", lambda _: provisioner.ensure_agent(
+                model=ai_agent_settings.model_deployment_name,
+                name="OrderStatusAgent",
+                description="A customer support agent that checks order status.",
+                instructions="Handle order status requests."
+            ))),
+            # Create the Refund agent
+            "RefundAgent": ProvisioningStep((), tracer.wrap("step RefundAgent", lambda _: provisioner.ensure_agent(
+                model=ai_agent_settings.model_deployment_name,
+                name="RefundAgent",
+                description="A customer support agent that handles refunds.",
+                instructions="Handle refund requests."
+            ))),
+            # Create the Order return agent
+            "OrderReturnAgent": ProvisioningStep((), tracer.wrap("step OrderReturnAgent", lambda _: provisioner.ensure_agent(
+                model=ai_agent_settings.model_deployment_name,
+                name="OrderReturnAgent",
+                description="A customer support agent that handles order returns.",
+                instructions="Handle order return requests."
+            ))),
+        },
+        max_concurrency=int(os.getenv("PROVISIONING_CONCURRENCY", "4")),
+    )
+
+    store = get_order_store()
+    from semantic_kernel.agents import AzureAIAgent, OrchestrationHandoffs
+
     # Create the created support agent as an AzureAIAgent instance
     support_agent = AzureAIAgent(
         client=project_client,
-        definition=support_agent_definition
+        definition=definitions["SupportAgent"]
     )
 
-
-     # Create the Order status agent
-    order_status_agent_definition = await project_client.agents.create_agent(
-        model=ai_agent_settings.model_deployment_name,
-        name="OrderStatusAgent",
-         description="A customer support agent that checks order status.",
-        instructions="Handle order status requests."
-    )
     order_status_agent = AzureAIAgent(
         client=project_client,
-        definition=order_status_agent_definition,
-        plugins=[OrderStatusPlugin()]
+        definition=definitions["OrderStatusAgent"],
+        plugins=[OrderStatusPlugin(store)]
     )
 
-    # Create the Refund agent
-    refund_agent_definition = await project_client.agents.create_agent(
-        model=ai_agent_settings.model_deployment_name,
-        name="RefundAgent",
-        description="A customer support agent that handles refunds.",
-        instructions="Handle refund requests."
-    )
     refund_agent = AzureAIAgent(
         client=project_client,
-        definition=refund_agent_definition,
-        plugins=[OrderRefundPlugin()]
+        definition=definitions["RefundAgent"],
+        plugins=[OrderRefundPlugin(store)]
     )
 
     # Order return agent as AzureAIAgent
-    order_return_agent_definition = await project_client.agents.create_agent(
-        model=ai_agent_settings.model_deployment_name,
-        name="OrderReturnAgent",
-         description="A customer support agent that handles order returns.",
-        instructions="Handle order return requests."
-    )
     order_return_agent = AzureAIAgent(
         client=project_client,
-        definition=order_return_agent_definition,
-        plugins=[OrderReturnPlugin()]
+        definition=definitions["OrderReturnAgent"],
+        plugins=[OrderReturnPlugin(store)]
     )
 
     # Define the handoff relationships between agents
@@ -135,11 +264,17 @@ async def get_agents(project_client, ai_agent_settings) -> tuple[list[Agent], Or
     return [support_agent, refund_agent, order_status_agent, order_return_agent], handoffs
 
 
-# Flag to indicate if a new message is being received
-is_new_message = True
+def output_sinks() -> list[OutputSink]:
+    """The terminal and the optional JSONL file and WebSocket endpoint of the agent output."""
+    sinks: list[OutputSink] = [TerminalSink()]
+    if os.getenv("OUTPUT_JSONL_PATH"):
+        sinks.append(JsonlSink(os.environ["OUTPUT_JSONL_PATH"]))
+    if os.getenv("OUTPUT_WEBSOCKET_URL"):
+        sinks.append(WebSocketSink(os.environ["OUTPUT_WEBSOCKET_URL"]))
+    return sinks
 
 
-def streaming_agent_response_callback(message: StreamingChatMessageContent, is_final: bool) -> None:
+def streaming_agent_response_callback(output: SessionOutput, message: StreamingChatMessageContent, is_final: bool) -> None:
     """Observer function to print the messages from the agents.
 
     Please note that this function is called whenever the agent generates a response,
@@ -150,67 +285,185 @@ def streaming_agent_response_callback(message: StreamingChatMessageContent, is_f
     complete message.
 
     Args:
+        output (SessionOutput): The buffered output of this orchestration.
         message (StreamingChatMessageContent): The streaming message content from the agent.
         is_final (bool): Indicates if this is the final part of the message.
     """
-    global is_new_message
-    if is_new_message:
-        print(f"{message.name}: ", end="", flush=True)
-        is_new_message = False
-    print(message.content, end="", flush=True)
+    output.write_message(message, is_final)
+
+    if intent_router:
+        from routed_handoff import observe_agent_message
+
+        observe_agent_message(intent_router, message, is_final)
 
-    for item in message.items:
-        if isinstance(item, FunctionCallContent):
-            print(f"Calling '{item.name}' with arguments '{item.arguments}'", end="", flush=True)
-        if isinstance(item, FunctionResultContent):
-            print(f"Result from '{item.name}' is '{item.result}'", end="", flush=True)
 
-    if is_final:
-        print()
-        is_new_message = True
+def print_local_route(output: SessionOutput, source_agent: str, target_agent: str) -> None:
+    """Show that a customer message was routed locally instead of by a handoff turn."""
+    output.info(f"Router: {source_agent} -> {target_agent} (local)")
 
 
-def human_response_function() -> ChatMessageContent:
+def human_input_source() -> HumanInput:
+    """The source of the customer messages: the terminal, an HTTP-fed queue or a transcript."""
+    source = os.getenv("HUMAN_INPUT", "script" if os.getenv("HUMAN_INPUT_SCRIPT") else "terminal").lower()
+    if source == "queue":
+        return QueueInput()
+    if source == "script":
+        return ScriptedInput.from_file(
+            os.environ["HUMAN_INPUT_SCRIPT"],
+            think_time=float(os.getenv("HUMAN_INPUT_THINK_TIME", "0")),
+            think_time_jitter=float(os.getenv("HUMAN_INPUT_THINK_TIME_JITTER", "0")),
+            echo=True,
+        )
+    return TerminalInput()
+
+
+async def collect_usage() -> None:
+    """Record the usage of the runs finished since the last call.
+
+    Semantic Kernel executes the runs, so they are read from the threads of the conversation.
+    """
+    with usage_ledger.turn("console"):
+        await usage_ledger.collect_runs(lifecycle.client, lifecycle.tracked("thread"))
+
+
+async def human_response_function(output: SessionOutput, human_input: HumanInput, input_ended: asyncio.Event) -> ChatMessageContent:
     """Observer function to print the messages from the agents."""
-    user_input = input("User: ")
+    # Everything since the last customer message belongs to one turn
+    tracer.end_root()
+    if print_trace_breakdown and tracer.enabled:
+        output.info(f"[Trace]\n{tracer.breakdown()}\n")
+    # The prompt must not overtake agent output that is still on its way to the terminal
+    await output.drain()
+    await collect_usage()
+    try:
+        if usage_ledger.check_budget("console") == BUDGET_STOP:
+            if not human_input.ended:
+                output.info(f"[Token budget used up: {usage_ledger.spent('console')} of {conversation_token_budget} tokens]")
+            # Treated like the end of the input, the agents may still complete the task once
+            raise EOFError()
+        user_input = await human_input.read("User: ")
+        while user_input.strip().lower() == "trace":
+            print(tracer.breakdown() if tracer.enabled else "Tracing is disabled (set TRACING=true).")
+            user_input = await human_input.read("User: ")
+    except EOFError:
+        if human_input.ended:
+            # The agents did not complete the task after the end message, the error ends the agent's
+            # loop and main stops waiting for the result
+            input_ended.set()
+            raise
+        # No more input, give the agents the chance to complete the task
+        human_input.ended = True
+        user_input = end_of_input_message
+        output.info(f"User: {user_input}")
+    tracer.start_root("turn")
     return ChatMessageContent(role=AuthorRole.USER, content=user_input)
 
 
 async def main():
     """Main function to run the agents."""
+    from azure.ai.projects.aio import AIProjectClient
+    from semantic_kernel.agents import HandoffOrchestration
+    from semantic_kernel.agents.runtime import InProcessRuntime
+
+    from routed_handoff import VERIFIED_SEMANTIC_KERNEL_VERSION, RoutedHandoffOrchestration, routing_supported
+
+    ai_agent_settings = get_ai_agent_settings()
     # 1. Create a handoff orchestration with multiple agents
-    
+    agent_manifest = agent_manifest_from_env()
+    if replaying:
+        credential = AsyncReplayCredential()
+    else:
+        # Without the warm-up of the script, e.g. when main is called by another module, the token is fetched now
+        credential = AsyncDeferredCredential(prefetch=token_prefetch or DeferredCredential().warm(AGENTS_SCOPE))
+
     async with (
-        DefaultAzureCredential() as creds,
-        AzureAIAgent.create_client(credential=creds, endpoint=ai_agent_settings.endpoint) as project_client,
+        AsyncTracedCredential(credential, tracer) as creds,
+        AIProjectClient(
+            credential=creds,
+            endpoint=ai_agent_settings.endpoint,
+            **({"transport": cassette.async_transport()} if cassette else {}),
+        ) as project_client,
+        OutputPipeline(output_sinks()) as output_pipeline,
+        lifecycle.cleanup_on_exit(
+            enabled=cleanup_on_exit != "none",
+            manifest=agent_manifest if cleanup_on_exit == "all" else None,
+            names=agent_names,
+            on_report=lambda report: print(f"Cleanup: {report.summary()}"),
+        ),
     ):
-    
-        agents, handoffs = await get_agents(project_client, ai_agent_settings)
+        # Track the conversation threads, so they are deleted on exit and found by the sweeper after a crash
+        lifecycle.watch(project_client.agents)
+        lifecycle.install_signal_handlers()
+        console = output_pipeline.session("console")
+        human_input = human_input_source()
+        input_ended = asyncio.Event()
+        input_endpoint = None
+        if isinstance(human_input, QueueInput):
+            host, _, port = os.getenv("HUMAN_INPUT_ADDRESS", "127.0.0.1:8081").rpartition(":")
+            input_endpoint = asyncio.create_task(human_input.serve(
+                host or "127.0.0.1", int(port), ready=lambda host, port: console.info(f"Customer messages: POST http://{host}:{port}/input")
+            ))
+        instrument_project_client(project_client, tracer)
+
+        with tracer.root_span("provisioning"):
+            agents, handoffs = await get_agents(project_client, ai_agent_settings, agent_manifest)
+        tracer.agent_names.update({agent.id: agent.name for agent in agents})
         
         # Create the handoff orchestration with the agents and handoffs
-        handoff_orchestration = HandoffOrchestration(
+        orchestration_options = dict(
             members=agents,
             handoffs=handoffs,
-            streaming_agent_response_callback=streaming_agent_response_callback,
-            human_response_function=human_response_function,
+            streaming_agent_response_callback=partial(streaming_agent_response_callback, console),
+            human_response_function=partial(human_response_function, console, human_input, input_ended),
         )
+        if intent_router and routing_supported():
+            handoff_orchestration = RoutedHandoffOrchestration(**orchestration_options, router=intent_router, on_route=partial(print_local_route, console))
+        else:
+            if intent_router:
+                print(f"Intent router disabled: it was verified with semantic-kernel {VERIFIED_SEMANTIC_KERNEL_VERSION} only")
+            handoff_orchestration = HandoffOrchestration(**orchestration_options)
 
         # 2. Create a runtime and start it
         runtime = InProcessRuntime()
         runtime.start()
 
         # 3. Invoke the orchestration with a task and the runtime
+        tracer.start_root("turn")
         orchestration_result = await handoff_orchestration.invoke(
             task="Greet the customer who is reaching out for support.",
             runtime=runtime,
         )
 
         # 4. Wait for the results
-        value = await orchestration_result.get()
-        print(value)
+        result = asyncio.ensure_future(orchestration_result.get())
+        ended = asyncio.ensure_future(input_ended.wait())
+        await asyncio.wait((result, ended), return_when=asyncio.FIRST_COMPLETED)
+        ended.cancel()
+        if result.done():
+            value = result.result()
+        else:
+            orchestration_result.cancel()
+            result.cancel()
+            value = "The customer input ended before the agents completed the task."
+        tracer.end_root()
 
         # 5. Stop the runtime after the invocation is complete
         await runtime.stop_when_idle()
+        await console.drain()
+        print(value)
+        await human_input.close()
+        if input_endpoint:
+            input_endpoint.cancel()
+
+        if intent_router:
+            print(f"Intent router: {intent_router.stats.summary()}")
+        await collect_usage()
+        if usage_ledger.total.calls:
+            print(f"Token usage, exported to {usage_ledger.export()}:\n{usage_ledger.summary()}")
+        if cassette:
+            print(f"Cassette {cassette.path}: {cassette.summary()}")
+        if order_store:
+            order_store.close()
 
     """
     Sample output:
@@ -248,4 +501,8 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    except asyncio.CancelledError:
+        # Cancelled by SIGTERM, the resources are already cleaned up
+        raise SystemExit(128 + signal.SIGTERM)
\ No newline at end of file
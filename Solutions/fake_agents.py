@@ -0,0 +1,975 @@
+"""In-process stand-in for the Azure AI Agents service.
+
+Benchmarks and CI cannot call the real service. :class:`FakeAgentsService` keeps agents,
+threads, messages and runs in memory and simulates the service behaviour that matters for
+performance: request latency, model latency of a run, streamed text deltas, the fan-out to
+connected agents, function tool round trips and transient failures. All latencies are drawn
+from log-normal distributions around configurable medians, so percentiles look like those of
+a real network service.
+
+Two facades expose the service with the SDK surface used in this repository:
+
+- :class:`FakeAgentsClient` replaces the synchronous ``AgentsClient`` of session 1, including
+  ``runs.stream`` with auto function calls.
+- :func:`fake_project_client` returns an ``AIProjectClient`` whose ``agents`` attribute is the
+  asynchronous :class:`FakeAsyncAgentsClient`, which is what Semantic Kernel's ``AzureAIAgent``
+  calls in session 2.
+
+Both return real SDK models, so streaming is parsed by the SDK's own event handlers. What the
+agents answer is decided by a responder callable, see :class:`Reply` and
+:func:`default_responder`.
+"""
+
+import asyncio
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, NamedTuple, Optional
+
+from azure.ai.agents.models import (
+    Agent,
+    AgentEventHandler,
+    AgentRunStream,
+    AgentThread,
+    AsyncAgentEventHandler,
+    AsyncAgentRunStream,
+    FileInfo,
+    FileListResponse,
+    MessageTextContent,
+    RunStep,
+    SubmitToolOutputsAction,
+    ThreadMessage,
+    ThreadRun,
+    ToolSet,
+    VectorStore,
+)
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+
+
+@dataclass
+class LatencyProfile:
+    """Median latencies in seconds of the simulated service.
+
+    Args:
+        api_call (float): A single REST request (create, get, list, ...).
+        run (float): Model time of one run segment until its answer or tool call is ready.
+        first_token (float): Delay until the first streamed text delta of an answer.
+        token_interval (float): Delay between two streamed text deltas.
+        connected_agent (float): Complete run of a connected agent.
+        upload (float): Upload and processing of a file.
+        vector_store (float): Creation and indexing of a vector store.
+        sigma (float): Spread of the log-normal distribution, 0 makes every latency the median.
+        time_scale (float): Factor applied to every latency, e.g. 0.01 for fast CI runs.
+    """
+
+    api_call: float = 0.05
+    run: float = 1.5
+    first_token: float = 0.4
+    token_interval: float = 0.02
+    connected_agent: float = 2.5
+    upload: float = 0.8
+    vector_store: float = 1.5
+    sigma: float = 0.35
+    time_scale: float = 1.0
+
+
+class Reply(NamedTuple):
+    """What an agent does in one run segment.
+
+    A segment either calls tools (``function_calls`` are answered by the client,
+    ``connected_agents`` run inside the service) or answers with ``text``.
+    """
+
+    text: str = ""
+    function_calls: tuple = ()
+    connected_agents: tuple = ()
+
+
+Responder = Callable[[dict, list[dict], list[dict], list[dict]], Reply]
+
+
+def tool_names(tools: list[dict]) -> list[str]:
+    """Return the names of the function and connected agent tools of a tool list."""
+    names = []
+    for tool in tools:
+        if tool.get("type") == "function":
+            names.append(tool["function"]["name"])
+        elif tool.get("type") == "connected_agent":
+            names.append(tool["connected_agent"]["name"])
+    return names
+
+
+def _word_count(text: Optional[str]) -> int:
+    return len(text.split()) if text else 0
+
+
+def last_user_text(messages: list[dict]) -> str:
+    """Return the text of the newest user message of a thread."""
+    for message in reversed(messages):
+        if message["role"] == "user":
+            return message["content"][0]["text"]["value"]
+    return ""
+
+
+def default_responder(agent: dict, messages: list[dict], tools: list[dict], tool_outputs: list[dict]) -> Reply:
+    """Call every connected agent once, then answer with a short text."""
+    connected = [tool["connected_agent"]["name"] for tool in tools if tool.get("type") == "connected_agent"]
+    if connected and not tool_outputs:
+        return Reply(connected_agents=tuple(connected))
+    request = last_user_text(messages)
+    return Reply(text=f"{agent['name']} hat die Anfrage „{request[:60]}“ bearbeitet. Alle Daten vollständig.")
+
+
+def _as_dict(value: Any) -> Any:
+    if hasattr(value, "as_dict"):
+        return value.as_dict()
+    if isinstance(value, dict):
+        return {key: _as_dict(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_as_dict(item) for item in value]
+    return value
+
+
+def _simulated_error(operation: str) -> HttpResponseError:
+    error = HttpResponseError(message=f"Simulated service error in {operation}")
+    error.status_code = 503
+    return error
+
+
+class _Run:
+    """Server side state of a run."""
+
+    def __init__(self, run_id: str, thread_id: str, agent: dict, tools: list[dict], created: float):
+        self.id = run_id
+        self.thread_id = thread_id
+        self.agent = agent
+        self.tools = tools
+        self.created = created
+        self.status = "queued"
+        self.ready_at = created
+        self.reply = Reply()
+        self.tool_outputs: list[dict] = []
+        self.pending_calls: list[dict] = []
+        self.steps: list[dict] = []
+        self.last_error: Optional[dict] = None
+        self.finished_at: Optional[float] = None
+        self.connected_durations: list[float] = []
+        # Words stand in for tokens: the prompt of the current segment and the totals of the run
+        self.segment_prompt_tokens = 0
+        self.prompt_tokens = 0
+        self.tokens = 0
+
+
+class FakeAgentsService:
+    """In-memory agents service with simulated latencies and failures.
+
+    Args:
+        latency (Optional[LatencyProfile]): The simulated latencies.
+        responder (Optional[Responder]): Decides what an agent does in a run segment, defaults
+            to :func:`default_responder`.
+        api_failure_rate (float): Probability that a request fails with a 503 error.
+        run_failure_rate (float): Probability that a run ends with status ``failed``.
+        parallel_connected_agents (bool): Run the connected agents of a segment concurrently
+            instead of one after the other.
+        seed (Optional[int]): Seed for latencies and failures to make runs reproducible.
+    """
+
+    def __init__(
+        self,
+        latency: Optional[LatencyProfile] = None,
+        responder: Optional[Responder] = None,
+        api_failure_rate: float = 0.0,
+        run_failure_rate: float = 0.0,
+        parallel_connected_agents: bool = False,
+        seed: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.latency = latency or LatencyProfile()
+        self.responder = responder or default_responder
+        self.api_failure_rate = api_failure_rate
+        self.run_failure_rate = run_failure_rate
+        self.parallel_connected_agents = parallel_connected_agents
+        self.clock = clock
+        self.agents: dict[str, dict] = {}
+        self.threads: dict[str, list[dict]] = {}
+        self.thread_info: dict[str, dict] = {}
+        self.runs: dict[str, _Run] = {}
+        self.files: dict[str, dict] = {}
+        self.vector_stores: dict[str, dict] = {}
+        self.timings: dict[str, dict[str, list[float]]] = {"api": {}, "agent": {}, "provisioning": {}}
+        self._rng = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+    # region Simulation
+
+    def sample(self, kind: str) -> float:
+        """Draw a latency of ``kind`` (a :class:`LatencyProfile` field) in seconds."""
+        median = getattr(self.latency, kind) * self.latency.time_scale
+        with self._lock:
+            factor = math.exp(self._rng.gauss(0.0, self.latency.sigma)) if self.latency.sigma else 1.0
+        return median * factor
+
+    def maybe_fail(self, operation: str) -> None:
+        """Raise a transient service error with the configured probability."""
+        with self._lock:
+            failed = self.api_failure_rate and self._rng.random() < self.api_failure_rate
+        if failed:
+            raise _simulated_error(operation)
+
+    def record(self, category: str, name: str, seconds: float) -> None:
+        with self._lock:
+            self.timings[category].setdefault(name, []).append(seconds)
+
+    def _new_id(self, prefix: str) -> str:
+        return f"{prefix}_{next(self._ids):06d}"
+
+    # endregion
+
+    # region Agents, files and vector stores
+
+    def create_agent(self, **definition: Any) -> Agent:
+        agent_id = self._new_id("asst")
+        with self._lock:
+            self.agents[agent_id] = {
+                "id": agent_id,
+                "object": "assistant",
+                "created_at": int(time.time()),
+                "description": None,
+                "instructions": "",
+                "tools": [],
+                "tool_resources": {},
+                "metadata": {},
+                **{key: value for key, value in _as_dict(definition).items() if value is not None},
+            }
+            return Agent(self.agents[agent_id])
+
+    def update_agent(self, agent_id: str, **definition: Any) -> Agent:
+        with self._lock:
+            if agent_id not in self.agents:
+                raise ResourceNotFoundError(f"Agent {agent_id} not found")
+            self.agents[agent_id].update(_as_dict(definition))
+            return Agent(self.agents[agent_id])
+
+    def get_agent(self, agent_id: str) -> Agent:
+        with self._lock:
+            if agent_id not in self.agents:
+                raise ResourceNotFoundError(f"Agent {agent_id} not found")
+            return Agent(self.agents[agent_id])
+
+    def delete_agent(self, agent_id: str) -> None:
+        with self._lock:
+            if self.agents.pop(agent_id, None) is None:
+                raise ResourceNotFoundError(f"Agent {agent_id} not found")
+
+    def list_agents(self) -> list[Agent]:
+        with self._lock:
+            return [Agent(agent) for agent in self.agents.values()]
+
+    def upload_file(self, file_path: str, purpose: Any = "assistants") -> FileInfo:
+        file_id = self._new_id("assistant-file")
+        with self._lock:
+            self.files[file_id] = {
+                "id": file_id,
+                "object": "file",
+                "bytes": 0,
+                "filename": str(file_path),
+                "created_at": int(time.time()),
+                "purpose": getattr(purpose, "value", purpose),
+                "status": "processed",
+            }
+            return FileInfo(self.files[file_id])
+
+    def delete_file(self, file_id: str) -> None:
+        with self._lock:
+            if self.files.pop(file_id, None) is None:
+                raise ResourceNotFoundError(f"File {file_id} not found")
+
+    def list_files(self) -> FileListResponse:
+        with self._lock:
+            return FileListResponse({"object": "list", "data": list(self.files.values())})
+
+    def create_vector_store(self, file_ids: Optional[list[str]] = None, name: Optional[str] = None, metadata: Optional[dict] = None, **_: Any) -> VectorStore:
+        vector_store_id = self._new_id("vs")
+        with self._lock:
+            self.vector_stores[vector_store_id] = {
+                "id": vector_store_id,
+                "object": "vector_store",
+                "created_at": int(time.time()),
+                "name": name,
+                "usage_bytes": 0,
+                "status": "completed",
+                "file_counts": {"in_progress": 0, "completed": len(file_ids or []), "failed": 0, "cancelled": 0, "total": len(file_ids or [])},
+                "last_active_at": int(time.time()),
+                "metadata": metadata or {},
+            }
+            return VectorStore(self.vector_stores[vector_store_id])
+
+    def get_vector_store(self, vector_store_id: str) -> VectorStore:
+        with self._lock:
+            if vector_store_id not in self.vector_stores:
+                raise ResourceNotFoundError(f"Vector store {vector_store_id} not found")
+            return VectorStore(self.vector_stores[vector_store_id])
+
+    def delete_vector_store(self, vector_store_id: str) -> None:
+        with self._lock:
+            if self.vector_stores.pop(vector_store_id, None) is None:
+                raise ResourceNotFoundError(f"Vector store {vector_store_id} not found")
+
+    def list_vector_stores(self) -> list[VectorStore]:
+        with self._lock:
+            return [VectorStore(vector_store) for vector_store in self.vector_stores.values()]
+
+    # endregion
+
+    # region Threads and messages
+
+    def create_thread(self, messages: Optional[list] = None, metadata: Optional[dict] = None, **_: Any) -> AgentThread:
+        thread_id = self._new_id("thread")
+        with self._lock:
+            self.threads[thread_id] = []
+            self.thread_info[thread_id] = {"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": metadata or {}}
+        for message in messages or []:
+            self.create_message(thread_id, role=message["role"], content=message["content"])
+        return AgentThread(self.thread_info[thread_id])
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            if self.threads.pop(thread_id, None) is None:
+                raise ResourceNotFoundError(f"Thread {thread_id} not found")
+            self.thread_info.pop(thread_id, None)
+
+    def list_threads(self) -> list[AgentThread]:
+        with self._lock:
+            return [AgentThread(info) for info in self.thread_info.values()]
+
+    def _thread(self, thread_id: str) -> list[dict]:
+        if thread_id not in self.threads:
+            raise ResourceNotFoundError(f"Thread {thread_id} not found")
+        return self.threads[thread_id]
+
+    def create_message(
+        self, thread_id: str, role: Any, content: Any, run: Optional[_Run] = None, message_id: Optional[str] = None, **_: Any
+    ) -> ThreadMessage:
+        role = getattr(role, "value", role)
+        text = content if isinstance(content, str) else json.dumps(_as_dict(content), ensure_ascii=False)
+        message = {
+            "id": message_id or self._new_id("msg"),
+            "object": "thread.message",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "status": "completed",
+            "role": "assistant" if role in ("assistant", "agent") else "user",
+            "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+            "assistant_id": run.agent["id"] if run else None,
+            "run_id": run.id if run else None,
+            "attachments": [],
+            "metadata": {},
+        }
+        with self._lock:
+            self._thread(thread_id).append(message)
+        return ThreadMessage(message)
+
+    def list_messages(self, thread_id: str, run_id: Optional[str] = None, order: Any = "desc", limit: Optional[int] = None) -> list[ThreadMessage]:
+        with self._lock:
+            messages = [message for message in self._thread(thread_id) if run_id is None or message["run_id"] == run_id]
+        if getattr(order, "value", order) == "desc":
+            messages = list(reversed(messages))
+        return [ThreadMessage(message) for message in messages]
+
+    def get_message(self, thread_id: str, message_id: str) -> ThreadMessage:
+        with self._lock:
+            for message in self._thread(thread_id):
+                if message["id"] == message_id:
+                    return ThreadMessage(message)
+        raise ResourceNotFoundError(f"Message {message_id} not found")
+
+    def last_message_text(self, thread_id: str, role: Any) -> Optional[MessageTextContent]:
+        role = "assistant" if getattr(role, "value", role) in ("assistant", "agent") else "user"
+        with self._lock:
+            for message in reversed(self._thread(thread_id)):
+                if message["role"] == role:
+                    return MessageTextContent(message["content"][0])
+        return None
+
+    # endregion
+
+    # region Runs
+
+    def create_run(self, thread_id: str, agent_id: str, tools: Optional[list] = None, **_: Any) -> ThreadRun:
+        with self._lock:
+            agent = self.get_agent(agent_id).as_dict()
+            self._thread(thread_id)
+            run = _Run(self._new_id("run"), thread_id, agent, _as_dict(tools) if tools else agent.get("tools", []), self.clock())
+            self.runs[run.id] = run
+        self._plan_segment(run)
+        return self._snapshot(run)
+
+    def _plan_segment(self, run: _Run) -> None:
+        """Ask the responder for the next segment and schedule when it is ready."""
+        with self._lock:
+            messages = list(self._thread(run.thread_id))
+        run.reply = self.responder(run.agent, messages, run.tools, run.tool_outputs)
+        run.segment_prompt_tokens = _word_count(run.agent.get("instructions")) + sum(
+            _word_count(message["content"][0]["text"]["value"]) for message in messages
+        ) + sum(_word_count(output.get("output")) for output in run.tool_outputs)
+        duration = self.sample("run")
+        connected = [self.sample("connected_agent") for _ in run.reply.connected_agents]
+        if connected:
+            duration += max(connected) if self.parallel_connected_agents else sum(connected)
+        run.connected_durations = connected
+        run.status = "in_progress"
+        run.ready_at = self.clock() + duration
+
+    def _finish_segment(self, run: _Run, message_id: Optional[str] = None) -> None:
+        """Apply the result of a segment once it is ready."""
+        with self._lock:
+            failed = self.run_failure_rate and self._rng.random() < self.run_failure_rate
+        if failed:
+            run.status = "failed"
+            run.last_error = {"code": "server_error", "message": "Simulated run failure"}
+            self._close(run)
+            return
+
+        for name, seconds in zip(run.reply.connected_agents, run.connected_durations):
+            self.record("agent", name, seconds)
+            output = f"{name}: Ergebnis für {last_user_text(self.threads.get(run.thread_id, []))[:40]}"
+            run.steps.append(
+                self._tool_step(run, {"type": "connected_agent", "connected_agent": {"name": name, "arguments": "{}", "output": output}}, completion_tokens=_word_count(output))
+            )
+            run.tool_outputs.append({"name": name, "output": output})
+        if run.reply.connected_agents and not run.reply.text and not run.reply.function_calls:
+            # The model continues after its connected agents returned
+            self._plan_segment(run)
+            return
+
+        if run.reply.function_calls:
+            run.pending_calls = [
+                {"id": self._new_id("call"), "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+                for name, arguments in run.reply.function_calls
+            ]
+            run.status = "requires_action"
+            return
+
+        message = self.create_message(run.thread_id, role="assistant", content=run.reply.text, run=run, message_id=message_id)
+        run.steps.append(self._step(run, {"type": "message_creation", "message_creation": {"message_id": message.id}}, completion_tokens=_word_count(run.reply.text)))
+        run.status = "completed"
+        self._close(run)
+
+    def _close(self, run: _Run) -> None:
+        run.finished_at = run.ready_at
+        self.record("agent", run.agent.get("name") or run.agent["id"], run.finished_at - run.created)
+
+    def _step(self, run: _Run, details: dict, status: str = "completed", completion_tokens: int = 0) -> dict:
+        step = {
+            "id": self._new_id("step"),
+            "object": "thread.run.step",
+            "type": details["type"],
+            "assistant_id": run.agent["id"],
+            "thread_id": run.thread_id,
+            "run_id": run.id,
+            "status": status,
+            "step_details": details,
+            "created_at": int(time.time()),
+            "completed_at": int(time.time()) if status == "completed" else None,
+        }
+        if status == "completed":
+            run.prompt_tokens += run.segment_prompt_tokens
+            run.tokens += completion_tokens
+            step["usage"] = {
+                "prompt_tokens": run.segment_prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": run.segment_prompt_tokens + completion_tokens,
+            }
+        return step
+
+    def _tool_step(self, run: _Run, tool_call: dict, status: str = "completed", completion_tokens: int = 0) -> dict:
+        return self._step(run, {"type": "tool_calls", "tool_calls": [{"id": self._new_id("call"), **tool_call}]}, status, completion_tokens)
+
+    def _advance(self, run: _Run, message_id: Optional[str] = None) -> None:
+        with self._lock:
+            while run.status == "in_progress" and self.clock() >= run.ready_at:
+                self._finish_segment(run, message_id)
+
+    def _snapshot(self, run: _Run) -> ThreadRun:
+        data = {
+            "id": run.id,
+            "object": "thread.run",
+            "thread_id": run.thread_id,
+            "assistant_id": run.agent["id"],
+            "status": run.status,
+            "created_at": int(time.time()),
+            "model": run.agent.get("model", "fake-model"),
+            "instructions": run.agent.get("instructions") or "",
+            "tools": run.tools,
+            "last_error": run.last_error,
+            "usage": {"prompt_tokens": run.prompt_tokens, "completion_tokens": run.tokens, "total_tokens": run.prompt_tokens + run.tokens} if run.finished_at else None,
+            "metadata": {},
+            "parallel_tool_calls": True,
+        }
+        if run.status == "requires_action":
+            data["required_action"] = {"type": "submit_tool_outputs", "submit_tool_outputs": {"tool_calls": run.pending_calls}}
+        return ThreadRun(data)
+
+    def _run(self, run_id: str) -> _Run:
+        if run_id not in self.runs:
+            raise ResourceNotFoundError(f"Run {run_id} not found")
+        return self.runs[run_id]
+
+    def get_run(self, run_id: str) -> ThreadRun:
+        with self._lock:
+            run = self._run(run_id)
+            self._advance(run)
+            return self._snapshot(run)
+
+    def submit_tool_outputs(self, run_id: str, tool_outputs: Optional[list] = None, **_: Any) -> ThreadRun:
+        with self._lock:
+            run = self._run(run_id)
+            if run.status != "requires_action":
+                raise HttpResponseError(message=f"Run {run_id} is not waiting for tool outputs")
+            run.tool_outputs.extend(_as_dict(tool_outputs or []))
+            for call in run.pending_calls:
+                run.steps.append(self._step(run, {"type": "tool_calls", "tool_calls": [call]}, completion_tokens=_word_count(call["function"]["arguments"])))
+            run.pending_calls = []
+        self._plan_segment(run)
+        return self._snapshot(run)
+
+    def cancel_run(self, run_id: str) -> ThreadRun:
+        with self._lock:
+            run = self._run(run_id)
+            if run.status not in ("completed", "failed", "cancelled", "expired"):
+                run.status = "cancelled"
+                run.finished_at = self.clock()
+            return self._snapshot(run)
+
+    def list_runs(self, thread_id: str, order: Any = "desc") -> list[ThreadRun]:
+        with self._lock:
+            self._thread(thread_id)
+            runs = [self._snapshot(run) for run in self.runs.values() if run.thread_id == thread_id]
+        return list(reversed(runs)) if getattr(order, "value", order) == "desc" else runs
+
+    def list_run_steps(self, run_id: str) -> list[RunStep]:
+        with self._lock:
+            return [RunStep(step) for step in self._run(run_id).steps]
+
+    def stream_events(self, run_id: str, resumed: bool = False) -> Iterator[tuple[float, str, Callable[[], Any]]]:
+        """Yield the server-sent events of a run as ``(delay, event, payload)``.
+
+        ``payload`` is called after the delay has passed and returns the event data, so the run
+        state only changes when the event is actually delivered. ``resumed`` streams continue a
+        run after its tool outputs were submitted.
+        """
+        run = self._run(run_id)
+        if not resumed:
+            yield 0.0, "thread.run.created", lambda: self._snapshot(run).as_dict()
+        yield 0.0, "thread.run.in_progress", lambda: self._snapshot(run).as_dict()
+
+        while True:
+            # Connected agents show up as tool call steps while they run
+            for name, seconds in zip(run.reply.connected_agents, run.connected_durations):
+                pending = self._tool_step(run, {"type": "connected_agent", "connected_agent": {"name": name, "arguments": "{}"}}, "in_progress")
+                yield 0.0, "thread.run.step.created", lambda pending=pending: pending
+                completed = dict(pending, status="completed", completed_at=int(time.time()))
+                completed["step_details"] = {
+                    "type": "tool_calls",
+                    "tool_calls": [dict(pending["step_details"]["tool_calls"][0], connected_agent={"name": name, "arguments": "{}", "output": "ok"})],
+                }
+                yield seconds, "thread.run.step.completed", lambda completed=completed: completed
+
+            remaining = max(0.0, run.ready_at - self.clock())
+            if not run.reply.text or run.reply.function_calls:
+                yield remaining, "", lambda: self._advance(run)
+                if run.status == "in_progress":
+                    continue
+                break
+
+            # Stream the answer word by word, the model time is spent before the first token
+            words = run.reply.text.split(" ")
+            message_id = self._new_id("msg")
+            yield max(remaining, self.sample("first_token")), "thread.message.created", lambda: {
+                "id": message_id, "object": "thread.message", "thread_id": run.thread_id, "role": "assistant",
+                "status": "in_progress", "content": [], "created_at": int(time.time()), "assistant_id": run.agent["id"], "run_id": run.id,
+            }
+            for index, word in enumerate(words):
+                chunk = word if index == len(words) - 1 else word + " "
+                yield self.sample("token_interval") if index else 0.0, "thread.message.delta", lambda chunk=chunk: {
+                    "id": message_id, "object": "thread.message.delta",
+                    "delta": {"role": "assistant", "content": [{"index": 0, "type": "text", "text": {"value": chunk}}]},
+                }
+            run.ready_at = min(run.ready_at, self.clock())
+            yield 0.0, "", lambda: self._advance(run, message_id)
+            break
+
+        if run.status == "completed":
+            message = run.steps[-1]["step_details"]["message_creation"]["message_id"]
+            yield 0.0, "thread.message.completed", lambda: self.get_message(run.thread_id, message).as_dict()
+            yield 0.0, "thread.run.step.completed", lambda: run.steps[-1]
+            yield 0.0, "thread.run.completed", lambda: self._snapshot(run).as_dict()
+            yield 0.0, "done", lambda: "[DONE]"
+        elif run.status == "requires_action":
+            yield 0.0, "thread.run.requires_action", lambda: self._snapshot(run).as_dict()
+        else:
+            yield 0.0, f"thread.run.{run.status}", lambda: self._snapshot(run).as_dict()
+            yield 0.0, "done", lambda: "[DONE]"
+
+    # endregion
+
+
+def _sse(event: str, payload: Any) -> bytes:
+    data = payload if isinstance(payload, str) else json.dumps(payload if isinstance(payload, dict) else _as_dict(payload))
+    return f"event: {event}\ndata: {data}\n\n".encode("utf-8")
+
+
+class _Operations:
+    """Operation group of a fake client, e.g. ``client.threads``.
+
+    Simple operations are listed in ``_forward`` as ``name: service method`` and are executed
+    after the simulated request latency, the remaining ones are implemented by subclasses.
+    """
+
+    _group = ""
+    _forward: dict[str, str] = {}
+
+    def __init__(self, client):
+        self._client = client
+        self._service = client.service
+
+    def __getattr__(self, name: str):
+        target = type(self)._forward.get(name)
+        if target is None:
+            raise AttributeError(name)
+        return self._client._request(f"{self._group}.{name}", getattr(self._service, target))
+
+
+class _Threads(_Operations):
+    _group = "threads"
+    _forward = {"create": "create_thread", "delete": "delete_thread"}
+
+
+class _Messages(_Operations):
+    _group = "messages"
+    _forward = {"create": "create_message", "get": "get_message", "get_last_message_text_by_role": "last_message_text"}
+
+
+class _Files(_Operations):
+    _group = "files"
+    _forward = {"delete": "delete_file"}
+
+
+class _VectorStores(_Operations):
+    _group = "vector_stores"
+    _forward = {"get": "get_vector_store", "delete": "delete_vector_store"}
+
+
+class _Runs(_Operations):
+    _group = "runs"
+    _forward = {"create": "create_run"}
+
+
+class _SyncClientBase:
+    def __init__(self, service: FakeAgentsService):
+        self.service = service
+
+    def _request(self, name: str, function: Callable) -> Callable:
+        def request(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            time.sleep(self.service.sample("api_call"))
+            try:
+                self.service.maybe_fail(name)
+                return function(*args, **kwargs)
+            finally:
+                self.service.record("api", name, time.perf_counter() - started)
+
+        return request
+
+    def _events(self, run_id: str, resumed: bool = False) -> Iterator[bytes]:
+        for delay, event, payload in self.service.stream_events(run_id, resumed):
+            if delay:
+                time.sleep(delay)
+            data = payload()
+            if event:
+                yield _sse(event, data)
+
+
+class _SyncThreads(_Threads):
+    def list(self, **_: Any) -> list[AgentThread]:
+        return self._client._request("threads.list", self._service.list_threads)()
+
+
+class _SyncMessages(_Messages):
+    def list(self, thread_id: str, run_id: Optional[str] = None, order: Any = "desc", limit: Optional[int] = None, **_: Any):
+        return self._client._request("messages.list", self._service.list_messages)(thread_id, run_id=run_id, order=order, limit=limit)
+
+
+class _SyncRunSteps(_Operations):
+    _group = "run_steps"
+
+    def list(self, thread_id: str, run_id: str, **_: Any):
+        return self._client._request("run_steps.list", self._service.list_run_steps)(run_id)
+
+
+class _SyncFiles(_Files):
+    def list(self, **_: Any) -> FileListResponse:
+        return self._client._request("files.list", self._service.list_files)()
+
+    def upload_and_poll(self, file_path: str, purpose: Any = "assistants", **_: Any) -> FileInfo:
+        time.sleep(self._service.sample("upload"))
+        return self._client._request("files.upload_and_poll", self._service.upload_file)(file_path, purpose)
+
+
+class _SyncVectorStores(_VectorStores):
+    def create_and_poll(self, file_ids: Optional[list[str]] = None, name: Optional[str] = None, **kwargs: Any) -> VectorStore:
+        time.sleep(self._service.sample("vector_store"))
+        return self._client._request("vector_stores.create_and_poll", self._service.create_vector_store)(file_ids=file_ids, name=name, **kwargs)
+
+    def list(self, **_: Any) -> list[VectorStore]:
+        return self._client._request("vector_stores.list", self._service.list_vector_stores)()
+
+
+class _SyncRuns(_Runs):
+    def get(self, thread_id: str, run_id: str, **_: Any) -> ThreadRun:
+        return self._client._request("runs.get", self._service.get_run)(run_id)
+
+    def cancel(self, thread_id: str, run_id: str, **_: Any) -> ThreadRun:
+        return self._client._request("runs.cancel", self._service.cancel_run)(run_id)
+
+    def submit_tool_outputs(self, thread_id: str, run_id: str, tool_outputs: Optional[list] = None, **kwargs: Any) -> ThreadRun:
+        return self._client._request("runs.submit_tool_outputs", self._service.submit_tool_outputs)(run_id, tool_outputs, **kwargs)
+
+    def create_and_process(self, thread_id: str, agent_id: str, polling_interval: float = 1.0, **kwargs: Any) -> ThreadRun:
+        run = self.create(thread_id=thread_id, agent_id=agent_id, **kwargs)
+        while run.status in ("queued", "in_progress", "requires_action"):
+            time.sleep(polling_interval * self._service.latency.time_scale)
+            run = self.get(thread_id=thread_id, run_id=run.id)
+            if run.status == "requires_action" and isinstance(run.required_action, SubmitToolOutputsAction):
+                toolset = self._client._toolset
+                if toolset is None:
+                    run = self.cancel(thread_id=thread_id, run_id=run.id)
+                    break
+                outputs = toolset.execute_tool_calls(run.required_action.submit_tool_outputs.tool_calls)
+                run = self.submit_tool_outputs(thread_id=thread_id, run_id=run.id, tool_outputs=outputs)
+        return run
+
+    def stream(self, thread_id: str, agent_id: str, event_handler=None, **kwargs: Any) -> AgentRunStream:
+        run = self.create(thread_id=thread_id, agent_id=agent_id, **kwargs)
+        handler = event_handler or AgentEventHandler()
+        return AgentRunStream(self._client._events(run.id), self._handle_submit_tool_outputs, handler)
+
+    def submit_tool_outputs_stream(self, thread_id: str, run_id: str, tool_outputs: list, event_handler, **kwargs: Any) -> None:
+        self.submit_tool_outputs(thread_id=thread_id, run_id=run_id, tool_outputs=tool_outputs, **kwargs)
+        event_handler.initialize(self._client._events(run_id, resumed=True), self._handle_submit_tool_outputs)
+
+    def _handle_submit_tool_outputs(self, run: ThreadRun, event_handler, submit_with_error: bool) -> Any:
+        # Same as the SDK: only local functions registered with enable_auto_function_calls run here
+        toolset = self._client._toolset
+        if toolset is None or not isinstance(run.required_action, SubmitToolOutputsAction):
+            return []
+        outputs = toolset.execute_tool_calls(run.required_action.submit_tool_outputs.tool_calls)
+        if outputs:
+            self.submit_tool_outputs_stream(thread_id=run.thread_id, run_id=run.id, tool_outputs=outputs, event_handler=event_handler)
+        return outputs
+
+    def list(self, thread_id: str, order: Any = "desc", **_: Any) -> list[ThreadRun]:
+        return self._client._request("runs.list", self._service.list_runs)(thread_id, order=order)
+
+
+class FakeAgentsClient(_SyncClientBase):
+    """Synchronous ``AgentsClient`` backed by a :class:`FakeAgentsService`."""
+
+    def __init__(self, service: Optional[FakeAgentsService] = None):
+        super().__init__(service or FakeAgentsService())
+        self._toolset: Optional[ToolSet] = None
+        self.threads = _SyncThreads(self)
+        self.messages = _SyncMessages(self)
+        self.runs = _SyncRuns(self)
+        self.run_steps = _SyncRunSteps(self)
+        self.files = _SyncFiles(self)
+        self.vector_stores = _SyncVectorStores(self)
+
+    def __enter__(self) -> "FakeAgentsClient":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        pass
+
+    def create_agent(self, **definition: Any) -> Agent:
+        started = time.perf_counter()
+        agent = self._request("create_agent", self.service.create_agent)(**definition)
+        self.service.record("provisioning", agent.name, time.perf_counter() - started)
+        return agent
+
+    def update_agent(self, agent_id: str, **definition: Any) -> Agent:
+        started = time.perf_counter()
+        agent = self._request("update_agent", self.service.update_agent)(agent_id, **definition)
+        self.service.record("provisioning", agent.name, time.perf_counter() - started)
+        return agent
+
+    def get_agent(self, agent_id: str, **_: Any) -> Agent:
+        return self._request("get_agent", self.service.get_agent)(agent_id)
+
+    def delete_agent(self, agent_id: str, **_: Any) -> None:
+        return self._request("delete_agent", self.service.delete_agent)(agent_id)
+
+    def list_agents(self, **_: Any) -> list[Agent]:
+        return self._request("list_agents", self.service.list_agents)()
+
+    def create_thread_and_run(self, agent_id: str, thread=None, **kwargs: Any) -> ThreadRun:
+        messages = [{"role": message.role, "content": message.content} for message in (thread.messages if thread else None) or []]
+        new_thread = self.threads.create(messages=messages)
+        return self.runs.create(thread_id=new_thread.id, agent_id=agent_id, **kwargs)
+
+    def enable_auto_function_calls(self, tools: ToolSet, **_: Any) -> None:
+        self._toolset = tools
+
+
+class _AsyncPaged:
+    """Async iterator over the result of a listing request, like ``AsyncItemPaged``."""
+
+    def __init__(self, fetch: Callable):
+        self._fetch = fetch
+        self._items: Optional[Iterator] = None
+
+    def __aiter__(self) -> "_AsyncPaged":
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._items is None:
+            self._items = iter(await self._fetch())
+        try:
+            return next(self._items)
+        except StopIteration:
+            raise StopAsyncIteration from None
+
+
+class _AsyncMessages(_Messages):
+    def list(self, thread_id: str, run_id: Optional[str] = None, order: Any = "desc", limit: Optional[int] = None, **_: Any) -> _AsyncPaged:
+        request = self._client._request("messages.list", self._service.list_messages)
+        return _AsyncPaged(lambda: request(thread_id, run_id=run_id, order=order, limit=limit))
+
+
+class _AsyncRunSteps(_Operations):
+    _group = "run_steps"
+
+    def list(self, thread_id: str, run_id: str, **_: Any) -> _AsyncPaged:
+        request = self._client._request("run_steps.list", self._service.list_run_steps)
+        return _AsyncPaged(lambda: request(run_id))
+
+
+class _AsyncRuns(_Runs):
+    async def get(self, thread_id: str, run_id: str, **_: Any) -> ThreadRun:
+        return await self._client._request("runs.get", self._service.get_run)(run_id)
+
+    async def cancel(self, thread_id: str, run_id: str, **_: Any) -> ThreadRun:
+        return await self._client._request("runs.cancel", self._service.cancel_run)(run_id)
+
+    async def submit_tool_outputs(self, thread_id: str, run_id: str, tool_outputs: Optional[list] = None, **kwargs: Any) -> ThreadRun:
+        return await self._client._request("runs.submit_tool_outputs", self._service.submit_tool_outputs)(run_id, tool_outputs, **kwargs)
+
+    async def stream(self, thread_id: str, agent_id: str, event_handler=None, **kwargs: Any) -> AsyncAgentRunStream:
+        run = await self.create(thread_id=thread_id, agent_id=agent_id, **kwargs)
+        handler = event_handler or AsyncAgentEventHandler()
+        return AsyncAgentRunStream(self._client._events(run.id), self._handle_submit_tool_outputs, handler)
+
+    async def submit_tool_outputs_stream(self, thread_id: str, run_id: str, tool_outputs: list, event_handler, **kwargs: Any) -> None:
+        await self.submit_tool_outputs(thread_id=thread_id, run_id=run_id, tool_outputs=tool_outputs, **kwargs)
+        event_handler.initialize(self._client._events(run_id, resumed=True), self._handle_submit_tool_outputs)
+
+    async def _handle_submit_tool_outputs(self, run: ThreadRun, event_handler, submit_with_error: bool) -> Any:
+        # Semantic Kernel answers function calls itself, there are no auto function calls
+        return []
+
+    def list(self, thread_id: str, order: Any = "desc", **_: Any) -> _AsyncPaged:
+        request = self._client._request("runs.list", self._service.list_runs)
+        return _AsyncPaged(lambda: request(thread_id, order=order))
+
+
+class FakeAsyncAgentsClient:
+    """Asynchronous ``AgentsClient`` backed by a :class:`FakeAgentsService`."""
+
+    def __init__(self, service: Optional[FakeAgentsService] = None):
+        self.service = service or FakeAgentsService()
+        self.threads = _Threads(self)
+        self.messages = _AsyncMessages(self)
+        self.runs = _AsyncRuns(self)
+        self.run_steps = _AsyncRunSteps(self)
+
+    def _request(self, name: str, function: Callable) -> Callable:
+        async def request(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            await asyncio.sleep(self.service.sample("api_call"))
+            try:
+                self.service.maybe_fail(name)
+                return function(*args, **kwargs)
+            finally:
+                self.service.record("api", name, time.perf_counter() - started)
+
+        return request
+
+    async def _events(self, run_id: str, resumed: bool = False):
+        for delay, event, payload in self.service.stream_events(run_id, resumed):
+            if delay:
+                await asyncio.sleep(delay)
+            data = payload()
+            if event:
+                yield _sse(event, data)
+
+    async def __aenter__(self) -> "FakeAsyncAgentsClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        pass
+
+    async def create_agent(self, **definition: Any) -> Agent:
+        started = time.perf_counter()
+        agent = await self._request("create_agent", self.service.create_agent)(**definition)
+        self.service.record("provisioning", agent.name, time.perf_counter() - started)
+        return agent
+
+    async def update_agent(self, agent_id: str, **definition: Any) -> Agent:
+        started = time.perf_counter()
+        agent = await self._request("update_agent", self.service.update_agent)(agent_id, **definition)
+        self.service.record("provisioning", agent.name, time.perf_counter() - started)
+        return agent
+
+    async def get_agent(self, agent_id: str, **_: Any) -> Agent:
+        return await self._request("get_agent", self.service.get_agent)(agent_id)
+
+    async def delete_agent(self, agent_id: str, **_: Any) -> None:
+        return await self._request("delete_agent", self.service.delete_agent)(agent_id)
+
+
+def fake_project_client(service: Optional[FakeAgentsService] = None):
+    """Return an async ``AIProjectClient`` whose ``agents`` operations use the fake service.
+
+    Semantic Kernel validates that ``AzureAIAgent.client`` is an ``AIProjectClient``, so the
+    fake is a subclass that skips the constructor of the real client.
+    """
+    try:
+        from azure.ai.projects.aio import AIProjectClient
+    except ImportError as error:
+        raise ImportError("The fake project client needs 'azure-ai-projects': pip install azure-ai-projects") from error
+
+    class FakeAIProjectClient(AIProjectClient):
+        def __init__(self, agents: FakeAsyncAgentsClient):  # pylint: disable=super-init-not-called
+            self.agents = agents
+
+        async def __aenter__(self) -> "FakeAIProjectClient":
+            return self
+
+        async def __aexit__(self, *exc_info: Any) -> None:
+            pass
+
+        async def close(self) -> None:
+            pass
+
+    return FakeAIProjectClient(FakeAsyncAgentsClient(service))
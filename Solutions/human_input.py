@@ -0,0 +1,212 @@
+"""Asynchronous sources of the customer messages of the handoff orchestration.
+
+``input()`` inside the ``human_response_function`` blocks the event loop, so the
+``InProcessRuntime`` and everything else on the loop stands still while the customer types.
+The sources here are awaited instead:
+
+* :class:`TerminalInput` reads the terminal on a background thread,
+* :class:`QueueInput` hands out messages put into a queue, e.g. by its HTTP endpoint
+  (``POST /input`` with ``{"text": "..."}``),
+* :class:`ScriptedInput` replays a transcript with an optional think-time per message, for
+  unattended and repeatable runs.
+
+All sources raise ``EOFError`` once no further message will come, like ``input()`` does at the
+end of its input.
+"""
+
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+from functools import partial
+from typing import Callable, Optional
+
+from agent_service import handle_json_connection
+
+USER_PREFIX = "User:"
+
+
+class HumanInput:
+    """A source of customer messages."""
+
+    # Set by the consumer once it has reacted to the end of the input
+    ended = False
+
+    async def read(self, prompt: str = "") -> str:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class TerminalInput(HumanInput):
+    """Read lines from ``stdin`` without blocking the event loop.
+
+    A single daemon thread reads the stream for the whole session and queues its lines, so a
+    pending read never keeps the process alive, and a line that arrives after a read was
+    cancelled is handed to the next read instead of being lost.
+    """
+
+    def __init__(self, stream=None, prompt_stream=None):
+        self.stream = stream or sys.stdin
+        self.prompt_stream = prompt_stream or sys.stdout
+        self._lines: Optional[asyncio.Queue] = None
+        self._at_end = False
+
+    def _read_lines(self, loop: asyncio.AbstractEventLoop, lines: asyncio.Queue) -> None:
+        while True:
+            try:
+                line = self.stream.readline()
+                # None marks the end of the input
+                item = line.rstrip("\r\n") if line else None
+            except Exception as error:
+                item = error
+            try:
+                loop.call_soon_threadsafe(lines.put_nowait, item)
+            except RuntimeError:
+                # The event loop is closed, nobody reads anymore
+                return
+            if not isinstance(item, str):
+                return
+
+    async def read(self, prompt: str = "") -> str:
+        if self._at_end:
+            raise EOFError()
+        if self._lines is None:
+            self._lines = asyncio.Queue()
+            threading.Thread(
+                target=self._read_lines, args=(asyncio.get_running_loop(), self._lines), daemon=True, name="terminal-input"
+            ).start()
+        self.prompt_stream.write(prompt)
+        self.prompt_stream.flush()
+        item = await self._lines.get()
+        if isinstance(item, str):
+            return item
+        self._at_end = True
+        raise item or EOFError()
+
+
+class QueueInput(HumanInput):
+    """Hand out the messages of a queue in the order they were put.
+
+    Args:
+        timeout (Optional[float]): Seconds to wait for a message before ``read`` raises
+            ``EOFError``, ``None`` waits forever.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = timeout
+        self.waiting = False
+        self._queue: asyncio.Queue[Optional[str]] = asyncio.Queue()
+        self._closed = False
+
+    def put(self, text: str) -> int:
+        """Queue a message and return the number of queued messages."""
+        if self._closed:
+            raise EOFError("The input is closed")
+        self._queue.put_nowait(text)
+        return self._queue.qsize()
+
+    async def read(self, prompt: str = "") -> str:
+        if self._closed and self._queue.empty():
+            raise EOFError()
+        self.waiting = True
+        try:
+            text = await asyncio.wait_for(self._queue.get(), self.timeout)
+        except asyncio.TimeoutError:
+            raise EOFError(f"No input within {self.timeout} s") from None
+        finally:
+            self.waiting = False
+        if text is None:
+            raise EOFError()
+        return text
+
+    async def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._queue.put_nowait(None)
+
+    async def _route(self, method: str, path: str, body: bytes) -> tuple[int, dict]:
+        if path == "/health":
+            return (200, {"waiting": self.waiting, "queued": self._queue.qsize()}) if method == "GET" else (405, {"error": "Method not allowed"})
+        if path != "/input":
+            return 404, {"error": "Unknown path"}
+        if method != "POST":
+            return 405, {"error": "Method not allowed"}
+        try:
+            text = json.loads(body or b"{}").get("text")
+        except (json.JSONDecodeError, AttributeError):
+            return 400, {"error": "Invalid JSON"}
+        if not isinstance(text, str) or not text.strip():
+            return 400, {"error": "'text' is missing"}
+        try:
+            return 200, {"queued": self.put(text)}
+        except EOFError:
+            return 400, {"error": "The input is closed"}
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8081, ready: Optional[Callable[[str, int], None]] = None) -> None:
+        """Accept messages over HTTP until cancelled."""
+        server = await asyncio.start_server(partial(handle_json_connection, route=self._route), host, port)
+        if ready:
+            ready(*server.sockets[0].getsockname()[:2])
+        async with server:
+            await server.serve_forever()
+
+
+class ScriptedInput(HumanInput):
+    """Replay the customer messages of a transcript.
+
+    Args:
+        messages (list[str]): The messages in order.
+        think_time (float): Seconds to wait before each message.
+        think_time_jitter (float): Up to this many seconds are added to or removed from each
+            think-time, drawn with ``seed`` so runs are repeatable.
+        echo (bool): Print the prompt and the message like a terminal session.
+        seed (int): Seed of the think-time jitter.
+    """
+
+    def __init__(
+        self,
+        messages: list[str],
+        think_time: float = 0.0,
+        think_time_jitter: float = 0.0,
+        echo: bool = False,
+        seed: int = 0,
+    ):
+        self.messages = list(messages)
+        self.think_time = think_time
+        self.think_time_jitter = think_time_jitter
+        self.echo = echo
+        self.position = 0
+        # Seconds between the prompt and the message, per message
+        self.wait_times: list[float] = []
+        self._random = random.Random(seed)
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "ScriptedInput":
+        """Load a transcript.
+
+        Every non-empty line that does not start with ``#`` is a message. If some lines start
+        with ``User:``, e.g. in a recorded console session, only these lines are replayed.
+        """
+        with open(path, encoding="utf-8") as transcript:
+            lines = [line.strip() for line in transcript if line.strip() and not line.lstrip().startswith("#")]
+        if any(line.startswith(USER_PREFIX) for line in lines):
+            lines = [line[len(USER_PREFIX):].strip() for line in lines if line.startswith(USER_PREFIX)]
+        return cls(lines, **kwargs)
+
+    async def read(self, prompt: str = "") -> str:
+        if self.position >= len(self.messages):
+            raise EOFError()
+        started = time.perf_counter()
+        text = self.messages[self.position]
+        self.position += 1
+        delay = self.think_time + self._random.uniform(-self.think_time_jitter, self.think_time_jitter) if self.think_time_jitter else self.think_time
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.wait_times.append(time.perf_counter() - started)
+        if self.echo:
+            print(f"{prompt}{text}")
+        return text
@@ -0,0 +1,274 @@
+"""Local intent classification of customer messages for the support handoff.
+
+Every customer message of session 2 is answered by the agent that currently has the
+conversation. If that is the ``SupportAgent`` or the wrong specialist, a full model turn is
+spent just to call a ``Handoff-transfer_to_...`` function, and a specialist can only reach
+another specialist through the ``SupportAgent``. :class:`IntentRouter` classifies the message
+locally with weighted keyword patterns (English and German) and order ID patterns, so messages
+with an unambiguous intent can be delivered straight to the right specialist. Unclear
+messages are left to the agents.
+
+The patterns were written against :data:`EXAMPLES`. :data:`HELD_OUT_EXAMPLES` were collected
+separately and never used to tune them, so only they estimate the behaviour on real messages:
+every confident route is correct, but only about 60% of the messages with a clear intent are
+routed locally, the rest cost the usual handoff turn. Run the module to evaluate both sets::
+
+    python intent_router.py
+"""
+
+import re
+import sys
+from dataclasses import dataclass
+from typing import NamedTuple, Optional
+
+TRIAGE_AGENT = "SupportAgent"
+
+INTENT_AGENTS = {
+    "order_status": "OrderStatusAgent",
+    "refund": "RefundAgent",
+    "order_return": "OrderReturnAgent",
+}
+
+# (pattern, weight) per intent; a score of 1.0 is enough for an unambiguous message
+INTENT_PATTERNS = {
+    "order_status": [
+        (r"\b(track(ing)?|status|where is|where's|shipped|eta)\b", 1.0),
+        (r"\b(sendungsverfolgung|status|wo (ist|bleibt)|versandt|versendet|zugestellt)\b", 1.0),
+        (r"\b((has|have|did)(n't| not) (yet )?(arrived|come|been delivered)|still waiting|noch nicht (angekommen|geliefert|da))\b", 1.0),
+        # Deliveries are also mentioned when something arrived broken
+        (r"\b(shipping|deliver(y|ed)?|arriv(e|ed|al)|lieferung|geliefert|ankunft)\b", 0.5),
+    ],
+    "refund": [
+        (r"\b(refund(ed|s)?|money back|reimburse(ment)?|charge ?back|credit (it )?back)\b", 1.5),
+        (r"\b((rück)?erstattung|erstatten|geld zurück|gutschrift|zurückbuchen)\b", 1.5),
+        (r"\b(charged twice|double charged|overcharged|doppelt (abgebucht|belastet))\b", 1.0),
+    ],
+    "order_return": [
+        (r"\b(return(ing|ed)?|send (it )?back|ship (it )?back|exchange|rma)\b", 1.0),
+        (r"\b(rücksendung|zurück(senden|schicken)|retour(e|nieren)?|umtausch(en)?)\b", 1.0),
+        (r"\b(broken|damaged|defective|wrong (size|item)|kaputt|beschädigt|defekt|falsche (größe|artikel))\b", 0.5),
+    ],
+}
+
+ORDER_ID_PATTERN = re.compile(
+    r"\b(?:order|bestellung|auftrag)(?:\s*(?:id|no\.?|number|nr\.?|nummer))?\s*[:#]?\s*([A-Z]{0,4}-?\d{3,})\b",
+    re.IGNORECASE,
+)
+
+# A referenced order makes a stated intent more specific
+ORDER_ID_BONUS = 0.25
+DEFAULT_MIN_SCORE = 1.0
+DEFAULT_MIN_MARGIN = 0.75
+
+
+class Route(NamedTuple):
+    """The classification of a message."""
+
+    intent: Optional[str]
+    agent: Optional[str]
+    score: float
+    order_id: Optional[str]
+    confident: bool
+
+
+@dataclass
+class RoutingStats:
+    """Counters of the routing decisions during a conversation."""
+
+    messages: int = 0
+    routed: int = 0
+    fallbacks: int = 0
+    hops_saved: int = 0
+    confirmed: int = 0
+    misrouted: int = 0
+
+    def accuracy(self) -> Optional[float]:
+        judged = self.confirmed + self.misrouted
+        return self.confirmed / judged if judged else None
+
+    def summary(self) -> str:
+        accuracy = self.accuracy()
+        return (
+            f"{self.messages} messages, {self.routed} routed locally ({self.hops_saved} agent hops saved), "
+            f"{self.fallbacks} left to the agents, accuracy "
+            + (f"{accuracy:.0%} ({self.confirmed}/{self.confirmed + self.misrouted})" if accuracy is not None else "n/a")
+        )
+
+
+class IntentRouter:
+    """Route customer messages with a clear intent directly to the specialist.
+
+    A route is confident if the best intent scores at least ``min_score`` and leads the second
+    best by ``min_margin``. Delivering a message directly saves the transfer turn of the
+    ``SupportAgent``, and when a specialist has the conversation also its transfer back to
+    the ``SupportAgent``. A route counts as confirmed when the specialist answers and as
+    misrouted when it hands the conversation off right away.
+
+    Args:
+        min_score (float): Minimum score of the best intent.
+        min_margin (float): Minimum lead over the second best intent.
+        triage_agent (str): The agent that triages the conversation.
+    """
+
+    def __init__(self, min_score: float = DEFAULT_MIN_SCORE, min_margin: float = DEFAULT_MIN_MARGIN, triage_agent: str = TRIAGE_AGENT):
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.triage_agent = triage_agent
+        self.stats = RoutingStats()
+        self._patterns = {
+            intent: [(re.compile(pattern, re.IGNORECASE), weight) for pattern, weight in patterns]
+            for intent, patterns in INTENT_PATTERNS.items()
+        }
+        self._pending: Optional[str] = None
+
+    def classify(self, text: str) -> Route:
+        """Score the intents of a message."""
+        scores = {
+            intent: sum(weight for pattern, weight in patterns if pattern.search(text))
+            for intent, patterns in self._patterns.items()
+        }
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (intent, best), (_, second) = ranked[0], ranked[1]
+        match = ORDER_ID_PATTERN.search(text)
+        if match and best > 0:
+            best += ORDER_ID_BONUS
+        confident = best >= self.min_score and best - second >= self.min_margin
+        return Route(
+            intent if best > 0 else None,
+            INTENT_AGENTS[intent] if best > 0 else None,
+            best,
+            match.group(1) if match else None,
+            confident,
+        )
+
+    def route(self, text: str, current_agent: str) -> Optional[str]:
+        """Return the agent that should answer ``text`` instead of ``current_agent``, if any."""
+        self.stats.messages += 1
+        route = self.classify(text)
+        if not route.confident:
+            self.stats.fallbacks += 1
+            return None
+        if route.agent == current_agent:
+            return None
+        self.stats.routed += 1
+        self.stats.hops_saved += 1 if current_agent == self.triage_agent else 2
+        self._pending = route.agent
+        return route.agent
+
+    def record_handoff(self, source_agent: str, target_agent: str) -> None:
+        """Record a handoff function call of an agent."""
+        if self._pending == source_agent:
+            self.stats.misrouted += 1
+            self._pending = None
+
+    def record_answer(self, agent: str) -> None:
+        """Record that an agent answered without handing off."""
+        if self._pending == agent:
+            self.stats.confirmed += 1
+            self._pending = None
+
+
+# Labelled customer messages the patterns were written for, None means the message has to
+# stay with the current agent
+EXAMPLES = [
+    ("Where is my order 12345?", "OrderStatusAgent"),
+    ("I'd like to track the status of my order", "OrderStatusAgent"),
+    ("My package still hasn't arrived", "OrderStatusAgent"),
+    ("Wo bleibt meine Bestellung 4711?", "OrderStatusAgent"),
+    ("Wurde Bestellung Nr. 998 schon versendet?", "OrderStatusAgent"),
+    ("I want my money back for order 321", "RefundAgent"),
+    ("Please refund order #A-5521, I was charged twice", "RefundAgent"),
+    ("Ich hätte gerne eine Rückerstattung für Auftrag 772", "RefundAgent"),
+    ("I was double charged for my last purchase", "RefundAgent"),
+    ("I want to return another order of mine", "OrderReturnAgent"),
+    ("How do I send back a damaged item?", "OrderReturnAgent"),
+    ("Ich möchte die Jacke umtauschen, falsche Größe", "OrderReturnAgent"),
+    ("Die Lieferung ist kaputt angekommen, ich will sie zurückschicken", "OrderReturnAgent"),
+    ("Hi there", None),
+    ("My order ID is 123", None),
+    ("Broken item", None),
+    ("Thanks, that's all", None),
+    ("I want to return the item and get a refund", None),
+    ("Can you help me?", None),
+]
+
+# Labelled customer messages that were not used to write the patterns; do not tune on these
+HELD_OUT_EXAMPLES = [
+    ("Any update on when my parcel gets here?", "OrderStatusAgent"),
+    ("Can you check where order 55821 is right now?", "OrderStatusAgent"),
+    ("The tracking page hasn't changed in three days", "OrderStatusAgent"),
+    ("When will order 9913 be delivered?", "OrderStatusAgent"),
+    ("Ist meine Bestellung 2231 schon unterwegs?", "OrderStatusAgent"),
+    ("Mein Paket ist noch nicht angekommen, Bestellung 1204", "OrderStatusAgent"),
+    ("Has order #B-7781 shipped yet?", "OrderStatusAgent"),
+    ("Wann kommt meine Lieferung?", "OrderStatusAgent"),
+    ("I cancelled order 4410, when do I get my money back?", "RefundAgent"),
+    ("You charged my card twice for order 6618", "RefundAgent"),
+    ("I need a refund, the promo code wasn't applied", "RefundAgent"),
+    ("Bitte erstatten Sie mir den Betrag für Bestellung 3307", "RefundAgent"),
+    ("Wann bekomme ich mein Geld zurück?", "RefundAgent"),
+    ("Has my refund for order 8120 been processed?", "RefundAgent"),
+    ("I'd like to send these shoes back, they don't fit", "OrderReturnAgent"),
+    ("How can I exchange the blue shirt for a red one?", "OrderReturnAgent"),
+    ("Wie schicke ich den defekten Toaster zurück?", "OrderReturnAgent"),
+    ("I received the wrong item and want to return it", "OrderReturnAgent"),
+    ("Can I get a return label for order 5012?", "OrderReturnAgent"),
+    ("Ich möchte Bestellung 7734 retournieren", "OrderReturnAgent"),
+    ("Hello, I have a question", None),
+    ("Ok thank you so much", None),
+    ("What are your opening hours?", None),
+    ("Order 1234", None),
+    ("The lamp arrived damaged", None),
+    ("Do you ship to Austria?", None),
+    ("I returned it last week, where is my refund?", None),
+    ("Can I change my delivery address?", None),
+    ("Danke, das war alles", None),
+    ("Ich brauche Hilfe mit meinem Konto", None),
+]
+
+
+def evaluate(router: IntentRouter, examples: list[tuple[str, Optional[str]]] = EXAMPLES) -> dict:
+    """Classify labelled messages and return accuracy, precision and coverage of the confident routes.
+
+    Precision is the share of local routes that went to the right agent, coverage the share of
+    messages with a clear intent that were routed correctly.
+    """
+    correct = routed = routed_correctly = 0
+    errors = []
+    for text, expected in examples:
+        route = router.classify(text)
+        predicted = route.agent if route.confident else None
+        if predicted == expected:
+            correct += 1
+        else:
+            errors.append((text, expected, predicted))
+        if predicted is not None:
+            routed += 1
+            routed_correctly += predicted == expected
+    routable = sum(expected is not None for _, expected in examples)
+    return {
+        "examples": len(examples),
+        "accuracy": correct / len(examples),
+        "routed": routed,
+        "routed_correctly": routed_correctly,
+        "precision": routed_correctly / routed if routed else None,
+        "coverage": routed_correctly / routable if routable else None,
+        "errors": errors,
+    }
+
+
+if __name__ == "__main__":
+    router = IntentRouter()
+    reports = {"Training": evaluate(router), "Held-out": evaluate(router, HELD_OUT_EXAMPLES)}
+    for name, report in reports.items():
+        print(
+            f"{name}: accuracy {report['accuracy']:.0%} on {report['examples']} examples, "
+            f"{report['routed']} routed locally ({report['routed_correctly']} correctly), "
+            f"precision {report['precision']:.0%}, coverage {report['coverage']:.0%}"
+        )
+        for text, expected, predicted in report["errors"]:
+            print(f"  {text!r}: expected {expected}, routed {predicted}")
+    # The training set must stay correct; on held-out messages only misroutes fail, as they cost a
+    # wasted specialist turn while messages left to the agents only cost the usual handoff
+    misrouted = any(report["routed"] > report["routed_correctly"] for report in reports.values())
+    sys.exit(1 if reports["Training"]["errors"] or misrouted else 0)
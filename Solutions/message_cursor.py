@@ -0,0 +1,54 @@
+"""Incremental retrieval of thread messages.
+
+Listing the whole thread after every run transfers and prints the complete history each
+turn. :class:`MessageCursor` remembers the newest message it has returned and walks the
+thread from the newest message backwards, stopping as soon as it reaches that message.
+Because the SDK pages lazily, only the first page (usually a single request) is fetched per
+turn, independent of how long the thread already is.
+"""
+
+from typing import Optional
+
+from azure.ai.agents.models import ListSortOrder, ThreadMessage
+
+DEFAULT_PAGE_SIZE = 20
+
+
+class MessageCursor:
+    """Return only the messages of a thread that have not been seen yet."""
+
+    def __init__(self, client, thread_id: str, page_size: int = DEFAULT_PAGE_SIZE):
+        self.client = client
+        self.thread_id = thread_id
+        self.page_size = page_size
+        self.last_seen_id: Optional[str] = None
+
+    def new_messages(self, run_id: Optional[str] = None) -> list[ThreadMessage]:
+        """Fetch the messages created since the last call, oldest first.
+
+        Args:
+            run_id (Optional[str]): Restrict the result to the messages created by this run.
+
+        Returns:
+            list[ThreadMessage]: The new messages in chronological order.
+        """
+        fresh = []
+        messages = self.client.messages.list(
+            thread_id=self.thread_id,
+            run_id=run_id,
+            order=ListSortOrder.DESCENDING,
+            limit=self.page_size,
+        )
+        for message in messages:
+            if message.id == self.last_seen_id:
+                break
+            fresh.append(message)
+        fresh.reverse()
+        if fresh:
+            self.last_seen_id = fresh[-1].id
+        return fresh
+
+    def reset(self, thread_id: str) -> None:
+        """Continue on another thread from its beginning."""
+        self.thread_id = thread_id
+        self.last_seen_id = None
@@ -0,0 +1,390 @@
+"""Local order database behind the session 2 plugins.
+
+:class:`OrderStore` keeps the orders and their refunds and returns in SQLite. Lookups use the
+primary key index of a ``WITHOUT ROWID`` table, so a read stays well below a millisecond with
+millions of orders. The connections are pooled and memory-mapped, reads of several orders are
+answered with one query per 500 IDs, and refunds and returns are written in one transaction
+per call. The ``async`` methods run on a thread pool of the size of the connection pool, so
+lookups never block the event loop of the orchestration.
+
+Create a database with synthetic orders and measure the lookup latency::
+
+    python order_store.py seed --orders 1000000
+    python order_store.py bench
+"""
+
+import argparse
+import asyncio
+import os
+import queue
+import random
+import sqlite3
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from functools import partial
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+DEFAULT_ORDER_STORE_PATH = "orders.db"
+DEFAULT_POOL_SIZE = 4
+DEFAULT_SEED_ORDERS = 10_000
+# SQLite limits the number of parameters of a statement
+MAX_BATCH_PARAMETERS = 500
+SEED_CHUNK_SIZE = 50_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    order_id TEXT PRIMARY KEY,
+    customer_id TEXT NOT NULL,
+    item TEXT NOT NULL,
+    total_cents INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    ordered_on TEXT NOT NULL,
+    shipped_on TEXT,
+    delivery_on TEXT,
+    carrier TEXT,
+    tracking_number TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS order_events (
+    event_id INTEGER PRIMARY KEY,
+    order_id TEXT NOT NULL REFERENCES orders (order_id),
+    kind TEXT NOT NULL,
+    reason TEXT,
+    amount_cents INTEGER,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS order_events_by_order ON order_events (order_id, kind);
+"""
+
+ORDER_COLUMNS = "order_id, customer_id, item, total_cents, status, ordered_on, shipped_on, delivery_on, carrier, tracking_number"
+
+ITEMS = ("Laptop", "Headphones", "Monitor", "Keyboard", "Office chair", "Backpack", "Smartphone", "Desk lamp", "Webcam", "Printer")
+CARRIERS = ("DHL", "UPS", "DPD", "Hermes")
+# Share of the synthetic orders per status
+STATUS_WEIGHTS = {"processing": 15, "shipped": 30, "delivered": 50, "cancelled": 5}
+# An order in transit is returned first, one still being prepared is cancelled instead
+REFUNDABLE_STATUSES = ("delivered", "return_requested", "cancelled")
+RETURNABLE_STATUSES = ("shipped", "delivered")
+
+
+class OrderNotFoundError(LookupError):
+    """The order ID is unknown."""
+
+
+class OrderStateError(ValueError):
+    """The order cannot be refunded or returned in its current state."""
+
+
+class Order(NamedTuple):
+    """An order as stored in the ``orders`` table."""
+
+    order_id: str
+    customer_id: str
+    item: str
+    total_cents: int
+    status: str
+    ordered_on: str
+    shipped_on: Optional[str]
+    delivery_on: Optional[str]
+    carrier: Optional[str]
+    tracking_number: Optional[str]
+
+    @property
+    def total(self) -> str:
+        return f"{self.total_cents / 100:.2f} EUR"
+
+    def describe(self) -> str:
+        """Describe the order status for the customer."""
+        if self.status == "processing":
+            return f"Order {self.order_id} ({self.item}) is being prepared and will ship by {self.delivery_on}."
+        if self.status == "shipped":
+            return (
+                f"Order {self.order_id} ({self.item}) was shipped on {self.shipped_on} with {self.carrier} "
+                f"(tracking number {self.tracking_number}) and will arrive on {self.delivery_on}."
+            )
+        if self.status == "delivered":
+            return f"Order {self.order_id} ({self.item}) was delivered on {self.delivery_on}."
+        if self.status == "return_requested":
+            return f"A return of order {self.order_id} ({self.item}) has been registered."
+        return f"Order {self.order_id} ({self.item}) is {self.status.replace('_', ' ')}."
+
+
+class EventResult(NamedTuple):
+    """Outcome of a refund or return of one order."""
+
+    order_id: str
+    ok: bool
+    message: str
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class ConnectionPool:
+    """A fixed number of SQLite connections shared by threads."""
+
+    def __init__(self, path: str, size: int = DEFAULT_POOL_SIZE):
+        self.path = path
+        self._connections: queue.Queue[sqlite3.Connection] = queue.Queue()
+        for _ in range(size):
+            self._connections.put(self._connect())
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        # Map the database into memory instead of copying pages for every read
+        connection.execute("PRAGMA mmap_size=1073741824")
+        return connection
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        connection = self._connections.get()
+        try:
+            yield connection
+        finally:
+            self._connections.put(connection)
+
+    def close(self) -> None:
+        while not self._connections.empty():
+            self._connections.get_nowait().close()
+
+
+class OrderStore:
+    """Orders, refunds and returns in a local SQLite database.
+
+    Args:
+        path (str): The database file, created with the schema if it does not exist.
+        pool_size (int): Number of pooled connections and of worker threads of the async methods.
+    """
+
+    def __init__(self, path: str = DEFAULT_ORDER_STORE_PATH, pool_size: int = DEFAULT_POOL_SIZE):
+        self.path = path
+        self.pool = ConnectionPool(path, pool_size)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="order-store")
+        # SQLite has a single writer, concurrent write transactions would only wait for each other
+        self._write_lock = threading.Lock()
+        with self.pool.connection() as connection:
+            connection.executescript(SCHEMA)
+
+    @classmethod
+    def open(cls, path: str = DEFAULT_ORDER_STORE_PATH, seed_orders: int = DEFAULT_SEED_ORDERS, pool_size: int = DEFAULT_POOL_SIZE) -> "OrderStore":
+        """Open the store and fill an empty database with synthetic orders."""
+        store = cls(path, pool_size)
+        if seed_orders and store.count() == 0:
+            store.seed(seed_orders)
+        return store
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self.pool.close()
+
+    def count(self) -> int:
+        with self.pool.connection() as connection:
+            return connection.execute("SELECT count(*) FROM orders").fetchone()[0]
+
+    def seed(self, count: int, seed: int = 42, today: Optional[date] = None) -> None:
+        """Insert ``count`` synthetic orders with the IDs ``1`` to ``count``."""
+        generator = random.Random(seed)
+        today = today or date.today()
+        # Lookup tables keep the generation of millions of rows cheap
+        status_table = [status for status, weight in STATUS_WEIGHTS.items() for _ in range(weight)]
+        days = [(today + timedelta(days=offset)).isoformat() for offset in range(-61, 7)]
+        customers = max(1, count // 4)
+
+        def rows() -> Iterator[tuple]:
+            draw = generator.random
+            for number in range(1, count + 1):
+                status = status_table[int(draw() * len(status_table))]
+                ordered = 61 - int(draw() * (61 if status == "delivered" else 3))
+                shipped = status in ("shipped", "delivered")
+                carrier = CARRIERS[int(draw() * len(CARRIERS))] if shipped else None
+                yield (
+                    str(number),
+                    f"C{int(draw() * customers) + 1:07d}",
+                    ITEMS[int(draw() * len(ITEMS))],
+                    999 + int(draw() * 199_000),
+                    status,
+                    days[ordered],
+                    days[ordered + 1] if shipped else None,
+                    days[ordered + 2 + int(draw() * 4)] if status != "cancelled" else None,
+                    carrier,
+                    f"{carrier[:2].upper()}{10**9 + int(draw() * 9 * 10**9)}" if carrier else None,
+                )
+
+        generated = rows()
+        with self._write_lock, self.pool.connection() as connection:
+            connection.execute("BEGIN")
+            try:
+                while True:
+                    chunk = [row for _, row in zip(range(SEED_CHUNK_SIZE), generated)]
+                    if not chunk:
+                        break
+                    connection.executemany(f"INSERT OR IGNORE INTO orders ({ORDER_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", chunk)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    # Synchronous access, usable from any thread
+
+    def order(self, order_id: str) -> Order:
+        """Return an order.
+
+        Raises:
+            OrderNotFoundError: If the order does not exist.
+        """
+        with self.pool.connection() as connection:
+            row = connection.execute(f"SELECT {ORDER_COLUMNS} FROM orders WHERE order_id = ?", (order_id.strip(),)).fetchone()
+        if row is None:
+            raise OrderNotFoundError(f"Order {order_id} does not exist.")
+        return Order._make(row)
+
+    def orders(self, order_ids: Iterable[str]) -> dict[str, Order]:
+        """Return the existing orders among ``order_ids`` by ID."""
+        unique_ids = list(dict.fromkeys(order_id.strip() for order_id in order_ids))
+        found = {}
+        with self.pool.connection() as connection:
+            for start in range(0, len(unique_ids), MAX_BATCH_PARAMETERS):
+                chunk = unique_ids[start:start + MAX_BATCH_PARAMETERS]
+                placeholders = ", ".join("?" * len(chunk))
+                for row in connection.execute(f"SELECT {ORDER_COLUMNS} FROM orders WHERE order_id IN ({placeholders})", chunk):
+                    found[row[0]] = Order._make(row)
+        return found
+
+    def _record(self, kind: str, requests: list[tuple[str, str]]) -> list[EventResult]:
+        results = []
+        with self._write_lock, self.pool.connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for order_id, reason in requests:
+                    results.append(self._record_one(connection, kind, order_id.strip(), reason))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return results
+
+    def _record_one(self, connection: sqlite3.Connection, kind: str, order_id: str, reason: str) -> EventResult:
+        row = connection.execute(f"SELECT {ORDER_COLUMNS} FROM orders WHERE order_id = ?", (order_id,)).fetchone()
+        if row is None:
+            return EventResult(order_id, False, f"Order {order_id} does not exist.")
+        order = Order._make(row)
+        if kind == "refund":
+            if order.status == "refunded":
+                return EventResult(order_id, False, f"Order {order_id} has already been refunded.")
+            if order.status not in REFUNDABLE_STATUSES:
+                return EventResult(order_id, False, f"Order {order_id} cannot be refunded because it is {order.status.replace('_', ' ')}.")
+            amount, status = order.total_cents, "refunded"
+        else:
+            if order.status not in RETURNABLE_STATUSES:
+                return EventResult(order_id, False, f"Order {order_id} cannot be returned because it is {order.status.replace('_', ' ')}.")
+            amount, status = None, "return_requested"
+        event_id = connection.execute(
+            "INSERT INTO order_events (order_id, kind, reason, amount_cents, created_at) VALUES (?, ?, ?, ?, ?)",
+            (order_id, kind, reason, amount, _now()),
+        ).lastrowid
+        connection.execute("UPDATE orders SET status = ? WHERE order_id = ?", (status, order_id))
+        if kind == "refund":
+            return EventResult(order_id, True, f"Refund R-{event_id} of {order.total} for order {order_id} has been processed.")
+        return EventResult(order_id, True, f"Return RMA-{event_id} for order {order_id} ({order.item}) has been registered.")
+
+    def refund(self, requests: list[tuple[str, str]]) -> list[EventResult]:
+        """Refund orders, given as ``(order_id, reason)``, in one transaction."""
+        return self._record("refund", requests)
+
+    def register_return(self, requests: list[tuple[str, str]]) -> list[EventResult]:
+        """Register returns of orders, given as ``(order_id, reason)``, in one transaction."""
+        return self._record("return", requests)
+
+    # Asynchronous access for the kernel functions
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(function, *args))
+
+    async def get_order(self, order_id: str) -> Order:
+        return await self._run(self.order, order_id)
+
+    async def get_orders(self, order_ids: Iterable[str]) -> dict[str, Order]:
+        return await self._run(self.orders, list(order_ids))
+
+    async def refund_orders(self, requests: list[tuple[str, str]]) -> list[EventResult]:
+        return await self._run(self.refund, requests)
+
+    async def return_orders(self, requests: list[tuple[str, str]]) -> list[EventResult]:
+        return await self._run(self.register_return, requests)
+
+
+def _latency_summary(samples: list[float]) -> str:
+    samples = sorted(samples)
+    percentile = lambda share: samples[min(len(samples) - 1, int(share * len(samples)))] * 1000
+    return f"p50 {percentile(0.5):.3f} ms, p99 {percentile(0.99):.3f} ms, mean {statistics.fmean(samples) * 1000:.3f} ms"
+
+
+async def _bench_async(store: OrderStore, order_ids: list[str], concurrency: int) -> list[float]:
+    samples = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def lookup(order_id: str) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await store.get_order(order_id)
+            samples.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(lookup(order_id) for order_id in order_ids))
+    return samples
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Local order database of the session 2 plugins")
+    parser.add_argument("command", choices=("seed", "bench"))
+    parser.add_argument("--path", default=os.getenv("ORDER_STORE_PATH", DEFAULT_ORDER_STORE_PATH))
+    parser.add_argument("--orders", type=int, default=1_000_000, help="Number of synthetic orders (seed)")
+    parser.add_argument("--lookups", type=int, default=20_000, help="Number of timed lookups (bench)")
+    parser.add_argument("--batch-size", type=int, default=50, help="Orders per batch lookup (bench)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_POOL_SIZE, help="Concurrent async lookups (bench)")
+    args = parser.parse_args(argv)
+
+    if args.command == "seed":
+        store = OrderStore(args.path)
+        started = time.perf_counter()
+        store.seed(args.orders)
+        print(f"{store.count()} orders in {args.path} ({time.perf_counter() - started:.1f} s)")
+        store.close()
+        return
+
+    store = OrderStore(args.path, pool_size=args.concurrency)
+    total = store.count()
+    if not total:
+        raise SystemExit(f"{args.path} contains no orders, run 'seed' first")
+    generator = random.Random(7)
+    order_ids = [str(generator.randint(1, total)) for _ in range(args.lookups)]
+
+    samples = []
+    for order_id in order_ids:
+        started = time.perf_counter()
+        store.order(order_id)
+        samples.append(time.perf_counter() - started)
+    print(f"Single lookup ({total} orders): {_latency_summary(samples)}")
+
+    batch_samples = []
+    for start in range(0, len(order_ids), args.batch_size):
+        started = time.perf_counter()
+        store.orders(order_ids[start:start + args.batch_size])
+        batch_samples.append(time.perf_counter() - started)
+    print(f"Batch lookup of {args.batch_size} IDs: {_latency_summary(batch_samples)}")
+
+    started = time.perf_counter()
+    async_samples = asyncio.run(_bench_async(store, order_ids, args.concurrency))
+    elapsed = time.perf_counter() - started
+    print(f"Async lookup ({args.concurrency} concurrent): {_latency_summary(async_samples)}, {len(order_ids) / elapsed:.0f} lookups/s")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
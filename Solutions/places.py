@@ -0,0 +1,176 @@
+"""Small offline gazetteer of the destinations relevant for the travel policy.
+
+City and country names use the German spelling of the Reiserichtlinie so they can be matched
+against its tables directly. English and transliterated spellings are mapped via aliases.
+"""
+
+import re
+import unicodedata
+from typing import Optional
+
+CITY_COUNTRIES = {
+    # Deutschland
+    "Berlin": "Deutschland",
+    "Hamburg": "Deutschland",
+    "München": "Deutschland",
+    "Köln": "Deutschland",
+    "Frankfurt": "Deutschland",
+    "Stuttgart": "Deutschland",
+    "Düsseldorf": "Deutschland",
+    "Leipzig": "Deutschland",
+    "Dortmund": "Deutschland",
+    "Bremen": "Deutschland",
+    "Dresden": "Deutschland",
+    "Hannover": "Deutschland",
+    "Nürnberg": "Deutschland",
+    "Augsburg": "Deutschland",
+    "Bonn": "Deutschland",
+    "Mannheim": "Deutschland",
+    "Karlsruhe": "Deutschland",
+    "Freiburg": "Deutschland",
+    "Heidelberg": "Deutschland",
+    "Münster": "Deutschland",
+    "Regensburg": "Deutschland",
+    "Ulm": "Deutschland",
+    "Würzburg": "Deutschland",
+    "Ingolstadt": "Deutschland",
+    "Wolfsburg": "Deutschland",
+    "Kiel": "Deutschland",
+    "Rostock": "Deutschland",
+    "Erfurt": "Deutschland",
+    "Mainz": "Deutschland",
+    "Wiesbaden": "Deutschland",
+    "Potsdam": "Deutschland",
+    # Europa
+    "Wien": "Österreich",
+    "Salzburg": "Österreich",
+    "Graz": "Österreich",
+    "Innsbruck": "Österreich",
+    "Zürich": "Schweiz",
+    "Genf": "Schweiz",
+    "Basel": "Schweiz",
+    "Bern": "Schweiz",
+    "Paris": "Frankreich",
+    "Lyon": "Frankreich",
+    "Marseille": "Frankreich",
+    "Toulouse": "Frankreich",
+    "Straßburg": "Frankreich",
+    "Rom": "Italien",
+    "Mailand": "Italien",
+    "Turin": "Italien",
+    "Florenz": "Italien",
+    "Venedig": "Italien",
+    "Neapel": "Italien",
+    "Madrid": "Spanien",
+    "Barcelona": "Spanien",
+    "Valencia": "Spanien",
+    "Sevilla": "Spanien",
+    "Amsterdam": "Niederlande",
+    "Rotterdam": "Niederlande",
+    "Eindhoven": "Niederlande",
+    "Brüssel": "Belgien",
+    "Antwerpen": "Belgien",
+    "Warschau": "Polen",
+    "Krakau": "Polen",
+    "Breslau": "Polen",
+    "Prag": "Tschechien",
+    "Brünn": "Tschechien",
+    "London": "UK",
+    "Manchester": "UK",
+    "Edinburgh": "UK",
+    "Oslo": "Skandinavien",
+    "Stockholm": "Skandinavien",
+    "Kopenhagen": "Skandinavien",
+    # Weitere Länder
+    "New York": "USA",
+    "San Francisco": "USA",
+    "Boston": "USA",
+    "Chicago": "USA",
+    "Seattle": "USA",
+    "Bangalore": "Indien",
+    "Mumbai": "Indien",
+    "Neu-Delhi": "Indien",
+    "Shanghai": "China",
+    "Peking": "China",
+    "Singapur": "Singapur",
+    "Sao Paulo": "Brasilien",
+    "Dubai": "VAE",
+    "Abu Dhabi": "VAE",
+    "Kapstadt": "Südafrika",
+}
+
+# Cities counted as "große Städte" for the German hotel cap
+LARGE_GERMAN_CITIES = {
+    "Berlin", "Hamburg", "München", "Köln", "Frankfurt", "Stuttgart", "Düsseldorf",
+    "Leipzig", "Dortmund", "Bremen", "Dresden", "Hannover", "Nürnberg",
+}
+
+CITY_ALIASES = {
+    "munich": "München",
+    "cologne": "Köln",
+    "frankfurt am main": "Frankfurt",
+    "nuremberg": "Nürnberg",
+    "hanover": "Hannover",
+    "vienna": "Wien",
+    "zurich": "Zürich",
+    "geneva": "Genf",
+    "strasbourg": "Straßburg",
+    "rome": "Rom",
+    "milan": "Mailand",
+    "milano": "Mailand",
+    "florence": "Florenz",
+    "venice": "Venedig",
+    "naples": "Neapel",
+    "seville": "Sevilla",
+    "brussels": "Brüssel",
+    "bruxelles": "Brüssel",
+    "warsaw": "Warschau",
+    "krakow": "Krakau",
+    "cracow": "Krakau",
+    "wroclaw": "Breslau",
+    "prague": "Prag",
+    "praha": "Prag",
+    "brno": "Brünn",
+    "copenhagen": "Kopenhagen",
+    "new york city": "New York",
+    "nyc": "New York",
+    "bengaluru": "Bangalore",
+    "new delhi": "Neu-Delhi",
+    "beijing": "Peking",
+    "singapore": "Singapur",
+    "são paulo": "Sao Paulo",
+    "cape town": "Kapstadt",
+}
+
+
+def fold(text: str) -> str:
+    """Lower-case ``text`` and fold umlauts and accents (``München`` -> ``muenchen``)."""
+    text = text.lower().replace("ä", "ae").replace("ö", "oe").replace("ü", "ue").replace("ß", "ss")
+    return "".join(char for char in unicodedata.normalize("NFKD", text) if not unicodedata.combining(char))
+
+
+_LOOKUP = {fold(city): city for city in CITY_COUNTRIES}
+_LOOKUP.update({fold(alias): city for alias, city in CITY_ALIASES.items()})
+# Longest names first so "Frankfurt am Main" wins over "Frankfurt"
+_CITY_PATTERN = re.compile(
+    r"\b(" + "|".join(re.escape(name) for name in sorted(_LOOKUP, key=len, reverse=True)) + r")\b"
+)
+
+
+def normalize_city(name: str) -> Optional[str]:
+    """Return the canonical German name of a known city or ``None``."""
+    return _LOOKUP.get(fold(name.strip()))
+
+
+def country_of(city: str) -> Optional[str]:
+    """Return the policy country of a canonical city name."""
+    return CITY_COUNTRIES.get(city)
+
+
+def find_cities(text: str) -> list[tuple[int, str]]:
+    """Find known cities in free text.
+
+    Returns:
+        list[tuple[int, str]]: Position in the folded text and canonical name of every match.
+    """
+    return [(match.start(), _LOOKUP[match.group(1)]) for match in _CITY_PATTERN.finditer(fold(text))]
@@ -0,0 +1,287 @@
+"""Local, indexed travel policy engine.
+
+Answering every compliance question through ``policy_pruefungs_agent`` means a remote file
+search plus an additional model call. This module extracts the text of the Reiserichtlinie
+once, splits it into its numbered sections, builds a BM25 inverted index over them and parses
+a small rule table (hotel caps per city/country, meal caps, travel classes, ...). The result is
+stored on disk next to the content hash of the PDF, so later starts only load a JSON file.
+
+:meth:`PolicyEngine.lookup_travel_policy` is designed to be registered as a local function
+tool of the orchestrator, which keeps the remote policy agent as fallback for questions the
+rule table and the sections cannot answer.
+
+Extracting the PDF requires the optional ``pypdf`` package.
+"""
+
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Optional
+
+from places import LARGE_GERMAN_CITIES, country_of, fold, normalize_city
+from provisioning import file_hash
+
+DEFAULT_INDEX_PATH = ".policy_index.json"
+
+STOPWORDS = {
+    "der", "die", "das", "und", "oder", "ist", "sind", "in", "im", "für", "fuer", "mit", "von", "zu",
+    "bei", "den", "dem", "des", "ein", "eine", "einer", "nach", "auf", "an", "wie", "was", "wenn",
+    "ich", "wir", "es", "nicht", "z", "b", "the", "a", "an", "of", "to", "for", "is", "and", "or",
+    "can", "how", "much", "what", "i", "my", "mit", "werden", "wird", "über", "ueber", "bis",
+}
+
+_SUFFIXES = ("ungen", "ung", "en", "er", "es", "e", "n", "s")
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into folded, lightly stemmed terms without stopwords."""
+    terms = []
+    for token in re.findall(r"[a-z0-9]+", fold(text)):
+        if token in STOPWORDS:
+            continue
+        for suffix in _SUFFIXES:
+            if len(token) > len(suffix) + 3 and token.endswith(suffix):
+                token = token[: -len(suffix)]
+                break
+        terms.append(token)
+    return terms
+
+
+def extract_policy_text(pdf_path: str) -> str:
+    """Extract the plain text of the policy PDF."""
+    try:
+        from pypdf import PdfReader
+    except ImportError as error:
+        raise ImportError("The local policy engine needs 'pypdf' to read the PDF: pip install pypdf") from error
+    reader = PdfReader(pdf_path)
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def split_sections(text: str) -> list[dict]:
+    """Split the policy into its numbered sections (``3.``, ``3.1.``, ...).
+
+    A line only counts as heading if its number continues the numbering, which keeps lines
+    such as "1. Klasse ist ..." inside the section they belong to.
+    """
+    sections = [{"id": "0", "title": "Präambel", "text": ""}]
+    chapter, subsection = 0, 0
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        match = re.match(r"^(\d+)\.(?:(\d+)\.)?\s+(\S.*)$", line)
+        if match:
+            number, sub, title = int(match.group(1)), match.group(2), match.group(3)
+            if sub is None and number == chapter + 1:
+                chapter, subsection = number, 0
+                sections.append({"id": f"{number}", "title": title, "text": ""})
+                continue
+            if sub is not None and number == chapter and int(sub) == subsection + 1:
+                subsection = int(sub)
+                sections.append({"id": f"{number}.{sub}", "title": title, "text": ""})
+                continue
+        sections[-1]["text"] += line + "\n"
+    return [section for section in sections if section["text"].strip() or section["id"] != "0"]
+
+
+# An amount with thousands groups (1.200,50 or 1,200.50) or a plain one (1200, 130.00, 130,00)
+AMOUNT_PATTERN = r"\d{1,3}(?:[.,]\d{3})+(?:[.,]\d+)?|\d+(?:[.,]\d+)?"
+
+
+def parse_amount(value: str) -> float:
+    """Parse an amount in German or English notation, e.g. ``1.200,50``, ``1,200.50`` or ``130.00``.
+
+    The last separator is the decimal separator, unless three digits follow it and the other
+    separator does not occur before, as in the German ``1.200``.
+    """
+    last = max(value.rfind("."), value.rfind(","))
+    integer, fraction = value[:last], value[last + 1:]
+    if last < 0 or (len(fraction) == 3 and ("," if value[last] == "." else ".") not in integer):
+        return float(re.sub(r"[.,]", "", value))
+    return float(re.sub(r"[.,]", "", integer) + "." + fraction)
+
+
+def parse_rules(sections: list[dict]) -> dict:
+    """Parse the machine readable parts of the policy into a rule table."""
+    rules: dict = {"hotel_caps": [], "meal_caps": {}, "flight": {}, "train": {}, "hotel": {}, "car": {}, "taxi": {}}
+    full_text = " ".join(section["text"] for section in sections)
+    flat = re.sub(r"\s+", " ", full_text)
+
+    for section in sections:
+        for line in section["text"].splitlines():
+            match = re.match(r"^(?P<label>[^\d€]+?)\s+(?P<amount>\d+(?:,\d+)?)\s*€$", line.strip())
+            if not match:
+                continue
+            label, amount = match.group("label").strip(), parse_amount(match.group("amount"))
+            if section["id"] == "4.2":
+                rules["hotel_caps"].append(_hotel_cap(label, amount))
+            elif section["id"] == "5.2":
+                rules["meal_caps"][label] = amount
+
+    patterns = {
+        ("flight", "economy_max_hours"): r"Economy Class ist der Standard für alle Flüge bis einschließlich (\d+) Stunden",
+        ("flight", "business_min_hours"): r"Business Class ist zulässig für Flüge über (\d+) Stunden",
+        ("train", "first_class_min_minutes"): r"1\. Klasse ist bei Reisedauern über (\d+) Minuten",
+        ("car", "mileage_eur_per_km"): r"(\d+,\d+) €/km",
+        ("hotel", "min_stars"): r"(\d)- bis maximal \d-Sterne",
+        ("hotel", "max_stars"): r"\d- bis maximal (\d)-Sterne",
+        ("taxi", "night_from"): r"zwischen (\d{2}:\d{2})[–-]\d{2}:\d{2}",
+        ("taxi", "night_until"): r"zwischen \d{2}:\d{2}[–-](\d{2}:\d{2})",
+    }
+    for (group, key), pattern in patterns.items():
+        match = re.search(pattern, flat)
+        if match:
+            value = match.group(1)
+            rules[group][key] = value if ":" in value else parse_amount(value)
+
+    rules["flight"]["business_requires_approval"] = "nach vorheriger Genehmigung" in flat
+    rules["flight"]["first_class_allowed"] = "First Class ist nicht zulässig" not in flat
+    if "in der 2. Klasse zu buchen" in flat:
+        rules["train"]["default_class"] = 2
+    if "Kompakt- oder Mittelklasse" in flat:
+        rules["car"]["categories"] = ["Kompaktklasse", "Mittelklasse"]
+    return rules
+
+
+def _hotel_cap(label: str, amount: float) -> dict:
+    # "Österreich (Wien, Salzburg)" -> country Österreich, cities Wien and Salzburg
+    match = re.match(r"^(?P<country>[^(]+?)\s*(?:\((?P<scope>[^)]*)\))?$", label)
+    country, scope = match.group("country").strip(), (match.group("scope") or "").strip()
+    cap = {"label": label, "country": country, "max_eur_per_night": amount, "cities": [], "kind": "country"}
+    if scope == "sonstige":
+        cap["kind"] = "other"
+    elif scope == "große Städte":
+        cap["kind"] = "large_cities"
+    elif scope:
+        cap["kind"] = "cities"
+        cap["cities"] = [normalize_city(city) or city.strip() for city in scope.split(",")]
+    return cap
+
+
+class PolicyIndex:
+    """BM25 index over the policy sections."""
+
+    def __init__(self, sections: list[dict], k1: float = 1.5, b: float = 0.75):
+        self.sections = sections
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, dict[int, int]] = {}
+        self.lengths: list[int] = []
+        for position, section in enumerate(sections):
+            terms = tokenize(section["title"] + " " + section["text"])
+            self.lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                self.postings.setdefault(term, {})[position] = count
+        self.average_length = sum(self.lengths) / max(1, len(self.lengths))
+
+    def search(self, query: str, top_k: int = 3) -> list[tuple[float, dict]]:
+        """Return the ``top_k`` best matching sections with their BM25 score."""
+        scores: Counter = Counter()
+        documents = len(self.sections)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (documents - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / self.average_length)
+                scores[position] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return [(score, self.sections[position]) for position, score in scores.most_common(top_k)]
+
+    def to_dict(self) -> dict:
+        return {
+            "sections": self.sections,
+            "postings": {term: {str(pos): count for pos, count in postings.items()} for term, postings in self.postings.items()},
+            "lengths": self.lengths,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PolicyIndex":
+        index = cls.__new__(cls)
+        index.k1, index.b = 1.5, 0.75
+        index.sections = data["sections"]
+        index.postings = {term: {int(pos): count for pos, count in postings.items()} for term, postings in data["postings"].items()}
+        index.lengths = data["lengths"]
+        index.average_length = sum(index.lengths) / max(1, len(index.lengths))
+        return index
+
+
+class PolicyEngine:
+    """Offline answers to travel policy questions.
+
+    Args:
+        index (PolicyIndex): The section index.
+        rules (dict): The rule table produced by :func:`parse_rules`.
+        content_hash (str): Hash of the policy document the engine was built from.
+    """
+
+    def __init__(self, index: PolicyIndex, rules: dict, content_hash: str):
+        self.index = index
+        self.rules = rules
+        self.content_hash = content_hash
+
+    @classmethod
+    def load(cls, pdf_path: str, index_path: Optional[str] = None) -> "PolicyEngine":
+        """Load the engine from its on-disk index, rebuilding it when the PDF changed."""
+        index_path = index_path or os.getenv("POLICY_INDEX_PATH", DEFAULT_INDEX_PATH)
+        content_hash = file_hash(pdf_path)
+        try:
+            with open(index_path, encoding="utf-8") as index_file:
+                data = json.load(index_file)
+            if data.get("content_hash") == content_hash:
+                return cls(PolicyIndex.from_dict(data["index"]), data["rules"], content_hash)
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+
+        sections = split_sections(extract_policy_text(pdf_path))
+        engine = cls(PolicyIndex(sections), parse_rules(sections), content_hash)
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as index_file:
+            json.dump(
+                {"content_hash": content_hash, "index": engine.index.to_dict(), "rules": engine.rules},
+                index_file,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, index_path)
+        return engine
+
+    def hotel_cap(self, destination: str) -> Optional[dict]:
+        """Return the hotel cap row that applies to ``destination`` (city or country)."""
+        city = normalize_city(destination)
+        country = country_of(city) if city else destination.strip()
+        caps = self.rules["hotel_caps"]
+        if city:
+            for cap in caps:
+                if city in cap["cities"]:
+                    return cap
+            if city in LARGE_GERMAN_CITIES:
+                for cap in caps:
+                    if cap["country"] == country and cap["kind"] == "large_cities":
+                        return cap
+        for kind in ("other", "country"):
+            for cap in caps:
+                if fold(cap["country"]) == fold(country or "") and cap["kind"] == kind:
+                    return cap
+        return None
+
+    def lookup(self, query: str, destination: str = "", top_k: int = 3) -> dict:
+        """Answer a policy question from the rule table and the best matching sections."""
+        answer: dict = {"source": "local_policy_index", "policy_hash": self.content_hash[:12]}
+        if destination:
+            answer["destination"] = destination
+            answer["hotel_cap"] = self.hotel_cap(destination)
+        answer["rules"] = {key: value for key, value in self.rules.items() if key != "hotel_caps"}
+        answer["sections"] = [
+            {"id": section["id"], "title": section["title"], "text": section["text"].strip(), "score": round(score, 3)}
+            for score, section in self.index.search(f"{query} {destination}", top_k)
+        ]
+        return answer
+
+    def lookup_travel_policy(self, query: str, destination: str = "") -> str:
+        """Looks up the company travel policy locally: hotel caps per night, travel classes, meal caps and matching policy sections.
+
+        :param query: The policy question, e.g. "Hotelobergrenze und Flugklasse".
+        :param destination: Optional destination city or country, e.g. "Berlin".
+        :return: The applicable rules and policy sections as JSON.
+        """
+        return json.dumps(self.lookup(query, destination), ensure_ascii=False)
@@ -0,0 +1,387 @@
+"""Idempotent provisioning of the workshop agents and their knowledge sources.
+
+Creating every agent on each start costs several round-trips before the first prompt.
+The helpers in this module fingerprint each agent definition (name, model, instructions,
+tool definitions and tool resources) and remember the resulting agent IDs in a small local
+manifest. On the next start an agent whose fingerprint did not change is reused without
+calling the service at all; changed definitions are updated in place and only unknown
+agents are created. Uploaded files and vector stores are cached the same way, keyed by
+the content hash of the source document.
+
+Independent provisioning steps can be run concurrently with :func:`run_provisioning_graph`
+(thread pool) or :func:`run_provisioning_graph_async` (asyncio); only steps that depend on
+the IDs of other steps wait for them.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, NamedTuple, Optional
+
+from azure.ai.agents.models import Agent, FilePurpose, VectorStore
+from azure.core.exceptions import ResourceNotFoundError
+
+DEFAULT_MANIFEST_PATH = ".agent_manifest.json"
+DEFAULT_PROVISIONING_CONCURRENCY = 4
+
+
+def to_jsonable(value: Any) -> Any:
+    """Convert SDK models (and containers of them) into plain JSON-compatible values."""
+    if hasattr(value, "as_dict"):
+        return to_jsonable(value.as_dict())
+    if isinstance(value, dict):
+        return {str(key): to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def file_hash(file_path: str) -> str:
+    """Return the hex encoded SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as source:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(**definition: Any) -> str:
+    """Return a stable hash over an agent definition.
+
+    Args:
+        **definition: The keyword arguments that would be passed to ``create_agent``.
+
+    Returns:
+        str: The hex encoded SHA-256 of the canonical JSON form of the definition.
+    """
+    canonical = json.dumps(to_jsonable(definition), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ProvisioningManifest:
+    """Local JSON file that remembers which remote resources belong to which definition.
+
+    Entries are grouped by scope (usually the project endpoint) so one manifest can serve
+    several Foundry projects without mixing up their IDs.
+    """
+
+    def __init__(self, path: Optional[str] = None, scope: str = "default"):
+        self.path = path or os.getenv("AGENT_MANIFEST_PATH", DEFAULT_MANIFEST_PATH)
+        self.scope = scope
+        self._lock = threading.Lock()
+        self._data = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as manifest_file:
+                data = json.load(manifest_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+        data.setdefault("version", 1)
+        data.setdefault("scopes", {})
+        return data
+
+    def _section(self, kind: str) -> dict:
+        scope = self._data["scopes"].setdefault(self.scope, {})
+        return scope.setdefault(kind, {})
+
+    def get(self, kind: str, name: str) -> Optional[dict]:
+        """Return the entry stored for ``name`` or ``None`` if it is unknown."""
+        with self._lock:
+            return self._section(kind).get(name)
+
+    def put(self, kind: str, name: str, entry: dict) -> None:
+        """Store an entry and write the manifest to disk."""
+        with self._lock:
+            self._section(kind)[name] = entry
+            self._save()
+
+    def entries(self, kind: str) -> dict:
+        """Return a copy of all entries of ``kind`` in the scope by name."""
+        with self._lock:
+            return dict(self._section(kind))
+
+    def referenced_ids(self) -> set[str]:
+        """Return the IDs of all agents, vector stores and files recorded in any scope."""
+        with self._lock:
+            return {
+                entry[key]
+                for scope in self._data["scopes"].values()
+                for section in scope.values()
+                for entry in section.values()
+                for key in ("id", "file_id")
+                if key in entry
+            }
+
+    def remove(self, kind: str, name: str) -> Optional[dict]:
+        """Remove an entry and write the manifest to disk."""
+        with self._lock:
+            entry = self._section(kind).pop(name, None)
+            self._save()
+            return entry
+
+    def _save(self) -> None:
+        # Write to a temporary file first so a crash never leaves a half written manifest
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as manifest_file:
+            json.dump(self._data, manifest_file, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+class _ProvisionerBase:
+    def __init__(self, client, manifest: ProvisioningManifest, verify: bool = False, metadata: Optional[dict[str, str]] = None):
+        self.client = client
+        self.manifest = manifest
+        self.verify = verify
+        # Attached to agents and vector stores, e.g. the tags of the orphan sweeper
+        self.metadata = metadata
+        self.calls = 0
+
+    def _definition(self, **definition: Any) -> dict:
+        if self.metadata and definition.get("metadata") is None:
+            definition["metadata"] = self.metadata
+        return {key: value for key, value in definition.items() if value is not None}
+
+    def _record(self, name: str, agent: Agent, agent_fingerprint: str) -> Agent:
+        self.manifest.put(
+            "agents",
+            name,
+            {"id": agent.id, "fingerprint": agent_fingerprint, "definition": to_jsonable(agent)},
+        )
+        return agent
+
+
+class AgentProvisioner(_ProvisionerBase):
+    """Create, update or reuse agents with the synchronous ``AgentsClient``."""
+
+    def ensure_agent(self, *, name: str, model: str, **definition: Any) -> Agent:
+        """Return an agent matching the definition, creating or updating it only if needed.
+
+        Args:
+            name (str): The agent name, also used as the manifest key.
+            model (str): The model deployment name.
+            **definition: Further ``create_agent`` arguments (instructions, tools, ...).
+
+        Returns:
+            Agent: The reused, updated or newly created agent.
+        """
+        definition = self._definition(name=name, model=model, **definition)
+        agent_fingerprint = fingerprint(**definition)
+
+        known = self.manifest.get("agents", name)
+        if known and known["fingerprint"] == agent_fingerprint:
+            if not self.verify:
+                return Agent(known["definition"])
+            try:
+                self.calls += 1
+                return self.client.get_agent(known["id"])
+            except ResourceNotFoundError:
+                known = None
+
+        agent = None
+        if known:
+            try:
+                self.calls += 1
+                agent = self.client.update_agent(known["id"], **definition)
+            except ResourceNotFoundError:
+                agent = None
+        if agent is None:
+            self.calls += 1
+            agent = self.client.create_agent(**definition)
+        return self._record(name, agent, agent_fingerprint)
+
+    def delete_agent(self, name: str) -> None:
+        """Delete a provisioned agent and forget it in the manifest."""
+        entry = self.manifest.remove("agents", name)
+        if entry:
+            try:
+                self.client.delete_agent(entry["id"])
+            except ResourceNotFoundError:
+                pass
+
+    def ensure_vector_store(self, file_path: str, name: str) -> VectorStore:
+        """Return a vector store indexing ``file_path``, uploading the file only if it changed.
+
+        The manifest remembers the content hash of the last ingested document. As long as the
+        hash matches, the existing file and vector store are reused. When the document changed
+        it is uploaded and indexed again and the outdated file and store are deleted.
+
+        Args:
+            file_path (str): Path of the document to make searchable.
+            name (str): The vector store name, also used as the manifest key.
+
+        Returns:
+            VectorStore: The reused or newly created vector store.
+        """
+        content_hash = file_hash(file_path)
+        known = self.manifest.get("vector_stores", name)
+        if known and known["content_hash"] == content_hash:
+            if not self.verify:
+                return VectorStore(known["definition"])
+            try:
+                self.calls += 1
+                return self.client.vector_stores.get(known["id"])
+            except ResourceNotFoundError:
+                pass
+
+        self.calls += 2
+        file = self.client.files.upload_and_poll(file_path=file_path, purpose=FilePurpose.AGENTS)
+        vector_store = self.client.vector_stores.create_and_poll(
+            file_ids=[file.id], name=name, **({"metadata": self.metadata} if self.metadata else {})
+        )
+        self.manifest.put(
+            "vector_stores",
+            name,
+            {
+                "id": vector_store.id,
+                "file_id": file.id,
+                "content_hash": content_hash,
+                "definition": to_jsonable(vector_store),
+            },
+        )
+
+        # Remove the resources of the previous document version
+        if known:
+            self._delete_vector_store_resources(known)
+        return vector_store
+
+    def delete_vector_store(self, name: str) -> None:
+        """Delete a cached vector store together with its file and forget it in the manifest."""
+        entry = self.manifest.remove("vector_stores", name)
+        if entry:
+            self._delete_vector_store_resources(entry)
+
+    def _delete_vector_store_resources(self, entry: dict) -> None:
+        try:
+            self.client.vector_stores.delete(entry["id"])
+        except ResourceNotFoundError:
+            pass
+        try:
+            self.client.files.delete(entry["file_id"])
+        except ResourceNotFoundError:
+            pass
+
+
+class AsyncAgentProvisioner(_ProvisionerBase):
+    """Create, update or reuse agents with the asynchronous ``AgentsClient``."""
+
+    async def ensure_agent(self, *, name: str, model: str, **definition: Any) -> Agent:
+        """Async variant of :meth:`AgentProvisioner.ensure_agent`."""
+        definition = self._definition(name=name, model=model, **definition)
+        agent_fingerprint = fingerprint(**definition)
+
+        known = self.manifest.get("agents", name)
+        if known and known["fingerprint"] == agent_fingerprint:
+            if not self.verify:
+                return Agent(known["definition"])
+            try:
+                self.calls += 1
+                return await self.client.get_agent(known["id"])
+            except ResourceNotFoundError:
+                known = None
+
+        agent = None
+        if known:
+            try:
+                self.calls += 1
+                agent = await self.client.update_agent(known["id"], **definition)
+            except ResourceNotFoundError:
+                agent = None
+        if agent is None:
+            self.calls += 1
+            agent = await self.client.create_agent(**definition)
+        return self._record(name, agent, agent_fingerprint)
+
+    async def delete_agent(self, name: str) -> None:
+        """Delete a provisioned agent and forget it in the manifest."""
+        entry = self.manifest.remove("agents", name)
+        if entry:
+            try:
+                await self.client.delete_agent(entry["id"])
+            except ResourceNotFoundError:
+                pass
+
+
+class ProvisioningStep(NamedTuple):
+    """One node of a provisioning graph.
+
+    ``action`` receives a dict with the results of the steps listed in ``depends_on``.
+    """
+
+    depends_on: tuple[str, ...]
+    action: Callable[[dict], Any]
+
+
+def _check_graph(steps: dict[str, ProvisioningStep]) -> None:
+    for name, step in steps.items():
+        unknown = set(step.depends_on) - set(steps)
+        if unknown:
+            raise ValueError(f"Step '{name}' depends on unknown steps: {sorted(unknown)}")
+
+    # Kahn's algorithm, only used to reject cycles before anything is started
+    remaining = {name: set(step.depends_on) for name, step in steps.items()}
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Provisioning graph contains a cycle between: {sorted(remaining)}")
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+def run_provisioning_graph(steps: dict[str, ProvisioningStep], max_workers: int = DEFAULT_PROVISIONING_CONCURRENCY) -> dict:
+    """Run provisioning steps on a thread pool as soon as their dependencies are done.
+
+    Args:
+        steps (dict[str, ProvisioningStep]): The steps by name.
+        max_workers (int): Upper bound of steps running at the same time.
+
+    Returns:
+        dict: The result of every step by name.
+    """
+    _check_graph(steps)
+    results: dict[str, Any] = {}
+    pending = dict(steps)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="provisioning") as executor:
+        while pending or running:
+            for name, step in list(pending.items()):
+                if all(dep in results for dep in step.depends_on):
+                    inputs = {dep: results[dep] for dep in step.depends_on}
+                    running[executor.submit(step.action, inputs)] = name
+                    del pending[name]
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                # Re-raises the first failure; steps already running are still awaited on exit
+                results[running.pop(future)] = future.result()
+    return results
+
+
+async def run_provisioning_graph_async(
+    steps: dict[str, ProvisioningStep], max_concurrency: int = DEFAULT_PROVISIONING_CONCURRENCY
+) -> dict:
+    """Async variant of :func:`run_provisioning_graph` where actions return awaitables."""
+    _check_graph(steps)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    tasks: dict[str, asyncio.Task] = {}
+
+    async def run_step(name: str, step: ProvisioningStep) -> Any:
+        inputs = {dep: await tasks[dep] for dep in step.depends_on}
+        async with semaphore:
+            return await step.action(inputs)
+
+    for name, step in steps.items():
+        tasks[name] = asyncio.ensure_future(run_step(name, step))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    return {name: task.result() for name, task in tasks.items()}
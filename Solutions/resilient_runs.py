@@ -0,0 +1,487 @@
+"""Retries, hedging and circuit breakers around agent runs.
+
+A run that fails on a transient error (server error, rate limit, expired run, 5xx or 429
+response) is lost for the user, and a single slow connected agent holds the whole turn.
+:class:`ResilientRuns` wraps the :class:`~run_waiter.RunWaiter` and keeps the tail latency of a
+turn bounded:
+
+- **Retries**: runs that failed or expired for a transient reason are retried with a new run,
+  with exponential backoff and jitter, as long as the retry budget and the optional deadline
+  of the call allow it. Failed requests are not repeated, the ``RetryPolicy`` of azure-core
+  already retried them. Only when polling a run fails the wait resumes on the same run, which
+  goes on in the service; a new run would execute it a second time.
+- **Hedging**: once a run takes longer than a percentile (e.g. p95) of the recent successful
+  runs of its agent, a duplicate run is started on a fresh thread. The run that completes
+  first wins, the other one is cancelled.
+- **Circuit breaker**: every agent has a :class:`CircuitBreaker`. After consecutive failures
+  calls are rejected right away with :class:`CircuitOpenError` instead of waiting for the next
+  timeout, so callers can degrade gracefully, e.g. answer policy questions from the local
+  rule table. After ``reset_seconds`` a single trial run decides whether the agent is back.
+
+Duplicates of runs on a conversation thread run on a copy of the conversation. If such a
+duplicate wins, the returned run belongs to the copy, and the conversation continues there as
+after a compaction. Hedging these runs is opt-in (``hedge_conversations``), because the
+duplicate repeats the side effects of the original, e.g. a booking. Retrying them is opt-in
+as well (``retry_conversations``), and even then a failed run is only repeated while it did
+not call any tool.
+"""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Optional
+
+from azure.ai.agents.models import ListSortOrder, ThreadMessageOptions, ThreadRun
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError, ServiceRequestError, ServiceResponseError
+
+from run_waiter import AdaptiveBackoff
+
+# Error codes of failed runs that a new run may not hit again
+TRANSIENT_ERROR_CODES = ("server_error", "rate_limit_exceeded", "internal_error")
+TRANSIENT_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+METRICS = ("calls", "attempts", "retries", "hedges", "hedge_wins", "rejected", "failures")
+
+
+def _status(run: ThreadRun) -> str:
+    return getattr(run.status, "value", run.status)
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether a request error is worth another attempt."""
+    if isinstance(error, (ServiceRequestError, ServiceResponseError)):
+        return True
+    return isinstance(error, HttpResponseError) and error.status_code in TRANSIENT_STATUS_CODES
+
+
+def is_transient_run(run: ThreadRun) -> bool:
+    """Whether a finished run failed for a reason a new run may not hit again."""
+    if _status(run) == "expired":
+        return True
+    if _status(run) != "failed" or not run.last_error:
+        return False
+    code = run.last_error.get("code") if isinstance(run.last_error, dict) else getattr(run.last_error, "code", None)
+    return code in TRANSIENT_ERROR_CODES
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of starting a run while the circuit breaker of its agent is open."""
+
+    def __init__(self, agent: str, retry_after: float):
+        super().__init__(f"Agent {agent} is unavailable after repeated failures, next trial in {retry_after:.0f} s")
+        self.agent = agent
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Circuit breaker of a single agent.
+
+    ``closed`` lets all runs pass and opens after ``failure_threshold`` consecutive failures.
+    ``open`` rejects runs for ``reset_seconds``. ``half_open`` lets a single trial run pass,
+    its success closes the breaker and its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return CLOSED
+        return HALF_OPEN if self.clock() - self._opened_at >= self.reset_seconds else OPEN
+
+    def retry_after(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_seconds - (self.clock() - self._opened_at))
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def release(self) -> None:
+        """End a trial run without a verdict, e.g. after a cancellation by the user."""
+        with self._lock:
+            self._trial = False
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            self._trial = False
+            if success:
+                self.failures = 0
+                self._opened_at = None
+                return
+            self.failures += 1
+            if self._opened_at is not None or self.failures >= self.failure_threshold:
+                if self._opened_at is None or self.state == HALF_OPEN:
+                    self.opened += 1
+                self._opened_at = self.clock()
+
+
+class _AgentState:
+    def __init__(self, breaker: CircuitBreaker, window: int):
+        self.breaker = breaker
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.metrics = dict.fromkeys(METRICS, 0)
+
+
+class ResilientRuns:
+    """Retry, hedge and guard the runs waited for by a :class:`~run_waiter.RunWaiter`.
+
+    Offers ``create_and_wait`` and ``wait`` like the waiter, so it can replace it in
+    :class:`~subagents.CachedAgentTools`, :class:`~batch_runner.BatchRunner` and
+    :class:`~agent_service.AgentService`.
+
+    Args:
+        client: The synchronous ``AgentsClient``.
+        waiter (RunWaiter): Waits for every single run, its timeout bounds every attempt.
+        max_retries (int): Additional attempts after a transient failure.
+        backoff: Strategy with a ``delays()`` generator for the pauses between attempts.
+        deadline (Optional[float]): Seconds after which no further attempt is started.
+        hedge_percentile (Optional[float]): Start a duplicate once a run takes longer than this
+            percentile of the agent's recent successful runs, e.g. 95; ``None`` disables hedging.
+        hedge_min_samples (int): Successful runs of an agent needed before its runs are hedged.
+        hedge_conversations (bool): Also hedge runs on conversation threads, see the module
+            documentation.
+        retry_conversations (bool): Also retry failed runs on conversation threads, as long as
+            they did not call a tool, see :meth:`repeatable`.
+        failure_threshold (int): Consecutive failures that open the circuit breaker of an agent.
+        reset_seconds (float): Seconds an open circuit breaker rejects runs before a trial.
+        agent_names (Optional[dict]): Display names of the agent IDs for errors and summaries.
+    """
+
+    def __init__(
+        self,
+        client,
+        waiter,
+        max_retries: int = 2,
+        backoff=None,
+        deadline: Optional[float] = None,
+        hedge_percentile: Optional[float] = None,
+        hedge_min_samples: int = 20,
+        hedge_conversations: bool = False,
+        retry_conversations: bool = False,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+        latency_window: int = 200,
+        agent_names: Optional[dict] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.client = client
+        self.waiter = waiter
+        self.max_retries = max_retries
+        self.backoff = backoff or AdaptiveBackoff(fast_start_polls=0, initial=1.0, maximum=8.0, multiplier=2.0)
+        self.deadline = deadline
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_conversations = hedge_conversations
+        self.retry_conversations = retry_conversations
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.latency_window = latency_window
+        self.agent_names = agent_names if agent_names is not None else {}
+        self.clock = clock
+        self.sleep = sleep
+        self._agents: dict[str, _AgentState] = {}
+        self._lock = threading.Lock()
+
+    # The waiter's attributes, e.g. ``toolset`` and ``history``, stay reachable through the wrapper
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.waiter, name)
+
+    def _agent(self, agent_id: str) -> _AgentState:
+        with self._lock:
+            state = self._agents.get(agent_id)
+            if state is None:
+                state = self._agents[agent_id] = _AgentState(
+                    CircuitBreaker(self.failure_threshold, self.reset_seconds, self.clock), self.latency_window
+                )
+            return state
+
+    def _count(self, state: _AgentState, metric: str) -> None:
+        with self._lock:
+            state.metrics[metric] += 1
+
+    def breaker(self, agent_id: str) -> CircuitBreaker:
+        return self._agent(agent_id).breaker
+
+    def hedge_delay(self, agent_id: str) -> Optional[float]:
+        """Seconds after which a run of ``agent_id`` gets a duplicate, ``None`` while not hedged."""
+        if self.hedge_percentile is None:
+            return None
+        with self._lock:
+            state = self._agents.get(agent_id)
+            latencies = sorted(state.latencies) if state else []
+        if len(latencies) < self.hedge_min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100))]
+
+    def call(
+        self,
+        agent_id: str,
+        attempt: Callable[[], Any],
+        run_of: Callable[[Any], ThreadRun] = lambda result: result,
+        repeatable: Optional[Callable[[ThreadRun], bool]] = None,
+    ) -> Any:
+        """Call ``attempt`` behind the circuit breaker of ``agent_id``, again while its run fails transiently.
+
+        An exception of ``attempt`` ends the call, only a finished run with a transient failure
+        is retried.
+
+        Args:
+            agent_id (str): The agent whose breaker, latencies and metrics the call counts to.
+            attempt (Callable): Executes one attempt and returns a finished run, or a result
+                ``run_of`` extracts it from, e.g. the tuple of :func:`~run_stream.stream_run`.
+            repeatable (Optional[Callable]): Decides whether a transiently failed run may be
+                repeated, e.g. :meth:`repeatable` for runs on conversation threads.
+
+        Raises:
+            CircuitOpenError: The breaker of the agent is open.
+        """
+        state = self._agent(agent_id)
+        self._count(state, "calls")
+        if not state.breaker.allow():
+            self._count(state, "rejected")
+            raise CircuitOpenError(self.agent_names.get(agent_id, agent_id), state.breaker.retry_after())
+        started = self.clock()
+        delays = self.backoff.delays()
+        retries = 0
+        while True:
+            self._count(state, "attempts")
+            attempt_started = self.clock()
+            try:
+                result = attempt()
+            except BaseException as error:
+                # The request already went through the retries of azure-core and the run, if it
+                # was created, may still execute, so the call ends here
+                if isinstance(error, Exception) and is_transient_error(error):
+                    state.breaker.record(False)
+                    self._count(state, "failures")
+                else:
+                    state.breaker.release()
+                raise
+            run = run_of(result)
+            if not is_transient_run(run):
+                status = _status(run)
+                if status == "completed":
+                    state.breaker.record(True)
+                    with self._lock:
+                        state.latencies.append(self.clock() - attempt_started)
+                elif status in ("failed", "expired") or self._timed_out(run):
+                    state.breaker.record(False)
+                    self._count(state, "failures")
+                else:
+                    state.breaker.release()
+                return result
+            state.breaker.record(False)
+            delay = next(delays)
+            if not self._may_retry(state, retries, started, delay) or (repeatable is not None and not repeatable(run)):
+                self._count(state, "failures")
+                return result
+            retries += 1
+            self._count(state, "retries")
+            self.sleep(delay)
+
+    def _may_retry(self, state: _AgentState, retries: int, started: float, delay: float) -> bool:
+        # No further attempts once the failures of this or of concurrent calls opened the breaker
+        if retries >= self.max_retries or state.breaker.state != CLOSED:
+            return False
+        return self.deadline is None or self.clock() - started + delay < self.deadline
+
+    def repeatable(self, run: ThreadRun) -> bool:
+        """Whether a failed run on a conversation thread may be repeated with a new run.
+
+        Only with ``retry_conversations`` and only if the run did not call a tool: a connected
+        agent or a local function may already have booked a trip.
+        """
+        if not self.retry_conversations:
+            return False
+        steps = self.client.run_steps.list(thread_id=run.thread_id, run_id=run.id)
+        return not any(getattr(step.type, "value", step.type) == "tool_calls" for step in steps)
+
+    def _wait(self, state: _AgentState, run: ThreadRun, cancel_event: Optional[threading.Event] = None) -> ThreadRun:
+        """Wait for a created run and resume polling the same run after a transient error."""
+        started = self.clock()
+        delays = self.backoff.delays()
+        resumed = 0
+        while True:
+            try:
+                return self.waiter.wait(run, cancel_event=cancel_event)
+            except Exception as error:
+                delay = next(delays)
+                if not is_transient_error(error) or not self._may_retry(state, resumed, started, delay):
+                    raise
+            resumed += 1
+            self._count(state, "retries")
+            self.sleep(delay)
+
+    def _timed_out(self, run: ThreadRun) -> bool:
+        stats = self.waiter.stats_for(run.id) if hasattr(self.waiter, "stats_for") else None
+        return bool(stats and stats.timed_out)
+
+    def execute(
+        self,
+        agent_id: str,
+        start: Callable[[], ThreadRun],
+        hedge: Optional[Callable[[], ThreadRun]] = None,
+        discard: Optional[Callable[[ThreadRun], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        repeatable: Optional[Callable[[ThreadRun], bool]] = None,
+    ) -> ThreadRun:
+        """Start a run with ``start`` and wait for it, with retries, hedging and the breaker.
+
+        Args:
+            agent_id (str): The agent of the run.
+            start (Callable): Creates the run, called again for every retry of a failed run.
+            hedge (Optional[Callable]): Creates the duplicate run on a fresh thread; without it
+                the run is not hedged.
+            discard (Optional[Callable]): Called with every run that lost the race against its
+                duplicate, after it was cancelled.
+            cancel_event (Optional[threading.Event]): Setting this event cancels the run; runs
+                with a cancel event are not hedged.
+            repeatable (Optional[Callable]): See :meth:`call`.
+        """
+
+        def attempt() -> ThreadRun:
+            delay = self.hedge_delay(agent_id) if hedge is not None and cancel_event is None else None
+            if delay is None:
+                return self._wait(self._agent(agent_id), start(), cancel_event)
+            return self._race(agent_id, start, hedge, delay, discard)
+
+        return self.call(agent_id, attempt, repeatable=repeatable)
+
+    def _race(self, agent_id: str, start: Callable, hedge: Callable, delay: float, discard: Optional[Callable]) -> ThreadRun:
+        cancels = {}
+        state = self._agent(agent_id)
+        # The losing run may still execute a tool call, so the winner does not wait for it
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hedge")
+        try:
+
+            def submit(create: Callable) -> Any:
+                cancel = threading.Event()
+                future = executor.submit(contextvars.copy_context().run, lambda: self._wait(state, create(), cancel))
+                cancels[future] = cancel
+                return future
+
+            primary = submit(start)
+            if wait([primary], timeout=delay).done:
+                return primary.result()
+            self._count(state, "hedges")
+            duplicate = submit(hedge)
+
+            pending = {primary, duplicate}
+            finished, errors = [], []
+            winner = None
+            while pending and winner is None:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        run = future.result()
+                    except Exception as error:
+                        errors.append(error)
+                        continue
+                    if winner is None and _status(run) == "completed":
+                        winner = run
+                        if future is duplicate:
+                            self._count(state, "hedge_wins")
+                    else:
+                        finished.append(run)
+            for future in pending:
+                cancels[future].set()
+                if discard is not None:
+                    future.add_done_callback(lambda done: discard(done.result()) if not done.exception() else None)
+            if winner is None:
+                # Neither run completed, the later result is handed to the retry logic
+                if finished:
+                    return finished[-1]
+                raise errors[-1]
+            for run in finished:
+                if discard is not None:
+                    discard(run)
+            return winner
+        finally:
+            executor.shutdown(wait=False)
+
+    def wait(self, run: ThreadRun, cancel_event: Optional[threading.Event] = None) -> ThreadRun:
+        """Wait for an already created run; a failed run is repeated on its thread like in :meth:`create_and_wait`."""
+        first = [run]
+
+        def start() -> ThreadRun:
+            if first:
+                return first.pop()
+            return self.client.runs.create(thread_id=run.thread_id, agent_id=run.agent_id)
+
+        return self.execute(run.agent_id, start, cancel_event=cancel_event, repeatable=self.repeatable)
+
+    def create_and_wait(self, thread_id: str, agent_id: str, cancel_event: Optional[threading.Event] = None, **kwargs) -> ThreadRun:
+        """Create a run on a conversation thread and wait for it, the drop-in for ``RunWaiter.create_and_wait``.
+
+        With ``hedge_conversations`` the duplicate runs on a copy of the conversation. If it wins,
+        the returned run belongs to that new thread and the conversation continues there. A
+        failed run is repeated only under the conditions of :meth:`repeatable`.
+        """
+
+        def start() -> ThreadRun:
+            return self.client.runs.create(thread_id=thread_id, agent_id=agent_id, **kwargs)
+
+        def hedge() -> ThreadRun:
+            return self.client.runs.create(thread_id=self.copy_thread(thread_id).id, agent_id=agent_id, **kwargs)
+
+        def discard(run: ThreadRun) -> None:
+            # The abandoned conversation thread stays with the caller, like the thread of a compaction
+            if run.thread_id != thread_id:
+                self._delete_thread(run.thread_id)
+
+        return self.execute(agent_id, start, hedge if self.hedge_conversations else None, discard, cancel_event, self.repeatable)
+
+    def copy_thread(self, thread_id: str):
+        """Create a new thread with the text messages of ``thread_id``."""
+        messages = self.client.messages.list(thread_id=thread_id, order=ListSortOrder.ASCENDING)
+        return self.client.threads.create(
+            messages=[
+                ThreadMessageOptions(role=message.role, content=message.text_messages[-1].text.value)
+                for message in messages
+                if message.text_messages
+            ]
+        )
+
+    def _delete_thread(self, thread_id: str) -> None:
+        try:
+            self.client.threads.delete(thread_id)
+        except ResourceNotFoundError:
+            pass
+
+    def summary(self) -> dict:
+        """Metrics of all agents and per agent, with the state of their breakers and hedge delays."""
+        with self._lock:
+            agents = dict(self._agents)
+            totals = dict.fromkeys(METRICS, 0)
+            for state in agents.values():
+                for metric, value in state.metrics.items():
+                    totals[metric] += value
+        per_agent = {}
+        for agent_id, state in agents.items():
+            delay = self.hedge_delay(agent_id)
+            per_agent[self.agent_names.get(agent_id, agent_id)] = dict(
+                state.metrics,
+                breaker=state.breaker.state,
+                breaker_opened=state.breaker.opened,
+                hedge_after_seconds=round(delay, 3) if delay is not None else None,
+            )
+        return dict(totals, agents=per_agent)
@@ -0,0 +1,521 @@
+"""Lifecycle of the remote resources created by the workshop scripts.
+
+Agents, vector stores and files that the :mod:`provisioning` manifest caches are meant to
+survive a run. Everything else, above all the conversation threads, only lives as long as the
+script. :class:`ResourceRegistry` (and :class:`AsyncResourceRegistry` for the asynchronous
+client) tracks these resources and deletes them concurrently when the script ends, also on
+``SIGTERM``. On request the cached resources of the manifest are deleted in the same sweep.
+
+Tracked resources are written to a small SQLite journal shared by all scripts, so the
+resources of a process that crashed or was killed can still be found. Threads, agents and vector stores are additionally
+tagged with metadata. The sweeper deletes the journal entries of dead processes and all tagged
+resources older than a minimum age that neither the manifest nor a running process uses::
+
+    python resource_lifecycle.py sweep --older-than 24h --dry-run
+    python resource_lifecycle.py sweep --older-than 24h
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import signal
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, NamedTuple, Optional
+
+from azure.core.exceptions import ResourceNotFoundError
+
+from provisioning import ProvisioningManifest
+
+DEFAULT_JOURNAL_PATH = ".agent_resources.db"
+DEFAULT_CLEANUP_CONCURRENCY = 8
+DEFAULT_SWEEP_AGE = "24h"
+TAG_KEY = "created_by"
+TAG_VALUE = "agents-workshop"
+OWNER_KEY = "workshop_session"
+
+# Threads and agents reference vector stores, vector stores reference files
+DELETE_ORDER = ("thread", "agent", "vector_store", "file")
+# Kinds that carry metadata and can be found by tag; files only through the journal
+TAGGED_KINDS = ("thread", "agent", "vector_store")
+AGE_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+JOURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (kind, id)
+) WITHOUT ROWID
+"""
+
+
+class TrackedResource(NamedTuple):
+    """A remote resource and the process that created it."""
+
+    kind: str
+    id: str
+    owner: str
+    pid: int
+    created_at: float
+
+
+@dataclass
+class CleanupReport:
+    """Outcome of a bulk deletion."""
+
+    deleted: int = 0
+    missing: int = 0
+    failed: list[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.deleted} deleted, {self.missing} already gone, {len(self.failed)} failed in {self.seconds:.2f} s"
+            + (f" ({', '.join(self.failed)})" if self.failed else "")
+        )
+
+
+def parse_age(value: str) -> float:
+    """Parse an age like ``90m``, ``24h`` or ``7d`` (plain numbers are seconds)."""
+    value = value.strip().lower()
+    if value and value[-1] in AGE_UNITS:
+        return float(value[:-1]) * AGE_UNITS[value[-1]]
+    return float(value)
+
+
+def _timestamp(value: Any) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value or 0)
+
+
+def _process_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows, only the age decides there
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _delete_call(client, kind: str):
+    if kind == "thread":
+        return client.threads.delete
+    if kind == "agent":
+        return client.delete_agent
+    if kind == "vector_store":
+        return client.vector_stores.delete
+    return client.files.delete
+
+
+class ResourceJournal:
+    """Local SQLite journal of the tracked resources of all running scripts.
+
+    Every tracked or forgotten resource is a single row written in its own short transaction,
+    so the journal does not get slower with the number of threads, and SQLite's file locking
+    keeps the rows of concurrent scripts apart. The database is opened on first use.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("AGENT_RESOURCE_JOURNAL_PATH", DEFAULT_JOURNAL_PATH)
+        self._connection: Optional[sqlite3.Connection] = None
+        # One connection is shared by the threads of the script, e.g. the cleanup pool
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(JOURNAL_SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def entries(self) -> list[TrackedResource]:
+        with self._lock:
+            rows = self._connect().execute(f"SELECT {', '.join(TrackedResource._fields)} FROM resources ORDER BY created_at")
+            return [TrackedResource(*row) for row in rows]
+
+    def add(self, resource: TrackedResource) -> None:
+        with self._lock:
+            self._connect().execute("INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?)", resource)
+
+    def remove(self, keys: set[tuple[str, str]]) -> None:
+        if not keys:
+            return
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany("DELETE FROM resources WHERE kind = ? AND id = ?", keys)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+@contextmanager
+def _signals_deferred() -> Iterator[None]:
+    """Keep SIGINT and SIGTERM from interrupting a cleanup that is already running."""
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    previous = {signum: signal.signal(signum, signal.SIG_IGN) for signum in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        yield
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+
+
+class _RegistryBase:
+    def __init__(self, owner: str, journal: Optional[ResourceJournal] = None, max_concurrency: int = DEFAULT_CLEANUP_CONCURRENCY):
+        self.owner = owner
+        self.journal = journal
+        self.max_concurrency = max_concurrency
+        self.client = None
+        self._resources: dict[tuple[str, str], TrackedResource] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def tags(self) -> dict[str, str]:
+        """Metadata that marks resources of this script for the sweeper."""
+        return {TAG_KEY: TAG_VALUE, OWNER_KEY: self.owner}
+
+    def _tagged(self, kwargs: dict) -> dict:
+        kwargs["metadata"] = {**self.tags, **(kwargs.get("metadata") or {})}
+        return kwargs
+
+    def track(self, kind: str, resource_id: str) -> None:
+        """Delete the resource when the script ends."""
+        resource = TrackedResource(kind, resource_id, self.owner, os.getpid(), time.time())
+        with self._lock:
+            self._resources[(kind, resource_id)] = resource
+        if self.journal:
+            self.journal.add(resource)
+
+    def forget(self, kind: str, resource_id: str) -> None:
+        """Stop tracking a resource, e.g. because it was deleted elsewhere."""
+        with self._lock:
+            known = self._resources.pop((kind, resource_id), None)
+        if known and self.journal:
+            self.journal.remove({(kind, resource_id)})
+
+    def tracked(self, kind: str) -> list[str]:
+        """Return the IDs of the tracked resources of ``kind``, oldest first."""
+        with self._lock:
+            return [resource_id for resource_kind, resource_id in self._resources if resource_kind == kind]
+
+    def __len__(self) -> int:
+        return len(self._resources)
+
+    def _phases(self, manifest: Optional[ProvisioningManifest], names: Optional[Iterable[str]]) -> list[list[tuple[str, str]]]:
+        with self._lock:
+            targets = list(self._resources)
+        if manifest is not None:
+            names = None if names is None else set(names)
+            # The manifest forgets the entries first, so a failed deletion is left to the sweeper
+            for name in manifest.entries("agents"):
+                if names is None or name in names:
+                    targets.append(("agent", manifest.remove("agents", name)["id"]))
+            for name in manifest.entries("vector_stores"):
+                if names is None or name in names:
+                    entry = manifest.remove("vector_stores", name)
+                    targets += [("vector_store", entry["id"]), ("file", entry["file_id"])]
+        return [[target for target in targets if target[0] == kind] for kind in DELETE_ORDER]
+
+    def _settle(self, report: CleanupReport, outcomes: list[tuple[tuple[str, str], Optional[BaseException]]]) -> None:
+        done = set()
+        for target, error in outcomes:
+            if error is None:
+                report.deleted += 1
+            elif isinstance(error, ResourceNotFoundError):
+                report.missing += 1
+            else:
+                report.failed.append(f"{target[0]} {target[1]}: {type(error).__name__}")
+                continue
+            done.add(target)
+        with self._lock:
+            for target in done:
+                self._resources.pop(target, None)
+        if self.journal:
+            self.journal.remove(done)
+
+
+class ResourceRegistry(_RegistryBase):
+    """Track and delete the resources of a script that uses the synchronous ``AgentsClient``.
+
+    Args:
+        owner (str): Name of the script, stored in the tags and the journal.
+        journal (Optional[ResourceJournal]): Journal of the tracked resources for the sweeper.
+        max_concurrency (int): Deletions running at the same time.
+    """
+
+    def watch(self, client):
+        """Tag and track every thread created through ``client`` and return ``client``.
+
+        Call it before the client is wrapped, e.g. by :func:`tracing.instrument`.
+        """
+        self.client = client
+        threads = client.threads
+        create_thread, delete_thread, create_thread_and_run = threads.create, threads.delete, client.create_thread_and_run
+
+        def create(*args: Any, **kwargs: Any):
+            thread = create_thread(*args, **self._tagged(kwargs))
+            self.track("thread", thread.id)
+            return thread
+
+        def delete(thread_id: str, *args: Any, **kwargs: Any):
+            result = delete_thread(thread_id, *args, **kwargs)
+            self.forget("thread", thread_id)
+            return result
+
+        def create_and_run(*args: Any, **kwargs: Any):
+            run = create_thread_and_run(*args, **kwargs)
+            self.track("thread", run.thread_id)
+            return run
+
+        threads.create, threads.delete, client.create_thread_and_run = create, delete, create_and_run
+        return client
+
+    def cleanup(self, manifest: Optional[ProvisioningManifest] = None, names: Optional[Iterable[str]] = None) -> CleanupReport:
+        """Delete all tracked resources concurrently.
+
+        With a ``manifest`` its cached agents and vector stores (including their files) are
+        deleted as well, all of them or only those in ``names``.
+        """
+        started = time.perf_counter()
+        report = CleanupReport()
+        with _signals_deferred(), ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="cleanup") as executor:
+            for phase in self._phases(manifest, names):
+                futures = {target: executor.submit(_delete_call(self.client, target[0]), target[1]) for target in phase}
+                self._settle(report, [(target, future.exception()) for target, future in futures.items()])
+        report.seconds = time.perf_counter() - started
+        return report
+
+    @contextmanager
+    def cleanup_on_exit(
+        self,
+        enabled: bool = True,
+        manifest: Optional[ProvisioningManifest] = None,
+        names: Optional[Iterable[str]] = None,
+        on_report: Optional[Callable[[CleanupReport], None]] = None,
+    ) -> Iterator["ResourceRegistry"]:
+        """Run :meth:`cleanup` when the block is left, also through an exception or ``SystemExit``."""
+        try:
+            yield self
+        finally:
+            if enabled:
+                report = self.cleanup(manifest, names)
+                if on_report:
+                    on_report(report)
+
+    @staticmethod
+    def install_signal_handlers() -> None:
+        """Turn ``SIGTERM`` (and ``SIGHUP``) into ``SystemExit``, so ``finally`` blocks clean up."""
+
+        def exit_on_signal(signum, _frame):
+            raise SystemExit(128 + signum)
+
+        for name in ("SIGTERM", "SIGHUP"):
+            if hasattr(signal, name):
+                signal.signal(getattr(signal, name), exit_on_signal)
+
+
+class AsyncResourceRegistry(_RegistryBase):
+    """Async variant of :class:`ResourceRegistry` for the asynchronous ``AgentsClient``."""
+
+    def watch(self, client):
+        """Tag and track every thread created through ``client`` and return ``client``."""
+        self.client = client
+        threads = client.threads
+        create_thread, delete_thread = threads.create, threads.delete
+
+        async def create(*args: Any, **kwargs: Any):
+            thread = await create_thread(*args, **self._tagged(kwargs))
+            self.track("thread", thread.id)
+            return thread
+
+        async def delete(thread_id: str, *args: Any, **kwargs: Any):
+            result = await delete_thread(thread_id, *args, **kwargs)
+            self.forget("thread", thread_id)
+            return result
+
+        threads.create, threads.delete = create, delete
+        return client
+
+    async def cleanup(self, manifest: Optional[ProvisioningManifest] = None, names: Optional[Iterable[str]] = None) -> CleanupReport:
+        """Async variant of :meth:`ResourceRegistry.cleanup`."""
+        started = time.perf_counter()
+        report = CleanupReport()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def delete(target: tuple[str, str]) -> tuple[tuple[str, str], Optional[BaseException]]:
+            async with semaphore:
+                try:
+                    result = _delete_call(self.client, target[0])(target[1])
+                    if inspect.isawaitable(result):
+                        await result
+                    return target, None
+                except Exception as error:  # every failure is reported, the others are still deleted
+                    return target, error
+
+        for phase in self._phases(manifest, names):
+            # Shielded, so a cancellation of the script does not abort a started cleanup
+            self._settle(report, await asyncio.shield(asyncio.gather(*(delete(target) for target in phase))))
+        report.seconds = time.perf_counter() - started
+        return report
+
+    @asynccontextmanager
+    async def cleanup_on_exit(
+        self,
+        enabled: bool = True,
+        manifest: Optional[ProvisioningManifest] = None,
+        names: Optional[Iterable[str]] = None,
+        on_report: Optional[Callable[[CleanupReport], None]] = None,
+    ) -> AsyncIterator["AsyncResourceRegistry"]:
+        """Async variant of :meth:`ResourceRegistry.cleanup_on_exit`, also run on cancellation."""
+        try:
+            yield self
+        finally:
+            if enabled:
+                report = await self.cleanup(manifest, names)
+                if on_report:
+                    on_report(report)
+
+    @staticmethod
+    def install_signal_handlers() -> None:
+        """Cancel the current task on ``SIGTERM``, so ``finally`` blocks clean up."""
+        task = asyncio.current_task()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+        except (NotImplementedError, AttributeError):
+            # No signal handlers in the event loop on Windows
+            pass
+
+
+def _listing(client, kind: str) -> Any:
+    if kind == "thread":
+        return client.threads.list(limit=100)
+    if kind == "agent":
+        return client.list_agents(limit=100)
+    return client.vector_stores.list(limit=100)
+
+
+def find_orphans(
+    client,
+    journal: ResourceJournal,
+    protected_ids: set[str],
+    older_than: float,
+    kinds: tuple[str, ...] = DELETE_ORDER,
+    owner: Optional[str] = None,
+    now: Optional[float] = None,
+) -> list[TrackedResource]:
+    """Return the leaked resources.
+
+    These are the journal entries of processes that are no longer running or that are older
+    than ``older_than`` seconds, and the resources tagged by the workshop scripts that are
+    older than ``older_than`` and neither in ``protected_ids`` nor used by a running process.
+    """
+    now = now or time.time()
+    cutoff = now - older_than
+    orphans: dict[tuple[str, str], TrackedResource] = {}
+    live = set()
+    for resource in journal.entries():
+        if resource.kind not in kinds or (owner and resource.owner != owner) or resource.id in protected_ids:
+            continue
+        if _process_alive(resource.pid) and resource.created_at > cutoff:
+            live.add(resource.id)
+        else:
+            orphans[(resource.kind, resource.id)] = resource
+    for kind in TAGGED_KINDS:
+        if kind not in kinds:
+            continue
+        for item in _listing(client, kind):
+            metadata = item.metadata or {}
+            if metadata.get(TAG_KEY) != TAG_VALUE or (owner and metadata.get(OWNER_KEY) != owner):
+                continue
+            created_at = _timestamp(item.created_at)
+            if item.id in protected_ids or item.id in live or created_at > cutoff:
+                continue
+            orphans.setdefault((kind, item.id), TrackedResource(kind, item.id, metadata.get(OWNER_KEY, ""), 0, created_at))
+    return list(orphans.values())
+
+
+def sweep(
+    client,
+    journal: ResourceJournal,
+    manifest: ProvisioningManifest,
+    older_than: float,
+    kinds: tuple[str, ...] = DELETE_ORDER,
+    owner: Optional[str] = None,
+    dry_run: bool = False,
+    max_concurrency: int = DEFAULT_CLEANUP_CONCURRENCY,
+) -> tuple[list[TrackedResource], Optional[CleanupReport]]:
+    """Find the orphans and delete them concurrently, unless ``dry_run`` is set."""
+    orphans = find_orphans(client, journal, manifest.referenced_ids(), older_than, kinds, owner)
+    if dry_run:
+        return orphans, None
+    registry = ResourceRegistry(owner or "sweeper", journal, max_concurrency)
+    registry.client = client
+    registry._resources = {(orphan.kind, orphan.id): orphan for orphan in orphans}
+    return orphans, registry.cleanup()
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Clean up orphaned agents, threads, vector stores and files of the workshop scripts")
+    parser.add_argument("command", choices=("sweep",))
+    parser.add_argument("--older-than", default=DEFAULT_SWEEP_AGE, help="Minimum age of tagged resources, e.g. 90m, 24h, 7d")
+    parser.add_argument("--kind", action="append", choices=DELETE_ORDER, help="Only these resource kinds (repeatable)")
+    parser.add_argument("--owner", help="Only resources of one script, e.g. session1 or session2")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CLEANUP_CONCURRENCY, help="Concurrent deletions")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the orphaned resources")
+    args = parser.parse_args(argv)
+
+    from azure.ai.agents import AgentsClient
+    from azure.identity import DefaultAzureCredential
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    endpoint = os.getenv("PROJECT_ENDPOINT")
+    with AgentsClient(endpoint=endpoint, credential=DefaultAzureCredential()) as client:
+        orphans, report = sweep(
+            client,
+            ResourceJournal(),
+            ProvisioningManifest(scope=endpoint),
+            parse_age(args.older_than),
+            tuple(args.kind or DELETE_ORDER),
+            args.owner,
+            args.dry_run,
+            args.concurrency,
+        )
+    for orphan in orphans:
+        age = (time.time() - orphan.created_at) / 3600
+        print(f"{orphan.kind:<13} {orphan.id:<40} {orphan.owner or '-':<10} {age:8.1f} h")
+    print(f"{len(orphans)} orphaned resources" + (f", {report.summary()}" if report else " (dry run)"))
+
+
+if __name__ == "__main__":
+    main()
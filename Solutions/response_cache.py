@@ -0,0 +1,120 @@
+"""In-memory TTL/LRU cache for sub-agent answers.
+
+Near identical travel questions ("Berlin, Di–Fr, Hotelobergrenze?") would otherwise start a
+fresh agent run each time. Entries are grouped in namespaces (one per tool) that each have
+their own time to live; ``None`` means an entry never expires on its own. Policy answers use
+the content hash of the policy document as ``version`` so they stay valid exactly as long as
+the document does. The least recently used entry is evicted once the cache is full.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, Optional
+
+from places import fold, normalize_city
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+
+def normalize_trip_key(destination: str = "", start_date: str = "", end_date: str = "", travel_class: str = "", **extra: str) -> tuple:
+    """Build a cache key from trip parameters that ignores spelling and formatting differences.
+
+    Known cities are reduced to their canonical name ("Munich" and "München" match), all other
+    values are folded to lower case without umlauts and surrounding whitespace.
+    """
+
+    def clean(value: str) -> str:
+        return " ".join(fold(value or "").split())
+
+    parts = [
+        ("destination", normalize_city(destination or "") or clean(destination)),
+        ("start_date", clean(start_date)),
+        ("end_date", clean(end_date)),
+        ("travel_class", clean(travel_class)),
+    ]
+    parts.extend((name, clean(value)) for name, value in sorted(extra.items()))
+    return tuple(parts)
+
+
+class TTLLRUCache:
+    """Thread-safe LRU cache with a time to live per namespace.
+
+    Args:
+        max_entries (int): Capacity over all namespaces.
+        ttls (dict[str, Optional[float]]): Time to live in seconds per namespace.
+    """
+
+    def __init__(self, max_entries: int = 256, ttls: Optional[dict[str, Optional[float]]] = None, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttls = dict(ttls or {})
+        self.clock = clock
+        self.stats: dict[str, CacheStats] = {}
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _stats(self, namespace: str) -> CacheStats:
+        return self.stats.setdefault(namespace, CacheStats())
+
+    def get(self, namespace: str, key: Hashable, version: Optional[str] = None) -> Optional[Any]:
+        """Return the cached value or ``None`` on a miss."""
+        full_key = (namespace, version, key)
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > self.clock():
+                    self._entries.move_to_end(full_key)
+                    self._stats(namespace).hits += 1
+                    return value
+                del self._entries[full_key]
+                self._stats(namespace).expirations += 1
+            self._stats(namespace).misses += 1
+            return None
+
+    def put(self, namespace: str, key: Hashable, value: Any, version: Optional[str] = None) -> None:
+        """Store a value, evicting the least recently used entries when the cache is full."""
+        ttl = self.ttls.get(namespace)
+        expires_at = None if ttl is None else self.clock() + ttl
+        full_key = (namespace, version, key)
+        with self._lock:
+            self._entries[full_key] = (value, expires_at)
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.max_entries:
+                (evicted_namespace, _, _), _ = self._entries.popitem(last=False)
+                self._stats(evicted_namespace).evictions += 1
+
+    def get_or_compute(self, namespace: str, key: Hashable, compute: Callable[[], Any], version: Optional[str] = None) -> Any:
+        """Return the cached value or compute, store and return it."""
+        value = self.get(namespace, key, version)
+        if value is None:
+            value = compute()
+            self.put(namespace, key, value, version)
+        return value
+
+    def invalidate(self, namespace: str) -> None:
+        """Drop all entries of a namespace."""
+        with self._lock:
+            for full_key in [full_key for full_key in self._entries if full_key[0] == namespace]:
+                del self._entries[full_key]
+
+    def summary(self) -> dict:
+        """Return hit/miss counters and hit ratio per namespace."""
+        with self._lock:
+            return {
+                namespace: {
+                    "hits": stats.hits,
+                    "misses": stats.misses,
+                    "hit_ratio": round(stats.hits / (stats.hits + stats.misses), 3) if stats.hits + stats.misses else 0.0,
+                    "evictions": stats.evictions,
+                    "expirations": stats.expirations,
+                }
+                for namespace, stats in self.stats.items()
+            }
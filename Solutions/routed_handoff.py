@@ -0,0 +1,120 @@
+"""Handoff orchestration that delivers clear customer messages straight to the specialist.
+
+:class:`RoutedHandoffOrchestration` is a ``HandoffOrchestration`` whose agent actors ask an
+:class:`~intent_router.IntentRouter` before they answer a customer message. If the router is
+confident that another agent is responsible, the actor hands the conversation off without
+invoking its agent, exactly as if the agent had called the ``Handoff-transfer_to_...``
+function. The customer message has already been shared with all actors at that point, so the
+specialist answers it directly.
+
+The actor and the orchestration override private methods and attributes of Semantic Kernel,
+which were verified with :data:`VERIFIED_SEMANTIC_KERNEL_VERSION` only. Check
+:func:`routing_supported` and fall back to a plain ``HandoffOrchestration`` with any other
+version.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+import semantic_kernel
+from semantic_kernel.agents import Agent, HandoffOrchestration
+from semantic_kernel.agents.orchestration.handoffs import AgentHandoffs, HandoffAgentActor
+from semantic_kernel.agents.runtime import CoreRuntime
+from semantic_kernel.contents import AuthorRole, ChatMessageContent, FunctionCallContent, StreamingChatMessageContent
+
+from intent_router import IntentRouter
+
+VERIFIED_SEMANTIC_KERNEL_VERSION = "1.45.0"
+
+
+def routing_supported() -> bool:
+    """Return whether the installed Semantic Kernel is the version the overrides were verified with."""
+    return (
+        semantic_kernel.__version__ == VERIFIED_SEMANTIC_KERNEL_VERSION
+        and hasattr(HandoffAgentActor, "_invoke_agent_with_potentially_no_response")
+        and hasattr(HandoffOrchestration, "_register_members")
+    )
+
+
+def observe_agent_message(router: IntentRouter, message: StreamingChatMessageContent, is_final: bool) -> None:
+    """Tell the router whether an agent answered or handed off, to judge its routes.
+
+    Meant to be called from the ``streaming_agent_response_callback``.
+    """
+    handed_off = False
+    for item in message.items:
+        if isinstance(item, FunctionCallContent) and item.plugin_name == "Handoff" and item.function_name.startswith("transfer_to_"):
+            router.record_handoff(message.name, item.function_name.removeprefix("transfer_to_"))
+            handed_off = True
+    if is_final and message.content and not handed_off:
+        router.record_answer(message.name)
+
+
+class RoutedHandoffAgentActor(HandoffAgentActor):
+    """Agent actor that hands customer messages with a clear intent to the responsible agent."""
+
+    def __init__(self, *args, router: IntentRouter, on_route: Optional[Callable[[str, str], None]] = None, **kwargs):
+        self._router = router
+        self._on_route = on_route
+        super().__init__(*args, **kwargs)
+
+    async def _invoke_agent_with_potentially_no_response(self, additional_messages=None, **kwargs) -> Optional[ChatMessageContent]:
+        if isinstance(additional_messages, ChatMessageContent) and additional_messages.role == AuthorRole.USER:
+            target = self._router.route(additional_messages.content or "", self._agent.name)
+            if target is not None:
+                if self._on_route:
+                    self._on_route(self._agent.name, target)
+                # Keep the message for the next invocation of this agent, like a handoff turn would
+                self._message_cache.add_message(additional_messages)
+                self._handoff_agent_name = target
+                return None
+        return await super()._invoke_agent_with_potentially_no_response(additional_messages, **kwargs)
+
+
+class RoutedHandoffOrchestration(HandoffOrchestration):
+    """``HandoffOrchestration`` with local routing of customer messages.
+
+    Args:
+        router (IntentRouter): Classifies the customer messages.
+        on_route (Optional[Callable[[str, str], None]]): Called with the source and target agent
+            of every local route.
+        **kwargs: The arguments of ``HandoffOrchestration``.
+    """
+
+    def __init__(self, *args, router: IntentRouter, on_route: Optional[Callable[[str, str], None]] = None, **kwargs):
+        if not routing_supported():
+            raise RuntimeError(
+                f"RoutedHandoffOrchestration was verified with semantic-kernel {VERIFIED_SEMANTIC_KERNEL_VERSION}, "
+                f"found {semantic_kernel.__version__}"
+            )
+        self._router = router
+        self._on_route = on_route
+        super().__init__(*args, **kwargs)
+
+    async def _register_members(
+        self,
+        runtime: CoreRuntime,
+        internal_topic_type: str,
+        exception_callback: Callable[[BaseException], None],
+        result_callback: Optional[Callable[[ChatMessageContent], Awaitable[None]]] = None,
+    ) -> None:
+        async def register(agent: Agent) -> None:
+            handoff_connections = self._handoffs.get(agent.name, AgentHandoffs())
+            await RoutedHandoffAgentActor.register(
+                runtime,
+                self._get_agent_actor_type(agent, internal_topic_type),
+                lambda agent=agent, handoff_connections=handoff_connections: RoutedHandoffAgentActor(
+                    agent,
+                    internal_topic_type,
+                    handoff_connections,
+                    exception_callback,
+                    result_callback=result_callback,
+                    agent_response_callback=self._agent_response_callback,
+                    streaming_agent_response_callback=self._streaming_agent_response_callback,
+                    human_response_function=self._human_response_function,
+                    router=self._router,
+                    on_route=self._on_route,
+                ),
+            )
+
+        await asyncio.gather(*[register(member) for member in self._members])
@@ -0,0 +1,101 @@
+"""Streaming execution of orchestrator runs.
+
+``runs.create_and_process`` only returns once the complete multi-agent run has finished.
+:func:`stream_run` starts the run as a stream instead and prints the orchestrator's text as
+it is generated, together with the progress of the connected agents it calls. If the stream
+cannot be opened the run falls back to a blocking execution.
+"""
+
+import time
+from typing import Callable, Optional
+
+from azure.ai.agents.models import AgentEventHandler, MessageDeltaChunk, RunStep, ThreadMessage, ThreadRun
+from azure.core.exceptions import AzureError
+
+
+class ConsoleRunEventHandler(AgentEventHandler):
+    """Print text deltas and connected agent tool calls of a streamed run."""
+
+    def __init__(self, write: Optional[Callable[[str], None]] = None):
+        super().__init__()
+        self.write = write or (lambda text: print(text, end="", flush=True))
+        self.run: Optional[ThreadRun] = None
+        self.printed_text = False
+        self.first_output_at: Optional[float] = None
+        self._started_at = time.perf_counter()
+        self._tool_calls_started: dict[str, float] = {}
+        self._in_message = False
+
+    def _emit(self, text: str) -> None:
+        if self.first_output_at is None:
+            self.first_output_at = time.perf_counter() - self._started_at
+        self.write(text)
+
+    def on_thread_run(self, run: ThreadRun) -> None:
+        self.run = run
+
+    def on_message_delta(self, delta: MessageDeltaChunk) -> None:
+        if not delta.text:
+            return
+        if not self._in_message:
+            self._emit("assistant:\n")
+            self._in_message = True
+        self._emit(delta.text)
+        self.printed_text = True
+
+    def on_thread_message(self, message: ThreadMessage) -> None:
+        if message.status == "completed" and self._in_message:
+            self._emit("\n\n")
+            self._in_message = False
+
+    def on_run_step(self, step: RunStep) -> None:
+        tool_calls = getattr(step.step_details, "tool_calls", None) or []
+        for tool_call in tool_calls:
+            connected_agent = getattr(tool_call, "connected_agent", None)
+            if connected_agent is None:
+                continue
+            if tool_call.id not in self._tool_calls_started:
+                self._tool_calls_started[tool_call.id] = time.perf_counter()
+                self._emit(f"  → {connected_agent.name} wird ausgeführt...\n")
+            if step.status == "completed":
+                duration = time.perf_counter() - self._tool_calls_started[tool_call.id]
+                self._emit(f"  ✓ {connected_agent.name} fertig ({duration:.1f}s)\n")
+            elif step.status in ("failed", "cancelled", "expired"):
+                self._emit(f"  ✗ {connected_agent.name} {step.status}\n")
+
+    def on_error(self, data: str) -> None:
+        self._emit(f"\nStream-Fehler: {data}\n")
+
+
+def stream_run(
+    client,
+    thread_id: str,
+    agent_id: str,
+    event_handler: Optional[ConsoleRunEventHandler] = None,
+    fallback: Optional[Callable[[], ThreadRun]] = None,
+) -> tuple[ThreadRun, bool]:
+    """Execute a run while streaming its output to the console.
+
+    Args:
+        client: The synchronous ``AgentsClient``.
+        thread_id (str): The thread to run.
+        agent_id (str): The agent executing the run.
+        event_handler (Optional[ConsoleRunEventHandler]): Handler that renders the stream.
+        fallback (Optional[Callable[[], ThreadRun]]): Blocking execution used when streaming is
+            unavailable, defaults to ``runs.create_and_process``.
+
+    Returns:
+        tuple[ThreadRun, bool]: The finished run and whether its text was already printed.
+    """
+    handler = event_handler or ConsoleRunEventHandler()
+    try:
+        with client.runs.stream(thread_id=thread_id, agent_id=agent_id, event_handler=handler) as stream:
+            stream.until_done()
+    except AzureError:
+        # The run was never started, so the blocking variant can safely take over
+        if handler.run is None:
+            if fallback is not None:
+                return fallback(), False
+            return client.runs.create_and_process(thread_id=thread_id, agent_id=agent_id), False
+        raise
+    return handler.run, handler.printed_text
@@ -0,0 +1,221 @@
+"""Pluggable waiting for agent runs.
+
+``runs.create_and_process`` polls the run status on a fixed interval. :class:`RunWaiter`
+replaces that loop with an exchangeable polling strategy, a hard timeout, cancellation and
+per-run statistics (number of polls and time spent waiting), so request volume can be tuned
+against responsiveness.
+
+Strategies are iterables of delays in seconds:
+
+- :class:`FixedInterval` reproduces the SDK behaviour.
+- :class:`AdaptiveBackoff` polls quickly right after the start (short runs finish fast) and
+  then backs off exponentially with jitter (long connected agent runs cost few requests).
+"""
+
+import random
+import statistics
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterator, Optional
+
+from azure.ai.agents.models import SubmitToolOutputsAction, ThreadRun
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete")
+
+
+class FixedInterval:
+    """Poll on a constant interval."""
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+
+    def delays(self) -> Iterator[float]:
+        while True:
+            yield self.interval
+
+
+class AdaptiveBackoff:
+    """Poll fast at first, then back off exponentially with jitter.
+
+    Args:
+        fast_start_polls (int): Number of polls in the latency-optimized start phase.
+        fast_start_interval (float): Delay between polls of the start phase.
+        initial (float): First delay after the start phase.
+        maximum (float): Upper bound of a single delay.
+        multiplier (float): Growth factor of the delay after every poll.
+        jitter (float): Relative random deviation applied to every delay, e.g. 0.2 for ±20 %.
+    """
+
+    def __init__(
+        self,
+        fast_start_polls: int = 4,
+        fast_start_interval: float = 0.25,
+        initial: float = 0.5,
+        maximum: float = 5.0,
+        multiplier: float = 1.5,
+        jitter: float = 0.2,
+        rng: Optional[random.Random] = None,
+    ):
+        self.fast_start_polls = fast_start_polls
+        self.fast_start_interval = fast_start_interval
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+
+    def _jittered(self, delay: float) -> float:
+        return max(0.0, delay * (1 + self.rng.uniform(-self.jitter, self.jitter)))
+
+    def delays(self) -> Iterator[float]:
+        for _ in range(self.fast_start_polls):
+            yield self._jittered(self.fast_start_interval)
+        delay = self.initial
+        while True:
+            yield self._jittered(delay)
+            delay = min(self.maximum, delay * self.multiplier)
+
+
+@dataclass
+class RunWaitStats:
+    """Statistics of waiting for a single run."""
+
+    run_id: str
+    status: str = ""
+    polls: int = 0
+    wait_seconds: float = 0.0
+    tool_submissions: int = 0
+    timed_out: bool = False
+    cancelled: bool = False
+
+
+class RunWaiter:
+    """Wait for runs to reach a terminal status using a polling strategy.
+
+    Args:
+        client: The synchronous ``AgentsClient``.
+        strategy: Object with a ``delays()`` generator, defaults to :class:`AdaptiveBackoff`.
+        timeout (Optional[float]): Hard limit in seconds after which the run is cancelled.
+        toolset: Optional ``ToolSet`` used to answer ``requires_action`` with local functions.
+        on_finished (Optional[Callable[[ThreadRun, float], None]]): Called with every run that
+            was waited for and the seconds spent waiting, e.g. ``UsageLedger.record_run``.
+    """
+
+    def __init__(
+        self,
+        client,
+        strategy=None,
+        timeout: Optional[float] = None,
+        toolset=None,
+        clock: Callable[[], float] = time.monotonic,
+        on_finished: Optional[Callable[[ThreadRun, float], None]] = None,
+    ):
+        self.client = client
+        self.strategy = strategy or AdaptiveBackoff()
+        self.timeout = timeout
+        self.toolset = toolset
+        self.clock = clock
+        self.on_finished = on_finished
+        self.history: list[RunWaitStats] = []
+        self._lock = threading.Lock()
+
+    def create_and_wait(self, thread_id: str, agent_id: str, cancel_event: Optional[threading.Event] = None, **kwargs) -> ThreadRun:
+        """Create a run and wait for it, the drop-in replacement for ``create_and_process``."""
+        run = self.client.runs.create(thread_id=thread_id, agent_id=agent_id, **kwargs)
+        return self.wait(run, cancel_event=cancel_event)
+
+    def wait(self, run: ThreadRun, cancel_event: Optional[threading.Event] = None) -> ThreadRun:
+        """Poll ``run`` until it reaches a terminal status, the timeout or a cancellation.
+
+        Args:
+            run (ThreadRun): The run as returned by ``runs.create``.
+            cancel_event (Optional[threading.Event]): Setting this event cancels the run.
+
+        Returns:
+            ThreadRun: The run in its last observed status.
+        """
+        stats = RunWaitStats(run_id=run.id)
+        cancel_event = cancel_event or threading.Event()
+        started = self.clock()
+        delays = self.strategy.delays()
+        try:
+            while run.status not in TERMINAL_STATUSES:
+                if self.timeout is not None and self.clock() - started >= self.timeout:
+                    stats.timed_out = True
+                    run = self._cancel(run, stats)
+                    break
+
+                delay = next(delays)
+                if self.timeout is not None:
+                    delay = min(delay, max(0.0, self.timeout - (self.clock() - started)))
+                # Event.wait returns early when the run gets cancelled from another thread
+                if cancel_event.wait(delay):
+                    run = self._cancel(run, stats)
+                    break
+
+                run = self.client.runs.get(thread_id=run.thread_id, run_id=run.id)
+                stats.polls += 1
+
+                if run.status == "requires_action" and isinstance(run.required_action, SubmitToolOutputsAction):
+                    run = self._submit_tool_outputs(run, stats)
+        except KeyboardInterrupt:
+            self._cancel(run, stats)
+            raise
+        finally:
+            stats.status = getattr(run.status, "value", run.status)
+            stats.wait_seconds = self.clock() - started
+            with self._lock:
+                self.history.append(stats)
+        if self.on_finished is not None:
+            self.on_finished(run, stats.wait_seconds)
+        return run
+
+    def _submit_tool_outputs(self, run: ThreadRun, stats: RunWaitStats) -> ThreadRun:
+        tool_calls = run.required_action.submit_tool_outputs.tool_calls
+        if not self.toolset:
+            # Same as the SDK: without local tools the run cannot continue
+            return self._cancel(run, stats)
+        tool_outputs = self.toolset.execute_tool_calls(tool_calls)
+        stats.tool_submissions += 1
+        return self.client.runs.submit_tool_outputs(thread_id=run.thread_id, run_id=run.id, tool_outputs=tool_outputs)
+
+    def _cancel(self, run: ThreadRun, stats: RunWaitStats) -> ThreadRun:
+        stats.cancelled = True
+        return self.client.runs.cancel(thread_id=run.thread_id, run_id=run.id)
+
+    def summary(self) -> dict:
+        """Aggregate the recorded statistics over all waited runs."""
+        with self._lock:
+            history = list(self.history)
+        if not history:
+            return {"runs": 0}
+        waits = sorted(stats.wait_seconds for stats in history)
+        return {
+            "runs": len(history),
+            "polls_total": sum(stats.polls for stats in history),
+            "polls_mean": statistics.mean(stats.polls for stats in history),
+            "wait_p50_seconds": waits[len(waits) // 2],
+            "wait_p95_seconds": waits[min(len(waits) - 1, int(len(waits) * 0.95))],
+            "timeouts": sum(stats.timed_out for stats in history),
+            "cancellations": sum(stats.cancelled for stats in history),
+        }
+
+    def stats_for(self, run_id: str) -> Optional[RunWaitStats]:
+        """Return the statistics recorded for ``run_id``, needed when runs are awaited concurrently."""
+        with self._lock:
+            return next((stats for stats in reversed(self.history) if stats.run_id == run_id), None)
+
+    def last_stats(self) -> Optional[dict]:
+        """Return the statistics of the most recent run as a dict."""
+        with self._lock:
+            return asdict(self.history[-1]) if self.history else None
+
+
+def polling_strategy_from_name(name: str):
+    """Build a polling strategy from its configuration name (``adaptive`` or ``fixed``)."""
+    if name == "fixed":
+        return FixedInterval()
+    if name == "adaptive":
+        return AdaptiveBackoff()
+    raise ValueError(f"Unknown polling strategy '{name}', expected 'adaptive' or 'fixed'")
@@ -0,0 +1,263 @@
+"""Short startup of the solution scripts.
+
+The first request of a script waits for two slow things: importing the SDKs and the first token
+of ``DefaultAzureCredential``, which walks its chain of credential sources (environment,
+managed identity, Azure CLI, ...) and may start a subprocess for it. :class:`DeferredCredential`
+builds the credential only when it is needed, and :meth:`DeferredCredential.warm` fetches the
+first token on a background thread, so the credential chain runs while the script is still
+importing and initializing. The credential it builds is the pinned, cached credential of
+:mod:`token_cache` unless ``TOKEN_CACHE`` is ``false``. :class:`AsyncDeferredCredential` hands
+its tokens to async clients.
+:func:`preload` imports modules that are needed only later on a background thread, so their
+import overlaps with network calls like the provisioning of the agents.
+
+``python startup.py profile <script>`` reports how long the top-level imports of a script
+take, per module and per package, to find what to defer next.
+"""
+
+import argparse
+import ast
+import asyncio
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Callable, NamedTuple, Optional
+
+# Token scope of the Foundry agents service
+AGENTS_SCOPE = "https://ai.azure.com/.default"
+# A prefetched token is handed out only while it stays valid for at least this long
+MIN_TOKEN_LIFETIME = 300
+IMPORTS_MARKER = "--- script imports ---"
+
+
+def preload(*modules: str) -> threading.Thread:
+    """Import ``modules`` on a daemon thread.
+
+    A later ``import`` of one of them waits until the background import finished, and raises
+    its error again if it failed.
+    """
+
+    def load():
+        for module in modules:
+            try:
+                importlib.import_module(module)
+            except Exception:
+                pass
+
+    thread = threading.Thread(target=load, name="preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def default_credential():
+    from token_cache import credential_from_env
+
+    return credential_from_env()
+
+
+def default_async_credential():
+    from azure.identity.aio import DefaultAzureCredential
+
+    return DefaultAzureCredential()
+
+
+def _plain_request(kwargs: dict) -> bool:
+    """Whether a token request asks for no claims, tenant or CAE, which a prefetched token lacks."""
+    options = dict(kwargs.get("options") or {}, **{key: value for key, value in kwargs.items() if key != "options"})
+    return not any(options.values())
+
+
+class DeferredCredential:
+    """Synchronous credential that is built on first use and can fetch its first token early.
+
+    Args:
+        factory (Callable): Builds the actual credential, by default ``DefaultAzureCredential``.
+    """
+
+    def __init__(self, factory: Callable[[], Any] = default_credential):
+        self._factory = factory
+        self._credential = None
+        self._lock = threading.Lock()
+        self._warmup: Optional[threading.Thread] = None
+        self._prefetched: dict[tuple, Any] = {}
+        self._error: Optional[Exception] = None
+
+    @property
+    def credential(self):
+        with self._lock:
+            if self._credential is None:
+                self._credential = self._factory()
+            return self._credential
+
+    def warm(self, *scopes: str) -> "DeferredCredential":
+        """Build the credential and fetch a token for ``scopes`` on a daemon thread."""
+
+        def fetch():
+            try:
+                self._prefetched[scopes] = self.credential.get_token_info(*scopes)
+            except Exception as error:
+                # Raised by the first request that needs the token instead of walking the chain again
+                self._error = error
+
+        self._warmup = threading.Thread(target=fetch, name="credential-warmup", daemon=True)
+        self._warmup.start()
+        return self
+
+    def prefetched(self, scopes: tuple) -> Optional[Any]:
+        """Return the token fetched by :meth:`warm` if it is still valid, waiting for the warm-up."""
+        if self._warmup is not None:
+            self._warmup.join()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+        token = self._prefetched.get(scopes)
+        if token is not None and token.expires_on - time.time() > MIN_TOKEN_LIFETIME:
+            return token
+        return None
+
+    def get_token_info(self, *scopes: str, **kwargs: Any) -> Any:
+        token = self.prefetched(scopes) if _plain_request(kwargs) else None
+        return token or self.credential.get_token_info(*scopes, **kwargs)
+
+    def get_token(self, *scopes: str, **kwargs: Any) -> Any:
+        from azure.core.credentials import AccessToken
+
+        token = self.prefetched(scopes) if _plain_request(kwargs) else None
+        if token:
+            return AccessToken(token.token, token.expires_on)
+        return self.credential.get_token(*scopes, **kwargs)
+
+    def close(self) -> None:
+        if self._credential is not None:
+            self._credential.close()
+
+    def __enter__(self) -> "DeferredCredential":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class AsyncDeferredCredential:
+    """Async credential that serves the tokens of a warmed :class:`DeferredCredential`.
+
+    With ``prefetch`` every token request goes to the synchronous credential on a worker thread,
+    so the async client shares its warm-up token, pinned source and background refreshes.
+
+    Args:
+        factory (Callable): Builds the async credential that is used without ``prefetch``, by
+            default the async ``DefaultAzureCredential``.
+        prefetch (DeferredCredential): The warmed credential that serves the tokens.
+    """
+
+    def __init__(self, factory: Callable[[], Any] = default_async_credential, prefetch: Optional[DeferredCredential] = None):
+        self._factory = factory
+        self._credential = None
+        self._prefetch = prefetch
+
+    @property
+    def credential(self):
+        if self._credential is None:
+            self._credential = self._factory()
+        return self._credential
+
+    async def get_token_info(self, *scopes: str, **kwargs: Any) -> Any:
+        if self._prefetch is not None:
+            return await asyncio.to_thread(self._prefetch.get_token_info, *scopes, **kwargs)
+        return await self.credential.get_token_info(*scopes, **kwargs)
+
+    async def get_token(self, *scopes: str, **kwargs: Any) -> Any:
+        if self._prefetch is not None:
+            return await asyncio.to_thread(self._prefetch.get_token, *scopes, **kwargs)
+        return await self.credential.get_token(*scopes, **kwargs)
+
+    async def close(self) -> None:
+        if self._credential is not None:
+            await self._credential.close()
+        if self._prefetch is not None:
+            self._prefetch.close()
+
+    async def __aenter__(self) -> "AsyncDeferredCredential":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+
+class ImportTime(NamedTuple):
+    module: str
+    depth: int
+    self_seconds: float
+    cumulative_seconds: float
+
+
+def top_level_imports(script_path: str) -> list[str]:
+    """Return the import statements a script executes at module level, in order."""
+    with open(script_path, encoding="utf-8") as script_file:
+        tree = ast.parse(script_file.read(), script_path)
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+def profile_imports(script_path: str) -> tuple[list[ImportTime], float]:
+    """Run the top-level imports of a script under ``-X importtime`` in a fresh interpreter.
+
+    Returns:
+        tuple[list[ImportTime], float]: The import time of every module and the wall time of
+        the interpreter including its own startup.
+    """
+    script_dir = os.path.dirname(os.path.abspath(script_path))
+    # Modules of the interpreter startup are reported before the marker and skipped
+    code = "import sys; sys.path.insert(0, {!r}); sys.stderr.write({!r})\n{}".format(
+        os.path.dirname(os.path.abspath(__file__)), IMPORTS_MARKER + "\n", "\n".join(top_level_imports(script_path))
+    )
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=script_dir, capture_output=True, text=True)
+    wall_seconds = time.perf_counter() - started
+    if result.returncode:
+        raise RuntimeError(f"Import of {script_path} failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    times = []
+    for line in result.stderr.partition(IMPORTS_MARKER)[2].splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        module = name.rstrip()
+        depth = (len(module) - len(module.lstrip())) // 2
+        times.append(ImportTime(module.strip(), depth, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return times, wall_seconds
+
+
+def main(argv: Optional[list[str]] = None) -> list[ImportTime]:
+    parser = argparse.ArgumentParser(description="Analyse the startup time of the solution scripts")
+    commands = parser.add_subparsers(dest="command", required=True)
+    profile = commands.add_parser("profile", help="Import time per module of the top-level imports of a script")
+    profile.add_argument("script", help="Script, e.g. code_complete_session_2.py")
+    profile.add_argument("--top", type=int, default=15, help="Number of slowest modules")
+    args = parser.parse_args(argv)
+
+    times, wall_seconds = profile_imports(args.script)
+    # Depth 0 are the modules the script imports itself, their cumulative time adds up to the import phase
+    direct = [entry for entry in times if entry.depth == 0]
+    total = sum(entry.cumulative_seconds for entry in direct)
+    print(f"{args.script}: {len(times)} modules imported in {total:.3f} s, interpreter total {wall_seconds:.3f} s\n")
+    print("Direct imports (cumulative):")
+    for entry in sorted(direct, key=lambda entry: -entry.cumulative_seconds)[: args.top]:
+        print(f"  {entry.module:<50} {entry.cumulative_seconds * 1000:>9.1f} ms")
+    packages: dict[str, float] = {}
+    for entry in times:
+        package = entry.module.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + entry.self_seconds
+    print("\nPackages (sum of self time):")
+    for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[: args.top]:
+        print(f"  {package:<50} {seconds * 1000:>9.1f} ms")
+    print("\nSlowest modules (self time):")
+    for entry in sorted(times, key=lambda entry: -entry.self_seconds)[: args.top]:
+        print(f"  {entry.module:<50} {entry.self_seconds * 1000:>9.1f} ms")
+    return times
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+"""Client-side invocation of the policy and research agents.
+
+With ``ConnectedAgentTool`` the orchestrator calls its sub-agents inside the service, where no
+client-side cache can sit in between. :class:`CachedAgentTools` exposes the policy and the
+research agent as local function tools instead: each call is answered from a
+:class:`~response_cache.TTLLRUCache` when the normalized trip parameters were asked before and
+otherwise runs the sub-agent on a short-lived thread of its own.
+
+:meth:`CachedAgentTools.plan_trip` takes the two agents off the orchestrator's critical path:
+once the trip parameters are complete it runs the policy check and a speculative research
+concurrently, drops the research options that violate the policy constraints and returns the
+merged result, so a turn waits for the slower of the two agents instead of both in a row.
+
+With a :class:`~resilient_runs.ResilientRuns` as waiter the sub-agent runs are retried and
+hedged, and while the circuit breaker of an agent is open its tool answers without it: the
+policy check from the local rule table, the research with a notice for the orchestrator.
+"""
+
+import contextvars
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from azure.ai.agents.models import AgentThreadCreationOptions, MessageRole, ThreadMessageOptions
+from azure.core.exceptions import ResourceNotFoundError
+
+from policy_index import AMOUNT_PATTERN, parse_amount
+from resilient_runs import CircuitOpenError
+from response_cache import TTLLRUCache, normalize_trip_key
+
+POLICY_NAMESPACE = "policy"
+RESEARCH_NAMESPACE = "research"
+
+OPTION_FIELDS = (
+    "typ (hotel, flug, bahn oder mietwagen), anbieter, beschreibung, klasse, sterne, "
+    "preis_eur, preis_pro_nacht_eur, dauer_minuten"
+)
+_HOTEL_CAP_PATTERN = re.compile(rf"({AMOUNT_PATTERN})\s*(?:€|EUR|Euro)\s*(?:pro|je|/)\s*Nacht", re.IGNORECASE)
+_STARS_PATTERN = re.compile(r"(\d)\s*-?\s*bis\s*(?:maximal\s*)?(\d)\s*-?\s*Sterne", re.IGNORECASE)
+
+
+class SubAgentError(RuntimeError):
+    """Raised when a sub-agent run does not complete."""
+
+
+def invoke_agent(client, agent_id: str, prompt: str, waiter) -> str:
+    """Run ``agent_id`` on a fresh thread with a single prompt and return its answer.
+
+    Args:
+        client: The synchronous ``AgentsClient``.
+        agent_id (str): The agent to run.
+        prompt (str): The user message sent to the agent.
+        waiter: The :class:`~run_waiter.RunWaiter` used to wait for the run, or a
+            :class:`~resilient_runs.ResilientRuns` that retries and hedges it.
+
+    Returns:
+        str: The text of the agent's last message.
+    """
+    runs = []
+
+    def start():
+        run = client.create_thread_and_run(
+            agent_id=agent_id,
+            thread=AgentThreadCreationOptions(messages=[ThreadMessageOptions(role=MessageRole.USER, content=prompt)]),
+        )
+        runs.append(run)
+        return run
+
+    try:
+        # Retries and duplicates run on threads of their own, all of them are deleted below
+        run = waiter.execute(agent_id, start, hedge=start) if hasattr(waiter, "execute") else waiter.wait(start())
+        if run.status != "completed":
+            raise SubAgentError(f"Run {run.id} of agent {agent_id} ended with status {run.status}: {run.last_error}")
+        answer = client.messages.get_last_message_text_by_role(thread_id=run.thread_id, role=MessageRole.AGENT)
+        return answer.text.value if answer else ""
+    finally:
+        for started in list(runs):
+            try:
+                client.threads.delete(started.thread_id)
+            except ResourceNotFoundError:
+                pass
+
+
+def policy_limits(policy_text: str, destination: str = "", policy_engine=None) -> dict:
+    """Return the machine checkable limits of the travel policy for a trip.
+
+    The rule table of the local :class:`~policy_index.PolicyEngine` is exact and wins; without
+    it the hotel cap and star range are read from the policy agent's answer.
+
+    Args:
+        policy_text (str): The answer of the policy agent.
+        destination (str): The destination city or country.
+        policy_engine: An optional :class:`~policy_index.PolicyEngine`.
+
+    Returns:
+        dict: Any of ``hotel_max_eur_per_night``, ``hotel_min_stars``, ``hotel_max_stars``,
+        ``flight_first_class_allowed``, ``flight_business_requires_approval``,
+        ``train_first_class_min_minutes`` and ``car_categories``.
+    """
+    limits: dict = {}
+    match = _HOTEL_CAP_PATTERN.search(policy_text)
+    if match:
+        limits["hotel_max_eur_per_night"] = parse_amount(match.group(1))
+    match = _STARS_PATTERN.search(policy_text)
+    if match:
+        limits["hotel_min_stars"], limits["hotel_max_stars"] = int(match.group(1)), int(match.group(2))
+    if policy_engine is None:
+        return limits
+
+    rules = policy_engine.rules
+    cap = policy_engine.hotel_cap(destination) if destination else None
+    if cap:
+        limits["hotel_max_eur_per_night"] = cap["max_eur_per_night"]
+    for key, limit in (("min_stars", "hotel_min_stars"), ("max_stars", "hotel_max_stars")):
+        if key in rules["hotel"]:
+            limits[limit] = int(rules["hotel"][key])
+    if "first_class_allowed" in rules["flight"]:
+        limits["flight_first_class_allowed"] = rules["flight"]["first_class_allowed"]
+    if "business_requires_approval" in rules["flight"]:
+        limits["flight_business_requires_approval"] = rules["flight"]["business_requires_approval"]
+    if "first_class_min_minutes" in rules["train"]:
+        limits["train_first_class_min_minutes"] = rules["train"]["first_class_min_minutes"]
+    if "categories" in rules["car"]:
+        limits["car_categories"] = rules["car"]["categories"]
+    return limits
+
+
+def parse_options(text: str) -> Optional[list[dict]]:
+    """Return the JSON list of options in a research answer, or ``None`` if there is none."""
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end <= start:
+        return None
+    try:
+        options = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(options, list) or not all(isinstance(option, dict) for option in options):
+        return None
+    return options
+
+
+def _number(value) -> Optional[float]:
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(AMOUNT_PATTERN, str(value or ""))
+    return parse_amount(match.group()) if match else None
+
+
+def violation(option: dict, limits: dict) -> Optional[str]:
+    """Return why ``option`` violates ``limits``, or ``None`` if it complies."""
+    kind = str(option.get("typ", "")).lower()
+    travel_class = str(option.get("klasse", "")).lower()
+    if kind == "hotel":
+        price, cap = _number(option.get("preis_pro_nacht_eur")), limits.get("hotel_max_eur_per_night")
+        if price is not None and cap is not None and price > cap:
+            return f"{price:.0f} € pro Nacht über der Obergrenze von {cap:.0f} €"
+        stars = _number(option.get("sterne"))
+        if stars is not None and not limits.get("hotel_min_stars", 0) <= stars <= limits.get("hotel_max_stars", 5):
+            return f"{stars:.0f} Sterne außerhalb von {limits.get('hotel_min_stars', 0)} bis {limits.get('hotel_max_stars', 5)} Sternen"
+    elif kind == "flug":
+        if "first" in travel_class and not limits.get("flight_first_class_allowed", True):
+            return "First Class ist nicht zulässig"
+    elif kind == "bahn":
+        minimum, minutes = limits.get("train_first_class_min_minutes"), _number(option.get("dauer_minuten"))
+        if "1" in travel_class and minimum is not None and minutes is not None and minutes <= minimum:
+            return f"1. Klasse erst bei Fahrten über {minimum:.0f} Minuten"
+    elif kind == "mietwagen":
+        categories = limits.get("car_categories")
+        if categories and travel_class and not any(category.lower() in travel_class for category in categories):
+            return f"nur {' oder '.join(categories)} zulässig"
+    return None
+
+
+class CachedAgentTools:
+    """Policy and research agents as cached local function tools.
+
+    Args:
+        client: The synchronous ``AgentsClient``.
+        waiter: The :class:`~run_waiter.RunWaiter` used for the sub-agent runs.
+        cache (TTLLRUCache): The response cache shared by both tools.
+        policy_agent_id (str): ID of ``policy_pruefungs_agent``.
+        research_agent_id (str): ID of ``reise_recherche_agent``.
+        policy_version (str): Content hash of the policy document; policy answers are valid
+            as long as it does not change.
+        policy_engine: Optional :class:`~policy_index.PolicyEngine` whose rule table
+            :meth:`plan_trip` filters the research options with.
+    """
+
+    def __init__(
+        self,
+        client,
+        waiter,
+        cache: TTLLRUCache,
+        policy_agent_id: str,
+        research_agent_id: str,
+        policy_version: Optional[str] = None,
+        policy_engine=None,
+    ):
+        self.client = client
+        self.waiter = waiter
+        self.cache = cache
+        self.policy_agent_id = policy_agent_id
+        self.research_agent_id = research_agent_id
+        self.policy_version = policy_version
+        self.policy_engine = policy_engine
+
+    def functions(self, fan_out: bool = False) -> set:
+        """Return the callables to register in a ``FunctionTool``.
+
+        With ``fan_out`` the research tool is replaced by :meth:`plane_reiseoptionen`.
+        """
+        if fan_out:
+            return {self.pruefe_reiserichtlinie, self.plane_reiseoptionen}
+        return {self.pruefe_reiserichtlinie, self.recherchiere_reiseoptionen}
+
+    def check_policy(self, destination: str, start_date: str = "", end_date: str = "", travel_class: str = "") -> str:
+        key = normalize_trip_key(destination, start_date, end_date, travel_class)
+        prompt = (
+            "Extrahiere alle Rahmenbedingungen der Reiserichtlinie für folgende Reise "
+            "(Hotelobergrenze, erlaubte Transportmittel und Klassen, Genehmigungen, Verpflegung):\n"
+            + json.dumps(dict(key), ensure_ascii=False)
+        )
+        try:
+            return self.cache.get_or_compute(
+                POLICY_NAMESPACE,
+                key,
+                lambda: invoke_agent(self.client, self.policy_agent_id, prompt, self.waiter),
+                version=self.policy_version,
+            )
+        except CircuitOpenError as error:
+            # Not cached, the agent answers again once its breaker has closed
+            if self.policy_engine is not None:
+                return self.policy_engine.lookup_travel_policy("Hotelobergrenze Transportmittel Reiseklasse Genehmigung Verpflegung", destination)
+            return f"Die Richtlinienprüfung ist vorübergehend nicht verfügbar (erneuter Versuch in {error.retry_after:.0f} s)."
+
+    def research_options(
+        self,
+        destination: str,
+        start_date: str = "",
+        end_date: str = "",
+        travel_class: str = "",
+        origin: str = "",
+        policy_constraints: str = "",
+        preferences: str = "",
+    ) -> str:
+        key = normalize_trip_key(destination, start_date, end_date, travel_class, origin=origin, preferences=preferences)
+        prompt = (
+            "Suche passende Transport- und Unterkunftsoptionen für folgende Reise:\n"
+            + json.dumps(dict(key), ensure_ascii=False)
+            + (f"\n\nRahmenbedingungen der Reiserichtlinie:\n{policy_constraints}" if policy_constraints else "")
+        )
+        # Policy constraints follow from the trip parameters, so they are not part of the key
+        return self._research(key, prompt)
+
+    def research_option_list(
+        self,
+        destination: str,
+        start_date: str = "",
+        end_date: str = "",
+        travel_class: str = "",
+        origin: str = "",
+        preferences: str = "",
+    ) -> str:
+        # Speculative research without the policy constraints, answered as a JSON list to filter
+        key = normalize_trip_key(destination, start_date, end_date, travel_class, origin=origin, preferences=preferences, format="json")
+        prompt = (
+            "Suche passende Transport- und Unterkunftsoptionen für folgende Reise:\n"
+            + json.dumps(dict(key), ensure_ascii=False)
+            + f"\n\nGib mehrere Optionen pro Kategorie zurück, auch verschiedene Preis- und Reiseklassen. "
+            f"Antworte ausschließlich mit einem JSON-Array von Objekten mit den Feldern {OPTION_FIELDS}."
+        )
+        return self._research(key, prompt)
+
+    def _research(self, key, prompt: str) -> str:
+        try:
+            return self.cache.get_or_compute(
+                RESEARCH_NAMESPACE,
+                key,
+                lambda: invoke_agent(self.client, self.research_agent_id, prompt, self.waiter),
+            )
+        except CircuitOpenError as error:
+            return (
+                f"Die Recherche ist vorübergehend nicht verfügbar (erneuter Versuch in {error.retry_after:.0f} s). "
+                "Teile dem Nutzer mit, dass die Reiseoptionen später nachgereicht werden."
+            )
+
+    def plan_trip(
+        self,
+        destination: str,
+        start_date: str = "",
+        end_date: str = "",
+        travel_class: str = "",
+        origin: str = "",
+        preferences: str = "",
+    ) -> dict:
+        """Check the policy and research options concurrently and merge both answers.
+
+        Returns:
+            dict: The trip, the policy constraints and limits, the compliant options, the
+            rejected options with their reason and the seconds each agent and the whole fan-out took.
+        """
+        started = time.perf_counter()
+        seconds: dict = {}
+
+        def timed(name, function, *args):
+            begin = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                seconds[name] = round(time.perf_counter() - begin, 3)
+
+        # Each call runs in a copy of the caller's context, so spans and usage stay attributed to the turn
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="fan-out") as executor:
+            policy = executor.submit(
+                contextvars.copy_context().run, timed, "policy", self.check_policy, destination, start_date, end_date, travel_class
+            )
+            research = executor.submit(
+                contextvars.copy_context().run,
+                timed,
+                "research",
+                self.research_option_list,
+                destination,
+                start_date,
+                end_date,
+                travel_class,
+                origin,
+                preferences,
+            )
+            policy_text, research_text = policy.result(), research.result()
+
+        limits = policy_limits(policy_text, destination, self.policy_engine)
+        result: dict = {
+            "trip": dict(normalize_trip_key(destination, start_date, end_date, travel_class, origin=origin, preferences=preferences)),
+            "policy_constraints": policy_text,
+            "policy_limits": limits,
+        }
+        options = parse_options(research_text)
+        if options is None:
+            # Nothing to filter, the orchestrator has to compare the options with the constraints itself
+            result["options_text"] = research_text
+        else:
+            result["options"], result["rejected_options"] = [], []
+            for option in options:
+                reason = violation(option, limits)
+                if reason:
+                    result["rejected_options"].append({"option": option, "reason": reason})
+                else:
+                    result["options"].append(option)
+        seconds["total"] = round(time.perf_counter() - started, 3)
+        result["seconds"] = seconds
+        return result
+
+    def pruefe_reiserichtlinie(self, destination: str, start_date: str = "", end_date: str = "", travel_class: str = "") -> str:
+        """Prüft die Reiserichtlinie für die geplante Reise und liefert alle Rahmenbedingungen (Policy_Prüfungs_Agent).
+
+        :param destination: Reiseziel (Stadt oder Land), z. B. "Berlin".
+        :param start_date: Anreisedatum im Format JJJJ-MM-TT.
+        :param end_date: Abreisedatum im Format JJJJ-MM-TT.
+        :param travel_class: Gewünschte Reiseklasse oder Transportmittel, z. B. "Bahn 2. Klasse".
+        :return: Die Rahmenbedingungen der Reiserichtlinie für diese Reise.
+        """
+        return self.check_policy(destination, start_date, end_date, travel_class)
+
+    def recherchiere_reiseoptionen(
+        self,
+        destination: str,
+        start_date: str = "",
+        end_date: str = "",
+        travel_class: str = "",
+        origin: str = "",
+        policy_constraints: str = "",
+        preferences: str = "",
+    ) -> str:
+        """Sucht Transport- und Unterkunftsoptionen für die geplante Reise (Recherche_Agent).
+
+        :param destination: Reiseziel (Stadt oder Land), z. B. "Berlin".
+        :param start_date: Anreisedatum im Format JJJJ-MM-TT.
+        :param end_date: Abreisedatum im Format JJJJ-MM-TT.
+        :param travel_class: Gewünschte Reiseklasse oder Transportmittel.
+        :param origin: Abreiseort, z. B. "München".
+        :param policy_constraints: Rahmenbedingungen aus der Reiserichtlinie.
+        :param preferences: Weitere Wünsche, z. B. Uhrzeiten oder Hotelpräferenz.
+        :return: Gefundene Transport- und Unterkunftsoptionen.
+        """
+        return self.research_options(destination, start_date, end_date, travel_class, origin, policy_constraints, preferences)
+
+    def plane_reiseoptionen(
+        self,
+        destination: str,
+        start_date: str = "",
+        end_date: str = "",
+        travel_class: str = "",
+        origin: str = "",
+        preferences: str = "",
+    ) -> str:
+        """Prüft die Reiserichtlinie und sucht gleichzeitig Reiseoptionen; liefert nur richtlinienkonforme Optionen (Policy_Prüfungs_Agent und Recherche_Agent).
+
+        :param destination: Reiseziel (Stadt oder Land), z. B. "Berlin".
+        :param start_date: Anreisedatum im Format JJJJ-MM-TT.
+        :param end_date: Abreisedatum im Format JJJJ-MM-TT.
+        :param travel_class: Gewünschte Reiseklasse oder Transportmittel.
+        :param origin: Abreiseort, z. B. "München".
+        :param preferences: Weitere Wünsche, z. B. Uhrzeiten oder Hotelpräferenz.
+        :return: Rahmenbedingungen, zulässige und ausgeschlossene Optionen als JSON.
+        """
+        return json.dumps(self.plan_trip(destination, start_date, end_date, travel_class, origin, preferences), ensure_ascii=False)
@@ -0,0 +1,68 @@
+import asyncio
+import io
+import json
+
+from semantic_kernel.contents import AuthorRole, FunctionCallContent, StreamingChatMessageContent
+
+from agent_output import END, FUNCTION_CALL, TEXT, JsonlSink, OutputPipeline, OutputSink, TerminalSink
+
+
+def chunk(agent: str, text: str = "", items: tuple = ()) -> StreamingChatMessageContent:
+    return StreamingChatMessageContent(role=AuthorRole.ASSISTANT, choice_index=0, name=agent, content=text, items=list(items))
+
+
+class FailingSink(OutputSink):
+    async def write(self, events):
+        raise OSError("disk full")
+
+
+def test_concurrent_sessions_never_share_a_terminal_line():
+    stream = io.StringIO()
+
+    async def scenario():
+        async with OutputPipeline([TerminalSink(stream)], flush_interval=60) as pipeline:
+            first, second = pipeline.session("a"), pipeline.session("b")
+            first.write_message(chunk("SupportAgent", "Hallo, "), False)
+            second.write_message(chunk("RefundAgent", "Ihre Erstattung "), False)
+            await first.drain()
+            second.write_message(chunk("RefundAgent", "ist unterwegs."), True)
+            first.write_message(chunk("SupportAgent", "wie kann ich helfen?"), True)
+
+    asyncio.run(scenario())
+
+    assert stream.getvalue() == "SupportAgent: Hallo, wie kann ich helfen?\n[b] RefundAgent: Ihre Erstattung ist unterwegs.\n"
+
+
+def test_chunks_are_coalesced_and_function_calls_keep_their_order(tmp_path):
+    path = tmp_path / "output.jsonl"
+
+    async def scenario():
+        async with OutputPipeline([JsonlSink(str(path))], flush_interval=60) as pipeline:
+            console = pipeline.session("console")
+            for word in ("Ich ", "prüfe ", "die ", "Bestellung."):
+                console.write_message(chunk("OrderStatusAgent", word), False)
+            console.write_message(chunk("OrderStatusAgent", items=[FunctionCallContent(name="check_order_status", arguments='{"order_id": "1"}')]), False)
+            console.write_message(chunk("OrderStatusAgent", "Sie ist unterwegs."), True)
+
+    asyncio.run(scenario())
+
+    events = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [(event["kind"], event["text"]) for event in events] == [
+        (TEXT, "Ich prüfe die Bestellung."),
+        (FUNCTION_CALL, "'check_order_status' with arguments '{\"order_id\": \"1\"}'"),
+        (TEXT, "Sie ist unterwegs."),
+        (END, ""),
+    ]
+
+
+def test_a_failing_sink_does_not_stop_the_other_sinks():
+    stream = io.StringIO()
+
+    async def scenario():
+        async with OutputPipeline([FailingSink(), TerminalSink(stream)]) as pipeline:
+            pipeline.session("console").write_message(chunk("SupportAgent", "Guten Tag!"), True)
+            pipeline.session("console").info("Router: SupportAgent -> RefundAgent (local)")
+        return pipeline.errors
+
+    assert asyncio.run(scenario()) >= 1
+    assert stream.getvalue() == "SupportAgent: Guten Tag!\nRouter: SupportAgent -> RefundAgent (local)\n"
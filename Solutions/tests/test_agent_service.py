@@ -0,0 +1,103 @@
+import asyncio
+import http.client
+import json
+
+from agent_service import AgentService, SessionMap, UserSession
+from fake_agents import FakeAgentsClient, FakeAgentsService, LatencyProfile
+from run_waiter import FixedInterval, RunWaiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _session(session_id: str) -> UserSession:
+    return UserSession(session_id=session_id, thread_id=f"thread_{session_id}", cursor=None)
+
+
+def test_expire_removes_idle_sessions_behind_a_session_that_finished_a_long_run():
+    clock = FakeClock()
+    sessions = SessionMap(max_sessions=10, idle_seconds=30, clock=clock)
+    for session_id in ("long", "idle1", "idle2"):
+        sessions.add(_session(session_id))
+        clock.now += 1
+
+    # The run of the first session ends long after the others were last used
+    clock.now = 50
+    sessions.touch(sessions._sessions["long"])
+    clock.now = 55
+
+    assert [session.session_id for session in sessions.expire()] == ["idle1", "idle2"]
+    assert len(sessions) == 1
+
+
+def test_expire_keeps_running_sessions_and_get_refreshes_them():
+    clock = FakeClock()
+    sessions = SessionMap(max_sessions=10, idle_seconds=30, clock=clock)
+    busy, idle, recent = _session("busy"), _session("idle"), _session("recent")
+    for session in (busy, idle, recent):
+        sessions.add(session)
+    clock.now = 40
+    assert sessions.get("recent") is recent
+
+    async def expire_while_running():
+        async with busy.lock:
+            return sessions.expire()
+
+    assert [session.session_id for session in asyncio.run(expire_while_running())] == ["idle"]
+    assert sessions.get("busy") is busy and sessions.get("recent") is recent
+
+
+def test_touch_ignores_sessions_that_were_removed():
+    sessions = SessionMap(max_sessions=10, idle_seconds=30, clock=FakeClock())
+    session = _session("gone")
+    sessions.add(session)
+    sessions.pop("gone")
+    sessions.touch(session)
+    assert len(sessions) == 0
+
+
+def _request(port: int, method: str, path: str, body: bytes = b"") -> tuple[int, dict]:
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        connection.request(method, path, body, {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_the_http_service_answers_chats_and_keeps_the_thread_of_a_session():
+    service = FakeAgentsService(LatencyProfile(sigma=0.0, time_scale=0.01), seed=1)
+    client = FakeAgentsClient(service)
+    agent = client.create_agent(model="fake-model", name="orchestrator")
+    agent_service = AgentService(client, agent.id, RunWaiter(client, FixedInterval(0.01)))
+
+    async def scenario():
+        ready = asyncio.get_running_loop().create_future()
+        server = asyncio.create_task(agent_service.serve(port=0, ready=lambda host, port: ready.set_result(port)))
+        port = await asyncio.wait_for(ready, 5)
+        try:
+            chat = json.dumps({"session_id": "s1", "user": "anna", "message": "Ich muss nach Berlin"}).encode("utf-8")
+            first = await asyncio.to_thread(_request, port, "POST", "/chat", chat)
+            second = await asyncio.to_thread(_request, port, "POST", "/chat", chat)
+            invalid = await asyncio.to_thread(_request, port, "POST", "/chat", b"{not json")
+            health = await asyncio.to_thread(_request, port, "GET", "/health")
+            return first, second, invalid, health
+        finally:
+            server.cancel()
+            await asyncio.gather(server, return_exceptions=True)
+
+    (status, first), (_, second), (invalid_status, invalid), (_, health) = asyncio.run(scenario())
+
+    assert status == 200 and first["status"] == "completed" and first["session_id"] == "s1"
+    assert [message["role"] for message in first["messages"]] == ["assistant"] and first["messages"][0]["text"]
+    # The second turn continues the thread of the session
+    assert second["thread_id"] == first["thread_id"] and second["turn"] == 2 and second["run_id"] != first["run_id"]
+    assert len(service.timings["api"]["threads.create"]) == 1
+    assert invalid_status == 400 and invalid["error"].startswith("Invalid JSON")
+    assert health == {"sessions": 1, "runs_in_progress": 0, "requests": 2, "runs": 2, "local_replies": 0, "budget_exceeded": 0, "errors": 0, "evicted": 0}
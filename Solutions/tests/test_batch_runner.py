@@ -0,0 +1,88 @@
+import json
+import threading
+
+from batch_runner import BatchRunner
+from fake_agents import FakeAgentsClient, FakeAgentsService, LatencyProfile
+from resilient_runs import ResilientRuns
+from run_waiter import FixedInterval, RunWaiter
+
+FAST = LatencyProfile(sigma=0.0, time_scale=0.01)
+MESSAGES = [
+    "Ich muss Dienstag bis Freitag nach Berlin",
+    "Zwei Nächte in Hamburg ab Montag",
+    "Flug nach Wien am 12. März",
+    "Darf ich Business Class fliegen?",
+    "Hotel in München für die Messe",
+    "Bahnfahrt nach Köln und zurück",
+]
+
+
+def setup(tmp_path, **options):
+    service = FakeAgentsService(FAST, seed=1)
+    client = FakeAgentsClient(service)
+    runs = ResilientRuns(client, RunWaiter(client, FixedInterval(0.01)), sleep=lambda _: None)
+    agent = client.create_agent(model="fake-model", name="orchestrator")
+    input_path = tmp_path / "requests.jsonl"
+    input_path.write_text("".join(json.dumps({"id": f"req-{number}", "message": message}) + "\n" for number, message in enumerate(MESSAGES, 1)), encoding="utf-8")
+    return service, BatchRunner(client, agent.id, runs, **options), str(input_path), str(tmp_path / "results.jsonl")
+
+
+def created_runs(service: FakeAgentsService) -> int:
+    return len(service.timings["api"].get("runs.create", []))
+
+
+def results(output_path: str, skip: int = 0) -> list[dict]:
+    with open(output_path, encoding="utf-8") as output_file:
+        return [json.loads(line) for line in output_file.readlines()[skip:]]
+
+
+def test_an_interrupted_batch_resumes_without_repeating_finished_requests(tmp_path):
+    service, runner, input_path, output_path = setup(tmp_path)
+    # The previous batch completed two requests, failed one and was cut off while writing
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        output_file.write(json.dumps({"id": "req-1", "status": "completed"}) + "\n")
+        output_file.write(json.dumps({"id": "req-2", "status": "failed"}) + "\n")
+        output_file.write(json.dumps({"id": "req-3", "status": "completed"}) + "\n")
+        output_file.write('{"id": "req-4", "sta')
+
+    summary = runner.run(input_path, output_path)
+
+    assert summary["skipped"] == 2 and summary["statuses"] == {"completed": 4}
+    assert created_runs(service) == 4
+    # The cut off line is terminated, the new results start on the line after it
+    written = results(output_path, skip=4)
+    assert sorted(result["id"] for result in written) == ["req-2", "req-4", "req-5", "req-6"]
+    assert all(result["message"] for result in written)
+
+
+def test_no_more_requests_run_at_the_same_time_than_allowed(tmp_path):
+    service, runner, input_path, output_path = setup(tmp_path, max_concurrency=2)
+    lock, running, peak = threading.Lock(), [0], [0]
+    process = runner.process
+
+    def counting_process(request: dict) -> dict:
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        try:
+            return process(request)
+        finally:
+            with lock:
+                running[0] -= 1
+
+    runner.process = counting_process
+    summary = runner.run(input_path, output_path)
+
+    assert summary["processed"] == len(MESSAGES)
+    assert peak[0] == 2
+
+
+def test_failed_requests_are_not_repeated_by_the_batch(tmp_path):
+    service, runner, input_path, output_path = setup(tmp_path)
+    service.run_failure_rate = 1.0
+
+    summary = runner.run(input_path, output_path)
+
+    # Each request ran once: its orchestrator may have called a tool before it failed
+    assert summary["statuses"] == {"failed": len(MESSAGES)}
+    assert created_runs(service) == len(MESSAGES)
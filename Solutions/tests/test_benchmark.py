@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from benchmark import main, percentile, summarize
+
+FAST = ["--time-scale", "0.01", "--provisioning-rounds", "1", "--seed", "1"]
+
+
+def test_percentiles_use_the_nearest_rank():
+    values = [0.1, 0.2, 0.3, 0.4, 1.0]
+
+    assert [percentile(values, p) for p in (50, 95, 99)] == [0.3, 1.0, 1.0]
+    assert summarize(values) == {"count": 5, "mean": 0.4, "p50": 0.3, "p95": 1.0, "p99": 1.0, "max": 1.0}
+    assert summarize([]) == {"count": 0}
+
+
+def test_streamed_session1_conversations_are_reported_per_turn_and_agent(tmp_path, capsys):
+    report_path = tmp_path / "session1.json"
+
+    report = main(["session1", "--conversations", "3", "--concurrency", "3", "--turns", "2", *FAST, "--json", str(report_path)])
+
+    assert report["turns"] == 6 and report["errors"] == 0
+    assert report["turn"]["stream"]["count"] == 6
+    assert {"orchestrator_agent", "policy_agent", "vector_store"} <= set(report["provisioning"])
+    assert json.loads(report_path.read_text(encoding="utf-8"))["turns"] == 6
+    assert capsys.readouterr().out.startswith("Scenario session1: 6 turns in ")
+
+
+def test_failed_runs_are_retried_and_counted_as_errors(capsys):
+    report = main(["session1", "--mode", "poll", "--conversations", "2", "--concurrency", "2", "--turns", "2", "--run-failure-rate", "1.0", "--retries", "1", *FAST])
+
+    resilience = report["resilience"]
+    assert report["errors"] == report["turns"] == 4
+    assert resilience["retries"] >= 1 and resilience["attempts"] == resilience["calls"] + resilience["retries"]
+    assert "Resilience: " in capsys.readouterr().out
+
+
+def test_session2_routes_customer_messages_locally(capsys):
+    pytest.importorskip("semantic_kernel")
+
+    report = main(["session2", "--conversations", "2", "--concurrency", "2", "--intent-router", *FAST])
+
+    assert report["errors"] == 0
+    assert report["routing"]["routed"] >= 1 and report["routing"]["accuracy"] == 1.0
+    assert "Intent router: " in capsys.readouterr().out
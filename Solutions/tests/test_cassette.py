@@ -0,0 +1,212 @@
+import asyncio
+import itertools
+import json
+import os
+from urllib.parse import urlsplit
+
+from azure.ai.agents import AgentsClient
+from azure.ai.agents.aio import AgentsClient as AsyncAgentsClient
+from azure.core.pipeline.transport import AsyncHttpTransport, HttpTransport
+
+from cassette import AsyncReplayCredential, Cassette, ReplayCredential
+
+ENDPOINT = "https://example.services.ai.azure.com/api/projects/demo"
+# Recorded with ``PYTHONPATH=. python tests/test_cassette.py`` against the stub below
+RECORDED_CASSETTE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cassettes", "agents_run.json")
+ANSWER = "Die Erstattung dauert fünf Werktage."
+
+
+class StubAgentsApi:
+    """Answers the REST calls of one agent conversation like the Agents service does."""
+
+    def __init__(self):
+        self.ids = itertools.count(1)
+        self.messages: dict[str, list[dict]] = {}
+        self.runs: dict[str, dict] = {}
+        self.calls = 0
+
+    def handle(self, request) -> tuple[int, list[bytes]]:
+        self.calls += 1
+        method, parts = request.method, urlsplit(request.url).path.split("/")[4:]
+        body = json.loads(request.content) if request.content else {}
+        if method == "POST" and parts == ["assistants"]:
+            return 200, [self._json({"id": f"asst_{next(self.ids)}", "object": "assistant", **body})]
+        if method == "DELETE" and parts[0] == "assistants":
+            return 200, [self._json({"id": parts[1], "object": "assistant.deleted", "deleted": True})]
+        if method == "POST" and parts == ["threads"]:
+            thread_id = f"thread_{next(self.ids)}"
+            self.messages[thread_id] = []
+            return 200, [self._json({"id": thread_id, "object": "thread"})]
+        thread_id = parts[1]
+        if parts[2:] == ["messages"] and method == "POST":
+            return 200, [self._json(self._message(thread_id, body["role"], body["content"]))]
+        if parts[2:] == ["messages"]:
+            data = list(reversed(self.messages[thread_id]))
+            return 200, [self._json({"object": "list", "data": data, "first_id": data[0]["id"], "last_id": data[-1]["id"], "has_more": False})]
+        if parts[2:] == ["runs"]:
+            run = {"id": f"run_{next(self.ids)}", "object": "thread.run", "thread_id": thread_id, "assistant_id": body["assistant_id"], "status": "queued"}
+            self.runs[run["id"]] = run
+            message = self._message(thread_id, "assistant", ANSWER)
+            if not body.get("stream"):
+                return 200, [self._json(run)]
+            # Streamed runs answer in several chunks, one server-sent event each
+            delta = {"id": message["id"], "object": "thread.message.delta", "delta": {"content": [{"index": 0, "type": "text", "text": {"value": ANSWER}}]}}
+            run["status"] = "completed"
+            return 200, [
+                self._event("thread.run.created", {**run, "status": "queued"}),
+                self._event("thread.message.delta", delta),
+                self._event("thread.run.completed", run),
+                b"event: done\ndata: [DONE]\n\n",
+            ]
+        run = self.runs[parts[3]]
+        run["status"] = "completed"
+        return 200, [self._json(run)]
+
+    def _message(self, thread_id: str, role: str, text: str) -> dict:
+        message = {
+            "id": f"msg_{next(self.ids)}",
+            "object": "thread.message",
+            "thread_id": thread_id,
+            "role": role,
+            "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+        }
+        self.messages[thread_id].append(message)
+        return message
+
+    @staticmethod
+    def _json(data: dict) -> bytes:
+        return json.dumps(data).encode("utf-8")
+
+    @staticmethod
+    def _event(name: str, data: dict) -> bytes:
+        return f"event: {name}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+class StubResponse:
+    def __init__(self, status: int, chunks: list[bytes]):
+        self.status_code = status
+        self.reason = "OK"
+        self.headers = {"content-type": "application/json"}
+        self.chunks = chunks
+
+    def iter_bytes(self):
+        yield from self.chunks
+
+    def close(self) -> None:
+        pass
+
+
+class AsyncStubResponse(StubResponse):
+    async def iter_bytes(self):
+        for chunk in self.chunks:
+            yield chunk
+
+    async def close(self) -> None:
+        pass
+
+
+class StubTransport(HttpTransport):
+    def __init__(self, api: StubAgentsApi):
+        self.api = api
+
+    def send(self, request, **kwargs):
+        return StubResponse(*self.api.handle(request))
+
+    def open(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "StubTransport":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+class AsyncStubTransport(AsyncHttpTransport):
+    def __init__(self, api: StubAgentsApi):
+        self.api = api
+
+    async def send(self, request, **kwargs):
+        return AsyncStubResponse(*self.api.handle(request))
+
+    async def open(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def __aenter__(self) -> "AsyncStubTransport":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
+
+
+def converse(transport) -> list[str]:
+    """Run one polled and one streamed turn and return the answers."""
+    with AgentsClient(ENDPOINT, ReplayCredential(), transport=transport) as client:
+        agent = client.create_agent(model="gpt-4o", name="support", instructions="Beantworte Fragen zu Erstattungen.")
+        thread = client.threads.create()
+        client.messages.create(thread_id=thread.id, role="user", content="Wie lange dauert eine Erstattung?")
+        run = client.runs.create(thread_id=thread.id, agent_id=agent.id)
+        run = client.runs.get(thread_id=thread.id, run_id=run.id)
+        answers = [next(message.text_messages[0].text.value for message in client.messages.list(thread_id=thread.id) if message.role == "assistant")]
+        with client.runs.stream(thread_id=thread.id, agent_id=agent.id) as stream:
+            answers.append("".join(event_data.text for event_type, event_data, _ in stream if event_type == "thread.message.delta"))
+        client.delete_agent(agent.id)
+    return [run.status] + answers
+
+
+async def converse_async(transport) -> str:
+    async with AsyncAgentsClient(ENDPOINT, AsyncReplayCredential(), transport=transport) as client:
+        agent = await client.create_agent(model="gpt-4o", name="support")
+        thread = await client.threads.create()
+        await client.messages.create(thread_id=thread.id, role="user", content="Wie lange dauert eine Erstattung?")
+        answer = ""
+        async with await client.runs.stream(thread_id=thread.id, agent_id=agent.id) as stream:
+            async for event_type, event_data, _ in stream:
+                if event_type == "thread.message.delta":
+                    answer += event_data.text
+        return answer
+
+
+def test_replays_the_recorded_cassette_without_a_service():
+    cassette = Cassette(RECORDED_CASSETTE)
+
+    assert converse(cassette.transport()) == ["completed", ANSWER, ANSWER]
+    assert cassette.summary() == {"mode": "replay", "interactions": 8, "replayed": 8, "unused": 0}
+
+
+def test_round_trip_replays_what_was_recorded(tmp_path):
+    path = str(tmp_path / "session.json.gz")
+    api = StubAgentsApi()
+    recorded = converse(Cassette(path, "record").transport(StubTransport(api)))
+    calls = api.calls
+
+    replayed = converse(Cassette(path).transport(StubTransport(api)))
+
+    assert replayed == recorded == ["completed", ANSWER, ANSWER]
+    assert api.calls == calls
+
+
+def test_async_round_trip_keeps_the_chunks_of_streamed_runs(tmp_path):
+    path = str(tmp_path / "session.json")
+    api = StubAgentsApi()
+    recorded = asyncio.run(converse_async(Cassette(path, "record").async_transport(AsyncStubTransport(api))))
+    cassette = Cassette(path)
+
+    replayed = asyncio.run(converse_async(cassette.async_transport()))
+
+    assert replayed == recorded == ANSWER
+    streamed = [entry for entry in cassette.interactions if len(entry["chunks"]) > 1]
+    assert [len(entry["chunks"]) for entry in streamed] == [4]
+
+
+if __name__ == "__main__":
+    os.makedirs(os.path.dirname(RECORDED_CASSETTE), exist_ok=True)
+    if os.path.exists(RECORDED_CASSETTE):
+        os.remove(RECORDED_CASSETTE)
+    print(converse(Cassette(RECORDED_CASSETTE, "record").transport(StubTransport(StubAgentsApi()))))
@@ -0,0 +1,47 @@
+import asyncio
+import io
+import os
+import threading
+
+import pytest
+
+from human_input import TerminalInput
+
+
+def _reader_threads() -> int:
+    return sum(thread.name == "terminal-input" and thread.is_alive() for thread in threading.enumerate())
+
+
+def test_terminal_input_keeps_a_line_that_arrives_after_a_cancelled_read():
+    read_fd, write_fd = os.pipe()
+    terminal = TerminalInput(stream=os.fdopen(read_fd, "r"), prompt_stream=io.StringIO())
+    before = _reader_threads()
+
+    async def scenario():
+        pending = asyncio.create_task(terminal.read("User: "))
+        await asyncio.sleep(0.05)
+        pending.cancel()
+        os.write(write_fd, b"first\n")
+        second = asyncio.create_task(terminal.read("User: "))
+        first_line = await asyncio.wait_for(second, 5)
+        os.write(write_fd, b"second\n")
+        return first_line, await asyncio.wait_for(terminal.read("User: "), 5), _reader_threads() - before
+
+    try:
+        assert asyncio.run(scenario()) == ("first", "second", 1)
+    finally:
+        os.close(write_fd)
+
+
+def test_terminal_input_raises_eof_at_the_end_of_the_stream():
+    terminal = TerminalInput(stream=io.StringIO("only line\n"), prompt_stream=io.StringIO())
+
+    async def scenario():
+        line = await terminal.read()
+        with pytest.raises(EOFError):
+            await terminal.read()
+        with pytest.raises(EOFError):
+            await terminal.read()
+        return line
+
+    assert asyncio.run(scenario()) == "only line"
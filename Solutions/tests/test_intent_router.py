@@ -0,0 +1,17 @@
+from intent_router import EXAMPLES, HELD_OUT_EXAMPLES, IntentRouter, evaluate
+
+
+def test_routes_every_training_example():
+    assert evaluate(IntentRouter())["errors"] == []
+
+
+def test_held_out_messages_are_never_misrouted():
+    report = evaluate(IntentRouter(), HELD_OUT_EXAMPLES)
+
+    # Unclear messages may stay with the agents, but a local route must reach the right one
+    assert report["precision"] == 1.0
+    assert report["coverage"] >= 0.5
+
+
+def test_held_out_messages_were_not_used_for_training():
+    assert not {text for text, _ in EXAMPLES} & {text for text, _ in HELD_OUT_EXAMPLES}
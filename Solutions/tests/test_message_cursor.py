@@ -0,0 +1,54 @@
+from fake_agents import FakeAgentsClient, FakeAgentsService, LatencyProfile
+from message_cursor import MessageCursor
+from run_waiter import FixedInterval, RunWaiter
+
+
+def setup():
+    service = FakeAgentsService(LatencyProfile(sigma=0.0, time_scale=0.01), seed=1)
+    client = FakeAgentsClient(service)
+    agent = client.create_agent(model="fake-model", name="orchestrator")
+    thread_id = client.threads.create().id
+    return service, client, RunWaiter(client, FixedInterval(0.01)), agent.id, thread_id
+
+
+def turn(client, waiter: RunWaiter, agent_id: str, thread_id: str, text: str):
+    client.messages.create(thread_id=thread_id, role="user", content=text)
+    return waiter.create_and_wait(thread_id, agent_id)
+
+
+def test_every_turn_returns_only_its_new_messages_in_order():
+    service, client, waiter, agent_id, thread_id = setup()
+    cursor = MessageCursor(client, thread_id)
+
+    turn(client, waiter, agent_id, thread_id, "Ich muss nach Berlin")
+    first = cursor.new_messages()
+    turn(client, waiter, agent_id, thread_id, "Dienstag bis Freitag")
+    second = cursor.new_messages()
+
+    assert [message.role for message in first] == [message.role for message in second] == ["user", "assistant"]
+    assert second[0].content[0].text.value == "Dienstag bis Freitag"
+    assert cursor.new_messages() == []
+    # One listing request per call, however long the thread gets
+    assert len(service.timings["api"]["messages.list"]) == 3
+
+
+def test_run_id_restricts_the_result_to_the_answer_of_that_run():
+    service, client, waiter, agent_id, thread_id = setup()
+    cursor = MessageCursor(client, thread_id)
+
+    run = turn(client, waiter, agent_id, thread_id, "Ich muss nach Berlin")
+
+    assert [message.role for message in cursor.new_messages(run_id=run.id)] == ["assistant"]
+
+
+def test_reset_continues_on_another_thread_from_its_beginning():
+    service, client, waiter, agent_id, thread_id = setup()
+    cursor = MessageCursor(client, thread_id)
+    turn(client, waiter, agent_id, thread_id, "Ich muss nach Berlin")
+    cursor.new_messages()
+
+    other_thread_id = client.threads.create().id
+    client.messages.create(thread_id=other_thread_id, role="user", content="Zusammenfassung")
+    cursor.reset(other_thread_id)
+
+    assert [message.content[0].text.value for message in cursor.new_messages()] == ["Zusammenfassung"]
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from order_store import ORDER_COLUMNS, OrderNotFoundError, OrderStore
+
+STATUSES = ("processing", "shipped", "delivered", "cancelled", "return_requested", "refunded")
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = OrderStore(str(tmp_path / "orders.db"), pool_size=2)
+    # One order per status, the order ID is the status
+    rows = [(status, "C0000001", "Laptop", 129_900, status, "2026-10-01", None, "2026-10-05", None, None) for status in STATUSES]
+    with store.pool.connection() as connection:
+        connection.executemany(f"INSERT INTO orders ({ORDER_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    yield store
+    store.close()
+
+
+def test_refunds_are_only_processed_for_delivered_returned_or_cancelled_orders(store):
+    results = {result.order_id: result for result in store.refund([(status, "Defekt") for status in STATUSES])}
+
+    assert {order_id for order_id, result in results.items() if result.ok} == {"delivered", "return_requested", "cancelled"}
+    assert results["processing"].message == "Order processing cannot be refunded because it is processing."
+    assert results["shipped"].message == "Order shipped cannot be refunded because it is shipped."
+    assert results["refunded"].message == "Order refunded has already been refunded."
+    assert store.order("shipped").status == "shipped"
+    assert store.order("delivered").status == "refunded"
+
+
+def test_returns_are_only_registered_for_shipped_or_delivered_orders(store):
+    results = {result.order_id: result for result in store.register_return([(status, "Falsche Größe") for status in STATUSES])}
+
+    assert {order_id for order_id, result in results.items() if result.ok} == {"shipped", "delivered"}
+    assert results["cancelled"].message == "Order cancelled cannot be returned because it is cancelled."
+    assert results["return_requested"].message == "Order return_requested cannot be returned because it is return requested."
+    assert store.order("processing").status == "processing"
+    assert store.order("shipped").status == "return_requested"
+
+
+def test_a_refunded_order_cannot_be_returned_or_refunded_again(store):
+    (first,) = store.refund([("delivered", "Defekt")])
+    assert first.ok and first.message.endswith("1299.00 EUR for order delivered has been processed.")
+
+    assert not store.refund([("delivered", "Defekt")])[0].ok
+    assert not store.register_return([("delivered", "Defekt")])[0].ok
+
+
+def test_async_lookups_answer_single_and_batched_reads(store):
+    async def lookups():
+        return await store.get_order("shipped"), await store.get_orders(["delivered", " cancelled", "unknown"])
+
+    order, orders = asyncio.run(lookups())
+
+    assert order.status == "shipped"
+    assert sorted(orders) == ["cancelled", "delivered"]
+    with pytest.raises(OrderNotFoundError):
+        store.order("unknown")
+    assert store.refund([("unknown", "Defekt")])[0].message == "Order unknown does not exist."
@@ -0,0 +1,62 @@
+import json
+import os
+
+import pytest
+
+import policy_index
+from policy_index import PolicyEngine, split_sections
+
+POLICY_PDF = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "Hands-On-Hacking-Session-1", "Resources", "Reiserichtlinie_Munich_Agent_Factory_GmbH_v1.pdf"
+)
+
+pytest.importorskip("pypdf")
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return PolicyEngine.load(POLICY_PDF, str(tmp_path / "policy_index.json"))
+
+
+@pytest.mark.parametrize(
+    "destination, label, cap",
+    [
+        ("Berlin", "Deutschland (große Städte)", 130.0),
+        ("Wien", "Österreich (Wien, Salzburg)", 140.0),
+        ("Paris", "Frankreich (Paris)", 190.0),
+        ("Frankreich", "Frankreich (sonstige)", 140.0),
+    ],
+)
+def test_hotel_caps_are_found_for_cities_and_countries(engine, destination, label, cap):
+    assert engine.hotel_cap(destination)["label"] == label
+    assert engine.hotel_cap(destination)["max_eur_per_night"] == cap
+
+
+def test_travel_class_rules_are_parsed_from_the_policy(engine):
+    assert engine.rules["flight"] == {"economy_max_hours": 3.0, "business_min_hours": 3.0, "business_requires_approval": True, "first_class_allowed": False}
+    assert engine.rules["train"] == {"first_class_min_minutes": 90.0, "default_class": 2}
+
+
+def test_questions_are_answered_with_the_matching_section(engine):
+    answer = json.loads(engine.lookup_travel_policy("Darf ich Business Class fliegen?", "Wien"))
+
+    assert answer["sections"][0]["title"] == "Flugreisen"
+    assert answer["hotel_cap"]["max_eur_per_night"] == 140.0
+
+
+def test_a_second_start_loads_the_index_without_reading_the_pdf(tmp_path, monkeypatch):
+    index_path = str(tmp_path / "policy_index.json")
+    first = PolicyEngine.load(POLICY_PDF, index_path)
+
+    monkeypatch.setattr(policy_index, "extract_policy_text", lambda _: pytest.fail("the PDF was read again"))
+    second = PolicyEngine.load(POLICY_PDF, index_path)
+
+    assert second.rules == first.rules
+    assert second.index.search("Taxi nachts") == first.index.search("Taxi nachts")
+
+
+def test_numbered_lines_inside_a_section_are_not_headings():
+    sections = split_sections("1. Reisen\nText\n1.1. Bahn\n1. Klasse ist bei langen Fahrten erlaubt\n2. Hotels\n")
+
+    assert [section["id"] for section in sections] == ["1", "1.1", "2"]
+    assert "1. Klasse" in sections[1]["text"]
@@ -0,0 +1,151 @@
+import asyncio
+import threading
+
+import pytest
+from azure.ai.agents.models import FileSearchTool
+
+from fake_agents import FakeAgentsClient, FakeAgentsService, FakeAsyncAgentsClient, LatencyProfile
+from provisioning import AgentProvisioner, AsyncAgentProvisioner, ProvisioningManifest, ProvisioningStep, run_provisioning_graph, run_provisioning_graph_async
+
+ENDPOINT = "https://example.services.ai.azure.com/api/projects/demo"
+
+
+def api_calls(service: FakeAgentsService) -> dict[str, int]:
+    return {name: len(timings) for name, timings in service.timings["api"].items()}
+
+
+def start(client: FakeAgentsClient, manifest_path: str, policy_path: str):
+    """Provision like a fresh process: a new manifest read from disk and a new provisioner."""
+    provisioner = AgentProvisioner(client, ProvisioningManifest(manifest_path, scope=ENDPOINT))
+    vector_store = provisioner.ensure_vector_store(policy_path, name="travel_policy_vector_store")
+    file_search = FileSearchTool(vector_store_ids=[vector_store.id])
+    agent = provisioner.ensure_agent(
+        name="policy_agent",
+        model="gpt-4o",
+        instructions="Beantworte Fragen zur Reiserichtlinie.",
+        tools=file_search.definitions,
+        tool_resources=file_search.resources,
+    )
+    return provisioner, vector_store, agent
+
+
+def test_second_start_makes_no_upload_or_index_calls(tmp_path):
+    service = FakeAgentsService(LatencyProfile(time_scale=0.0), seed=1)
+    client = FakeAgentsClient(service)
+    manifest_path, policy_path = str(tmp_path / "manifest.json"), tmp_path / "policy.pdf"
+    policy_path.write_bytes(b"%PDF-1.4 Reiserichtlinie 2025")
+
+    _, first_store, first_agent = start(client, manifest_path, str(policy_path))
+    calls = api_calls(service)
+    provisioner, second_store, second_agent = start(client, manifest_path, str(policy_path))
+
+    assert calls == {"files.upload_and_poll": 1, "vector_stores.create_and_poll": 1, "create_agent": 1}
+    assert api_calls(service) == calls
+    assert provisioner.calls == 0
+    assert (second_store.id, second_agent.id) == (first_store.id, first_agent.id)
+
+
+def test_changed_document_is_ingested_again(tmp_path):
+    service = FakeAgentsService(LatencyProfile(time_scale=0.0), seed=1)
+    client = FakeAgentsClient(service)
+    manifest_path, policy_path = str(tmp_path / "manifest.json"), tmp_path / "policy.pdf"
+    policy_path.write_bytes(b"%PDF-1.4 Reiserichtlinie 2025")
+    _, first_store, first_agent = start(client, manifest_path, str(policy_path))
+
+    policy_path.write_bytes(b"%PDF-1.4 Reiserichtlinie 2026")
+    _, second_store, second_agent = start(client, manifest_path, str(policy_path))
+
+    calls = api_calls(service)
+    assert calls["files.upload_and_poll"] == calls["vector_stores.create_and_poll"] == 2
+    assert second_store.id != first_store.id
+    # The agent now searches the new store and is updated in place, the old store and file are deleted
+    assert second_agent.id == first_agent.id
+    assert calls["update_agent"] == 1
+    assert calls["vector_stores.delete"] == calls["files.delete"] == 1
+    assert [store.id for store in client.vector_stores.list()] == [second_store.id]
+
+
+class PeakCounter:
+    """Wraps step actions and records how many of them ran at the same time."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = self.peak = 0
+
+    def _enter(self) -> None:
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+
+    def _exit(self) -> None:
+        with self.lock:
+            self.running -= 1
+
+    def wrap(self, action):
+        def counted(inputs):
+            self._enter()
+            try:
+                return action(inputs)
+            finally:
+                self._exit()
+
+        return counted
+
+    def wrap_async(self, action):
+        async def counted(inputs):
+            self._enter()
+            try:
+                return await action(inputs)
+            finally:
+                self._exit()
+
+        return counted
+
+
+def test_independent_agents_are_created_concurrently_before_the_orchestrator(tmp_path):
+    service = FakeAgentsService(LatencyProfile(sigma=0.0, time_scale=0.5), seed=1)
+    provisioner = AgentProvisioner(FakeAgentsClient(service), ProvisioningManifest(str(tmp_path / "manifest.json"), scope=ENDPOINT))
+    counter = PeakCounter()
+    specialists = ("flight_agent", "hotel_agent", "policy_agent")
+    steps = {
+        name: ProvisioningStep((), counter.wrap(lambda _, name=name: provisioner.ensure_agent(name=name, model="gpt-4o")))
+        for name in specialists
+    }
+    steps["orchestrator"] = ProvisioningStep(
+        specialists,
+        counter.wrap(lambda agents: provisioner.ensure_agent(name="orchestrator", model="gpt-4o", connected=sorted(agent.id for agent in agents.values()))),
+    )
+
+    results = run_provisioning_graph(steps, max_workers=4)
+
+    assert counter.peak == len(specialists)
+    assert results["orchestrator"].name == "orchestrator"
+    assert service.agents[results["orchestrator"].id]["connected"] == sorted(results[name].id for name in specialists)
+    assert len(service.timings["api"]["create_agent"]) == 4
+
+
+def test_async_graph_respects_its_concurrency_limit(tmp_path):
+    service = FakeAgentsService(LatencyProfile(sigma=0.0, time_scale=0.5), seed=1)
+    provisioner = AsyncAgentProvisioner(FakeAsyncAgentsClient(service), ProvisioningManifest(str(tmp_path / "manifest.json"), scope=ENDPOINT))
+    counter = PeakCounter()
+    steps = {
+        f"agent_{number}": ProvisioningStep((), counter.wrap_async(lambda _, number=number: provisioner.ensure_agent(name=f"agent_{number}", model="gpt-4o")))
+        for number in range(5)
+    }
+
+    results = asyncio.run(run_provisioning_graph_async(steps, max_concurrency=2))
+
+    assert sorted(agent.name for agent in results.values()) == sorted(steps)
+    assert counter.peak == 2
+
+
+@pytest.mark.parametrize(
+    "steps, error",
+    [
+        ({"a": ProvisioningStep(("b",), dict), "b": ProvisioningStep(("a",), dict)}, "cycle"),
+        ({"a": ProvisioningStep(("missing",), dict)}, "unknown steps"),
+    ],
+)
+def test_invalid_graphs_are_rejected_before_any_step_runs(steps, error):
+    with pytest.raises(ValueError, match=error):
+        run_provisioning_graph(steps)
@@ -0,0 +1,132 @@
+import time
+
+import pytest
+
+from fake_agents import FakeAgentsClient, FakeAgentsService, LatencyProfile, _simulated_error
+from resilient_runs import CLOSED, OPEN, CircuitOpenError, ResilientRuns
+from run_waiter import FixedInterval, RunWaiter
+
+FAST = LatencyProfile(sigma=0.0, time_scale=0.01)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def setup(latency: LatencyProfile = FAST, **options):
+    service = FakeAgentsService(latency, seed=1)
+    client = FakeAgentsClient(service)
+    runs = ResilientRuns(client, RunWaiter(client, FixedInterval(0.01)), sleep=lambda _: None, **options)
+    agent = client.create_agent(model="fake-model", name="policy")
+    thread_id = client.threads.create().id
+    client.messages.create(thread_id=thread_id, role="user", content="Darf ich Business Class fliegen?")
+    return service, client, runs, agent.id, thread_id
+
+
+def created_runs(service: FakeAgentsService) -> int:
+    return len(service.timings["api"].get("runs.create", []))
+
+
+def test_transiently_failed_runs_are_retried_with_a_new_run():
+    service, client, runs, agent_id, thread_id = setup()
+    failure_rates = iter([1.0, 0.0])
+
+    def start():
+        service.run_failure_rate = next(failure_rates)
+        return client.runs.create(thread_id=thread_id, agent_id=agent_id)
+
+    run = runs.execute(agent_id, start)
+
+    assert run.status == "completed"
+    assert created_runs(service) == 2
+    assert runs.summary()["retries"] == 1
+
+
+def test_polling_errors_resume_the_same_run():
+    service, client, runs, agent_id, thread_id = setup()
+    get_run = client.runs.get
+    failures = [_simulated_error("runs.get")]
+
+    def flaky_get(*args, **kwargs):
+        if failures:
+            raise failures.pop()
+        return get_run(*args, **kwargs)
+
+    client.runs.get = flaky_get
+    run = runs.create_and_wait(thread_id, agent_id)
+
+    assert run.status == "completed"
+    assert created_runs(service) == 1
+    assert runs.summary()["retries"] == 1
+
+
+def test_failed_conversation_runs_are_repeated_only_when_enabled():
+    service, client, runs, agent_id, thread_id = setup()
+    service.run_failure_rate = 1.0
+
+    assert runs.create_and_wait(thread_id, agent_id).status == "failed"
+    assert created_runs(service) == 1
+
+    runs.retry_conversations = True
+    runs.create_and_wait(thread_id, agent_id)
+    assert created_runs(service) == 1 + 1 + runs.max_retries
+
+
+def test_waiting_for_a_created_run_repeats_it_only_when_enabled():
+    service, client, runs, agent_id, thread_id = setup()
+    service.run_failure_rate = 1.0
+
+    assert runs.wait(client.runs.create(thread_id=thread_id, agent_id=agent_id)).status == "failed"
+    assert created_runs(service) == 1
+
+    runs.retry_conversations = True
+    runs.wait(client.runs.create(thread_id=thread_id, agent_id=agent_id))
+    assert created_runs(service) == 1 + 1 + runs.max_retries
+
+
+def test_slow_runs_are_hedged_and_the_duplicate_wins():
+    service, client, runs, agent_id, thread_id = setup(hedge_percentile=50, hedge_min_samples=1)
+    runs.execute(agent_id, lambda: client.runs.create(thread_id=thread_id, agent_id=agent_id))
+    discarded = []
+
+    def start():
+        # The primary run takes 100 times as long as the runs so far
+        service.latency = LatencyProfile(run=150.0, sigma=0.0, time_scale=0.01)
+        return client.runs.create(thread_id=thread_id, agent_id=agent_id)
+
+    def hedge():
+        service.latency = FAST
+        return client.runs.create(thread_id=client.threads.create().id, agent_id=agent_id)
+
+    run = runs.execute(agent_id, start, hedge=hedge, discard=discarded.append)
+
+    assert run.status == "completed" and run.thread_id != thread_id
+    assert runs.summary()["hedges"] == runs.summary()["hedge_wins"] == 1
+    # The primary run is cancelled and handed to discard once its waiter has noticed
+    deadline = time.monotonic() + 5
+    while not discarded and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [loser.thread_id for loser in discarded] == [thread_id]
+
+
+def test_breaker_opens_after_consecutive_failures_and_closes_after_a_good_trial():
+    clock = FakeClock()
+    service, client, runs, agent_id, thread_id = setup(max_retries=0, failure_threshold=2, reset_seconds=30.0, clock=clock)
+    service.run_failure_rate = 1.0
+    for _ in range(2):
+        assert runs.create_and_wait(thread_id, agent_id).status == "failed"
+
+    assert runs.breaker(agent_id).state == OPEN
+    with pytest.raises(CircuitOpenError):
+        runs.create_and_wait(thread_id, agent_id)
+    assert created_runs(service) == 2
+
+    clock.now += 30.0
+    service.run_failure_rate = 0.0
+    assert runs.create_and_wait(thread_id, agent_id).status == "completed"
+    assert runs.breaker(agent_id).state == CLOSED
+    assert runs.summary()["rejected"] == 1
@@ -0,0 +1,70 @@
+import subprocess
+import sys
+import time
+
+import pytest
+
+from fake_agents import FakeAgentsClient, FakeAgentsService, LatencyProfile
+from provisioning import ProvisioningManifest
+from resource_lifecycle import OWNER_KEY, TAG_KEY, TAG_VALUE, ResourceJournal, ResourceRegistry, TrackedResource, parse_age, sweep
+
+DAY = 86400
+
+
+def setup(tmp_path):
+    service = FakeAgentsService(LatencyProfile(sigma=0.0, time_scale=0.01), seed=1)
+    return service, FakeAgentsClient(service), ResourceJournal(str(tmp_path / "resources.db"))
+
+
+def finished_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+@pytest.mark.parametrize("value, seconds", [("90m", 5400.0), ("24h", 86400.0), ("7d", 604800.0), ("30", 30.0)])
+def test_ages_are_parsed_with_their_unit(value, seconds):
+    assert parse_age(value) == seconds
+
+
+def test_cleanup_deletes_the_watched_threads_and_empties_the_journal(tmp_path):
+    service, client, journal = setup(tmp_path)
+    registry = ResourceRegistry("session1", journal)
+    registry.watch(client)
+    threads = [client.threads.create() for _ in range(3)]
+    client.threads.delete(threads[0].id)
+    service.delete_thread(threads[1].id)
+    unrelated = service.create_thread()
+    assert service.thread_info[threads[2].id]["metadata"] == {TAG_KEY: TAG_VALUE, OWNER_KEY: "session1"}
+
+    report = registry.cleanup()
+
+    assert (report.deleted, report.missing, report.failed) == (1, 1, [])
+    assert list(service.threads) == [unrelated.id]
+    assert len(registry) == 0 and journal.entries() == []
+
+
+def test_the_sweeper_deletes_only_old_tagged_resources_and_crashed_journal_entries(tmp_path):
+    service, client, journal = setup(tmp_path)
+    manifest = ProvisioningManifest(str(tmp_path / "manifest.json"))
+    tags = {TAG_KEY: TAG_VALUE, OWNER_KEY: "session2"}
+    old_thread, recent_thread = client.threads.create(metadata=tags), client.threads.create(metadata=tags)
+    untagged_thread = client.threads.create()
+    cached_agent = client.create_agent(model="fake-model", name="policy_agent", metadata=tags)
+    for resource_id in (old_thread.id, untagged_thread.id):
+        service.thread_info[resource_id]["created_at"] = time.time() - 2 * DAY
+    service.agents[cached_agent.id]["created_at"] = time.time() - 2 * DAY
+    manifest.put("agents", "policy_agent", {"id": cached_agent.id})
+    crashed_thread = client.threads.create()
+    journal.add(TrackedResource("thread", crashed_thread.id, "session1", finished_pid(), time.time()))
+
+    orphans, report = sweep(client, journal, manifest, parse_age("24h"), dry_run=True)
+
+    assert {orphan.id for orphan in orphans} == {old_thread.id, crashed_thread.id}
+    assert report is None and crashed_thread.id in service.threads
+
+    orphans, report = sweep(client, journal, manifest, parse_age("24h"))
+
+    assert report.deleted == 2 and report.failed == []
+    assert set(service.threads) == {recent_thread.id, untagged_thread.id}
+    assert cached_agent.id in service.agents and journal.entries() == []
@@ -0,0 +1,66 @@
+from fake_agents import FakeAgentsClient, FakeAgentsService, LatencyProfile
+from response_cache import TTLLRUCache, normalize_trip_key
+from run_waiter import FixedInterval, RunWaiter
+from subagents import POLICY_NAMESPACE, RESEARCH_NAMESPACE, CachedAgentTools
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_entries_expire_after_the_ttl_of_their_namespace():
+    clock = FakeClock()
+    cache = TTLLRUCache(ttls={"research": 60.0, "policy": None}, clock=clock)
+    cache.put("research", "berlin", "Hotels in Berlin")
+    cache.put("policy", "berlin", "130 € pro Nacht")
+
+    clock.now = 61
+    assert cache.get("research", "berlin") is None
+    assert cache.get("policy", "berlin") == "130 € pro Nacht"
+    assert cache.summary()["research"] == {"hits": 0, "misses": 1, "hit_ratio": 0.0, "evictions": 0, "expirations": 1}
+
+
+def test_the_least_recently_used_entry_is_evicted():
+    cache = TTLLRUCache(max_entries=2)
+    cache.put("research", "berlin", 1)
+    cache.put("research", "wien", 2)
+    cache.get("research", "berlin")
+
+    cache.put("research", "paris", 3)
+
+    assert cache.get("research", "wien") is None
+    assert cache.get("research", "berlin") == 1 and cache.get("research", "paris") == 3
+    assert cache.stats["research"].evictions == 1
+
+
+def test_a_new_version_misses_the_entries_of_the_old_one():
+    cache = TTLLRUCache()
+    cache.put("policy", "berlin", "alt", version="hash-1")
+
+    assert cache.get("policy", "berlin", version="hash-2") is None
+    assert cache.get("policy", "berlin", version="hash-1") == "alt"
+
+
+def test_trip_keys_ignore_spelling_and_formatting():
+    assert normalize_trip_key("Munich", "2026-10-20 ", "2026-10-23", "Economy") == normalize_trip_key(" München", "2026-10-20", "2026-10-23", "economy")
+    assert normalize_trip_key("Berlin", origin="Köln") != normalize_trip_key("Berlin", origin="Hamburg")
+
+
+def test_repeated_policy_questions_start_a_single_agent_run():
+    service = FakeAgentsService(LatencyProfile(sigma=0.0, time_scale=0.01), seed=1)
+    client = FakeAgentsClient(service)
+    policy_agent = client.create_agent(model="fake-model", name="policy_pruefungs_agent")
+    research_agent = client.create_agent(model="fake-model", name="reise_recherche_agent")
+    cache = TTLLRUCache(ttls={POLICY_NAMESPACE: None, RESEARCH_NAMESPACE: 900.0})
+    tools = CachedAgentTools(client, RunWaiter(client, FixedInterval(0.01)), cache, policy_agent.id, research_agent.id, policy_version="hash-1")
+
+    first = tools.check_policy("München", "2026-10-20", "2026-10-23")
+    second = tools.check_policy("Munich", "2026-10-20", "2026-10-23 ")
+
+    assert first == second and "policy_pruefungs_agent" in first
+    assert len(service.timings["api"]["runs.create"]) == 1
+    assert cache.summary()[POLICY_NAMESPACE]["hits"] == 1
@@ -0,0 +1,14 @@
+import pytest
+import semantic_kernel
+
+from intent_router import IntentRouter
+from routed_handoff import RoutedHandoffOrchestration, routing_supported
+
+
+def test_refuses_semantic_kernel_versions_it_was_not_verified_with(monkeypatch):
+    assert routing_supported()
+    monkeypatch.setattr(semantic_kernel, "__version__", "9.0.0")
+
+    assert not routing_supported()
+    with pytest.raises(RuntimeError, match="verified with semantic-kernel"):
+        RoutedHandoffOrchestration(members=[], handoffs={}, router=IntentRouter())
@@ -0,0 +1,46 @@
+from azure.ai.agents.models import ConnectedAgentTool
+
+from fake_agents import FakeAgentsClient, FakeAgentsService, LatencyProfile, _simulated_error
+from run_stream import ConsoleRunEventHandler, stream_run
+
+
+def setup():
+    service = FakeAgentsService(LatencyProfile(sigma=0.0, time_scale=0.01), seed=1)
+    client = FakeAgentsClient(service)
+    flight_agent = client.create_agent(model="fake-model", name="flight_agent")
+    connected = ConnectedAgentTool(id=flight_agent.id, name="flight_agent", description="Sucht Flüge")
+    orchestrator = client.create_agent(model="fake-model", name="orchestrator", tools=connected.definitions)
+    thread_id = client.threads.create().id
+    client.messages.create(thread_id=thread_id, role="user", content="Flug nach Wien am Dienstag")
+    return service, client, orchestrator.id, thread_id
+
+
+def test_streamed_runs_print_the_answer_and_the_connected_agents():
+    service, client, agent_id, thread_id = setup()
+    output = []
+
+    run, printed = stream_run(client, thread_id, agent_id, ConsoleRunEventHandler(write=output.append))
+
+    assert run.status == "completed" and printed
+    text = "".join(output)
+    assert text.index("  → flight_agent wird ausgeführt...") < text.index("  ✓ flight_agent fertig") < text.index("assistant:\n")
+    answer = client.messages.get_last_message_text_by_role(thread_id=thread_id, role="assistant").text.value
+    assert text.endswith(answer + "\n\n")
+
+
+def test_a_stream_that_cannot_be_opened_falls_back_to_the_blocking_run():
+    service, client, agent_id, thread_id = setup()
+    fallback_runs = []
+
+    def unavailable(**_):
+        raise _simulated_error("runs.stream")
+
+    def fallback():
+        fallback_runs.append(client.runs.create_and_process(thread_id=thread_id, agent_id=agent_id, polling_interval=0.01))
+        return fallback_runs[-1]
+
+    client.runs.stream = unavailable
+    run, printed = stream_run(client, thread_id, agent_id, ConsoleRunEventHandler(write=lambda _: None), fallback=fallback)
+
+    assert fallback_runs == [run] and run.status == "completed"
+    assert not printed
@@ -0,0 +1,68 @@
+import itertools
+import threading
+
+import pytest
+
+from fake_agents import FakeAgentsClient, FakeAgentsService, LatencyProfile
+from run_waiter import AdaptiveBackoff, FixedInterval, RunWaiter, polling_strategy_from_name
+
+
+def setup(latency: LatencyProfile = LatencyProfile(sigma=0.0, time_scale=0.01)):
+    service = FakeAgentsService(latency, seed=1)
+    client = FakeAgentsClient(service)
+    agent = client.create_agent(model="fake-model", name="orchestrator")
+    thread_id = client.threads.create().id
+    client.messages.create(thread_id=thread_id, role="user", content="Ich muss nach Berlin")
+    return service, client, agent.id, thread_id
+
+
+def test_adaptive_backoff_polls_fast_first_and_then_backs_off_up_to_the_maximum():
+    strategy = AdaptiveBackoff(fast_start_polls=2, fast_start_interval=0.1, initial=0.5, maximum=2.0, multiplier=2.0, jitter=0.0)
+
+    assert list(itertools.islice(strategy.delays(), 7)) == [0.1, 0.1, 0.5, 1.0, 2.0, 2.0, 2.0]
+
+
+def test_jitter_stays_within_its_bounds():
+    strategy = AdaptiveBackoff(fast_start_polls=0, initial=1.0, maximum=1.0, jitter=0.2)
+
+    assert all(0.8 <= delay <= 1.2 for delay in itertools.islice(strategy.delays(), 100))
+
+
+def test_finished_runs_are_recorded_with_their_polls():
+    service, client, agent_id, thread_id = setup()
+    finished = []
+    waiter = RunWaiter(client, FixedInterval(0.01), on_finished=lambda run, seconds: finished.append(run.id))
+
+    run = waiter.create_and_wait(thread_id, agent_id)
+
+    stats = waiter.stats_for(run.id)
+    assert run.status == "completed" and finished == [run.id]
+    assert stats.status == "completed" and stats.polls == len(service.timings["api"]["runs.get"])
+    assert waiter.summary()["runs"] == 1 and waiter.summary()["timeouts"] == 0
+
+
+def test_runs_that_exceed_the_timeout_are_cancelled():
+    service, client, agent_id, thread_id = setup(LatencyProfile(run=100.0, sigma=0.0, time_scale=0.01))
+    waiter = RunWaiter(client, FixedInterval(0.01), timeout=0.1)
+
+    run = waiter.create_and_wait(thread_id, agent_id)
+
+    assert run.status in ("cancelling", "cancelled")
+    assert waiter.last_stats()["timed_out"] and waiter.last_stats()["cancelled"]
+
+
+def test_setting_the_cancel_event_cancels_the_run_without_further_polls():
+    service, client, agent_id, thread_id = setup(LatencyProfile(run=100.0, sigma=0.0, time_scale=0.01))
+    cancel_event = threading.Event()
+    cancel_event.set()
+
+    run = RunWaiter(client, FixedInterval(10.0)).create_and_wait(thread_id, agent_id, cancel_event=cancel_event)
+
+    assert run.status in ("cancelling", "cancelled")
+    assert "runs.get" not in service.timings["api"]
+
+
+def test_unknown_strategy_names_are_rejected():
+    assert isinstance(polling_strategy_from_name("fixed"), FixedInterval)
+    with pytest.raises(ValueError, match="Unknown polling strategy"):
+        polling_strategy_from_name("eager")
@@ -0,0 +1,41 @@
+import pytest
+
+from policy_index import parse_amount
+from subagents import policy_limits, violation
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("130,00", 130.0),
+        ("130.00", 130.0),
+        ("1.200,50", 1200.5),
+        ("1,200.50", 1200.5),
+        ("1.200", 1200.0),
+        ("1.200.000", 1200000.0),
+        ("0,30", 0.3),
+        ("150", 150.0),
+    ],
+)
+def test_parse_amount_german_and_english_notation(text, expected):
+    assert parse_amount(text) == expected
+
+
+@pytest.mark.parametrize(
+    "policy_text, expected",
+    [
+        ("Die Obergrenze beträgt 130,00 € pro Nacht.", 130.0),
+        ("Die Obergrenze beträgt 130.00 € pro Nacht.", 130.0),
+        ("Maximal 1.200,50 EUR je Nacht", 1200.5),
+        ("Maximal 1,200.50 Euro / Nacht", 1200.5),
+    ],
+)
+def test_policy_limits_hotel_cap(policy_text, expected):
+    assert policy_limits(policy_text, "Berlin") == {"hotel_max_eur_per_night": expected}
+
+
+def test_violation_compares_prices_in_both_notations():
+    limits = policy_limits("Hotels bis 130.00 € pro Nacht, 3- bis maximal 4-Sterne", "Berlin")
+    assert limits["hotel_min_stars"] == 3 and limits["hotel_max_stars"] == 4
+    assert violation({"typ": "hotel", "preis_pro_nacht_eur": "129,90 €", "sterne": 4}, limits) is None
+    assert violation({"typ": "hotel", "preis_pro_nacht_eur": "1.130,00 €", "sterne": 4}, limits) is not None
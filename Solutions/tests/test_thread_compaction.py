@@ -0,0 +1,62 @@
+import json
+
+from fake_agents import FakeAgentsClient, FakeAgentsService, LatencyProfile
+from run_waiter import FixedInterval, RunWaiter
+from thread_compaction import STATE_MARKER, ThreadCompactor
+from trip_parser import STRUCTURED_MARKER
+
+TRIP = {"destination": "Berlin", "start_date": "2026-10-20", "end_date": "2026-10-23"}
+CONVERSATION = [
+    ("user", f"Ich muss Dienstag bis Freitag nach Berlin\n\n{STRUCTURED_MARKER}\n{json.dumps(TRIP)}"),
+    ("assistant", "Option 1: Hotel Adlon für 129 € pro Nacht. Soll ich buchen?"),
+    ("user", "Ja, bitte buchen"),
+    ("assistant", "Die Buchung wurde erfolgreich bestätigt, Buchungsnummer B-4711."),
+]
+
+
+def setup(**options):
+    service = FakeAgentsService(LatencyProfile(sigma=0.0, time_scale=0.01), seed=1)
+    client = FakeAgentsClient(service)
+    agent = client.create_agent(model="fake-model", name="orchestrator")
+    thread = client.threads.create(messages=[{"role": role, "content": content} for role, content in CONVERSATION])
+    return service, client, agent.id, thread.id, ThreadCompactor(client, **options)
+
+
+def texts(client, thread_id: str) -> list[tuple[str, str]]:
+    messages = client.messages.list(thread_id=thread_id, order="asc")
+    return [(message.role, message.text_messages[0].text.value) for message in messages]
+
+
+def test_a_long_thread_continues_on_a_new_thread_with_the_state_and_the_last_turn():
+    service, client, agent_id, thread_id, compactor = setup(max_messages=6, delete_old_threads=True)
+    compactor.messages = len(CONVERSATION)
+    client.messages.create(thread_id=thread_id, role="user", content="Brauche ich noch einen Mietwagen?")
+    run = RunWaiter(client, FixedInterval(0.01)).create_and_wait(thread_id, agent_id)
+
+    assert compactor.record_run(run)
+    new_thread = compactor.compact(thread_id)
+
+    (state_role, state_text), *recent = texts(client, new_thread.id)
+    state = json.loads(state_text.split("\n", 2)[2])
+    assert state_role == "user" and state_text.startswith(STATE_MARKER)
+    assert state["trip"] == TRIP
+    assert state["approvals"] == ["Option 1: Hotel Adlon für 129 € pro Nacht. Soll ich buchen? → Ja, bitte buchen"]
+    assert state["bookings"] == ["Die Buchung wurde erfolgreich bestätigt, Buchungsnummer B-4711."]
+    assert state["previous_threads"] == [thread_id] and state["compacted_turns"] == 2
+    assert [role for role, _ in recent] == ["user", "assistant"] and recent[0][1] == "Brauche ich noch einen Mietwagen?"
+    assert thread_id not in service.threads
+    assert compactor.messages == 3 and not compactor.record_run(run)
+
+
+def test_a_second_compaction_starts_from_the_state_of_the_first():
+    service, client, agent_id, thread_id, compactor = setup(keep_turns=0)
+    first = compactor.compact(thread_id, trip={"origin": "München"})
+    client.messages.create(thread_id=first.id, role="user", content="Ich bleibe doch bis Samstag")
+
+    second = compactor.compact(first.id)
+
+    state = json.loads(texts(client, second.id)[0][1].split("\n", 2)[2])
+    assert state["trip"] == {**TRIP, "origin": "München"}
+    assert len(state["bookings"]) == 1
+    assert state["previous_threads"] == [thread_id, first.id] and state["compacted_turns"] == 3
+    assert compactor.compactions == 2
@@ -0,0 +1,81 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from startup import AGENTS_SCOPE
+from token_cache import FakeTokenEndpoint, PinnedCredential, TokenCache
+
+pytest.importorskip("cryptography")
+pytest.importorskip("azure.identity")
+
+SOLUTIONS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Fetches one token like the solution scripts and prints the statistics of the credential
+TOKEN_PROCESS = (
+    "import json; from token_cache import credential_from_env; "
+    f"credential = credential_from_env(); credential.get_token_info({AGENTS_SCOPE!r}); "
+    "print(json.dumps({'source': credential.source, **credential.stats})); credential.close()"
+)
+
+
+@pytest.fixture
+def endpoint():
+    with FakeTokenEndpoint() as endpoint:
+        yield endpoint
+
+
+@pytest.fixture
+def cache_environ(tmp_path, endpoint, monkeypatch):
+    from cryptography.fernet import Fernet
+
+    environ = {**endpoint.environ, "TOKEN_CACHE_PATH": str(tmp_path / "tokens.bin"), "TOKEN_CACHE_KEY": Fernet.generate_key().decode()}
+    for name in ("AZURE_CLIENT_ID", "AZURE_TENANT_ID", "AZURE_CLIENT_SECRET", "TOKEN_CACHE"):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in environ.items():
+        monkeypatch.setenv(name, value)
+    return environ
+
+
+def fetch_in_new_process() -> dict:
+    result = subprocess.run([sys.executable, "-c", TOKEN_PROCESS], cwd=SOLUTIONS, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_second_process_is_served_from_the_encrypted_cache(endpoint, cache_environ):
+    first = fetch_in_new_process()
+    second = fetch_in_new_process()
+
+    assert first["fetched"] == 1 and first["source"] == "ManagedIdentityCredential"
+    assert second["cached"] == 1 and second["fetched"] == 0
+    assert endpoint.requests == 1
+    with open(cache_environ["TOKEN_CACHE_PATH"], "rb") as cache_file:
+        assert b"fake-token" not in cache_file.read()
+
+
+def test_cache_with_another_key_is_not_used(endpoint, cache_environ, monkeypatch):
+    from cryptography.fernet import Fernet
+
+    fetch_in_new_process()
+    monkeypatch.setenv("TOKEN_CACHE_KEY", Fernet.generate_key().decode())
+
+    assert fetch_in_new_process()["fetched"] == 1
+    assert endpoint.requests == 2
+
+
+def test_tokens_are_refreshed_in_the_background(endpoint, cache_environ):
+    # A token of 2 seconds is refreshed after half its lifetime
+    endpoint.lifetime = 2.0
+    with PinnedCredential(TokenCache()) as credential:
+        first = credential.get_token_info(AGENTS_SCOPE)
+        deadline = time.monotonic() + 10
+        while credential.stats["refreshed"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        # The refreshed token replaced the first one in the cache, for the next process too
+        assert credential.stats["refreshed"] >= 1
+        _, tokens = TokenCache().load()
+    assert endpoint.requests >= 2
+    assert tokens[AGENTS_SCOPE].token != first.token
@@ -0,0 +1,72 @@
+import pytest
+
+from fake_agents import FakeAgentsClient, FakeAgentsService, LatencyProfile
+from tracing import Tracer, instrument
+
+
+class OpaqueStream:
+    """A run stream whose event handler hides how it processes events."""
+
+    event_handler = object()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+    def __iter__(self):
+        return iter([("thread.run.created", None, None)])
+
+
+class OpaqueRuns:
+    def stream(self, thread_id, agent_id, **kwargs):
+        return OpaqueStream()
+
+
+class OpaqueClient:
+    runs = OpaqueRuns()
+
+
+def run_spans(tracer):
+    return [span for span in tracer.spans if span.name.startswith("run ")]
+
+
+def test_streamed_runs_are_followed_through_their_events():
+    service = FakeAgentsService(LatencyProfile(time_scale=0.001), seed=1)
+    tracer = Tracer()
+    client = instrument(FakeAgentsClient(service), tracer)
+    agent = client.create_agent(model="fake-model", name="support")
+    thread_id = client.threads.create().id
+    client.messages.create(thread_id=thread_id, role="user", content="Hallo")
+
+    with client.runs.stream(thread_id=thread_id, agent_id=agent.id) as stream:
+        stream.until_done()
+
+    [span] = run_spans(tracer)
+    assert span.status == "ok"
+    assert "time_to_first_token_ms" in span.attributes
+
+
+def test_streams_without_observable_events_are_timed_as_a_whole():
+    tracer = Tracer()
+    client = instrument(OpaqueClient(), tracer)
+
+    with client.runs.stream(thread_id="thread_1", agent_id="asst_1") as stream:
+        assert [event_type for event_type, _, _ in stream] == ["thread.run.created"]
+        assert run_spans(tracer) == []
+
+    [span] = run_spans(tracer)
+    assert span.status == "ok"
+
+
+def test_failed_streams_without_observable_events_end_their_span_with_the_error():
+    tracer = Tracer()
+    client = instrument(OpaqueClient(), tracer)
+
+    with pytest.raises(ConnectionError):
+        with client.runs.stream(thread_id="thread_1", agent_id="asst_1"):
+            raise ConnectionError("stream interrupted")
+
+    [span] = run_spans(tracer)
+    assert span.status == "error"
@@ -0,0 +1,46 @@
+from datetime import date
+
+import pytest
+
+from trip_parser import STRUCTURED_MARKER, TripIntake, parse_trip_request
+
+# A Sunday
+TODAY = date(2026, 10, 18)
+
+
+def test_weekday_ranges_places_and_times_are_extracted():
+    trip = parse_trip_request("Ich muss Dienstag bis Freitag von München nach Berlin, Abfahrt 7:30", TODAY)
+
+    assert (trip.origin, trip.destination) == ("München", "Berlin")
+    assert (trip.start_date, trip.end_date) == (date(2026, 10, 20), date(2026, 10, 23))
+    assert trip.departure_time == "07:30" and trip.missing() == []
+
+
+def test_english_dates_are_extracted():
+    trip = parse_trip_request("I need to go to Hamburg from 3 November to 6 November", TODAY)
+
+    assert trip.destination == "Hamburg"
+    assert (trip.start_date, trip.end_date) == (date(2026, 11, 3), date(2026, 11, 6))
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["Ich fliege am Montag nach Wien", "Er fliegt nach Wien", "Letztes Mal bin ich nach Wien geflogen", "Mit dem Flugzeug nach Wien", "Flug nach Wien"],
+)
+def test_inflected_forms_of_fliegen_mean_a_flight(text):
+    assert parse_trip_request(text, TODAY).transport == "Flug"
+
+
+def test_incomplete_requests_are_answered_locally_until_the_period_is_known():
+    intake = TripIntake(TODAY)
+
+    reply, message = intake.handle("Ich muss nach Berlin")
+    assert message is None and reply.startswith("Ziel erkannt (Berlin)")
+
+    reply, message = intake.handle("Dienstag bis Freitag")
+    assert reply is None
+    assert message.startswith("Ich muss nach Berlin\nDienstag bis Freitag\n\n" + STRUCTURED_MARKER)
+    assert message.endswith('{"destination": "Berlin", "start_date": "2026-10-20", "end_date": "2026-10-23"}')
+
+    # Messages that are not about a trip go to the orchestrator unchanged
+    assert intake.handle("Danke!") == (None, "Danke!")
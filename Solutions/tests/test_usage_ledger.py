@@ -0,0 +1,62 @@
+import asyncio
+
+from fake_agents import FakeAgentsClient, FakeAgentsService, LatencyProfile, fake_project_client
+from run_waiter import FixedInterval, RunWaiter
+from usage_ledger import UsageLedger
+
+
+class CountingRuns:
+    """Counts the runs a ``runs.list`` call yields before the caller stops iterating."""
+
+    def __init__(self, runs):
+        self._runs = runs
+        self.listed = 0
+
+    def list(self, **kwargs):
+        async def runs():
+            async for run in self._runs.list(**kwargs):
+                self.listed += 1
+                yield run
+
+        return runs()
+
+
+def test_collect_runs_reads_the_steps_of_every_run_once():
+    service = FakeAgentsService(LatencyProfile(time_scale=0.001), seed=1)
+    client = FakeAgentsClient(service)
+    waiter = RunWaiter(client, FixedInterval(0.0))
+    agent = client.create_agent(model="fake-model", name="support")
+    thread_id = client.threads.create().id
+    agents = fake_project_client(service).agents
+    agents.runs = counting = CountingRuns(agents.runs)
+    ledger = UsageLedger()
+
+    recorded = []
+    for turn in range(4):
+        client.messages.create(thread_id=thread_id, role="user", content=f"Frage {turn}")
+        waiter.create_and_wait(thread_id, agent.id)
+        recorded.append(len(asyncio.run(ledger.collect_runs(agents, [thread_id]))))
+
+    assert recorded == [1, 1, 1, 1]
+    assert ledger.total.calls == 4
+    assert len(service.timings["api"]["run_steps.list"]) == 4
+    assert len(service.timings["api"]["runs.list"]) == 4
+    # Each call stops at the run recorded last time instead of walking the whole thread
+    assert counting.listed == 1 + 2 + 2 + 2
+
+
+def test_collect_runs_records_a_run_that_was_in_progress_later():
+    service = FakeAgentsService(LatencyProfile(time_scale=0.001), seed=1)
+    client = FakeAgentsClient(service)
+    agent = client.create_agent(model="fake-model", name="support")
+    thread_id = client.threads.create().id
+    agents = fake_project_client(service).agents
+    ledger = UsageLedger()
+
+    client.messages.create(thread_id=thread_id, role="user", content="Frage")
+    run = client.runs.create(thread_id=thread_id, agent_id=agent.id)
+    assert asyncio.run(ledger.collect_runs(agents, [thread_id])) == []
+
+    RunWaiter(client, FixedInterval(0.0)).wait(run)
+    assert [record.run_id for record in asyncio.run(ledger.collect_runs(agents, [thread_id]))] == [run.id]
+    assert asyncio.run(ledger.collect_runs(agents, [thread_id])) == []
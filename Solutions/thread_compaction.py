@@ -0,0 +1,182 @@
+"""Compaction of long conversations onto a fresh thread.
+
+Every orchestrator run reads the complete thread, so a long planning conversation makes each
+turn slower and more expensive than the one before. :class:`ThreadCompactor` watches the size
+of the thread and, once it passes a threshold, condenses the older turns into a state record
+(confirmed trip parameters, approvals, bookings) and continues on a new thread that only
+contains this record and the most recent turns.
+
+The state record is extracted locally from the messages, no model call is needed: the trip
+parameters come from the structured trip data attached by :mod:`trip_parser`, approvals are
+short affirmative user answers and bookings are agent messages that confirm a booking.
+"""
+
+import json
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from azure.ai.agents.models import ListSortOrder, MessageRole, ThreadMessage, ThreadMessageOptions
+from azure.core.exceptions import ResourceNotFoundError
+
+from trip_parser import STRUCTURED_MARKER
+
+STATE_MARKER = "[Gesprächsstand]"
+# Entries of each list kept in the state record
+MAX_STATE_ENTRIES = 5
+MAX_ENTRY_CHARS = 300
+
+APPROVAL_PATTERN = re.compile(
+    r"^\W*(ja|jawohl|genehmigt|freigegeben|einverstanden|passt|bitte buchen|buchen|ok(ay)?|yes|approved?|go ahead)\b",
+    re.IGNORECASE,
+)
+BOOKING_PATTERN = re.compile(
+    r"(gebucht|buchung (ist |wurde )?(erfolgreich )?(bestätigt|abgeschlossen|durchgeführt)|buchungsnummer|booking (reference|confirmed)|\bbooked\b)",
+    re.IGNORECASE,
+)
+
+
+def _text(message: ThreadMessage) -> str:
+    return "\n".join(part.text.value for part in message.text_messages)
+
+
+def _shorten(text: str) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= MAX_ENTRY_CHARS else text[: MAX_ENTRY_CHARS - 1] + "…"
+
+
+def _embedded_json(text: str, marker: str) -> Optional[dict]:
+    if marker not in text:
+        return None
+    try:
+        data = json.loads(text.split(marker, 1)[1].strip())
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@dataclass
+class ConversationState:
+    """What the conversation has settled so far."""
+
+    trip: dict = field(default_factory=dict)
+    approvals: list[str] = field(default_factory=list)
+    bookings: list[str] = field(default_factory=list)
+    previous_threads: list[str] = field(default_factory=list)
+    compacted_turns: int = 0
+
+    def add(self, entries: list[str], entry: str) -> None:
+        entries.append(_shorten(entry))
+        del entries[:-MAX_STATE_ENTRIES]
+
+    def render(self) -> str:
+        """Render the record as the first message of the new thread."""
+        return (
+            f"{STATE_MARKER}\n"
+            "Dies ist die Zusammenfassung des bisherigen Gesprächs. Bestätigte Reisedaten, "
+            "Genehmigungen und Buchungen gelten weiterhin und müssen nicht erneut erfragt werden.\n"
+            + json.dumps(asdict(self), ensure_ascii=False)
+        )
+
+    @classmethod
+    def extract(cls, messages: list[ThreadMessage], previous: Optional["ConversationState"] = None) -> "ConversationState":
+        """Build the state from the messages of a thread in chronological order."""
+        state = previous or cls()
+        last_agent_text = ""
+        for message in messages:
+            text = _text(message)
+            if not text:
+                continue
+            if message.role == MessageRole.AGENT:
+                if BOOKING_PATTERN.search(text):
+                    state.add(state.bookings, text)
+                last_agent_text = text
+                continue
+            seeded = _embedded_json(text, STATE_MARKER)
+            if seeded is not None:
+                # The record of an earlier compaction is the starting point
+                state = cls(**{**asdict(cls()), **seeded})
+                continue
+            trip = _embedded_json(text, STRUCTURED_MARKER)
+            if trip is not None:
+                state.trip.update(trip)
+            elif APPROVAL_PATTERN.search(text) and last_agent_text:
+                state.add(state.approvals, f"{_shorten(last_agent_text)} → {text.strip()}")
+        return state
+
+
+class ThreadCompactor:
+    """Move a conversation to a fresh thread once it has grown past a threshold.
+
+    Args:
+        client: The synchronous ``AgentsClient``.
+        max_messages (int): Compact once the thread holds this many messages (one user and at
+            least one agent message per turn, 0 disables the check).
+        max_prompt_tokens (int): Compact once a run needed this many prompt tokens (0 disables
+            the check).
+        keep_turns (int): Number of recent turns copied verbatim to the new thread.
+        delete_old_threads (bool): Delete the compacted thread.
+    """
+
+    def __init__(self, client, max_messages: int = 24, max_prompt_tokens: int = 12000, keep_turns: int = 1, delete_old_threads: bool = False):
+        self.client = client
+        self.max_messages = max_messages
+        self.max_prompt_tokens = max_prompt_tokens
+        self.keep_turns = keep_turns
+        self.delete_old_threads = delete_old_threads
+        self.state = ConversationState()
+        self.messages = 0
+        self.last_prompt_tokens = 0
+        self.compactions = 0
+
+    def record_run(self, run) -> bool:
+        """Account for a finished turn and return whether the thread should be compacted now."""
+        self.messages += 2
+        if run.usage:
+            self.last_prompt_tokens = run.usage.prompt_tokens
+        return bool(
+            (self.max_messages and self.messages >= self.max_messages)
+            or (self.max_prompt_tokens and self.last_prompt_tokens >= self.max_prompt_tokens)
+        )
+
+    def _recent_turns(self, messages: list[ThreadMessage]) -> list[ThreadMessage]:
+        starts = [index for index, message in enumerate(messages) if message.role == MessageRole.USER]
+        if self.keep_turns <= 0 or not starts:
+            return []
+        return messages[starts[-self.keep_turns] if len(starts) >= self.keep_turns else starts[0]:]
+
+    def compact(self, thread_id: str, trip: Optional[dict] = None):
+        """Create the new thread seeded with the state record and return it.
+
+        Args:
+            thread_id (str): The thread to compact.
+            trip (Optional[dict]): The current trip parameters, e.g. of the
+                :class:`~trip_parser.TripIntake`, which take precedence over the extracted ones.
+        """
+        messages = list(self.client.messages.list(thread_id=thread_id, order=ListSortOrder.ASCENDING))
+        recent = self._recent_turns(messages)
+        older = messages[: len(messages) - len(recent)]
+        self.state = ConversationState.extract(older, self.state)
+        if trip:
+            self.state.trip.update(trip)
+        self.state.previous_threads = (self.state.previous_threads + [thread_id])[-MAX_STATE_ENTRIES:]
+        self.state.compacted_turns += sum(
+            1 for message in older if message.role == MessageRole.USER and STATE_MARKER not in _text(message)
+        )
+
+        seed = [ThreadMessageOptions(role=MessageRole.USER, content=self.state.render())]
+        seed += [
+            ThreadMessageOptions(role=message.role, content=_text(message))
+            for message in recent
+            if _text(message)
+        ]
+        thread = self.client.threads.create(messages=seed)
+        if self.delete_old_threads:
+            try:
+                self.client.threads.delete(thread_id)
+            except ResourceNotFoundError:
+                pass
+        self.messages = len(seed)
+        self.last_prompt_tokens = 0
+        self.compactions += 1
+        return thread
@@ -0,0 +1,483 @@
+"""Pinned credential source with an encrypted token cache shared across processes.
+
+``DefaultAzureCredential`` walks its chain of credential sources (environment, workload
+identity, managed identity, Azure CLI, ...) in every new process and fetches a new token only
+once the old one is about to expire, on the thread of the request that needs it. Both can add
+seconds to a turn of the user. :class:`PinnedCredential` removes that latency from the hot
+path:
+
+- It remembers which source of the chain returned the token and builds only that source in
+  the next process. If the pinned source stops working (e.g. after ``az logout``) the chain is
+  walked again and the source that works then is pinned.
+- Tokens are kept in a :class:`TokenCache`, a file encrypted with Fernet (AES-128-CBC with
+  HMAC-SHA256), so the next process starts with a valid token without asking any source. The
+  key is read from ``TOKEN_CACHE_KEY`` or from a key file in the home directory that only
+  the user can read, so the cache file alone does not reveal the tokens.
+- A timer refreshes every token the process uses in the background, ``refresh_margin``
+  seconds before it expires, so requests are served from memory.
+
+:class:`FakeTokenEndpoint` is a local token endpoint in the format of the App Service
+managed identity. With its environment variables set, ``DefaultAzureCredential`` fetches its
+tokens from it, which makes the cache testable without Azure.
+
+Examples::
+
+    python token_cache.py fake-endpoint --lifetime 600
+    python token_cache.py token --repeat 3
+    python token_cache.py status
+    python token_cache.py clear
+"""
+
+import argparse
+import json
+import os
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from azure.core.credentials import AccessToken, AccessTokenInfo
+
+from startup import AGENTS_SCOPE, MIN_TOKEN_LIFETIME
+
+DEFAULT_TOKEN_CACHE_PATH = ".agent_tokens.bin"
+DEFAULT_KEY_PATH = os.path.join(os.path.expanduser("~"), ".agent_tokens.key")
+# A token is refreshed in the background this many seconds before it expires
+DEFAULT_REFRESH_MARGIN = 600.0
+# Delay before a failed background refresh is tried again
+REFRESH_RETRY_SECONDS = 30.0
+# Sources of DefaultAzureCredential that can be built on their own
+PINNABLE_SOURCES = (
+    "EnvironmentCredential",
+    "WorkloadIdentityCredential",
+    "ManagedIdentityCredential",
+    "SharedTokenCacheCredential",
+    "AzureCliCredential",
+    "AzurePowerShellCredential",
+    "AzureDeveloperCliCredential",
+)
+
+
+def default_chain():
+    from azure.identity import DefaultAzureCredential
+
+    return DefaultAzureCredential()
+
+
+def source_credential(name: str):
+    """Build the credential source ``name`` of the chain of ``DefaultAzureCredential``."""
+    import azure.identity
+
+    if name == "ManagedIdentityCredential":
+        # DefaultAzureCredential selects a user-assigned identity the same way
+        return azure.identity.ManagedIdentityCredential(client_id=os.getenv("AZURE_CLIENT_ID"))
+    return getattr(azure.identity, name)()
+
+
+def _cache_key(scopes: tuple, options: dict) -> str:
+    key = " ".join(scopes)
+    if options.get("tenant_id"):
+        key += f" tenant={options['tenant_id']}"
+    if options.get("enable_cae"):
+        key += " cae"
+    return key
+
+
+def _read_or_create_key(path: str) -> bytes:
+    from cryptography.fernet import Fernet
+
+    try:
+        with open(path, "rb") as key_file:
+            return key_file.read().strip()
+    except FileNotFoundError:
+        pass
+    # The key is linked into place complete, so a concurrent process never reads half of it
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    descriptor = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, "wb") as key_file:
+        key_file.write(Fernet.generate_key())
+    try:
+        os.link(tmp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+    with open(path, "rb") as key_file:
+        return key_file.read().strip()
+
+
+class TokenCache:
+    """Encrypted local file with the pinned credential source and the cached tokens.
+
+    Args:
+        path (str): The cache file, by default ``TOKEN_CACHE_PATH`` or ``.agent_tokens.bin``.
+        key (bytes): Fernet key, by default ``TOKEN_CACHE_KEY`` or the content of the key file
+            ``TOKEN_CACHE_KEY_PATH`` (``~/.agent_tokens.key``), which is created if missing.
+    """
+
+    def __init__(self, path: Optional[str] = None, key: Optional[bytes] = None):
+        self.path = path or os.getenv("TOKEN_CACHE_PATH", DEFAULT_TOKEN_CACHE_PATH)
+        self._key = key
+        self._fernet = None
+        self._lock = threading.Lock()
+
+    def _cipher(self):
+        if self._fernet is None:
+            try:
+                from cryptography.fernet import Fernet
+            except ImportError as error:
+                raise ImportError("The token cache needs cryptography: pip install cryptography") from error
+            key = self._key or os.getenv("TOKEN_CACHE_KEY", "").encode() or _read_or_create_key(os.getenv("TOKEN_CACHE_KEY_PATH", DEFAULT_KEY_PATH))
+            self._fernet = Fernet(key)
+        return self._fernet
+
+    def _load(self) -> dict:
+        from cryptography.fernet import InvalidToken
+
+        try:
+            with open(self.path, "rb") as cache_file:
+                data = json.loads(self._cipher().decrypt(cache_file.read()))
+        except (FileNotFoundError, InvalidToken, ValueError):
+            # A cache written with another key is treated like a missing one
+            return {"source": None, "tokens": {}}
+        return {"source": data.get("source"), "tokens": data.get("tokens", {})}
+
+    def _save(self, data: dict) -> None:
+        # Other processes read the cache, so it is replaced atomically and readable only by the user
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        descriptor = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, "wb") as cache_file:
+            cache_file.write(self._cipher().encrypt(json.dumps(data).encode("utf-8")))
+        os.replace(tmp_path, self.path)
+
+    def load(self) -> tuple[Optional[str], dict[str, AccessTokenInfo]]:
+        """Return the pinned source and the tokens that are not expired yet."""
+        with self._lock:
+            data = self._load()
+        now = time.time()
+        tokens = {
+            key: AccessTokenInfo(entry["token"], entry["expires_on"], token_type=entry.get("token_type", "Bearer"), refresh_on=entry.get("refresh_on"))
+            for key, entry in data["tokens"].items()
+            if entry["expires_on"] > now
+        }
+        return data["source"], tokens
+
+    def store(self, key: str, token: AccessTokenInfo) -> None:
+        with self._lock:
+            data = self._load()
+            now = time.time()
+            data["tokens"] = {other: entry for other, entry in data["tokens"].items() if entry["expires_on"] > now}
+            data["tokens"][key] = {"token": token.token, "expires_on": token.expires_on, "token_type": token.token_type, "refresh_on": token.refresh_on}
+            self._save(data)
+
+    def pin(self, source: Optional[str]) -> None:
+        with self._lock:
+            data = self._load()
+            if data["source"] != source:
+                data["source"] = source
+                self._save(data)
+
+    def clear(self) -> bool:
+        with self._lock:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                return False
+            return True
+
+
+class PinnedCredential:
+    """Synchronous credential with a pinned source, a token cache and background refreshes.
+
+    Thread-safe; concurrent requests for a missing token wait for a single fetch.
+
+    Args:
+        cache (TokenCache): Persists the pinned source and the tokens across processes; ``None``
+            keeps both in memory.
+        refresh_margin (float): Seconds before the expiry at which a token is refreshed in the
+            background, at most half of the remaining lifetime.
+        chain (Callable): Builds the chain that is walked while no source is pinned.
+        source_factory (Callable): Builds the pinned source from its class name.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[TokenCache] = None,
+        refresh_margin: float = DEFAULT_REFRESH_MARGIN,
+        chain: Callable[[], Any] = default_chain,
+        source_factory: Callable[[str], Any] = source_credential,
+    ):
+        self.cache = cache
+        self.refresh_margin = refresh_margin
+        self._chain = chain
+        self._source_factory = source_factory
+        self._credential = None
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._timers: dict[str, threading.Timer] = {}
+        self._closed = False
+        self.source: Optional[str] = None
+        self._tokens: dict[str, AccessTokenInfo] = {}
+        if cache is not None:
+            self.source, self._tokens = cache.load()
+        self.last_error: Optional[Exception] = None
+        self.stats = {"cached": 0, "fetched": 0, "refreshed": 0, "refresh_failed": 0, "unpinned": 0}
+
+    def _source_credential(self):
+        if self._credential is None:
+            self._credential = self._source_factory(self.source) if self.source in PINNABLE_SOURCES else self._chain()
+        return self._credential
+
+    def _fetch(self, scopes: tuple, options: dict) -> AccessTokenInfo:
+        try:
+            credential = self._source_credential()
+            token = credential.get_token_info(*scopes, options=options)
+        except Exception:
+            if self.source is None:
+                raise
+            # The pinned source failed; it is replaced only if the chain finds a source that works
+            credential = self._chain()
+            try:
+                token = credential.get_token_info(*scopes, options=options)
+            except Exception:
+                credential.close()
+                raise
+            if self._credential is not None:
+                self._credential.close()
+            self._credential, self.source = credential, None
+            self.stats["unpinned"] += 1
+        if self.source is None:
+            succeeded = type(getattr(credential, "_successful_credential", None)).__name__
+            if succeeded in PINNABLE_SOURCES:
+                self.source = succeeded
+            if self.cache is not None:
+                self.cache.pin(self.source)
+        self.stats["fetched"] += 1
+        return token
+
+    def _valid(self, key: str) -> Optional[AccessTokenInfo]:
+        with self._lock:
+            token = self._tokens.get(key)
+        if token is not None and token.expires_on - time.time() > MIN_TOKEN_LIFETIME:
+            return token
+        return None
+
+    def _store(self, key: str, token: AccessTokenInfo) -> None:
+        with self._lock:
+            self._tokens[key] = token
+        if self.cache is not None:
+            self.cache.store(key, token)
+
+    def _refresh_delay(self, token: AccessTokenInfo) -> float:
+        remaining = token.expires_on - time.time()
+        delay = remaining - min(self.refresh_margin, remaining / 2)
+        if token.refresh_on:
+            delay = min(delay, token.refresh_on - time.time())
+        return max(delay, 0.0)
+
+    def _schedule(self, key: str, scopes: tuple, options: dict, delay: float) -> None:
+        with self._lock:
+            if self._closed or key in self._timers:
+                return
+            timer = threading.Timer(delay, self._refresh, (key, scopes, options))
+            timer.name = "token-refresh"
+            timer.daemon = True
+            self._timers[key] = timer
+        timer.start()
+
+    def _refresh(self, key: str, scopes: tuple, options: dict) -> None:
+        with self._lock:
+            self._timers.pop(key, None)
+        try:
+            with self._fetch_lock:
+                token = self._fetch(scopes, options)
+                self._store(key, token)
+        except Exception as error:
+            # The current token stays in use; once it is too old a request fetches a new one itself
+            self.last_error = error
+            self.stats["refresh_failed"] += 1
+            current = self._valid(key)
+            if current is not None:
+                self._schedule(key, scopes, options, min(REFRESH_RETRY_SECONDS, self._refresh_delay(current)))
+            return
+        self.stats["refreshed"] += 1
+        self._schedule(key, scopes, options, self._refresh_delay(token))
+
+    def get_token_info(self, *scopes: str, options: Optional[dict] = None) -> AccessTokenInfo:
+        options = dict(options or {})
+        if options.get("claims"):
+            # A claims challenge is answered only by a new token of the source
+            with self._fetch_lock:
+                return self._fetch(scopes, options)
+        key = _cache_key(scopes, options)
+        token = self._valid(key)
+        if token is not None:
+            self.stats["cached"] += 1
+        else:
+            with self._fetch_lock:
+                # Another thread may have fetched the token while this one waited
+                token = self._valid(key)
+                if token is None:
+                    token = self._fetch(scopes, options)
+                    self._store(key, token)
+        self._schedule(key, scopes, options, self._refresh_delay(token))
+        # Without refresh_on the SDK keeps the token until shortly before its expiry, by then the
+        # background refresh has already replaced it here
+        return AccessTokenInfo(token.token, token.expires_on, token_type=token.token_type)
+
+    def get_token(self, *scopes: str, claims: Optional[str] = None, tenant_id: Optional[str] = None, enable_cae: bool = False, **kwargs: Any) -> AccessToken:
+        options = {key: value for key, value in (("claims", claims), ("tenant_id", tenant_id), ("enable_cae", enable_cae)) if value}
+        token = self.get_token_info(*scopes, options=options)
+        return AccessToken(token.token, token.expires_on)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            timers, self._timers = list(self._timers.values()), {}
+        for timer in timers:
+            timer.cancel()
+        if self._credential is not None:
+            self._credential.close()
+
+    def __enter__(self) -> "PinnedCredential":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def credential_from_env():
+    """Return the credential of the solution scripts.
+
+    ``TOKEN_CACHE`` (default ``true``) enables the :class:`PinnedCredential` with its encrypted
+    file cache, ``false`` uses a plain ``DefaultAzureCredential``. ``TOKEN_REFRESH_MARGIN`` sets
+    the seconds before the expiry at which tokens are refreshed in the background.
+    """
+    if os.getenv("TOKEN_CACHE", "true").lower() != "true":
+        return default_chain()
+    return PinnedCredential(TokenCache(), refresh_margin=float(os.getenv("TOKEN_REFRESH_MARGIN", str(DEFAULT_REFRESH_MARGIN))))
+
+
+class FakeTokenEndpoint:
+    """Local token endpoint in the format of the App Service managed identity.
+
+    With the variables of :attr:`environ` set, ``ManagedIdentityCredential`` and therefore
+    ``DefaultAzureCredential`` request their tokens from this endpoint.
+
+    Args:
+        lifetime (float): Seconds until the issued tokens expire.
+        latency (float): Seconds every token request takes.
+    """
+
+    def __init__(self, lifetime: float = 3600.0, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.lifetime = lifetime
+        self.latency = latency
+        self.secret = secrets.token_hex(16)
+        self.requests = 0
+        # While set, requests fail like an unreachable identity endpoint
+        self.failing = False
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                endpoint.requests += 1
+                time.sleep(endpoint.latency)
+                url = urlsplit(self.path)
+                if url.path != "/msi/token" or self.headers.get("X-IDENTITY-HEADER") != endpoint.secret:
+                    return self._send(401, {"error": "invalid_request"})
+                if endpoint.failing:
+                    return self._send(500, {"error": "temporarily_unavailable"})
+                resource = parse_qs(url.query).get("resource", [""])[0]
+                self._send(200, {
+                    "access_token": f"fake-token-{endpoint.requests}",
+                    "expires_on": str(int(time.time() + endpoint.lifetime)),
+                    "resource": resource,
+                    "token_type": "Bearer",
+                    "client_id": "00000000-0000-0000-0000-000000000000",
+                })
+
+            def _send(self, status: int, payload: dict) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/msi/token"
+
+    @property
+    def environ(self) -> dict[str, str]:
+        return {"IDENTITY_ENDPOINT": self.url, "IDENTITY_HEADER": self.secret}
+
+    def start(self) -> "FakeTokenEndpoint":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-token-endpoint", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeTokenEndpoint":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Manage the token cache of the solution scripts")
+    commands = parser.add_subparsers(dest="command", required=True)
+    token = commands.add_parser("token", help="Fetch a token like the scripts and show how long it took")
+    token.add_argument("--scope", default=AGENTS_SCOPE, help="Scope of the token")
+    token.add_argument("--repeat", type=int, default=1, help="Number of fetches")
+    commands.add_parser("status", help="Show the pinned source and the cached tokens")
+    commands.add_parser("clear", help="Delete the cache file")
+    fake = commands.add_parser("fake-endpoint", help="Start a local token endpoint for tests")
+    fake.add_argument("--port", type=int, default=0, help="Port, 0 picks a free port")
+    fake.add_argument("--lifetime", type=float, default=3600.0, help="Lifetime of the tokens in seconds")
+    fake.add_argument("--latency", type=float, default=0.0, help="Duration of every fetch in seconds")
+    args = parser.parse_args(argv)
+
+    if args.command == "token":
+        with credential_from_env() as credential:
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                info = credential.get_token_info(args.scope)
+                print(f"Token in {(time.perf_counter() - started) * 1000:.1f} ms, valid for {(info.expires_on - time.time()) / 60:.0f} min")
+            if isinstance(credential, PinnedCredential):
+                print(f"Source: {credential.source or 'not pinned'}, {credential.stats}")
+    elif args.command == "status":
+        cache = TokenCache()
+        source, tokens = cache.load()
+        print(f"{cache.path}: source {source or 'not pinned'}, {len(tokens)} valid tokens")
+        for key, info in tokens.items():
+            print(f"  {key:<60} {(info.expires_on - time.time()) / 60:.0f} min left")
+    elif args.command == "clear":
+        cache = TokenCache()
+        print(f"{cache.path} deleted" if cache.clear() else f"{cache.path} does not exist")
+    else:
+        with FakeTokenEndpoint(args.lifetime, args.latency, port=args.port) as endpoint:
+            print("Token endpoint running, set for DefaultAzureCredential:")
+            for name, value in endpoint.environ.items():
+                print(f"  export {name}={value}")
+            try:
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                pass
+
+
+if __name__ == "__main__":
+    main()
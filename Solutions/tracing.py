@@ -0,0 +1,717 @@
+"""Spans and timings of provisioning, runs and connected agent calls.
+
+A slow turn can spend its time in credential acquisition, file uploads, vector store indexing,
+agent provisioning, the orchestrator run or a single connected agent. :class:`Tracer` records
+nested spans with durations and attributes for all of them:
+
+* :func:`instrument` wraps an ``AgentsClient`` (sync or async) so every operation becomes a
+  span, e.g. ``agents.files.upload_and_poll`` or ``agents.runs.create``.
+* Streamed runs become a ``run <agent>`` span that stays open until the run is finished, with a
+  child span per run step (``connected_agent <name>``, ``function <name>``, ``message_creation``)
+  and the token usage of the run and of every step.
+* :class:`TracedCredential` and :class:`AsyncTracedCredential` time token requests.
+
+Finished spans are appended to a JSON lines file in the OTLP/JSON format of the OpenTelemetry
+collector's file exporter, one ``resourceSpans`` document per flush, and :meth:`Tracer.breakdown`
+renders the latency breakdown of a turn.
+"""
+
+import contextvars
+import inspect
+import json
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Optional
+
+from azure.ai.agents.models import MessageDeltaChunk, RunStep, ThreadRun
+
+DEFAULT_TRACE_PATH = ".agent_traces.jsonl"
+TERMINAL_RUN_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete")
+TERMINAL_STEP_STATUSES = ("completed", "failed", "cancelled", "expired")
+# Operation groups of the AgentsClient whose calls are traced as well
+TRACED_GROUPS = (
+    "threads",
+    "messages",
+    "runs",
+    "run_steps",
+    "files",
+    "vector_stores",
+    "vector_store_files",
+    "vector_store_file_batches",
+)
+
+_OTLP_SPAN_KINDS = {"internal": 1, "client": 3}
+_OTLP_STATUS_CODES = {"unset": 0, "ok": 1, "error": 2}
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+@dataclass
+class Span:
+    """A timed operation with its position in the trace."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    kind: str = "internal"
+    attributes: dict = field(default_factory=dict)
+    start_time_ns: int = field(default_factory=time.time_ns)
+    started: float = field(default_factory=time.perf_counter)
+    ended: Optional[float] = None
+    status: str = "unset"
+    status_message: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        """Seconds from the start until the end, or until now while the span is open."""
+        return (self.ended if self.ended is not None else time.perf_counter()) - self.started
+
+    def set(self, **attributes: Any) -> None:
+        """Set the attributes that are not ``None``."""
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+    def add(self, key: str, amount: int = 1) -> None:
+        """Increase a counter attribute."""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(span: Span) -> dict:
+    record = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": _OTLP_SPAN_KINDS.get(span.kind, 1),
+        "startTimeUnixNano": str(span.start_time_ns),
+        "endTimeUnixNano": str(span.start_time_ns + int(span.duration * 1e9)),
+        "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+        "status": {"code": _OTLP_STATUS_CODES[span.status]},
+    }
+    if span.parent_id:
+        record["parentSpanId"] = span.parent_id
+    if span.status_message:
+        record["status"]["message"] = span.status_message
+    return record
+
+
+def _usage_attributes(usage: Any) -> dict:
+    if not usage:
+        return {}
+    return {
+        "gen_ai.usage.input_tokens": getattr(usage, "prompt_tokens", None),
+        "gen_ai.usage.output_tokens": getattr(usage, "completion_tokens", None),
+        "gen_ai.usage.total_tokens": getattr(usage, "total_tokens", None),
+    }
+
+
+def _step_name(step: RunStep) -> str:
+    tool_calls = getattr(step.step_details, "tool_calls", None) or []
+    if not tool_calls:
+        return str(getattr(step.type, "value", step.type))
+    names = []
+    for tool_call in tool_calls:
+        tool_type = str(getattr(tool_call.type, "value", tool_call.type))
+        details = getattr(tool_call, tool_type, None)
+        name = getattr(details, "name", None) if details is not None and not isinstance(details, dict) else None
+        names.append(f"{tool_type} {name}" if name else tool_type)
+    return ", ".join(names)
+
+
+class Tracer:
+    """Record spans and export them as OTLP/JSON lines.
+
+    Spans opened with :meth:`span` are children of the span that is current in the calling
+    thread or task. Work that runs on other threads or tasks (the provisioning workers, the
+    actors of an orchestration) has no current span and is attached to the root span opened
+    with :meth:`start_root` instead.
+
+    Args:
+        service_name (str): The ``service.name`` resource attribute of the exported spans.
+        export_path (Optional[str]): JSON lines file the spans are appended to on :meth:`flush`.
+        enabled (bool): Record nothing and leave clients untouched when disabled.
+        max_spans (int): Number of finished spans kept in memory for :meth:`breakdown`.
+    """
+
+    def __init__(
+        self,
+        service_name: str = "agents-workshop",
+        export_path: Optional[str] = None,
+        enabled: bool = True,
+        max_spans: int = 10_000,
+    ):
+        self.service_name = service_name
+        self.export_path = export_path
+        self.enabled = enabled
+        self.root: Optional[Span] = None
+        # Agent IDs are resolved to names for the run span names
+        self.agent_names: dict[str, str] = {}
+        self.spans: deque[Span] = deque(maxlen=max_spans)
+        self._pending: list[Span] = []
+        self._runs: dict[str, "_RunObserver"] = {}
+        self._lock = threading.Lock()
+
+    def start_span(self, name: str, parent: Optional[Span] = None, kind: str = "internal", **attributes: Any) -> Span:
+        """Open a span that is ended with :meth:`end_span`."""
+        parent = parent or _current_span.get() or self.root
+        span = Span(
+            name,
+            trace_id=parent.trace_id if parent else secrets.token_hex(16),
+            span_id=secrets.token_hex(8),
+            parent_id=parent.span_id if parent else None,
+            kind=kind,
+        )
+        span.set(**attributes)
+        return span
+
+    def end_span(self, span: Span, error: Optional[BaseException] = None) -> None:
+        """End a span, marking it as failed if ``error`` is given."""
+        with self._lock:
+            if span.ended is not None:
+                return
+            span.ended = time.perf_counter()
+            if error is not None:
+                span.status = "error"
+                span.status_message = f"{type(error).__name__}: {error}"
+            elif span.status == "unset":
+                span.status = "ok"
+            self.spans.append(span)
+            if self.export_path:
+                self._pending.append(span)
+
+    @contextmanager
+    def span(self, name: str, parent: Optional[Span] = None, kind: str = "internal", **attributes: Any) -> Iterator[Optional[Span]]:
+        """Time the enclosed block as a span that is current while the block runs."""
+        if not self.enabled:
+            yield None
+            return
+        span = self.start_span(name, parent=parent, kind=kind, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as error:
+            self.end_span(span, error)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+
+    def start_root(self, name: str, **attributes: Any) -> Optional[Span]:
+        """End the current root span and open a new trace with a root span."""
+        self.end_root()
+        if not self.enabled:
+            return None
+        self.root = Span(name, trace_id=secrets.token_hex(16), span_id=secrets.token_hex(8))
+        self.root.set(**attributes)
+        return self.root
+
+    def end_root(self) -> Optional[Span]:
+        """End the root span together with runs of its trace that are still open and flush."""
+        root, self.root = self.root, None
+        if root is None:
+            return None
+        for observer in list(self._runs.values()):
+            if observer.span.trace_id == root.trace_id:
+                observer.finish()
+        self.end_span(root)
+        self.flush()
+        return root
+
+    @contextmanager
+    def root_span(self, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Time the enclosed block as the root span of a new trace."""
+        root = self.start_root(name, **attributes)
+        try:
+            yield root
+        except BaseException as error:
+            if root is not None:
+                self.end_span(root, error)
+            raise
+        finally:
+            if self.root is root:
+                self.end_root()
+
+    def wrap(self, name: str, function: Callable) -> Callable:
+        """Return ``function`` timed as a span, e.g. for a provisioning step on a worker thread.
+
+        If ``function`` returns an awaitable, the span lasts until it has been awaited.
+        """
+        if not self.enabled:
+            return function
+
+        def traced(*args: Any, **kwargs: Any) -> Any:
+            span = self.start_span(name)
+            token = _current_span.set(span)
+            try:
+                result = function(*args, **kwargs)
+            except BaseException as error:
+                self.end_span(span, error)
+                raise
+            finally:
+                _current_span.reset(token)
+            if inspect.isawaitable(result):
+                return self._await_in_span(span, result)
+            self.end_span(span)
+            return result
+
+        return traced
+
+    async def _await_in_span(self, span: Span, awaitable: Any) -> Any:
+        token = _current_span.set(span)
+        try:
+            return await awaitable
+        except BaseException as error:
+            self.end_span(span, error)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+
+    def record_run(self, span: Optional[Span], run: ThreadRun, client: Any = None) -> None:
+        """Add status and token usage of a finished run to ``span``.
+
+        With the ``client`` the run steps are listed and added as child spans, which is only
+        needed for runs that were not streamed.
+        """
+        if span is None or run is None:
+            return
+        span.set(
+            **{"run.id": run.id, "thread.id": run.thread_id, "run.status": str(getattr(run.status, "value", run.status))},
+            **_usage_attributes(run.usage),
+        )
+        if run.last_error:
+            span.status = "error"
+            span.status_message = str(run.last_error)
+        if client is None:
+            return
+        for step in client.run_steps.list(thread_id=run.thread_id, run_id=run.id):
+            if not step.created_at:
+                continue
+            finished = step.completed_at or step.failed_at or step.cancelled_at or step.expired_at or step.created_at
+            child = self.start_span(_step_name(step), parent=span, **{"run_step.id": step.id}, **_usage_attributes(step.usage))
+            # Run steps only have timestamps in seconds
+            child.start_time_ns = int(step.created_at.timestamp() * 1e9)
+            child.started = span.started + (step.created_at.timestamp() - span.start_time_ns / 1e9)
+            child.ended = child.started + (finished - step.created_at).total_seconds()
+            child.status = "error" if step.status in ("failed", "cancelled", "expired") else "ok"
+            with self._lock:
+                self.spans.append(child)
+                if self.export_path:
+                    self._pending.append(child)
+
+    def _observer(self, run_id: Optional[str]) -> Optional["_RunObserver"]:
+        with self._lock:
+            return self._runs.get(run_id) if run_id else None
+
+    def _stream_method(self, method: Callable, name: str) -> Callable:
+        # ``runs.stream`` starts a run span that stays open until the run has finished,
+        # ``runs.submit_tool_outputs_stream`` continues the run span of its run
+        def begin(kwargs: dict) -> "_RunObserver":
+            observer = self._observer(kwargs.get("run_id"))
+            if observer is None:
+                agent_id = kwargs.get("agent_id")
+                span = self.start_span(
+                    f"run {self.agent_names.get(agent_id, agent_id)}",
+                    **{"gen_ai.agent.id": agent_id, "thread.id": kwargs.get("thread_id")},
+                )
+                observer = _RunObserver(self, span)
+            return observer
+
+        if inspect.iscoroutinefunction(method):
+
+            async def traced_async(*args: Any, **kwargs: Any) -> Any:
+                observer = begin(kwargs)
+                try:
+                    with self.span(name, parent=observer.span, kind="client"):
+                        result = await method(*args, **kwargs)
+                except BaseException as error:
+                    observer.finish(error)
+                    raise
+                return self._follow(observer, kwargs, result)
+
+            return traced_async
+
+        def traced(*args: Any, **kwargs: Any) -> Any:
+            observer = begin(kwargs)
+            try:
+                with self.span(name, parent=observer.span, kind="client"):
+                    result = method(*args, **kwargs)
+            except BaseException as error:
+                observer.finish(error)
+                raise
+            return self._follow(observer, kwargs, result)
+
+        return traced
+
+    def _follow(self, observer: "_RunObserver", kwargs: dict, result: Any) -> Any:
+        handler = kwargs.get("event_handler") or getattr(result, "event_handler", None)
+        if handler is None or observer.attach(handler):
+            return result
+        # Without its events the run span covers the stream, or only the call of a continuation
+        if result is None:
+            observer.finish()
+            return result
+        return _TimedStream(result, observer)
+
+    def flush(self) -> None:
+        """Append the spans finished since the last flush to the export file."""
+        with self._lock:
+            spans, self._pending = self._pending, []
+        if not spans or not self.export_path:
+            return
+        document = {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [{"key": "service.name", "value": _otlp_value(self.service_name)}]},
+                    "scopeSpans": [{"scope": {"name": __name__}, "spans": [_otlp_span(span) for span in spans]}],
+                }
+            ]
+        }
+        with open(self.export_path, "a", encoding="utf-8") as export_file:
+            export_file.write(json.dumps(document, ensure_ascii=False) + "\n")
+
+    def last_root(self, name: Optional[str] = None) -> Optional[Span]:
+        """Return the most recently finished root span, optionally with the given name."""
+        with self._lock:
+            spans = list(self.spans)
+        for span in reversed(spans):
+            if span.parent_id is None and (name is None or span.name == name):
+                return span
+        return None
+
+    def breakdown(self, span: Optional[Span] = None) -> str:
+        """Render the span tree below ``span`` (default: the last root span) with durations.
+
+        Siblings with the same name, like the polls of a run, are summed up in one line.
+        """
+        span = span or self.root or self.last_root()
+        if span is None:
+            return "Keine Spans aufgezeichnet."
+        with self._lock:
+            spans = [candidate for candidate in self.spans if candidate.trace_id == span.trace_id]
+        with self._lock:
+            open_runs = {observer.span.span_id: observer.span for observer in self._runs.values()}
+        spans.extend(run_span for run_span in open_runs.values() if run_span.trace_id == span.trace_id)
+        children: dict[str, list[Span]] = {}
+        for candidate in sorted(spans, key=lambda candidate: candidate.started):
+            children.setdefault(candidate.parent_id, []).append(candidate)
+        lines: list[str] = []
+        self._render(span, [span], children, 0, lines)
+        return "\n".join(lines)
+
+    def _render(self, span: Span, group: list[Span], children: dict, depth: int, lines: list[str]) -> None:
+        label = "  " * depth + span.name + (f" ×{len(group)}" if len(group) > 1 else "")
+        duration = sum(member.duration for member in group)
+        details = []
+        tokens = sum(member.attributes.get("gen_ai.usage.total_tokens", 0) for member in group)
+        if tokens:
+            details.append(f"{tokens} tokens")
+        if "time_to_first_token_ms" in span.attributes:
+            details.append(f"first token {span.attributes['time_to_first_token_ms']} ms")
+        if span.ended is None:
+            details.append("open")
+        if any(member.status == "error" for member in group):
+            details.append("error")
+        lines.append(f"{label:<56} {duration * 1000:>9.0f} ms  {', '.join(details)}".rstrip())
+        if len(group) > 1:
+            return
+        grouped: dict[str, list[Span]] = {}
+        for child in children.get(span.span_id, []):
+            grouped.setdefault(child.name, []).append(child)
+        for members in grouped.values():
+            self._render(members[0], members, children, depth + 1, lines)
+
+
+class _RunObserver:
+    """Follow the events of a streamed run and keep its span and step spans up to date."""
+
+    def __init__(self, tracer: Tracer, span: Span):
+        self.tracer = tracer
+        self.span = span
+        self.run_id: Optional[str] = None
+        self._steps: dict[str, Span] = {}
+        with tracer._lock:
+            tracer._runs[span.span_id] = self
+
+    def attach(self, handler: Any) -> bool:
+        """Observe the events processed by ``handler``, including the ones of continuations.
+
+        Returns ``False`` if the handler has no ``_process_event`` to wrap. The method is private
+        to the SDK, so the run is then only timed as a whole.
+        """
+        if getattr(handler, "_traced_by", None) is self:
+            return True
+        process_event = getattr(handler, "_process_event", None)
+        if not callable(process_event):
+            return False
+        if inspect.iscoroutinefunction(process_event):
+
+            async def traced_process_event(event_data: str) -> Any:
+                result = await process_event(event_data)
+                self.observe(result)
+                return result
+
+        else:
+
+            def traced_process_event(event_data: str) -> Any:
+                result = process_event(event_data)
+                self.observe(result)
+                return result
+
+        handler._process_event = traced_process_event
+        handler._traced_by = self
+        return True
+
+    def observe(self, result: Any) -> None:
+        if not isinstance(result, tuple) or len(result) < 2:
+            return
+        data = result[1]
+        if isinstance(data, ThreadRun):
+            self._on_run(data)
+        elif isinstance(data, RunStep):
+            self._on_step(data)
+        elif isinstance(data, MessageDeltaChunk) and "time_to_first_token_ms" not in self.span.attributes:
+            self.span.set(time_to_first_token_ms=round(self.span.duration * 1000))
+
+    def _on_run(self, run: ThreadRun) -> None:
+        if self.run_id is None:
+            self.run_id = run.id
+            with self.tracer._lock:
+                self.tracer._runs[run.id] = self
+        status = str(getattr(run.status, "value", run.status))
+        if status == "requires_action":
+            self.span.add("run.requires_action")
+        if status in TERMINAL_RUN_STATUSES:
+            self.tracer.record_run(self.span, run)
+            self.finish()
+
+    def _on_step(self, step: RunStep) -> None:
+        span = self._steps.get(step.id)
+        if span is None:
+            span = self._steps[step.id] = self.tracer.start_span(_step_name(step), parent=self.span, **{"run_step.id": step.id})
+        elif getattr(step.step_details, "tool_calls", None):
+            # Tool calls are only known once the step has progressed
+            span.name = _step_name(step)
+        status = str(getattr(step.status, "value", step.status))
+        if status in TERMINAL_STEP_STATUSES:
+            span.set(**_usage_attributes(step.usage))
+            if status != "completed":
+                span.status = "error"
+                span.status_message = str(step.last_error or status)
+            self.tracer.end_span(span)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        """End the run span and the step spans that are still open."""
+        for step_span in self._steps.values():
+            self.tracer.end_span(step_span)
+        self.tracer.end_span(self.span, error)
+        with self.tracer._lock:
+            self.tracer._runs.pop(self.span.span_id, None)
+            if self.run_id:
+                self.tracer._runs.pop(self.run_id, None)
+
+
+class _TimedStream:
+    """Proxy of a run stream whose events cannot be observed: the run span ends with the stream."""
+
+    def __init__(self, stream: Any, observer: _RunObserver):
+        self._stream = stream
+        self._observer = observer
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+    def __iter__(self) -> Any:
+        return iter(self._stream)
+
+    def __aiter__(self) -> Any:
+        return self._stream.__aiter__()
+
+    def __enter__(self) -> "_TimedStream":
+        self._stream.__enter__()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> Any:
+        try:
+            return self._stream.__exit__(*exc_info)
+        finally:
+            self._observer.finish(exc_info[1])
+
+    async def __aenter__(self) -> "_TimedStream":
+        await self._stream.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> Any:
+        try:
+            return await self._stream.__aexit__(*exc_info)
+        finally:
+            self._observer.finish(exc_info[1])
+
+
+class _TracedOperations:
+    """Proxy of a client or operation group that times every public call as a span."""
+
+    def __init__(self, target: Any, tracer: Tracer, prefix: str):
+        self._target = target
+        self._tracer = tracer
+        self._prefix = prefix
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._target, name)
+        if name in TRACED_GROUPS:
+            return _TracedOperations(attribute, self._tracer, f"{self._prefix}.{name}")
+        if name.startswith("_") or not callable(attribute) or inspect.isclass(attribute):
+            return attribute
+        span_name = f"{self._prefix}.{name}"
+        if name in ("stream", "submit_tool_outputs_stream"):
+            return self._tracer._stream_method(attribute, span_name)
+        return self._traced_method(attribute, span_name)
+
+    def _traced_method(self, method: Callable, name: str) -> Callable:
+        tracer = self._tracer
+        if inspect.iscoroutinefunction(method):
+
+            async def traced_async(*args: Any, **kwargs: Any) -> Any:
+                with tracer.span(name, kind="client"):
+                    return await method(*args, **kwargs)
+
+            return traced_async
+
+        def traced(*args: Any, **kwargs: Any) -> Any:
+            parent = _current_span.get() or tracer.root
+            with tracer.span(name, kind="client"):
+                result = method(*args, **kwargs)
+            # Listings only send their requests while they are iterated
+            if hasattr(result, "__aiter__"):
+                return _traced_async_items(tracer, f"{name}.iterate", parent, result)
+            if hasattr(result, "by_page"):
+                return _traced_items(tracer, f"{name}.iterate", parent, result)
+            return result
+
+        return traced
+
+    def __enter__(self) -> "_TracedOperations":
+        self._target.__enter__()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> Any:
+        return self._target.__exit__(*exc_info)
+
+    async def __aenter__(self) -> "_TracedOperations":
+        await self._target.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> Any:
+        return await self._target.__aexit__(*exc_info)
+
+
+def _traced_items(tracer: Tracer, name: str, parent: Optional[Span], items: Any) -> Iterator:
+    span = tracer.start_span(name, parent=parent, kind="client")
+    try:
+        for item in items:
+            yield item
+    finally:
+        tracer.end_span(span)
+
+
+async def _traced_async_items(tracer: Tracer, name: str, parent: Optional[Span], items: Any) -> Any:
+    span = tracer.start_span(name, parent=parent, kind="client")
+    try:
+        async for item in items:
+            yield item
+    finally:
+        tracer.end_span(span)
+
+
+def instrument(client: Any, tracer: Tracer, prefix: str = "agents") -> Any:
+    """Return ``client`` with all operations traced, or ``client`` itself if tracing is disabled."""
+    if not tracer.enabled:
+        return client
+    return _TracedOperations(client, tracer, prefix)
+
+
+def instrument_project_client(project_client: Any, tracer: Tracer) -> Any:
+    """Trace the agents operations of an ``AIProjectClient`` in place.
+
+    The project client itself is kept, because Semantic Kernel checks its type.
+    """
+    if tracer.enabled:
+        traced = instrument(project_client.agents, tracer)
+        try:
+            project_client.agents = traced
+        except AttributeError:
+            # Read-only property in front of the private attribute
+            project_client._agents = traced
+    return project_client
+
+
+class TracedCredential:
+    """Credential wrapper that times token requests."""
+
+    def __init__(self, credential: Any, tracer: Tracer):
+        self._credential = credential
+        self._tracer = tracer
+
+    def get_token(self, *scopes: str, **kwargs: Any) -> Any:
+        with self._tracer.span("credential.get_token", kind="client", credential=type(self._credential).__name__):
+            return self._credential.get_token(*scopes, **kwargs)
+
+    def get_token_info(self, *scopes: str, **kwargs: Any) -> Any:
+        with self._tracer.span("credential.get_token", kind="client", credential=type(self._credential).__name__):
+            return self._credential.get_token_info(*scopes, **kwargs)
+
+    def close(self) -> None:
+        self._credential.close()
+
+    def __enter__(self) -> "TracedCredential":
+        self._credential.__enter__()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._credential.__exit__(*exc_info)
+
+
+class AsyncTracedCredential:
+    """Async credential wrapper that times token requests."""
+
+    def __init__(self, credential: Any, tracer: Tracer):
+        self._credential = credential
+        self._tracer = tracer
+
+    async def get_token(self, *scopes: str, **kwargs: Any) -> Any:
+        with self._tracer.span("credential.get_token", kind="client", credential=type(self._credential).__name__):
+            return await self._credential.get_token(*scopes, **kwargs)
+
+    async def get_token_info(self, *scopes: str, **kwargs: Any) -> Any:
+        with self._tracer.span("credential.get_token", kind="client", credential=type(self._credential).__name__):
+            return await self._credential.get_token_info(*scopes, **kwargs)
+
+    async def close(self) -> None:
+        await self._credential.close()
+
+    async def __aenter__(self) -> "AsyncTracedCredential":
+        await self._credential.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self._credential.__aexit__(*exc_info)
+
+
+def tracer_from_env(service_name: str) -> Tracer:
+    """Create the tracer configured by ``TRACING`` and ``TRACE_EXPORT_PATH``."""
+    enabled = os.getenv("TRACING", "false").lower() == "true"
+    return Tracer(service_name, export_path=os.getenv("TRACE_EXPORT_PATH", DEFAULT_TRACE_PATH) or None, enabled=enabled)
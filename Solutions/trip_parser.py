@@ -0,0 +1,398 @@
+"""Deterministic local extraction of trip parameters.
+
+The orchestrator needs destination and travel period before it can start the connected agents
+and otherwise spends a full run just to ask for them. :func:`parse_trip_request` extracts the
+structured trip record from German or English free text (cities, dates, weekday ranges such as
+"Dienstag bis Freitag", relative days, times and the means of transport) without any model
+call, so incomplete requests can be answered locally and complete ones are sent to the
+orchestrator together with the structured data.
+"""
+
+import json
+import re
+from dataclasses import asdict, dataclass, fields
+from datetime import date, timedelta
+from typing import Optional
+
+from places import find_cities, fold
+
+REQUIRED_FIELDS = ("destination", "start_date", "end_date")
+
+# Precedes the JSON trip record attached to the messages for the orchestrator
+STRUCTURED_MARKER = "[Strukturierte Reisedaten]"
+
+FIELD_LABELS = {
+    "destination": "Ziel",
+    "start_date": "Anreisedatum",
+    "end_date": "Abreisedatum",
+}
+
+WEEKDAYS = {
+    "montag": 0, "monday": 0,
+    "dienstag": 1, "tuesday": 1,
+    "mittwoch": 2, "wednesday": 2,
+    "donnerstag": 3, "thursday": 3,
+    "freitag": 4, "friday": 4,
+    "samstag": 5, "saturday": 5,
+    "sonntag": 6, "sunday": 6,
+}
+
+# Abbreviations such as "so" or "do" are ordinary words, so they only count inside ranges ("Di-Fr")
+WEEKDAY_ABBREVIATIONS = {
+    "mo": 0, "mon": 0, "di": 1, "tue": 1, "mi": 2, "wed": 2, "do": 3, "thu": 3,
+    "fr": 4, "fri": 4, "sa": 5, "sat": 5, "so": 6, "sun": 6,
+}
+
+MONTHS = {
+    "januar": 1, "jaenner": 1, "january": 1, "jan": 1,
+    "februar": 2, "february": 2, "feb": 2,
+    "maerz": 3, "march": 3, "mar": 3, "mrz": 3,
+    "april": 4, "apr": 4,
+    "mai": 5, "may": 5,
+    "juni": 6, "june": 6, "jun": 6,
+    "juli": 7, "july": 7, "jul": 7,
+    "august": 8, "aug": 8,
+    "september": 9, "sept": 9, "sep": 9,
+    "oktober": 10, "october": 10, "okt": 10, "oct": 10,
+    "november": 11, "nov": 11,
+    "dezember": 12, "december": 12, "dez": 12, "dec": 12,
+}
+
+# Whole words of the folded text, so every inflected form is listed ("fliegt", "geflogen")
+TRANSPORT_KEYWORDS = {
+    "Bahn": ("bahn", "zug", "ice", "train", "rail"),
+    "Flug": (
+        "flug", "fluege", "flugzeug", "flieg", "fliege", "fliegen", "fliegst", "fliegt", "geflogen",
+        "flight", "flights", "fly", "flies", "flying", "plane",
+    ),
+    "Mietwagen": ("mietwagen", "auto", "rental car", "car"),
+}
+
+TRAVEL_KEYWORDS = re.compile(
+    r"\b(reise|reisen|dienstreise|geschaeftsreise|fahre|fliege|muss nach|trip|travel|need to go|going to)\b"
+)
+
+_WEEKDAY = "|".join(sorted(WEEKDAYS, key=len, reverse=True))
+_WEEKDAY_ABBREVIATION = "|".join(sorted(WEEKDAY_ABBREVIATIONS, key=len, reverse=True))
+_MONTH = "|".join(sorted(MONTHS, key=len, reverse=True))
+_RANGE_SEP = r"\s*(?:-|–|bis(?: zum| einschliesslich)?|to|until|till|through)\s*"
+
+
+@dataclass
+class TripRequest:
+    """Structured trip parameters extracted from the conversation."""
+
+    destination: Optional[str] = None
+    origin: Optional[str] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    departure_time: Optional[str] = None
+    return_time: Optional[str] = None
+    transport: Optional[str] = None
+
+    def missing(self) -> list[str]:
+        """Return the names of the required fields that are still unknown."""
+        return [name for name in REQUIRED_FIELDS if getattr(self, name) is None]
+
+    def is_empty(self) -> bool:
+        return all(getattr(self, item.name) is None for item in fields(self))
+
+    def merge(self, update: "TripRequest") -> "TripRequest":
+        """Return a copy where every field known in ``update`` replaces the current value."""
+        merged = TripRequest(**{item.name: getattr(self, item.name) for item in fields(self)})
+        for item in fields(update):
+            value = getattr(update, item.name)
+            if value is not None:
+                setattr(merged, item.name, value)
+        return merged
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        for key in ("start_date", "end_date"):
+            data[key] = data[key].isoformat() if data[key] else None
+        return {key: value for key, value in data.items() if value is not None}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+
+def _next_weekday(today: date, weekday: int, week_offset: Optional[int]) -> date:
+    if week_offset is not None:
+        monday = today - timedelta(days=today.weekday()) + timedelta(weeks=week_offset)
+        return monday + timedelta(days=weekday)
+    days_ahead = (weekday - today.weekday()) % 7 or 7
+    return today + timedelta(days=days_ahead)
+
+
+def _make_date(day: int, month: int, year: Optional[int], today: date) -> Optional[date]:
+    if year is not None and year < 100:
+        year += 2000
+    try:
+        candidate = date(year or today.year, month, day)
+    except ValueError:
+        return None
+    # Dates without year lie in the future
+    if year is None and candidate < today:
+        candidate = candidate.replace(year=candidate.year + 1)
+    return candidate
+
+
+def _week_offset(text: str) -> Optional[int]:
+    if re.search(r"\b(naechste[nrs]?|kommende[nrs]?|next) (woche|week)\b", text):
+        return 1
+    if re.search(r"\b(uebernaechste[nrs]?) woche\b|\bweek after next\b", text):
+        return 2
+    if re.search(r"\b(diese[nrs]?|this) (woche|week)\b", text):
+        return 0
+    return None
+
+
+def _parse_dates(text: str, today: date) -> list[tuple[int, date]]:
+    found: list[tuple[int, date]] = []
+
+    def add(position: int, value: Optional[date]) -> None:
+        if value is not None:
+            found.append((position, value))
+
+    # 2025-07-01
+    for match in re.finditer(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b", text):
+        add(match.start(), _make_date(int(match.group(3)), int(match.group(2)), int(match.group(1)), today))
+
+    # 1.7. / 01.07.2025 / 1.-4.7. / 1. bis 4.7.2025
+    for match in re.finditer(r"\b(\d{1,2})\.(?:" + _RANGE_SEP + r"(\d{1,2})\.)?(\d{1,2})\.(\d{2,4})?(?!\d)", text):
+        month = int(match.group(3))
+        year = int(match.group(4)) if match.group(4) else None
+        if match.group(2):
+            add(match.start(), _make_date(int(match.group(1)), month, year, today))
+            add(match.start(2), _make_date(int(match.group(2)), month, year, today))
+        else:
+            add(match.start(), _make_date(int(match.group(1)), month, year, today))
+
+    # 1. Juli / 1.-4. Juli 2025 / 1 July / 1st to 4th July
+    for match in re.finditer(
+        r"\b(\d{1,2})(?:\.|st|nd|rd|th)?(?:" + _RANGE_SEP + r"(\d{1,2})(?:\.|st|nd|rd|th)?)?\s+(?:of\s+)?(" + _MONTH + r")\b\.?(?:\s+(\d{4}))?",
+        text,
+    ):
+        month = MONTHS[match.group(3)]
+        year = int(match.group(4)) if match.group(4) else None
+        add(match.start(), _make_date(int(match.group(1)), month, year, today))
+        if match.group(2):
+            add(match.start(2), _make_date(int(match.group(2)), month, year, today))
+
+    # July 1 / July 1st to 4th / July 1 - 4, 2025
+    for match in re.finditer(
+        r"\b(" + _MONTH + r")\s+(\d{1,2})(?:st|nd|rd|th)?(?:" + _RANGE_SEP + r"(\d{1,2})(?:st|nd|rd|th)?)?(?:,?\s+(\d{4}))?\b",
+        text,
+    ):
+        month = MONTHS[match.group(1)]
+        year = int(match.group(4)) if match.group(4) else None
+        add(match.start(), _make_date(int(match.group(2)), month, year, today))
+        if match.group(3):
+            add(match.start(3), _make_date(int(match.group(3)), month, year, today))
+
+    # heute / morgen / übermorgen
+    relative = {"heute": 0, "today": 0, "morgen": 1, "tomorrow": 1, "uebermorgen": 2, "day after tomorrow": 2}
+    for word, offset in relative.items():
+        for match in re.finditer(r"\b" + word + r"\b", text):
+            if word == "tomorrow" and text[:match.start()].endswith("after "):
+                continue
+            add(match.start(), today + timedelta(days=offset))
+
+    # Dienstag bis Freitag / Di-Fr / next week Monday to Friday
+    week_offset = _week_offset(text)
+    weekday_ranges = (
+        (r"\b(" + _WEEKDAY + r")\b(?:" + _RANGE_SEP + r"\b(" + _WEEKDAY + r")\b)?", WEEKDAYS),
+        (r"\b(" + _WEEKDAY_ABBREVIATION + r")\.?" + _RANGE_SEP + r"\b(" + _WEEKDAY_ABBREVIATION + r")\b", WEEKDAY_ABBREVIATIONS),
+    )
+    for pattern, names in weekday_ranges:
+        for match in re.finditer(pattern, text):
+            first = _next_weekday(today, names[match.group(1)], week_offset)
+            add(match.start(), first)
+            if match.group(2):
+                last = first + timedelta(days=(names[match.group(2)] - first.weekday()) % 7)
+                add(match.start(2), last)
+
+    # Deduplicate while keeping the textual order
+    result: list[tuple[int, date]] = []
+    for position, value in sorted(found, key=lambda item: item[0]):
+        if value not in (known for _, known in result):
+            result.append((position, value))
+    return result
+
+
+def _parse_duration(text: str) -> Optional[int]:
+    match = re.search(r"\b(?:fuer\s+|for\s+)?(\d+|eine?n?|zwei|drei|vier|fuenf|one|two|three|four|five)\s+(naechte?|nights?|tage?|days?)\b", text)
+    if not match:
+        return None
+    words = {"ein": 1, "eine": 1, "einen": 1, "one": 1, "zwei": 2, "two": 2, "drei": 3, "three": 3,
+             "vier": 4, "four": 4, "fuenf": 5, "five": 5}
+    count = int(match.group(1)) if match.group(1).isdigit() else words.get(match.group(1), 1)
+    # n nights end n days later, n days end n - 1 days later
+    return count if match.group(2).startswith(("n", "N")) else max(0, count - 1)
+
+
+def _parse_times(text: str) -> list[str]:
+    times = []
+    for match in re.finditer(r"\b(\d{1,2})(?::(\d{2}))?\s*(uhr|am|pm|h)\b|\b(\d{1,2}):(\d{2})\b", text):
+        if match.group(4):
+            hour, minute = int(match.group(4)), int(match.group(5))
+        else:
+            hour, minute = int(match.group(1)), int(match.group(2) or 0)
+            if match.group(3) == "pm" and hour < 12:
+                hour += 12
+            if match.group(3) == "am" and hour == 12:
+                hour = 0
+        if hour < 24 and minute < 60:
+            times.append(f"{hour:02d}:{minute:02d}")
+    return times
+
+
+def _parse_places(text: str) -> tuple[Optional[str], Optional[str]]:
+    cities = find_cities(text)
+    origin = destination = None
+    for position, city in cities:
+        before = text[max(0, position - 12):position]
+        if re.search(r"\b(von|ab|aus|from|starting in)\s+$", before):
+            origin = origin or city
+        elif re.search(r"\b(nach|in|to|bis|zum|zur)\s+$", before):
+            destination = destination or city
+    # A single city without preposition is the destination
+    remaining = [city for _, city in cities if city not in (origin, destination)]
+    if destination is None and remaining:
+        destination = remaining[0]
+    return origin, destination
+
+
+def parse_trip_request(text: str, today: Optional[date] = None) -> TripRequest:
+    """Extract trip parameters from a single user message.
+
+    Args:
+        text (str): The user input.
+        today (Optional[date]): Reference date for relative expressions, defaults to today.
+
+    Returns:
+        TripRequest: The fields that could be extracted, all others are ``None``.
+    """
+    today = today or date.today()
+    folded = fold(text)
+    trip = TripRequest()
+    trip.origin, trip.destination = _parse_places(folded)
+
+    dated = _parse_dates(folded, today)
+    dates = [value for _, value in dated]
+    if len(dates) == 1 and re.search(r"\b(bis|until|till|zurueck|rueckreise|return|returning)\b\D*$", folded[: dated[0][0]]):
+        # "bis 5.7." answers the question for the end of the trip only
+        trip.end_date = dates[0]
+    elif dates:
+        trip.start_date = dates[0]
+        if len(dates) > 1:
+            trip.end_date = max(dates[1:])
+        else:
+            duration = _parse_duration(folded)
+            if duration is not None:
+                trip.end_date = trip.start_date + timedelta(days=duration)
+    if trip.start_date and trip.end_date and trip.end_date < trip.start_date:
+        trip.end_date = None
+
+    times = _parse_times(folded)
+    if times:
+        trip.departure_time = times[0]
+        if len(times) > 1:
+            trip.return_time = times[1]
+
+    for transport, keywords in TRANSPORT_KEYWORDS.items():
+        if any(re.search(r"\b" + re.escape(keyword) + r"\b", folded) for keyword in keywords):
+            trip.transport = transport
+            break
+    return trip
+
+
+def is_trip_request(text: str, parsed: TripRequest) -> bool:
+    """Return whether a message requests a trip rather than e.g. asking a policy question.
+
+    Messages with dates always count. A destination alone only counts together with a travel
+    phrase ("Ich muss nach Berlin") and never in a question ("Hotelobergrenze in Paris?").
+    """
+    if parsed.start_date or parsed.end_date:
+        return True
+    if text.strip().endswith("?"):
+        return False
+    return bool(parsed.destination) and bool(TRAVEL_KEYWORDS.search(fold(text)))
+
+
+def clarification_question(trip: TripRequest) -> str:
+    """Phrase the local follow-up question for a trip with missing required fields."""
+    known = []
+    if trip.destination:
+        known.append(f"Ziel erkannt ({trip.destination})")
+    if trip.start_date:
+        known.append(f"Anreise {trip.start_date.strftime('%d.%m.%Y')}")
+    missing = trip.missing()
+    missing_labels = ", ".join(FIELD_LABELS[name] for name in missing)
+    questions = {
+        "destination": "Wohin geht die Reise?",
+        "start_date": "Wann beginnt die Reise?",
+        "end_date": "Wann endet die Reise?",
+    }
+    if "start_date" in missing and "end_date" in missing:
+        questions = {**questions, "start_date": "Von wann bis wann findet die Reise statt?", "end_date": ""}
+    prefix = ", ".join(known) + ", " if known else ""
+    asked = " ".join(question for name, question in questions.items() if name in missing and question)
+    return f"{prefix}{missing_labels} fehlt – Rückfrage erforderlich: {asked}"
+
+
+def format_structured_message(texts: list[str], trip: TripRequest) -> str:
+    """Combine the collected user messages with the structured trip record."""
+    return "\n".join(texts) + f"\n\n{STRUCTURED_MARKER}\n" + trip.to_json()
+
+
+def structure_message(text: str, today: Optional[date] = None) -> str:
+    """Attach the structured trip record to a single message without asking back.
+
+    Used where nobody can answer a clarification question, e.g. in batch mode.
+    """
+    trip = parse_trip_request(text, today)
+    if not is_trip_request(text, trip):
+        return text
+    return format_structured_message([text], trip)
+
+
+class TripIntake:
+    """Collect trip parameters over several user messages before the orchestrator is called.
+
+    :meth:`handle` returns either a local reply (required fields are missing, no model call
+    needed) or the message to send to the orchestrator. Messages that are not about a trip,
+    e.g. approvals or policy questions, are passed through unchanged.
+    """
+
+    def __init__(self, today: Optional[date] = None):
+        self.today = today
+        self.trip = TripRequest()
+        self.pending: list[str] = []
+
+    def handle(self, text: str) -> tuple[Optional[str], Optional[str]]:
+        """Process a user message.
+
+        Returns:
+            tuple[Optional[str], Optional[str]]: The local reply and the message for the
+            orchestrator; exactly one of both is set.
+        """
+        parsed = parse_trip_request(text, self.today)
+        awaiting_answer = bool(self.pending) and not parsed.is_empty()
+        if not awaiting_answer and not is_trip_request(text, parsed):
+            message = "\n".join(self.pending + [text])
+            self.pending = []
+            return None, message
+
+        # A different destination after a completed request starts a new trip
+        if not self.pending and not self.trip.missing() and parsed.destination not in (None, self.trip.destination):
+            self.trip = parsed
+        else:
+            self.trip = self.trip.merge(parsed)
+        self.pending.append(text)
+
+        if self.trip.missing():
+            return clarification_question(self.trip), None
+        message = format_structured_message(self.pending, self.trip)
+        self.pending = []
+        return None, message
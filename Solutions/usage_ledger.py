@@ -0,0 +1,383 @@
+"""Token usage, wall time and cost of the agent runs.
+
+Every run and every run step reports its prompt and completion tokens, but the scripts only
+looked at the run status. :class:`UsageLedger` records the usage of each finished run:
+
+* per run, attributed to the agent that executed it, with the wall time of the run,
+* per connected agent call, taken from its tool call step, so ``policy_pruefungs_agent``,
+  ``reise_recherche_agent`` and ``buchungs_agent`` show up separately from the orchestrator.
+  The orchestrator's wall time includes the time it waited for its connected agents.
+
+The records are aggregated per agent, per user, per conversation and per model, with costs
+from a price list. A :class:`ConversationBudget` limits the tokens of a conversation: before a
+turn, :meth:`UsageLedger.check_budget` predicts its tokens from the latest turn and asks to
+compact the thread or to stop before the budget would be exceeded. :meth:`UsageLedger.export`
+writes the aggregates as JSON for capacity planning.
+"""
+
+import contextvars
+import getpass
+import json
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Iterable, Iterator, NamedTuple, Optional
+
+DEFAULT_USAGE_PATH = ".agent_usage.json"
+BUDGET_OK = "ok"
+BUDGET_COMPACT = "compact"
+BUDGET_STOP = "stop"
+FINISHED_RUN_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete")
+RUN_PAGE_SIZE = 20
+
+
+class UsageRecord(NamedTuple):
+    """Tokens and wall time of a run or of a connected agent call."""
+
+    conversation: str
+    user: str
+    agent: str
+    # The agent whose run called a connected agent, empty for runs
+    caller: str
+    run_id: str
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    seconds: float
+    cost: float
+
+
+@dataclass
+class UsageTotals:
+    """Sum of usage records."""
+
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    seconds: float = 0.0
+    cost: float = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, record: UsageRecord) -> None:
+        self.calls += 1
+        self.prompt_tokens += record.prompt_tokens
+        self.completion_tokens += record.completion_tokens
+        self.seconds += record.seconds
+        self.cost += record.cost
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "seconds": round(self.seconds, 3),
+            "cost": round(self.cost, 6),
+        }
+
+
+class ConversationBudget(NamedTuple):
+    """Token limit of a conversation.
+
+    Args:
+        max_tokens (int): Prompt and completion tokens of all runs of the conversation.
+        compact (bool): Ask to compact the thread before stopping the conversation.
+    """
+
+    max_tokens: int
+    compact: bool = True
+
+
+@dataclass
+class _Conversation:
+    turns: int = 0
+    first_turn_tokens: int = 0
+    last_turn_tokens: int = 0
+
+
+@dataclass
+class _Turn:
+    conversation: str
+    user: str
+    tokens: int = 0
+
+
+_current_turn: contextvars.ContextVar[Optional[_Turn]] = contextvars.ContextVar("usage_turn", default=None)
+
+
+def parse_prices(value: str) -> dict[str, tuple[float, float]]:
+    """Parse prices per million tokens like ``gpt-4o=2.5/10,gpt-4o-mini=0.15/0.6``.
+
+    The first price is for prompt tokens, the second for completion tokens.
+    """
+    prices = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        model, _, price = entry.partition("=")
+        prompt_price, _, completion_price = price.partition("/")
+        prices[model.strip()] = (float(prompt_price), float(completion_price or prompt_price))
+    return prices
+
+
+def _timestamp(value: Any) -> Optional[float]:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value) if value else None
+
+
+def _duration(started: Any, ended: Any) -> float:
+    started, ended = _timestamp(started), _timestamp(ended)
+    return max(0.0, ended - started) if started is not None and ended is not None else 0.0
+
+
+def _tokens(usage: Any) -> tuple[int, int]:
+    if not usage:
+        return 0, 0
+    return getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+
+
+def _connected_agents(step: Any) -> list[str]:
+    """Names of the connected agents called in a tool call step."""
+    names = []
+    for tool_call in getattr(step.step_details, "tool_calls", None) or []:
+        if str(getattr(tool_call.type, "value", tool_call.type)) == "connected_agent":
+            details = getattr(tool_call, "connected_agent", None)
+            names.append(getattr(details, "name", None) or "connected_agent")
+    return names
+
+
+class UsageLedger:
+    """Record and aggregate the token usage of runs.
+
+    Args:
+        client: The synchronous ``AgentsClient`` used to read the run steps of recorded runs.
+            Without a client every run is attributed to its agent as a whole.
+        agent_names (Optional[dict[str, str]]): Agent names by ID; unknown agents are reported
+            by ID. The dict is shared, so names can be added once the agents are provisioned.
+        prices (Optional[dict[str, tuple[float, float]]]): Prompt and completion price per
+            million tokens by model deployment, see :func:`parse_prices`.
+        budget (Optional[ConversationBudget]): Token limit per conversation.
+        default_user (Optional[str]): User of runs recorded outside of a :meth:`turn`.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        agent_names: Optional[dict[str, str]] = None,
+        prices: Optional[dict[str, tuple[float, float]]] = None,
+        budget: Optional[ConversationBudget] = None,
+        default_user: Optional[str] = None,
+    ):
+        self.client = client
+        self.agent_names = agent_names if agent_names is not None else {}
+        self.prices = prices or {}
+        self.budget = budget
+        self.default_user = default_user or getpass.getuser()
+        self.total = UsageTotals()
+        self._groups: dict[str, dict[str, UsageTotals]] = {"by_agent": {}, "by_user": {}, "by_conversation": {}, "by_model": {}}
+        self._conversations: dict[str, _Conversation] = {}
+        self._recorded_runs: set[str] = set()
+        # Per thread the newest run that, like all runs before it, is finished and recorded
+        self._run_cursors: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        prompt_price, completion_price = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+    def _conversation(self, conversation: str) -> _Conversation:
+        return self._conversations.setdefault(conversation, _Conversation())
+
+    @contextmanager
+    def turn(self, conversation: str, user: Optional[str] = None) -> Iterator[None]:
+        """Attribute the runs recorded in this block, also those of sub-agents, to one turn."""
+        state = _Turn(conversation, user or self.default_user)
+        token = _current_turn.set(state)
+        try:
+            yield
+        finally:
+            _current_turn.reset(token)
+            with self._lock:
+                entry = self._conversation(conversation)
+                entry.turns += 1
+                if state.tokens:
+                    entry.last_turn_tokens = state.tokens
+                    entry.first_turn_tokens = entry.first_turn_tokens or state.tokens
+
+    def _records(self, run: Any, steps: Iterable[Any], seconds: Optional[float]) -> list[UsageRecord]:
+        turn = _current_turn.get()
+        conversation = turn.conversation if turn else run.thread_id
+        user = turn.user if turn else self.default_user
+        agent = self.agent_names.get(run.agent_id, run.agent_id)
+        model = run.model or ""
+        if seconds is None:
+            ended = run.completed_at or run.failed_at or run.cancelled_at
+            seconds = _duration(run.started_at or run.created_at, ended)
+        prompt_tokens, completion_tokens = _tokens(run.usage)
+        records = []
+        for step in steps:
+            names = _connected_agents(step)
+            if not names:
+                continue
+            # Parallel calls of one step share its usage, each took the wall time of the step
+            step_prompt, step_completion = _tokens(step.usage)
+            step_seconds = _duration(step.created_at, step.completed_at)
+            for name in names:
+                share_prompt, share_completion = step_prompt // len(names), step_completion // len(names)
+                records.append(
+                    UsageRecord(
+                        conversation, user, name, agent, run.id, model, share_prompt, share_completion, step_seconds,
+                        self._cost(model, share_prompt, share_completion),
+                    )
+                )
+                prompt_tokens -= share_prompt
+                completion_tokens -= share_completion
+        prompt_tokens, completion_tokens = max(0, prompt_tokens), max(0, completion_tokens)
+        records.insert(
+            0, UsageRecord(conversation, user, agent, "", run.id, model, prompt_tokens, completion_tokens, seconds, self._cost(model, prompt_tokens, completion_tokens))
+        )
+        return records
+
+    def _add(self, records: list[UsageRecord]) -> None:
+        turn = _current_turn.get()
+        with self._lock:
+            for record in records:
+                self.total.add(record)
+                for group, key in (
+                    ("by_agent", record.agent),
+                    ("by_user", record.user),
+                    ("by_conversation", record.conversation),
+                    ("by_model", record.model),
+                ):
+                    self._groups[group].setdefault(key, UsageTotals()).add(record)
+                self._conversation(record.conversation)
+                if turn is not None:
+                    turn.tokens += record.prompt_tokens + record.completion_tokens
+
+    def _claim(self, run: Any) -> bool:
+        status = getattr(run.status, "value", run.status)
+        with self._lock:
+            if status not in FINISHED_RUN_STATUSES or run.id in self._recorded_runs:
+                return False
+            self._recorded_runs.add(run.id)
+            return True
+
+    def record_run(self, run: Any, seconds: Optional[float] = None) -> list[UsageRecord]:
+        """Record a finished run, e.g. as ``RunWaiter.on_finished``; runs are recorded once.
+
+        Args:
+            run (ThreadRun): The finished run.
+            seconds (Optional[float]): Wall time measured by the caller, defaults to the time
+                between the start and the end of the run reported by the service.
+
+        Returns:
+            list[UsageRecord]: The records of the run and of its connected agent calls.
+        """
+        if not self._claim(run):
+            return []
+        steps = self.client.run_steps.list(thread_id=run.thread_id, run_id=run.id) if self.client is not None else ()
+        records = self._records(run, steps, seconds)
+        self._add(records)
+        return records
+
+    async def collect_runs(self, client, thread_ids: Iterable[str]) -> list[UsageRecord]:
+        """Record the finished runs of ``thread_ids`` that were not recorded yet.
+
+        For scripts whose runs are executed by a framework, e.g. Semantic Kernel, with the
+        asynchronous ``AgentsClient``. Like :class:`~message_cursor.MessageCursor` the runs are
+        listed newest first and only up to the run a thread was recorded up to last time, so a
+        call usually costs one request per thread, independent of the length of the
+        conversation.
+        """
+        records = []
+        for thread_id in thread_ids:
+            fresh = []
+            async for run in client.runs.list(thread_id=thread_id, order="desc", limit=RUN_PAGE_SIZE):
+                if run.id == self._run_cursors.get(thread_id):
+                    break
+                fresh.append(run)
+            fresh.reverse()
+            for run in fresh:
+                if self._claim(run):
+                    steps = [step async for step in client.run_steps.list(thread_id=thread_id, run_id=run.id)]
+                    records += self._records(run, steps, None)
+            # A run still in progress is listed again next time, together with the runs after it
+            for run in fresh:
+                if getattr(run.status, "value", run.status) not in FINISHED_RUN_STATUSES:
+                    break
+                self._run_cursors[thread_id] = run.id
+        self._add(records)
+        return records
+
+    def spent(self, conversation: str) -> int:
+        """Tokens used by the conversation so far."""
+        with self._lock:
+            return self._spent(conversation)
+
+    def _spent(self, conversation: str) -> int:
+        totals = self._groups["by_conversation"].get(conversation)
+        return totals.total_tokens if totals else 0
+
+    def check_budget(self, conversation: str, can_compact: bool = False) -> str:
+        """Decide whether the next turn of ``conversation`` fits into the budget.
+
+        Returns:
+            str: :data:`BUDGET_OK`, :data:`BUDGET_COMPACT` if compacting the thread is expected
+            to make the next turn cheaper, otherwise :data:`BUDGET_STOP`.
+        """
+        if self.budget is None:
+            return BUDGET_OK
+        with self._lock:
+            entry = self._conversation(conversation)
+            spent = self._spent(conversation)
+            if spent + entry.last_turn_tokens <= self.budget.max_tokens:
+                return BUDGET_OK
+            # A compacted thread makes the next turn about as expensive as the first one
+            if can_compact and self.budget.compact and spent + entry.first_turn_tokens <= self.budget.max_tokens:
+                return BUDGET_COMPACT
+            return BUDGET_STOP
+
+    def compacted(self, conversation: str) -> None:
+        """Expect turns as cheap as the first one after the thread was compacted."""
+        with self._lock:
+            entry = self._conversation(conversation)
+            entry.last_turn_tokens = entry.first_turn_tokens
+
+    def aggregates(self) -> dict:
+        """Return the totals per agent, user, conversation and model."""
+        with self._lock:
+            result = {
+                "generated_at": datetime.now(timezone.utc).isoformat(),
+                "budget": self.budget._asdict() if self.budget else None,
+                "prices_per_million_tokens": {model: list(price) for model, price in self.prices.items()},
+                "total": self.total.to_dict(),
+            }
+            for group, totals in self._groups.items():
+                result[group] = {key: value.to_dict() for key, value in sorted(totals.items(), key=lambda item: -item[1].total_tokens)}
+            for conversation, totals in result["by_conversation"].items():
+                totals["turns"] = self._conversations[conversation].turns
+        return result
+
+    def export(self, path: Optional[str] = None) -> str:
+        """Write :meth:`aggregates` as JSON and return the path."""
+        path = path or os.getenv("USAGE_EXPORT_PATH", DEFAULT_USAGE_PATH)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as usage_file:
+            json.dump(self.aggregates(), usage_file, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return path
+
+    def summary(self) -> str:
+        """Render the totals per agent, one line each."""
+        aggregates = self.aggregates()
+        lines = []
+        for name, totals in [("total", aggregates["total"]), *aggregates["by_agent"].items()]:
+            lines.append(
+                f"{name:<24} {totals['calls']:>4} calls {totals['prompt_tokens']:>8} + {totals['completion_tokens']:>7} tokens "
+                f"{totals['seconds']:>8.1f} s {totals['cost']:>9.4f}"
+            )
+        return "\n".join(lines)